@@ -28,6 +28,7 @@ __all__ = [
 import collections
 import datetime
 import json
+import math
 import os
 try:
     import psutil
@@ -50,6 +51,8 @@ from twisted.protocols import amp
 
 from twistedcaldav.config import config
 
+from txdav.caldav.datastore.componentcache import componentCache
+
 log = Logger()
 
 
@@ -64,6 +67,148 @@ class DirectoryLogWrapperResource(LogWrapperResource):
         return self.directory
 
 
+class LatencyHistogram(object):
+    """
+    A log-linear histogram of durations in milliseconds. Each power of two
+    range is split into L{subBuckets} equal width buckets, so a value is known
+    to within 1/L{subBuckets} of its size. Only non-empty buckets are stored,
+    and histograms are merged (or subtracted) by adding (or subtracting) their
+    bucket counts.
+    """
+
+    subBuckets = 8
+
+    # The first bucket starts at 2**minExponent ms - shorter durations are
+    # counted in it too
+    minExponent = -3
+
+    percentiles = (
+        ("p50", 50.0),
+        ("p90", 90.0),
+        ("p99", 99.0),
+        ("p999", 99.9),
+    )
+
+    def __init__(self):
+        self.buckets = collections.defaultdict(int)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    @classmethod
+    def bucketIndex(cls, value):
+        """
+        Get the index of the bucket a value falls in.
+
+        @param value: duration in ms
+        @type value: C{float}
+        @rtype: C{int}
+        """
+        if value < 2.0 ** cls.minExponent:
+            return 0
+        mantissa, exponent = math.frexp(value)
+        subBucket = int((mantissa * 2.0 - 1.0) * cls.subBuckets)
+        return (exponent - 1 - cls.minExponent) * cls.subBuckets + subBucket
+
+    @classmethod
+    def bucketUpperBound(cls, index):
+        """
+        Get the (exclusive) upper bound of a bucket.
+
+        @param index: the bucket index
+        @type index: C{int}
+        @rtype: C{float}
+        """
+        exponent, subBucket = divmod(index, cls.subBuckets)
+        return 2.0 ** (exponent + cls.minExponent) * (1.0 + float(subBucket + 1) / cls.subBuckets)
+
+    def add(self, value):
+        """
+        Record a duration.
+
+        @param value: duration in ms
+        @type value: C{float}
+        """
+        self.buckets[self.bucketIndex(value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def merge(self, other):
+        """
+        Add the contents of another histogram to this one.
+
+        @type other: L{LatencyHistogram}
+        """
+        for index, count in other.buckets.iteritems():
+            self.buckets[index] += count
+        self.count += other.count
+        self.sum += other.sum
+        self.max = max(self.max, other.max)
+
+    def subtract(self, other):
+        """
+        Remove the contents of another histogram, previously merged into this
+        one. The maximum can only be bounded by the highest bucket left.
+
+        @type other: L{LatencyHistogram}
+        """
+        for index, count in other.buckets.iteritems():
+            self.buckets[index] -= count
+            if self.buckets[index] <= 0:
+                del self.buckets[index]
+        self.count -= other.count
+        self.sum -= other.sum
+        if self.buckets:
+            self.max = min(self.max, self.bucketUpperBound(max(self.buckets)))
+        else:
+            self.count = 0
+            self.sum = 0.0
+            self.max = 0.0
+
+    def percentile(self, percent):
+        """
+        Get the duration which the given percentage of recorded durations do
+        not exceed. This is the upper bound of the bucket holding that rank,
+        limited to the maximum duration seen.
+
+        @param percent: the percentile (0 - 100)
+        @type percent: C{float}
+        @return: duration in ms
+        @rtype: C{float}
+        """
+        if self.count <= 0:
+            return 0.0
+        rank = math.ceil(self.count * percent / 100.0)
+        total = 0
+        for index in sorted(self.buckets):
+            total += self.buckets[index]
+            if total >= rank:
+                return min(self.bucketUpperBound(index), self.max)
+        return self.max
+
+    def toDict(self):
+        """
+        Get a JSON-able version of the histogram. Buckets are keyed by their
+        upper bound, so histograms from different servers can be merged by
+        adding the counts of matching keys.
+
+        @rtype: C{dict}
+        """
+        result = {
+            "count": self.count,
+            "sum": self.sum,
+            "max": self.max,
+            "buckets": dict([
+                (repr(self.bucketUpperBound(index)), count)
+                for index, count in self.buckets.iteritems()
+            ]),
+        }
+        for name, percent in self.percentiles:
+            result[name] = self.percentile(percent)
+        return result
+
+
 class CommonAccessLoggingObserverExtensions(BaseCommonAccessLoggingObserver):
     """
     A base class for our extension to the L{BaseCommonAccessLoggingObserver}
@@ -180,6 +325,15 @@ class CommonAccessLoggingObserverExtensions(BaseCommonAccessLoggingObserver):
                     format += " fwd=%(fwd)s"
                     formatArgs["fwd"] = forwardedFor
 
+            # Component cache activity since the last request (stats only, not logged)
+            cache = componentCache()
+            if cache is not None:
+                formatArgs["component-cache"] = cache.takeCounts()
+
+            # Response cache lookup outcome (stats only, not logged)
+            if hasattr(request, "responseCacheStats"):
+                formatArgs["response-cache"] = request.responseCacheStats
+
             if formatArgs["host"] == "0.0.0.0":
                 fwdHeaders = request.headers.getRawHeaders("x-forwarded-for", "")
                 if fwdHeaders:
@@ -407,28 +561,19 @@ class RotatingFileAccessLoggingObserver(CommonAccessLoggingObserverExtensions):
             else:
                 self.stats1m = self.initStats()
 
-        # Do five minute aggregate
+        # The five minute and one hour aggregates are kept up to date as each
+        # minute completes, so they only need building from scratch once
         if self.stats5m is None:
-            self.stats5m = self.initStats()
-            index = min(6, len(self.statsByMinute))
-            for i in range(-index, -1):
-                stat = self.statsByMinute[i][1]
-                self.mergeStats(self.stats5m, stat)
-
-        # Do one hour aggregate
+            self.stats5m = self.windowStats(5)
         if self.stats1h is None:
-            self.stats1h = self.initStats()
-            index = min(61, len(self.statsByMinute))
-            for i in range(-index, -1):
-                stat = self.statsByMinute[i][1]
-                self.mergeStats(self.stats1h, stat)
+            self.stats1h = self.windowStats(60)
 
         printStats = {
             "system": self.systemStats.items,
-            "current": currentStats,
-            "1m": self.stats1m,
-            "5m": self.stats5m,
-            "1h": self.stats1h,
+            "current": self.printableStats(currentStats),
+            "1m": self.printableStats(self.stats1m),
+            "5m": self.printableStats(self.stats5m),
+            "1h": self.printableStats(self.stats1h),
         }
         return printStats
 
@@ -442,17 +587,23 @@ class RotatingFileAccessLoggingObserver(CommonAccessLoggingObserverExtensions):
             if self.statsByMinute[-1][0] != dtindex:
                 oldindex = self.statsByMinute[-1][0]
                 if oldindex != dtindex:
-                    # Adding a new minutes worth of data - clear out any cached
-                    # historical data
+                    # Adding a new minutes worth of data - the previous minute
+                    # is now the last completed one
                     self.stats1m = None
-                    self.stats5m = None
-                    self.stats1h = None
+
+                    # After a long gap it is cheaper to rebuild the aggregates
+                    if dtindex - oldindex > 60 * 60:
+                        self.stats5m = None
+                        self.stats1h = None
 
                 # Add enough new stats to account for any idle minutes between
-                # the last recorded stat and the current one
+                # the last recorded stat and the current one, moving the
+                # aggregates along as each minute completes
                 while oldindex != dtindex:
                     oldindex += 60
                     self.statsByMinute.append((oldindex, self.initStats(),))
+                    self.advanceWindowStats(self.stats5m, 5)
+                    self.advanceWindowStats(self.stats1h, 60)
         else:
             self.statsByMinute.append((dtindex, self.initStats(),))
             self.stats1m = None
@@ -467,6 +618,72 @@ class RotatingFileAccessLoggingObserver(CommonAccessLoggingObserverExtensions):
 
         return self.statsByMinute[-1][1]
 
+    def windowStats(self, minutes):
+        """
+        Build the aggregate of the given number of most recently completed
+        minutes.
+
+        @param minutes: the number of minutes to aggregate
+        @type minutes: C{int}
+        """
+        window = self.initStats()
+        window["cpu"] = 0.0
+        completed = [stat for _ignore_index, stat in self.statsByMinute[-(minutes + 1):-1]]
+        for stat in completed:
+            self.combineStats(window, stat)
+        self.updateWindowMaxima(window, completed)
+        return window
+
+    def advanceWindowStats(self, window, minutes):
+        """
+        A new minute has just been added to L{statsByMinute}: add the minute
+        which just completed to the aggregate and take out the one that is now
+        too old.
+
+        @param window: the aggregate stats, or L{None} if not built yet
+        @type window: C{dict}
+        @param minutes: the number of minutes aggregated
+        @type minutes: C{int}
+        """
+        if window is None:
+            return
+        self.combineStats(window, self.statsByMinute[-2][1])
+        if len(self.statsByMinute) > minutes + 1:
+            self.combineStats(window, self.statsByMinute[-(minutes + 2)][1], sign=-1)
+        self.updateWindowMaxima(
+            window,
+            [stat for _ignore_index, stat in self.statsByMinute[-(minutes + 1):-1]]
+        )
+
+    def updateWindowMaxima(self, window, completed):
+        """
+        Maxima cannot be subtracted, so recompute them from the minutes in the
+        aggregate.
+        """
+        window["max-slots"] = max([0] + [stat["max-slots"] for stat in completed])
+        window["T-MAX"] = max([0.0] + [stat["T-MAX"] for stat in completed])
+        for key in ("T-HIST", "T-RESP-WR-HIST", "T-SQL-HIST",):
+            window[key].max = max([0.0] + [stat[key].max for stat in completed])
+        for method, histogram in window["method-T-HIST"].items():
+            histogram.max = max([0.0] + [
+                stat["method-T-HIST"][method].max
+                for stat in completed if method in stat["method-T-HIST"]
+            ])
+
+    def printableStats(self, stats):
+        """
+        Return a copy of the stats with the latency histograms replaced by
+        their JSON-able summaries.
+        """
+        printable = dict(stats)
+        for key in ("T-HIST", "T-RESP-WR-HIST", "T-SQL-HIST",):
+            printable[key] = stats[key].toDict()
+        printable["method-T-HIST"] = dict([
+            (method, histogram.toDict())
+            for method, histogram in stats["method-T-HIST"].items()
+        ])
+        return printable
+
     def initStats(self):
 
         def initTimeHistogram():
@@ -495,9 +712,20 @@ class RotatingFileAccessLoggingObserver(CommonAccessLoggingObserverExtensions):
             "T": initTimeHistogram(),
             "T-RESP-WR": initTimeHistogram(),
             "T-MAX": 0.0,
+            "T-HIST": LatencyHistogram(),
+            "T-RESP-WR-HIST": LatencyHistogram(),
+            "T-SQL-HIST": LatencyHistogram(),
+            "method-T-HIST": collections.defaultdict(LatencyHistogram),
             "cpu": self.systemStats.items["cpu use"],
+            "component-cache": {"hit": 0, "miss": 0, "evict": 0},
+            "response-cache": {},
         }
 
+    def _responseCacheUpdate(self, current, method, stats, sign=1):
+        methodStats = current["response-cache"].setdefault(method, {"hit": 0, "miss": 0, "t-saved": 0.0})
+        for key, value in stats.items():
+            methodStats[key] += sign * value
+
     def updateStats(self, current, stats):
         # Gather specific information and aggregate into our persistent stats
         adjustedMethod = getAdjustedMethodName(stats)
@@ -516,6 +744,12 @@ class RotatingFileAccessLoggingObserver(CommonAccessLoggingObserverExtensions):
         current["slots"] += stats.get("outstandingRequests", 0)
         current["max-slots"] = max(current["max-slots"], self.limiter.maxOutstandingRequests if hasattr(self, "limiter") else 0)
         current["cpu"] += self.systemStats.items["cpu use"]
+        for key, value in stats.get("component-cache", {}).items():
+            current["component-cache"][key] += value
+        if "response-cache" in stats:
+            # Count hits and misses against the same (uncached) method name
+            cacheMethod = getAdjustedMethodName(dict([(k, v) for k, v in stats.items() if k != "cached"]))
+            self._responseCacheUpdate(current, cacheMethod, stats["response-cache"])
 
         def histogramUpdate(t, key):
             if t >= 60000.0:
@@ -534,59 +768,86 @@ class RotatingFileAccessLoggingObserver(CommonAccessLoggingObserverExtensions):
                 current[key]["<10ms"] += 1
             if t >= 1000.0:
                 current[key]["Over 1s"] += 1
-            elif t >= 10000.0:
+            if t >= 10000.0:
                 current[key]["Over 10s"] += 1
 
         t = stats.get("t", None)
         if t is not None:
             histogramUpdate(t, "T")
+            current["T-HIST"].add(t)
+            current["method-T-HIST"][adjustedMethod].add(t)
         current["T-MAX"] = max(current["T-MAX"], t)
         t = stats.get("t-resp-wr", None)
         if t is not None:
             histogramUpdate(t, "T-RESP-WR")
+            current["T-RESP-WR-HIST"].add(t)
+
+        # SQL time is an extended log item, so arrives as a string
+        try:
+            t = float(stats["sql-t"])
+        except (KeyError, TypeError, ValueError):
+            pass
+        else:
+            current["T-SQL-HIST"].add(t)
 
     def mergeStats(self, current, stats):
         # Gather specific information and aggregate into our persistent stats
         if current["requests"] == 0:
             current["cpu"] = 0.0
-        current["requests"] += stats["requests"]
-        for method in stats["method"].keys():
-            current["method"][method] += stats["method"][method]
-        for method in stats["method-t"].keys():
-            current["method-t"][method] += stats["method-t"][method]
-        current["500"] += stats["500"]
-        current["401"] += stats["401"]
-        current["t"] += stats["t"]
-        current["t-resp-wr"] += stats["t-resp-wr"]
-        current["slots"] += stats["slots"]
+        self.combineStats(current, stats)
         current["max-slots"] = max(current["max-slots"], stats["max-slots"])
-        current["cpu"] += stats["cpu"]
+        current["T-MAX"] = max(current["T-MAX"], stats["T-MAX"])
 
-        def histogramUpdate(t, key):
-            if t >= 60000.0:
-                current[key][">60s"] += 1
-            elif t >= 30000.0:
-                current[key]["30s<->60s"] += 1
-            elif t >= 10000.0:
-                current[key]["10s<->30s"] += 1
-            elif t >= 1000.0:
-                current[key]["1s<->10s"] += 1
-            elif t >= 100.0:
-                current[key]["100ms<->1s"] += 1
-            elif t >= 10.0:
-                current[key]["10ms<->100ms"] += 1
-            else:
-                current[key]["<10ms"] += 1
-            if t >= 1000.0:
-                current[key]["Over 1s"] += 1
-            elif t >= 10000.0:
-                current[key]["Over 10s"] += 1
+    def combineStats(self, current, stats, sign=1):
+        """
+        Add (or with a negative sign, subtract) the counts and times of one
+        set of stats to another. Maxima are not touched.
 
-        for bin in stats["T"].keys():
-            current["T"][bin] += stats["T"][bin]
-        current["T-MAX"] = max(current["T-MAX"], stats["T-MAX"])
-        for bin in stats["T-RESP-WR"].keys():
-            current["T-RESP-WR"][bin] += stats["T-RESP-WR"][bin]
+        @param current: the stats to update
+        @type current: C{dict}
+        @param stats: the stats to add or subtract
+        @type stats: C{dict}
+        @param sign: 1 to add, -1 to subtract
+        @type sign: C{int}
+        """
+        for key in ("requests", "500", "401", "t", "t-resp-wr", "slots", "cpu",):
+            current[key] += sign * stats[key]
+        for method in stats["method"].keys():
+            current["method"][method] += sign * stats["method"][method]
+        for method in stats["method-t"].keys():
+            current["method-t"][method] += sign * stats["method-t"][method]
+        for key, value in stats.get("component-cache", {}).items():
+            current["component-cache"][key] += sign * value
+        for method, methodStats in stats.get("response-cache", {}).items():
+            self._responseCacheUpdate(current, method, methodStats, sign)
+
+        for key in ("T", "T-RESP-WR",):
+            for bin in stats[key].keys():
+                current[key][bin] += sign * stats[key][bin]
+
+        def histogramCombine(histogram, other):
+            if sign > 0:
+                histogram.merge(other)
+            else:
+                histogram.subtract(other)
+
+        for key in ("T-HIST", "T-RESP-WR-HIST", "T-SQL-HIST",):
+            if key in stats:
+                histogramCombine(current[key], stats[key])
+        for method, histogram in stats.get("method-T-HIST", {}).items():
+            histogramCombine(current["method-T-HIST"][method], histogram)
+
+        # Drop methods no longer seen in the aggregate
+        if sign < 0:
+            for method in stats["method"].keys():
+                if current["method"][method] <= 0:
+                    del current["method"][method]
+                    current["method-t"].pop(method, None)
+                    current["method-T-HIST"].pop(method, None)
+            for method in stats.get("response-cache", {}).keys():
+                methodStats = current["response-cache"][method]
+                if methodStats["hit"] <= 0 and methodStats["miss"] <= 0:
+                    del current["response-cache"][method]
 
 
 class SystemMonitor(object):
@@ -17,10 +17,11 @@
 from calendarserver.push.ipush import PushPriority
 from calendarserver.push.util import PushScheduler
 from twext.python.log import Logger
-from twisted.internet.defer import inlineCallbacks, returnValue
+from twisted.internet.defer import inlineCallbacks, returnValue, DeferredList
 from twisted.internet.endpoints import TCP4ClientEndpoint
 from twisted.internet.protocol import Factory, ServerFactory
 from twisted.protocols import amp
+import itertools
 import time
 import uuid
 
@@ -155,6 +156,16 @@ class AMPPushMaster(object):
 
         self.subscribers = []
 
+        # Index of subscribers by pushKey, plus those subscribed to "any"
+        # pushKey, so that notifications only visit interested subscribers
+        self._subscribersByID = {}
+        self._anySubscribers = set()
+
+        # Order in which subscribers were added, which is the order they are
+        # notified in
+        self._subscriberOrder = {}
+        self._nextOrder = itertools.count()
+
         if enableStaggering:
             self.scheduler = PushScheduler(
                 reactor, self.sendNotification,
@@ -165,11 +176,69 @@ class AMPPushMaster(object):
     def addSubscriber(self, p):
         self.log.debug("Added subscriber")
         self.subscribers.append(p)
+        self._subscriberOrder[p] = next(self._nextOrder)
+
+        # Index any subscriptions made before being added
+        for id in p.subscriptions:
+            self.subscriptionAdded(p, id)
+        if p.any is not None:
+            self.subscriptionAdded(p, "any")
 
     def removeSubscriber(self, p):
         self.log.debug("Removed subscriber")
         self.subscribers.remove(p)
 
+        for id in p.subscriptions:
+            self.subscriptionRemoved(p, id)
+        self._anySubscribers.discard(p)
+        del self._subscriberOrder[p]
+
+    def subscriptionAdded(self, p, id):
+        """
+        Index a subscriber's subscription to a pushKey.
+
+        @param p: the subscriber
+        @type p: L{AMPPushNotifierProtocol}
+        @param id: the pushKey, or "any"
+        @type id: C{str}
+        """
+        if p not in self._subscriberOrder:
+            # Not added yet - will be indexed when it is
+            return
+        if id == "any":
+            self._anySubscribers.add(p)
+        else:
+            self._subscribersByID.setdefault(id, set()).add(p)
+
+    def subscriptionRemoved(self, p, id):
+        """
+        Remove a subscriber's subscription to a pushKey from the index.
+
+        @param p: the subscriber
+        @type p: L{AMPPushNotifierProtocol}
+        @param id: the pushKey
+        @type id: C{str}
+        """
+        subscribers = self._subscribersByID.get(id)
+        if subscribers is not None:
+            subscribers.discard(p)
+            if not subscribers:
+                del self._subscribersByID[id]
+
+    def subscribersForID(self, id):
+        """
+        Get the subscribers to a pushKey, in the order they were added.
+
+        @param id: the pushKey
+        @type id: C{str}
+
+        @rtype: C{list} of L{AMPPushNotifierProtocol}
+        """
+        subscribers = self._subscribersByID.get(id, set())
+        if self._anySubscribers:
+            subscribers = subscribers | self._anySubscribers
+        return sorted(subscribers, key=self._subscriberOrder.get)
+
     def enqueue(
         self, transaction, pushKey, dataChangedTimestamp=None,
         priority=PushPriority.high
@@ -192,33 +261,52 @@ class AMPPushMaster(object):
         if dataChangedTimestamp is None:
             dataChangedTimestamp = int(time.time())
 
-        tokens = []
-        for subscriber in self.subscribers:
-            token = subscriber.subscribedToID(pushKey)
-            if token is not None:
-                tokens.append(token)
-        if tokens:
-            return self.scheduleNotifications(
-                tokens, pushKey,
-                dataChangedTimestamp, priority)
+        subscribers = self.subscribersForID(pushKey)
+        if not subscribers:
+            return
+
+        if self.scheduler is not None:
+            tokens = [subscriber.subscribedToID(pushKey) for subscriber in subscribers]
+            self.scheduler.schedule(tokens, pushKey, dataChangedTimestamp, priority)
+        else:
+            # Each subscriber is notified once, without waiting for the others
+            return self._notifySubscribers(
+                [(subscriber, subscriber.subscribedToID(pushKey)) for subscriber in subscribers],
+                pushKey, dataChangedTimestamp, priority
+            )
 
-    @inlineCallbacks
     def sendNotification(self, token, id, dataChangedTimestamp, priority):
-        for subscriber in self.subscribers:
-            if subscriber.subscribedToID(id):
-                yield subscriber.notify(
-                    token, id, dataChangedTimestamp,
-                    priority)
+        return self._notifySubscribers(
+            [(subscriber, token) for subscriber in self.subscribersForID(id)],
+            id, dataChangedTimestamp, priority
+        )
+
+    def _notifySubscribers(self, notifications, id, dataChangedTimestamp, priority):
+        """
+        Send a notification to a batch of subscribers. The notifications are all
+        sent before waiting for any responses, and a failure to notify one
+        subscriber does not prevent the others being notified.
+
+        @param notifications: the subscribers and the token to notify each with
+        @type notifications: C{list} of C{tuple}
+
+        @return: a L{Deferred} that fires when all subscribers have responded
+        """
+        ds = []
+        for subscriber, token in notifications:
+            d = subscriber.notify(token, id, dataChangedTimestamp, priority)
+            if d is not None:
+                ds.append(d)
+        return DeferredList(ds, consumeErrors=True)
 
-    @inlineCallbacks
     def scheduleNotifications(self, tokens, id, dataChangedTimestamp, priority):
         if self.scheduler is not None:
             self.scheduler.schedule(tokens, id, dataChangedTimestamp, priority)
         else:
-            for token in tokens:
-                yield self.sendNotification(
-                    token, id, dataChangedTimestamp,
-                    priority)
+            return DeferredList([
+                self.sendNotification(token, id, dataChangedTimestamp, priority)
+                for token in tokens
+            ])
 
 
 class AMPPushNotifierProtocol(amp.AMP):
@@ -235,6 +323,7 @@ class AMPPushNotifierProtocol(amp.AMP):
             self.any = token
         else:
             self.subscriptions[id] = token
+        self.service.subscriptionAdded(self, id)
         return {"status": "OK"}
     SubscribeToID.responder(subscribe)
 
@@ -243,6 +332,8 @@ class AMPPushNotifierProtocol(amp.AMP):
             del self.subscriptions[id]
         except KeyError:
             pass
+        else:
+            self.service.subscriptionRemoved(self, id)
         return {"status": "OK"}
     UnsubscribeFromID.responder(unsubscribe)
 
@@ -17,6 +17,7 @@
 from calendarserver.push.amppush import AMPPushMaster, AMPPushNotifierProtocol
 from calendarserver.push.amppush import NotificationForID
 from twistedcaldav.test.util import StoreTestCase
+from twisted.internet.defer import fail
 from twisted.internet.task import Clock
 from calendarserver.push.ipush import PushPriority
 
@@ -177,6 +178,85 @@ class AMPPushMasterTests(StoreTestCase):
         )
 
 
+    def test_subscriberIndex(self):
+        """
+        The pushKey index is maintained on subscribe, unsubscribe and loss of
+        connection, and lists subscribers in the order they were added.
+        """
+
+        service = AMPPushMaster(None, None, 0, False, 0, reactor=Clock())
+
+        client1 = TestProtocol(service)
+        client1.subscribe("token1", "/CalDAV/localhost/user01/")
+        service.addSubscriber(client1)
+
+        client2 = TestProtocol(service)
+        service.addSubscriber(client2)
+        client2.subscribe("token2", "/CalDAV/localhost/user01/")
+        client2.subscribe("token2", "/CalDAV/localhost/user02/")
+
+        client3 = TestProtocol(service)
+        service.addSubscriber(client3)
+        client3.subscribe("token3", "any")
+
+        self.assertEqual(service.subscribersForID("/CalDAV/localhost/user01/"), [client1, client2, client3])
+        self.assertEqual(service.subscribersForID("/CalDAV/localhost/user02/"), [client2, client3])
+        self.assertEqual(service.subscribersForID("/CalDAV/localhost/user03/"), [client3])
+
+        client2.unsubscribe("/CalDAV/localhost/user01/")
+        self.assertEqual(service.subscribersForID("/CalDAV/localhost/user01/"), [client1, client3])
+
+        client3.connectionLost()
+        self.assertEqual(service.subscribersForID("/CalDAV/localhost/user01/"), [client1])
+        self.assertEqual(service.subscribersForID("/CalDAV/localhost/user03/"), [])
+
+        client2.connectionLost()
+        self.assertEqual(service.subscribersForID("/CalDAV/localhost/user02/"), [])
+        self.assertEqual(service._subscribersByID.keys(), ["/CalDAV/localhost/user01/"])
+        self.assertEqual(service.subscribers, [client1])
+
+    def test_notifyEachSubscriberOnce(self):
+        """
+        Without staggering each subscriber is notified once, even when several
+        subscribers share a token, and one failing subscriber does not stop the
+        others being notified.
+        """
+
+        service = AMPPushMaster(None, None, 0, False, 0, reactor=Clock())
+
+        client1 = FailingTestProtocol(service)
+        client1.subscribe("token1", "/CalDAV/localhost/user01/")
+        service.addSubscriber(client1)
+
+        client2 = TestProtocol(service)
+        client2.subscribe("token1", "/CalDAV/localhost/user01/")
+        service.addSubscriber(client2)
+
+        client3 = TestProtocol(service)
+        client3.subscribe("token3", "/CalDAV/localhost/user02/")
+        service.addSubscriber(client3)
+
+        service.enqueue(
+            None, "/CalDAV/localhost/user01/",
+            dataChangedTimestamp=1354815999,
+            priority=PushPriority.high)
+        self.assertEqual(len(client1.history), 1)
+        self.assertEqual(
+            client2.history,
+            [
+                (
+                    NotificationForID,
+                    {
+                        'id': '/CalDAV/localhost/user01/',
+                        'dataChangedTimestamp': 1354815999,
+                        'priority': PushPriority.high.value,
+                    }
+                )
+            ]
+        )
+        self.assertEqual(client3.history, [])
+
+
 class TestProtocol(AMPPushNotifierProtocol):
 
     def __init__(self, service):
@@ -188,3 +268,10 @@ class TestProtocol(AMPPushNotifierProtocol):
 
     def reset(self):
         self.history = []
+
+
+class FailingTestProtocol(TestProtocol):
+
+    def callRemote(self, cls, **kwds):
+        super(FailingTestProtocol, self).callRemote(cls, **kwds)
+        return fail(RuntimeError("Connection gone"))
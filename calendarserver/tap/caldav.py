@@ -24,6 +24,7 @@ __all__ = [
 
 import sys
 from collections import OrderedDict
+from weakref import WeakSet
 from os import getuid, getgid, geteuid, umask, remove, environ, stat, chown, W_OK
 from os.path import exists, basename
 import signal
@@ -79,6 +80,7 @@ from calendarserver.tools.util import checkDirectory
 from txweb2.channel.http import (
     LimitingHTTPFactory, SSLRedirectRequest, HTTPChannel
 )
+from txweb2.dav import util as davutil
 from txweb2.metafd import ConnectionLimiter, ReportingHTTPService
 from txweb2.server import Site
 
@@ -1049,6 +1051,9 @@ class CalDAVServiceMaker (object):
         HTTPChannel.idleTimeOut = config.IdleConnectionTimeOut
         HTTPChannel.closeTimeOut = config.CloseConnectionTimeOut
 
+        # Limit the size of XML request bodies, which are parsed as they arrive
+        davutil.maxXMLBodySize = config.MaxXMLRequestBodySize
+
         # Add the Strict-Transport-Security header to all secured requests
         # if enabled.
         if config.StrictTransportSecuritySeconds:
@@ -1150,9 +1155,21 @@ class CalDAVServiceMaker (object):
                     # 'SSL' tag on it, since that's the only time it's used.
                     contextFactory = None
 
+            # Track open store transactions for load reports to the master
+            openTransactions = WeakSet()
+
+            def trackTransaction(txn):
+                openTransactions.add(txn)
+                txn.postCommit(lambda: openTransactions.discard(txn))
+                txn.postAbort(lambda: openTransactions.discard(txn))
+
+            store.callWithNewTransactions(trackTransaction)
+
             reportingService = ReportingHTTPService(
                 requestFactory, int(config.MetaFD), contextFactory,
                 usingSocketFile=config.SocketFiles.Enabled,
+                loadReportInterval=config.LoadReportInterval,
+                openTransactions=lambda: len(openTransactions),
             )
             reportingService.setName("http-{}".format(int(config.MetaFD)))
             reportingService.setServiceParent(connectionService)
@@ -274,6 +274,16 @@ def storeFromConfig(config, txnFactory, directoryService):
             uri = "https://{config.ServerHostName}:{config.HTTPPort}".format(config=config)
         attachments_uri = uri + "/calendars/__uids__/%(home)s/dropbox/%(dropbox_id)s/%(name)s"
         from txdav.common.datastore.sql import CommonDataStore as CommonSQLDataStore
+        from txdav.common.datastore.sql import SQLTracer
+        if config.LogDatabase.Tracing.Enabled:
+            sqlTracer = SQLTracer(
+                slowSeconds=config.LogDatabase.Tracing.SlowSeconds,
+                sampleRate=config.LogDatabase.Tracing.SampleRate,
+                maxStatements=config.LogDatabase.Tracing.MaxStatements,
+                bufferSize=config.LogDatabase.Tracing.BufferSize,
+            )
+        else:
+            sqlTracer = None
         store = CommonSQLDataStore(
             txnFactory, notifierFactories,
             directoryService,
@@ -287,6 +297,7 @@ def storeFromConfig(config, txnFactory, directoryService):
             logSQL=config.LogDatabase.SQLStatements,
             logTransactionWaits=config.LogDatabase.TransactionWaitSeconds,
             timeoutTransactions=config.TransactionTimeoutSeconds,
+            sqlTracer=sqlTracer,
             cacheQueries=config.QueryCaching.Enabled,
             cachePool=config.QueryCaching.MemcachedPool,
             cacheExpireSeconds=config.QueryCaching.ExpireSeconds
@@ -16,11 +16,12 @@
 
 from twisted.trial.unittest import TestCase
 from calendarserver.accesslog import SystemMonitor, \
-    RotatingFileAccessLoggingObserver
+    RotatingFileAccessLoggingObserver, LatencyHistogram
 from twistedcaldav.stdconfig import config as stdconfig
 from twistedcaldav.config import config
 import time
 import collections
+import json
 
 hasattr(stdconfig, "Servers")   # Quell pyflakes
 
@@ -174,3 +175,181 @@ class AccessLog(TestCase):
         observer.stop()
         self.assertTrue("uid" not in stats)
         self.assertTrue("user-agent" not in stats)
+
+    def test_componentCacheStats(self):
+        """
+        Make sure component cache counters are aggregated into the
+        L{RotatingFileAccessLoggingObserver} stats data.
+        """
+
+        logpath = self.mktemp()
+        observer = RotatingFileAccessLoggingObserver(logpath)
+        observer.systemStats = SystemMonitor()
+        observer.start()
+
+        request = {
+            "method": "GET",
+            "uri": "/index.html",
+            "statusCode": 200,
+            "t": 10.0,
+        }
+        current = observer.initStats()
+        observer.updateStats(current, dict(request, **{"component-cache": {"hit": 2, "miss": 1, "evict": 0}}))
+        observer.updateStats(current, dict(request, **{"component-cache": {"hit": 1, "miss": 0, "evict": 1}}))
+        observer.updateStats(current, request)
+        self.assertEqual(current["component-cache"], {"hit": 3, "miss": 1, "evict": 1})
+
+        merged = observer.initStats()
+        observer.mergeStats(merged, current)
+        observer.mergeStats(merged, current)
+        observer.stop()
+        self.assertEqual(merged["component-cache"], {"hit": 6, "miss": 2, "evict": 2})
+
+    def test_responseCacheStats(self):
+        """
+        Make sure response cache hits, misses and time saved are aggregated per
+        method into the L{RotatingFileAccessLoggingObserver} stats data.
+        """
+
+        logpath = self.mktemp()
+        observer = RotatingFileAccessLoggingObserver(logpath)
+        observer.systemStats = SystemMonitor()
+        observer.start()
+
+        request = {
+            "method": "PROPFIND",
+            "uri": "/calendars/__uids__/user01/",
+            "statusCode": 207,
+            "t": 10.0,
+        }
+        current = observer.initStats()
+        observer.updateStats(current, dict(request, **{"response-cache": {"hit": 0, "miss": 1, "t-saved": 0.0}}))
+        observer.updateStats(current, dict(request, **{"cached": "1", "response-cache": {"hit": 1, "miss": 0, "t-saved": 90.0}}))
+        observer.updateStats(current, dict(request, **{"cached": "1", "response-cache": {"hit": 1, "miss": 0, "t-saved": 80.0}}))
+        observer.updateStats(current, request)
+        self.assertEqual(current["response-cache"], {
+            "PROPFIND Calendar Home": {"hit": 2, "miss": 1, "t-saved": 170.0},
+        })
+
+        merged = observer.initStats()
+        observer.mergeStats(merged, current)
+        observer.mergeStats(merged, current)
+        observer.stop()
+        self.assertEqual(merged["response-cache"], {
+            "PROPFIND Calendar Home": {"hit": 4, "miss": 2, "t-saved": 340.0},
+        })
+
+    def test_latencyHistogram(self):
+        """
+        L{LatencyHistogram} buckets durations to within 1/8th of their size and
+        produces percentiles that merge and subtract correctly.
+        """
+
+        for value in (0.01, 0.125, 0.9, 1.0, 3.7, 100.0, 1234.5, 60000.0):
+            index = LatencyHistogram.bucketIndex(value)
+            upper = LatencyHistogram.bucketUpperBound(index)
+            self.assertTrue(value < upper)
+            if index > 0:
+                self.assertTrue(value >= LatencyHistogram.bucketUpperBound(index - 1))
+                self.assertTrue(upper <= value * 1.125 + 1e-9)
+
+        fast = LatencyHistogram()
+        for _ignore in range(90):
+            fast.add(10.0)
+        slow = LatencyHistogram()
+        for _ignore in range(10):
+            slow.add(1000.0)
+
+        total = LatencyHistogram()
+        total.merge(fast)
+        total.merge(slow)
+        self.assertEqual(total.count, 100)
+        self.assertEqual(total.sum, 10900.0)
+        self.assertEqual(total.max, 1000.0)
+        self.assertTrue(10.0 <= total.percentile(50.0) <= 11.25)
+        self.assertTrue(10.0 <= total.percentile(90.0) <= 11.25)
+        self.assertEqual(total.percentile(99.0), 1000.0)
+
+        total.subtract(slow)
+        self.assertEqual(total.count, 90)
+        self.assertTrue(10.0 <= total.max <= 11.25)
+        self.assertTrue(10.0 <= total.percentile(99.0) <= 11.25)
+
+        total.subtract(fast)
+        self.assertEqual(total.count, 0)
+        self.assertEqual(total.percentile(50.0), 0.0)
+
+    def test_latencyStats(self):
+        """
+        Make sure L{RotatingFileAccessLoggingObserver} stats data include
+        latency histograms that can be serialized, and that requests over 10s
+        are counted.
+        """
+
+        logpath = self.mktemp()
+        observer = RotatingFileAccessLoggingObserver(logpath)
+        observer.systemStats = SystemMonitor()
+        observer.start()
+
+        request = {
+            "method": "GET",
+            "uri": "/index.html",
+            "statusCode": 200,
+            "t": 10.0,
+            "t-resp-wr": 1.0,
+            "sql-t": "2.5",
+        }
+        current = observer.initStats()
+        observer.updateStats(current, request)
+        observer.updateStats(current, dict(request, **{"t": 20000.0, "sql-t": "-"}))
+        observer.stop()
+
+        self.assertEqual(current["T"]["Over 1s"], 1)
+        self.assertEqual(current["T"]["Over 10s"], 1)
+        self.assertEqual(current["T-HIST"].count, 2)
+        self.assertEqual(current["T-RESP-WR-HIST"].count, 2)
+        self.assertEqual(current["T-SQL-HIST"].count, 1)
+        self.assertEqual(current["method-T-HIST"]["GET"].count, 2)
+
+        printable = json.loads(json.dumps(observer.printableStats(current)))
+        self.assertEqual(printable["T-HIST"]["count"], 2)
+        self.assertEqual(printable["T-HIST"]["max"], 20000.0)
+        self.assertEqual(printable["T-HIST"]["p99"], 20000.0)
+        self.assertEqual(sum(printable["T-HIST"]["buckets"].values()), 2)
+        self.assertEqual(printable["method-T-HIST"]["GET"]["count"], 2)
+
+    def test_windowStats(self):
+        """
+        Make sure the five minute and one hour aggregates in
+        L{RotatingFileAccessLoggingObserver} are kept up to date incrementally
+        as new minutes are added.
+        """
+
+        logpath = self.mktemp()
+        observer = RotatingFileAccessLoggingObserver(logpath)
+        observer.systemStats = SystemMonitor()
+        observer.start()
+
+        observer.statsByMinute.append((0, observer.initStats(),))
+        observer.stats5m = observer.windowStats(5)
+        observer.stats1h = observer.windowStats(60)
+        for i in range(70):
+            stats = observer.statsByMinute[-1][1]
+            for _ignore in range(i % 3):
+                observer.updateStats(stats, {
+                    "method": "GET" if i % 2 else "PUT",
+                    "uri": "/index.html",
+                    "statusCode": 200,
+                    "t": float(i),
+                })
+            observer.statsByMinute.append(((i + 1) * 60, observer.initStats(),))
+            observer.advanceWindowStats(observer.stats5m, 5)
+            observer.advanceWindowStats(observer.stats1h, 60)
+        observer.stop()
+
+        for window, minutes in ((observer.stats5m, 5), (observer.stats1h, 60),):
+            rebuilt = observer.windowStats(minutes)
+            window = observer.printableStats(window)
+            rebuilt = observer.printableStats(rebuilt)
+            for key in ("requests", "t", "method", "method-t", "T", "T-MAX", "T-HIST", "method-T-HIST",):
+                self.assertEqual(window[key], rebuilt[key], msg="{} {}".format(minutes, key))
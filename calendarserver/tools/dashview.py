@@ -30,6 +30,7 @@ import errno
 import fcntl
 import json
 import logging
+import math
 import os
 import sched
 import socket
@@ -118,6 +119,28 @@ def defaultIfNone(x, default):
     return x if x is not None else default
 
 
+def histogramPercentile(histogram, percent):
+    """
+    Get a percentile from a latency histogram as returned in the stats. The
+    buckets are keyed by their upper bound in ms.
+
+    @param histogram: the histogram
+    @type histogram: L{dict}
+    @param percent: the percentile (0 - 100)
+    @type percent: L{float}
+    """
+    count = histogram.get("count", 0)
+    if count <= 0:
+        return 0.0
+    rank = math.ceil(count * percent / 100.0)
+    total = 0
+    for bound, bucketCount in sorted([(float(k), v) for k, v in histogram["buckets"].items()]):
+        total += bucketCount
+        if total >= rank:
+            return min(bound, histogram["max"])
+    return histogram["max"]
+
+
 def terminal_size():
     h, w, _ignore_hp, _ignore_wp = struct.unpack(
         'HHHH',
@@ -564,6 +587,12 @@ class Aggregator(object):
             for operation_name, operation_details in server_data.items():
                 if operation_name not in results:
                     results[operation_name] = operation_details
+                elif isinstance(results[operation_name], dict):
+                    # Latency histograms: {command: {bucket: count}}
+                    for command, buckets in operation_details.items():
+                        merged = results[operation_name].setdefault(command, {})
+                        for bucket, count in buckets.items():
+                            merged[bucket] = merged.get(bucket, 0) + count
                 elif isinstance(results[operation_name], list):
                     results[operation_name][0] += operation_details[0]
                     results[operation_name][1] += operation_details[1]
@@ -628,6 +657,20 @@ class Aggregator(object):
             if key in serversdata[0]:
                 results[key] = Aggregator.dictValueSums(map(itemgetter(key), serversdata))
 
+        # Latency histograms
+        for key in ("T-HIST", "T-RESP-WR-HIST", "T-SQL-HIST",):
+            if key in serversdata[0]:
+                results[key] = Aggregator.histogramSums(map(itemgetter(key), serversdata))
+        if "method-T-HIST" in serversdata[0]:
+            methods = defaultdict(list)
+            for serverdata in serversdata:
+                for method, histogram in serverdata["method-T-HIST"].items():
+                    methods[method].append(histogram)
+            results["method-T-HIST"] = dict([
+                (method, Aggregator.histogramSums(histograms))
+                for method, histograms in methods.items()
+            ])
+
         return results
 
     @staticmethod
@@ -668,6 +711,23 @@ class Aggregator(object):
 
         return results
 
+    @staticmethod
+    def histogramSums(listOfHistograms):
+        """
+        Merge a list of latency histograms.
+
+        @param listOfHistograms: list of histograms to merge
+        @type listOfHistograms: L{list} of L{dict}
+        """
+        results = {"count": 0, "sum": 0.0, "max": 0.0, "buckets": {}}
+        for histogram in listOfHistograms:
+            results["count"] += histogram["count"]
+            results["sum"] += histogram["sum"]
+            results["max"] = max(results["max"], histogram["max"])
+            for bound, count in histogram["buckets"].items():
+                results["buckets"][bound] = results["buckets"].get(bound, 0) + count
+        return results
+
     @staticmethod
     def dictValueSums(listOfDicts):
         """
@@ -1077,6 +1137,102 @@ class RequestStatsWindow(BaseWindow):
         self.lastResult = records
 
 
+class LatencyWindow(BaseWindow):
+    """
+    Displays request latency percentiles.
+    """
+
+    help = "Request Latency"
+    clientItem = "stats"
+    stats_keys = ("current", "1m", "5m", "1h",)
+    histograms = (
+        ("Response", "T-HIST",),
+        ("Write", "T-RESP-WR-HIST",),
+        ("SQL", "T-SQL-HIST",),
+    )
+    percentiles = (50.0, 90.0, 99.0, 99.9,)
+
+    windowTitle = "Request Latency"
+    formatWidth = 80
+    additionalRows = 4
+
+    def updateRowCount(self):
+        self.rowCount = len(self.stats_keys) * len(self.histograms)
+
+    def update(self):
+        records = defaultIfNone(self.clientData(), {})
+        self.iter += 1
+
+        s1 = " {:<8}{:<10}{:>8}{:>10}{:>10}{:>10}{:>10}{:>10} ".format(
+            "Period", "Time", "Count", "p50", "p90", "p99", "p99.9", "Max"
+        )
+        s2 = " {:<8}{:<10}{:>8}{:>10}{:>10}{:>10}{:>10}{:>10} ".format(
+            "", "", "", "(ms)", "(ms)", "(ms)", "(ms)", "(ms)"
+        )
+        pt = self.tableHeader((s1, s2,), len(records))
+
+        for key in self.stats_keys:
+            for title, item in self.histograms:
+                histogram = records.get(key, {}).get(item, {"count": 0, "max": 0.0, "buckets": {}})
+                items = [key, title, histogram["count"]]
+                items.extend([histogramPercentile(histogram, percent) for percent in self.percentiles])
+                items.append(histogram["max"])
+                s = " {:<8}{:<10}{:>8}{:>10.1f}{:>10.1f}{:>10.1f}{:>10.1f}{:>10.1f} ".format(*items)
+                self.tableRow(s, pt)
+
+        self.window.refresh()
+
+        self.lastResult = records
+
+
+class MethodLatencyWindow(BaseWindow):
+    """
+    Displays request latency percentiles per method over the last five minutes.
+    """
+
+    help = "Method Latency"
+    clientItem = "stats"
+    stats_key = "5m"
+    percentiles = (50.0, 90.0, 99.0, 99.9,)
+
+    windowTitle = "Method Latency (5m)"
+    formatWidth = 100
+    additionalRows = 4
+
+    def methods(self):
+        stats = defaultIfNone(self.clientData(), {})
+        return stats.get(self.stats_key, {}).get("method-T-HIST", {})
+
+    def updateRowCount(self):
+        self.rowCount = len(self.methods())
+
+    def update(self):
+        records = self.methods()
+        if len(records) != self.rowCount:
+            self.needsReset = True
+            return
+        self.iter += 1
+
+        s1 = " {:<40}{:>8}{:>10}{:>10}{:>10}{:>10}{:>10} ".format(
+            "Method", "Count", "p50", "p90", "p99", "p99.9", "Max"
+        )
+        s2 = " {:<40}{:>8}{:>10}{:>10}{:>10}{:>10}{:>10} ".format(
+            "", "", "(ms)", "(ms)", "(ms)", "(ms)", "(ms)"
+        )
+        pt = self.tableHeader((s1, s2,), len(records))
+
+        for method, histogram in sorted(records.items(), key=lambda x: x[0]):
+            items = [method, histogram["count"]]
+            items.extend([histogramPercentile(histogram, percent) for percent in self.percentiles])
+            items.append(histogram["max"])
+            s = " {:<40}{:>8}{:>10.1f}{:>10.1f}{:>10.1f}{:>10.1f}{:>10.1f} ".format(*items)
+            self.tableRow(s, pt)
+
+        self.window.refresh()
+
+        self.lastResult = records
+
+
 class HTTPSlotsWindow(BaseWindow):
     """
     Displays the status of the server's master process worker slave slots.
@@ -1086,7 +1242,7 @@ class HTTPSlotsWindow(BaseWindow):
     clientItem = "slots"
 
     windowTitle = "HTTP Slots"
-    formatWidth = 72
+    formatWidth = 96
     additionalRows = 5
 
     def updateRowCount(self):
@@ -1100,9 +1256,10 @@ class HTTPSlotsWindow(BaseWindow):
             return
         self.iter += 1
 
-        s = " {:>4}{:>8}{:>8}{:>8}{:>8}{:>8}{:>8}{:>8}{:>8} ".format(
+        s = " {:>4}{:>8}{:>8}{:>8}{:>8}{:>8}{:>8}{:>8}{:>8}{:>8}{:>8}{:>8} ".format(
             "Slot", "unack", "ack", "uncls", "total",
-            "start", "strting", "stopped", "abd"
+            "start", "strting", "stopped", "abd",
+            "age-ms", "lag-ms", "txns",
         )
         pt = self.tableHeader((s,), len(records))
 
@@ -1111,7 +1268,7 @@ class HTTPSlotsWindow(BaseWindow):
                 record["slot"] in self.lastResult and
                 self.lastResult[record["slot"]] != record
             )
-            s = " {:>4}{:>8}{:>8}{:>8}{:>8}{:>8}{:>8}{:>8}{:>8} ".format(
+            s = " {:>4}{:>8}{:>8}{:>8}{:>8}{:>8}{:>8}{:>8}{:>8}{:>8}{:>8}{:>8} ".format(
                 record["slot"],
                 record["unacknowledged"],
                 record["acknowledged"],
@@ -1121,6 +1278,9 @@ class HTTPSlotsWindow(BaseWindow):
                 record["starting"],
                 record["stopped"],
                 record["abandoned"],
+                record.get("requestAge", 0),
+                record.get("reactorLag", 0),
+                record.get("transactions", 0),
             )
             count = record["unacknowledged"] + record["acknowledged"]
             self.tableRow(
@@ -1394,6 +1554,17 @@ class DirectoryStatsWindow(BaseWindow):
     formatWidth = 89
     additionalRows = 8
 
+    def clientData(self, item=None):
+        # Latency histograms are not shown in this table
+        records = super(DirectoryStatsWindow, self).clientData(item)
+        if records is None:
+            return None
+        return dict([
+            (methodName, result)
+            for methodName, result in records.items()
+            if not isinstance(result, dict)
+        ])
+
     def updateRowCount(self):
         self.rowCount = len(defaultIfNone(self.clientData(), {}))
 
@@ -1469,6 +1640,8 @@ Dashboard.registerWindow(SystemWindow, "s")
 Dashboard.registerWindow(RequestStatsWindow, "r")
 Dashboard.registerWindow(HTTPSlotsWindow, "c")
 Dashboard.registerWindow(MethodsWindow, "m")
+Dashboard.registerWindow(LatencyWindow, "l")
+Dashboard.registerWindow(MethodLatencyWindow, "L")
 Dashboard.registerWindow(AssignmentsWindow, "w")
 Dashboard.registerWindow(JobsWindow, "j")
 Dashboard.registerWindow(DirectoryStatsWindow, "d")
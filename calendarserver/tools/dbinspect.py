@@ -751,6 +751,32 @@ class EventsInTimerange(Cmd):
             print(ical_data.getTextWithoutTimezones())
 
 
+class VerifyHomeSyncToken(Cmd):
+
+    _name = "Verify (and repair) cached Calendar Home sync token"
+
+    @inlineCallbacks
+    def doIt(self, txn):
+
+        uid = raw_input("Owner UID/Name: ")
+        uid = yield UIDFromInput(txn, uid)
+        home = yield txn.calendarHomeWithUID(uid)
+        if home is None:
+            print("Could not find calendar home")
+            returnValue(None)
+
+        cached, revision = yield home.verifySyncTokenRevision(repair=True)
+
+        table = tables.Table()
+        table.addRow(("Home:", uid,))
+        table.addRow(("Cached Revision:", cached if cached is not None else "-",))
+        table.addRow(("Actual Revision:", revision,))
+        print("\n")
+        table.printTable()
+        if cached is not None and cached != revision:
+            print("Cached revision was invalid and has been reset")
+
+
 class Purge(Cmd):
 
     _name = "Purge all data from tables"
@@ -853,6 +879,7 @@ class DBInspectService(WorkerService, object):
         self.registerCommand(EventsByPath)
         self.registerCommand(EventsByContent)
         self.registerCommand(EventsInTimerange)
+        self.registerCommand(VerifyHomeSyncToken)
         self.doDBInspect()
 
         return succeed(None)
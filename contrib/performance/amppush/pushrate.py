@@ -0,0 +1,143 @@
+##
+# Copyright (c) 2017 Apple Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+##
+
+"""
+Measure the rate at which the AMP push master can fan out notifications, as
+the number of connected subscribers grows. Subscribers are in-process stubs, so
+this measures the master's own cost of finding and notifying subscribers, not
+network I/O.
+
+Each subscriber subscribes to its own calendar home pushKey, and a fraction of
+them also subscribe to one popular shared calendar pushKey. Two rates are
+reported for each subscriber count: pushes to individual homes (one interested
+subscriber each) and pushes to the shared calendar.
+"""
+
+from __future__ import print_function
+
+from getopt import getopt, GetoptError
+import os
+import sys
+import time
+
+from twisted.internet.task import Clock
+
+from calendarserver.push.amppush import AMPPushMaster, AMPPushNotifierProtocol
+from calendarserver.push.ipush import PushPriority
+
+
+class StubSubscriber(AMPPushNotifierProtocol):
+    """
+    A subscriber that counts notifications rather than sending them.
+    """
+
+    def __init__(self, service):
+        super(StubSubscriber, self).__init__(service)
+        self.count = 0
+
+    def callRemote(self, command, **kwargs):
+        self.count += 1
+
+
+def makeMaster(subscriberCount, sharedFraction):
+    master = AMPPushMaster(None, None, 0, False, 0, reactor=Clock())
+    sharedEvery = int(1 / sharedFraction) if sharedFraction else 0
+    for i in xrange(subscriberCount):
+        subscriber = StubSubscriber(master)
+        master.addSubscriber(subscriber)
+        subscriber.subscribe("token%05d" % (i,), "/CalDAV/localhost/user%05d/" % (i,))
+        if sharedEvery and i % sharedEvery == 0:
+            subscriber.subscribe("token%05d" % (i,), "/CalDAV/localhost/shared/calendar/")
+    return master
+
+
+def pushRate(master, pushKeys, duration):
+    """
+    Push to the given pushKeys in turn for C{duration} seconds.
+
+    @return: pushes per second
+    @rtype: C{float}
+    """
+    pushes = 0
+    start = time.time()
+    end = start + duration
+    while time.time() < end:
+        for pushKey in pushKeys:
+            master.enqueue(None, pushKey, dataChangedTimestamp=0, priority=PushPriority.high)
+        pushes += len(pushKeys)
+    return pushes / (time.time() - start)
+
+
+def usage(e=None):
+    name = os.path.basename(sys.argv[0])
+    print("usage: %s [options]" % (name,))
+    print("")
+    print("options:")
+    print("  -h --help: print this help and exit")
+    print("  -c: comma separated subscriber counts [100,1000,5000,10000]")
+    print("  -f: fraction of subscribers to the shared calendar [0.1]")
+    print("  -t: seconds to run each measurement for [2]")
+    print("")
+    print("This tool measures AMP push notifications per second against the")
+    print("number of connected subscribers.")
+
+    if e:
+        sys.exit(64)
+    else:
+        sys.exit(0)
+
+
+def main():
+    try:
+        (optargs, _ignore_args) = getopt(
+            sys.argv[1:], "hc:f:t:", [
+                "help",
+            ],
+        )
+    except GetoptError, e:
+        usage(e)
+
+    counts = (100, 1000, 5000, 10000,)
+    sharedFraction = 0.1
+    duration = 2.0
+
+    for opt, arg in optargs:
+        if opt in ("-h", "--help"):
+            usage()
+
+        elif opt == "-c":
+            counts = [int(count) for count in arg.split(",")]
+
+        elif opt == "-f":
+            sharedFraction = float(arg)
+
+        elif opt == "-t":
+            duration = float(arg)
+
+        else:
+            raise NotImplementedError(opt)
+
+    print("Subscribers\tHome pushes/s\tShared pushes/s")
+    for count in counts:
+        master = makeMaster(count, sharedFraction)
+        homeKeys = ["/CalDAV/localhost/user%05d/" % (i,) for i in xrange(0, count, max(count // 100, 1))]
+        homeRate = pushRate(master, homeKeys, duration)
+        sharedRate = pushRate(master, ["/CalDAV/localhost/shared/calendar/"], duration)
+        print("{}\t{:.0f}\t{:.0f}".format(count, homeRate, sharedRate))
+
+
+if __name__ == "__main__":
+    main()
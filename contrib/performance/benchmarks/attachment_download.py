@@ -0,0 +1,124 @@
+##
+# Copyright (c) 2017 Apple Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+##
+
+"""
+Benchmark downloading a managed attachment. The scaling parameter is the
+attachment size in MB, e.g. C{--parameters attachment_download:100} for a
+100 MB attachment (the server's MaximumAttachmentSize and quota must allow
+it). Besides full downloads this measures resuming a download half way
+through with a Range request, and checks that a conditional GET using the
+attachment's ETag is answered with a 304.
+"""
+
+from time import time
+from urllib2 import HTTPDigestAuthHandler
+from urlparse import urljoin
+
+from twisted.internet import reactor
+from twisted.internet.defer import inlineCallbacks, returnValue
+from twisted.web.client import Agent
+from twisted.web.http import CREATED, NOT_MODIFIED, OK, PARTIAL_CONTENT
+from twisted.web.http_headers import Headers
+
+from contrib.performance.httpauth import AuthHandlerAgent
+from contrib.performance.httpclient import StringProducer, readBody
+from contrib.performance.stats import Duration
+
+from contrib.performance.benchlib import CalDAVAccount
+from contrib.performance.benchmarks.find_events import uploadEvents
+
+MB = 1024 * 1024
+
+
+@inlineCallbacks
+def measure(host, port, dtrace, attachmentSize, samples):
+    user = password = "user14"
+    root = "/"
+    principal = "/"
+
+    uri = "http://%s:%d/" % (host, port)
+    authinfo = HTTPDigestAuthHandler()
+    authinfo.add_password(
+        realm="Test Realm",
+        uri=uri,
+        user=user,
+        passwd=password)
+    agent = AuthHandlerAgent(Agent(reactor), authinfo)
+
+    account = CalDAVAccount(
+        agent,
+        "%s:%d" % (host, port),
+        user=user, password=password,
+        root=root, principal=principal)
+    cal = "calendars/users/%s/attachment-download/" % (user,)
+    yield account.deleteResource("/" + cal)
+    yield account.makeCalendar("/" + cal)
+
+    # One event with one attachment of the requested size
+    yield uploadEvents(1, agent, uri, cal)
+    size = attachmentSize * MB
+    response = yield agent.request(
+        'POST',
+        '%s%s0.ics?action=attachment-add' % (uri, cal),
+        Headers({
+            "content-type": ["application/octet-stream"],
+            "content-disposition": ["attachment;filename=benchmark.bin"],
+        }),
+        StringProducer("x" * size))
+    if response.code != CREATED:
+        raise Exception("POST received unexpected response code: %d" % (response.code,))
+    yield readBody(response)
+    location = urljoin(uri, response.headers.getRawHeaders("location")[0])
+
+    @inlineCallbacks
+    def download(headers, expectedCode):
+        before = time()
+        response = yield agent.request('GET', location, Headers(headers))
+        if response.code != expectedCode:
+            raise Exception("GET received unexpected response code: %d" % (response.code,))
+        yield readBody(response)
+        returnValue((time() - before, response,))
+
+    # Check conditional requests are answered from the ETag
+    _ignore_duration, response = yield download({}, OK)
+    etag = response.headers.getRawHeaders("etag")
+    if not etag:
+        raise Exception("GET response has no ETag")
+    yield download({"if-none-match": etag}, NOT_MODIFIED)
+
+    duration = Duration('HTTP')
+    resume = Duration('HTTP resume')
+    data = {duration: [], resume: []}
+
+    yield dtrace.start()
+    start = time()
+    while time() < start + samples:
+        elapsed, _ignore_response = yield download({}, OK)
+        data[duration].append(elapsed)
+
+        elapsed, _ignore_response = yield download({"range": ["bytes=%d-" % (size / 2,)]}, PARTIAL_CONTENT)
+        data[resume].append(elapsed)
+
+        stats = yield dtrace.mark()
+        for k, v in stats.iteritems():
+            data.setdefault(k, []).append(v)
+    yield dtrace.stop()
+
+    # Delete the calendar we created to leave the server in roughly
+    # the same state as we found it.
+    yield account.deleteResource("/" + cal)
+
+    returnValue(data)
@@ -0,0 +1,147 @@
+##
+# Copyright (c) 2017 Apple Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+##
+
+"""
+Benchmark a server's handling of a calendar-query REPORT returning
+calendar-data for every event in a large calendar. Besides the usual request
+duration this records the time to the first byte of the response body, and
+the resident set size of the server instances after each request, as the
+multi-status response is streamed rather than rendered in memory.
+"""
+
+from subprocess import check_output
+from time import time
+from urllib2 import HTTPDigestAuthHandler
+
+from twisted.internet import reactor
+from twisted.internet.defer import Deferred, inlineCallbacks, returnValue
+from twisted.internet.protocol import Protocol
+from twisted.web.client import Agent
+from twisted.web.http import MULTI_STATUS
+from twisted.web.http_headers import Headers
+
+from contrib.performance.httpauth import AuthHandlerAgent
+from contrib.performance.httpclient import StringProducer
+from contrib.performance.stats import Bytes, Duration
+
+from contrib.performance.benchlib import CalDAVAccount
+from contrib.performance.benchmarks.find_events import uploadEvents
+
+REPORT = """\
+<?xml version="1.0" encoding="utf-8"?>
+<C:calendar-query xmlns:D="DAV:" xmlns:C="urn:ietf:params:xml:ns:caldav">
+ <D:prop>
+  <D:getetag/>
+  <C:calendar-data/>
+ </D:prop>
+ <C:filter>
+  <C:comp-filter name="VCALENDAR">
+   <C:comp-filter name="VEVENT"/>
+  </C:comp-filter>
+ </C:filter>
+</C:calendar-query>
+"""
+
+
+class _FirstByteReader(Protocol):
+    """
+    Read a response body, noting when the first part of it arrives.
+    """
+
+    def __init__(self, finished):
+        self.finished = finished
+        self.firstByte = None
+
+    def dataReceived(self, bytes):
+        if self.firstByte is None:
+            self.firstByte = time()
+
+    def connectionLost(self, reason):
+        self.finished.callback(self.firstByte)
+
+
+def serverRSS(pids):
+    """
+    Total resident set size in bytes of the server processes.
+    """
+    if not pids:
+        return 0
+    output = check_output(["ps", "-o", "rss=", "-p", ",".join(map(str, pids))])
+    return sum([int(line) for line in output.split()]) * 1024
+
+
+@inlineCallbacks
+def measure(host, port, dtrace, numEvents, samples):
+    user = password = "user12"
+    root = "/"
+    principal = "/"
+
+    uri = "http://%s:%d/" % (host, port)
+    authinfo = HTTPDigestAuthHandler()
+    authinfo.add_password(
+        realm="Test Realm",
+        uri=uri,
+        user=user,
+        passwd=password)
+    agent = AuthHandlerAgent(Agent(reactor), authinfo)
+
+    account = CalDAVAccount(
+        agent,
+        "%s:%d" % (host, port),
+        user=user, password=password,
+        root=root, principal=principal)
+    cal = "calendars/users/%s/calendar-query-large/" % (user,)
+    yield account.deleteResource("/" + cal)
+    yield account.makeCalendar("/" + cal)
+
+    # Create the indicated number of events on the calendar
+    yield uploadEvents(numEvents, agent, uri, cal)
+
+    duration = Duration('HTTP')
+    firstByte = Duration('TTFB')
+    rss = Bytes('RSS')
+    data = {duration: [], firstByte: [], rss: []}
+    pids = getattr(dtrace, "pids", ())
+
+    yield dtrace.start()
+    start = time()
+    while time() < start + samples:
+        before = time()
+        response = yield agent.request(
+            'REPORT',
+            '%scalendars/__uids__/%s/calendar-query-large/' % (uri, user),
+            Headers({"depth": ["1"], "content-type": ["text/xml"]}),
+            StringProducer(REPORT))
+        if response.code != MULTI_STATUS:
+            raise Exception("REPORT received unexpected response code: %d" % (response.code,))
+        finished = Deferred()
+        response.deliverBody(_FirstByteReader(finished))
+        first = yield finished
+        after = time()
+
+        stats = yield dtrace.mark()
+        for k, v in stats.iteritems():
+            data.setdefault(k, []).append(v)
+        data[duration].append(after - before)
+        data[firstByte].append(first - before)
+        data[rss].append([serverRSS(pids)])
+    yield dtrace.stop()
+
+    # Delete the calendar we created to leave the server in roughly
+    # the same state as we found it.
+    yield account.deleteResource("/" + cal)
+
+    returnValue(data)
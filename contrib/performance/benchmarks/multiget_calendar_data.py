@@ -0,0 +1,134 @@
+##
+# Copyright (c) 2017 Apple Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+##
+
+"""
+Benchmark a server's handling of a calendar-multiget REPORT returning
+calendar-data for every event in a calendar. Besides the request duration
+this records the server CPU time used per item in the multiget, which shows
+the cost of producing each calendar-data value.
+"""
+
+from subprocess import check_output
+from time import time
+from urllib2 import HTTPDigestAuthHandler
+
+from twisted.internet import reactor
+from twisted.internet.defer import inlineCallbacks, returnValue
+from twisted.web.client import Agent
+from twisted.web.http import MULTI_STATUS
+from twisted.web.http_headers import Headers
+
+from contrib.performance.httpauth import AuthHandlerAgent
+from contrib.performance.httpclient import StringProducer, readBody
+from contrib.performance.stats import Duration
+
+from contrib.performance.benchlib import CalDAVAccount
+from contrib.performance.benchmarks.find_events import uploadEvents
+
+REPORT = """\
+<?xml version="1.0" encoding="utf-8"?>
+<C:calendar-multiget xmlns:D="DAV:" xmlns:C="urn:ietf:params:xml:ns:caldav">
+ <D:prop>
+  <D:getetag/>
+  <C:calendar-data/>
+ </D:prop>
+%(hrefs)s</C:calendar-multiget>
+"""
+
+
+def serverCPUTime(pids):
+    """
+    Total CPU time in seconds used by the server processes.
+    """
+    if not pids:
+        return 0.0
+    output = check_output(["ps", "-o", "cputime=", "-p", ",".join(map(str, pids))])
+    total = 0.0
+    for line in output.split():
+        days, _ignore_sep, rest = line.rpartition("-")
+        seconds = 0.0
+        for part in rest.split(":"):
+            seconds = seconds * 60 + float(part)
+        total += (int(days) if days else 0) * 24 * 60 * 60 + seconds
+    return total
+
+
+@inlineCallbacks
+def measure(host, port, dtrace, numEvents, samples):
+    user = password = "user13"
+    root = "/"
+    principal = "/"
+
+    uri = "http://%s:%d/" % (host, port)
+    authinfo = HTTPDigestAuthHandler()
+    authinfo.add_password(
+        realm="Test Realm",
+        uri=uri,
+        user=user,
+        passwd=password)
+    agent = AuthHandlerAgent(Agent(reactor), authinfo)
+
+    account = CalDAVAccount(
+        agent,
+        "%s:%d" % (host, port),
+        user=user, password=password,
+        root=root, principal=principal)
+    cal = "calendars/users/%s/multiget-calendar-data/" % (user,)
+    yield account.deleteResource("/" + cal)
+    yield account.makeCalendar("/" + cal)
+
+    # Create the indicated number of events on the calendar
+    yield uploadEvents(numEvents, agent, uri, cal)
+
+    body = REPORT % {
+        "hrefs": "".join([
+            " <D:href>/%s%d.ics</D:href>\n" % (cal, i,)
+            for i in range(numEvents)
+        ]),
+    }
+
+    duration = Duration('HTTP')
+    cpu = Duration('CPU per item')
+    data = {duration: [], cpu: []}
+    pids = getattr(dtrace, "pids", ())
+
+    yield dtrace.start()
+    start = time()
+    while time() < start + samples:
+        before = time()
+        cpuBefore = serverCPUTime(pids)
+        response = yield agent.request(
+            'REPORT',
+            '%s%s' % (uri, cal),
+            Headers({"depth": ["1"], "content-type": ["text/xml"]}),
+            StringProducer(body))
+        if response.code != MULTI_STATUS:
+            raise Exception("REPORT received unexpected response code: %d" % (response.code,))
+        yield readBody(response)
+        after = time()
+
+        stats = yield dtrace.mark()
+        for k, v in stats.iteritems():
+            data.setdefault(k, []).append(v)
+        data[duration].append(after - before)
+        data[cpu].append((serverCPUTime(pids) - cpuBefore) / max(numEvents, 1))
+    yield dtrace.stop()
+
+    # Delete the calendar we created to leave the server in roughly
+    # the same state as we found it.
+    yield account.deleteResource("/" + cal)
+
+    returnValue(data)
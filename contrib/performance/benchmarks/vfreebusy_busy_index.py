@@ -0,0 +1,122 @@
+##
+# Copyright (c) 2017 Apple Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+##
+
+"""
+Benchmark a server's handling of repeated VFREEBUSY requests, as issued by a
+room booking UI polling many attendees, each with several events in the
+requested day. Run this once with the server's EnableBusyTimeIndex set to
+False (FBCache path) and once with it set to True (busy time index path) to
+compare the two. The request has no X-CALENDARSERVER-MASK-UID, as that always
+uses the FBCache path.
+"""
+
+from datetime import datetime, timedelta
+from urllib2 import HTTPDigestAuthHandler
+
+from twisted.internet.defer import inlineCallbacks, returnValue
+from twisted.web.http import OK
+from twisted.web.http_headers import Headers
+from twisted.web.client import Agent
+from twisted.internet import reactor
+
+from contrib.performance.httpauth import AuthHandlerAgent
+from contrib.performance.httpclient import StringProducer
+from contrib.performance.benchlib import CalDAVAccount, sample
+
+from contrib.performance.benchmarks.vfreebusy import formatDate, makeEventNear
+
+# Number of events created on each attendee's calendar
+EVENTS_PER_ATTENDEE = 8
+
+VFREEBUSY = """\
+BEGIN:VCALENDAR
+CALSCALE:GREGORIAN
+VERSION:2.0
+METHOD:REQUEST
+PRODID:-//Apple Inc.//iCal 4.0.3//EN
+BEGIN:VFREEBUSY
+UID:5C1B1A6D-3F0B-4E4B-9A5E-0C3A6B7D2E11
+DTEND:%(end)s
+%(attendees)sDTSTART:%(start)s
+DTSTAMP:20100729T174751Z
+ORGANIZER:mailto:user01@example.com
+SUMMARY:Availability
+END:VFREEBUSY
+END:VCALENDAR
+"""
+
+
+@inlineCallbacks
+def measure(host, port, dtrace, attendees, samples):
+    userNumber = 1
+    user = password = "user%02d" % (userNumber,)
+    root = "/"
+    principal = "/"
+    calendar = "vfreebusy-busy-index-benchmark"
+
+    targets = range(2, attendees + 2)
+
+    authinfo = HTTPDigestAuthHandler()
+
+    # Set up authentication info for our own user and all the other users that
+    # need events created on one of their calendars.
+    for i in [userNumber] + targets:
+        targetUser = "user%02d" % (i,)
+        for path in ["calendars/users/%s/" % (targetUser,),
+                     "calendars/__uids__/10000000-0000-0000-0000-000000000%03d/" % (i,)]:
+            authinfo.add_password(
+                realm="Test Realm",
+                uri="http://%s:%d/%s" % (host, port, path),
+                user=targetUser, passwd=targetUser)
+
+    agent = AuthHandlerAgent(Agent(reactor), authinfo)
+
+    # Set up several events on each of the target accounts
+    baseTime = datetime.now().replace(hour=0, minute=15, second=0, microsecond=0)
+    for i in targets:
+        targetUser = "user%02d" % (i,)
+        account = CalDAVAccount(
+            agent,
+            "%s:%d" % (host, port),
+            user=targetUser, password=password,
+            root=root, principal=principal)
+        cal = "/calendars/users/%s/%s/" % (targetUser, calendar)
+        yield account.deleteResource(cal)
+        yield account.makeCalendar(cal)
+        for j in range(EVENTS_PER_ATTENDEE):
+            yield account.writeData(cal + "foo%d.ics" % (j,), makeEventNear(baseTime, j + i % 2), "text/calendar")
+
+    # And now issue the actual VFREEBUSY request
+    method = 'POST'
+    uri = 'http://%s:%d/calendars/__uids__/10000000-0000-0000-0000-000000000001/outbox/' % (host, port)
+    headers = Headers({
+        "content-type": ["text/calendar"],
+        "originator": ["mailto:%s@example.com" % (user,)],
+        "recipient": [", ".join(["urn:x-uid:10000000-0000-0000-0000-000000000%03d" % (i,) for i in [userNumber] + targets])]})
+    body = StringProducer(VFREEBUSY % {
+        "attendees": "".join([
+            "ATTENDEE:urn:x-uid:10000000-0000-0000-0000-000000000%03d\n" % (i,)
+            for i in [userNumber] + targets]),
+        "start": formatDate(baseTime.replace(hour=0, minute=0)) + 'Z',
+        "end": formatDate(
+            baseTime.replace(hour=0, minute=0) + timedelta(days=1)) + 'Z'})
+
+    samples = yield sample(
+        dtrace, samples,
+        agent, lambda: (method, uri, headers, body),
+        OK)
+
+    returnValue(samples)
@@ -15,12 +15,13 @@
 ##
 
 from twext.python.log import Logger
-from txweb2.dav.util import allDataFromStream
+from txweb2.dav.util import allDataFromStream, DAVXMLBodyReader, ParsedXMLStream
 from txweb2.http import Response
 from txweb2.iweb import IResource
-from txweb2.stream import MemoryStream
+from txweb2.stream import MemoryStream, readStream
 
-from twisted.internet.defer import succeed, inlineCallbacks, returnValue
+from twisted.internet.defer import succeed, inlineCallbacks, returnValue, \
+    gatherResults
 
 from twistedcaldav.config import config
 from twistedcaldav.memcachepool import CachePoolUserMixIn, defaultCachePool
@@ -31,6 +32,7 @@ from zope.interface import implements
 
 import cPickle
 import hashlib
+import time
 import urllib
 import uuid
 
@@ -129,6 +131,7 @@ class MemcacheChangeNotifier(CachePoolUserMixIn):
             url = self._resource.url()
 
         self.log.debug("Changing Cache Token for {url}", url=url)
+        localTokens.forget('cacheToken:%s' % (url,))
         return self.getCachePool().set(
             'cacheToken:%s' % (url,),
             self._newCacheToken(), expireTime=config.ResponseCacheTimeout * 60)
@@ -158,6 +161,7 @@ class MemcacheURLPatternChangeNotifier(CachePoolUserMixIn):
         url = self._urlPattern.format(token=token)
 
         self.log.debug("Changing Cache Token for {url}", url=url)
+        localTokens.forget('cacheToken:{url}'.format(url=url))
         return self.getCachePool().set(
             'cacheToken:{url}'.format(url=url),
             self._newCacheToken(),
@@ -243,23 +247,26 @@ class BaseResponseCache(object):
         """
         Get a key for this request. This depends on the method, Depth: header, authn user principal,
         request uri and a hash of the request body (the body being normalized for property order).
+        The body is read in a single pass that also parses it, so that the request does not need
+        to parse it again.
         """
-        requestBody = (yield allDataFromStream(request.stream))
-        if requestBody is not None:
+        reader = RequestBodyReader(getattr(request.stream, "length", None))
+        yield readStream(request.stream, reader.feed)
+        if reader.data:
             # Give it back to the request so it can be read again
-            request.stream = MemoryStream(requestBody)
+            document = reader.document()
+            requestBody = "".join(reader.data)
+            if document is not None:
+                request.stream = ParsedXMLStream(requestBody, document)
+            else:
+                request.stream = MemoryStream(requestBody)
             request.stream.doStartReading = None
 
-            # Normalize the property order by doing a "dumb" sort on lines
-            requestLines = requestBody.splitlines()
-            requestLines.sort()
-            requestBody = "\n".join(requestLines)
-
         request.cacheKey = (request.method,
                             self._principalURI(request.authnUser),
                             request.uri,
                             request.headers.getHeader('depth'),
-                            hash(requestBody))
+                            reader.hash())
 
         returnValue(request.cacheKey)
 
@@ -269,61 +276,217 @@ class BaseResponseCache(object):
         return d1
 
 
+class RequestBodyReader(object):
+    """
+    Reads a request body in a single pass, computing a hash of it that does not
+    depend on the order of its lines (so that the order of properties in a
+    request does not matter) and parsing it as XML as the data arrives.
+    """
+
+    def __init__(self, length=None):
+        self.data = []
+        self._partial = ""
+        self._lineDigests = []
+        self._xml = DAVXMLBodyReader(length)
+
+    def _addLines(self, text):
+        for line in text.splitlines():
+            self._lineDigests.append(hashlib.md5(line).digest())
+
+    def feed(self, data):
+        chunk = str(data)
+        self.data.append(chunk)
+
+        # Only hash complete lines - the remainder waits for the next chunk
+        text = self._partial + chunk
+        end = text.rfind("\n") + 1
+        self._addLines(text[:end])
+        self._partial = text[end:]
+
+        # Bodies that are not XML are left for the request to deal with
+        if self._xml is not None:
+            try:
+                self._xml.feed(chunk)
+            except ValueError:
+                self._xml = None
+
+    def hash(self):
+        """
+        The md5 of the sorted md5 digests of each line of the body, so that the
+        order of lines does not matter.
+
+        @return: the hex digest of the body, normalized for line order, or
+            C{None} if there is no body
+        @rtype: C{str}
+        """
+        if not self.data:
+            return None
+        if self._partial:
+            self._addLines(self._partial)
+            self._partial = ""
+        return hashlib.md5("".join(sorted(self._lineDigests))).hexdigest()
+
+    def document(self):
+        """
+        @return: the parsed body, or C{None} if it is not a valid XML document
+        @rtype: L{WebDAVDocument}
+        """
+        if self._xml is None:
+            return None
+        try:
+            return self._xml.close()
+        except (ValueError, AssertionError):
+            return None
+        finally:
+            self._xml = None
+
+
+class LocalCache(object):
+    """
+    A short-lived, process-local copy of values read from memcache, including
+    values that were not present. Entries expire after a fixed lifetime, so
+    changes made by other processes are seen once the local copy expires.
+    """
+
+    # Expired entries are purged whenever this many entries are present
+    PURGE_SIZE = 10000
+
+    def __init__(self):
+        self._entries = {}
+
+    def get(self, key, now):
+        """
+        Get a local copy of a value.
+
+        @return: a C{tuple} of whether a valid local copy exists and the value
+        @rtype: C{tuple} of (C{bool}, C{object})
+        """
+        entry = self._entries.get(key)
+        if entry is not None:
+            value, expires = entry
+            if now < expires:
+                return (True, value,)
+            del self._entries[key]
+        return (False, None,)
+
+    def put(self, key, value, now, lifetime):
+        """
+        Keep a local copy of a value for C{lifetime} seconds.
+        """
+        if lifetime <= 0:
+            return
+        if len(self._entries) >= self.PURGE_SIZE:
+            for oldkey, (_ignore_value, expires) in self._entries.items():
+                if now >= expires:
+                    del self._entries[oldkey]
+            if len(self._entries) >= self.PURGE_SIZE:
+                self._entries.clear()
+        self._entries[key] = (value, now + lifetime,)
+
+    def forget(self, key):
+        self._entries.pop(key, None)
+
+    def clear(self):
+        self._entries.clear()
+
+
+# Local copy of the cache tokens shared by all response caches and notifiers in
+# this process, so that tokens changed by this process are dropped straight away
+localTokens = LocalCache()
+
+
 class MemcacheResponseCache(BaseResponseCache, CachePoolUserMixIn):
 
     def __init__(self, docroot, cachePool=None):
         self._docroot = docroot
         self._cachePool = cachePool
 
-    @inlineCallbacks
-    def _tokenForURI(self, uri, cachePoolHandle=None):
+        # Requests recently found not to be in the cache
+        self._localMisses = LocalCache()
+
+    def _cachePoolFor(self, cachePoolHandle):
         """
-        Get the current token for a particular URI.
+        Get the cache pool for a type of token. An explicitly supplied cache
+        pool is used for all tokens.
         """
-        if isinstance(uri, unicode):
-            uri = uri.encode("utf-8")
-        if cachePoolHandle:
-            result = (yield defaultCachePool(cachePoolHandle).get('cacheToken:%s' % (uri,)))
-        else:
-            result = (yield self.getCachePool().get('cacheToken:%s' % (uri,)))
-        if result is not None:
-            _ignore_flags, result = result
-        returnValue(result)
+        if cachePoolHandle and self._cachePool is None:
+            return defaultCachePool(cachePoolHandle)
+        return self.getCachePool()
 
     @inlineCallbacks
-    def _tokenForRecord(self, uri, request):
+    def _tokensForURIs(self, uris):
         """
-        Get the current token for a particular principal URI's directory record.
+        Get the current tokens for a set of URIs. Tokens with a valid local copy
+        are not fetched, the rest are fetched with a single multi-key request.
+
+        @param uris: the URIs, each with the handle of the cache pool holding
+            its token (L{None} for the default)
+        @type uris: iterable of C{tuple} of (C{str}, C{str})
+
+        @return: the tokens for each URI and handle
+        @rtype: C{dict}
         """
+        now = time.time()
+        tokens = {}
+        byPool = {}
+        for uri, cachePoolHandle in uris:
+            encoded = uri.encode("utf-8") if isinstance(uri, unicode) else uri
+            key = 'cacheToken:%s' % (encoded,)
+            found, token = localTokens.get(key, now)
+            if found:
+                tokens[(uri, cachePoolHandle)] = token
+            else:
+                cachePool = self._cachePoolFor(cachePoolHandle)
+                byPool.setdefault(cachePool, {})[key] = (uri, cachePoolHandle)
+
+        if byPool:
+            pools = byPool.items()
+            results = (yield gatherResults([pool.getMany(keys.keys()) for pool, keys in pools]))
+            for (_ignore_pool, keys), result in zip(pools, results):
+                for key, item in keys.items():
+                    token = result[key][-1]
+                    localTokens.put(key, token, now, config.ResponseCacheTokenTimeout)
+                    tokens[item] = token
 
-        record = (yield self._getRecordForURI(uri, request))
-        returnValue(record.cacheToken())
+        returnValue(tokens)
 
     @inlineCallbacks
-    def _tokensForChildren(self, rURI, request):
+    def _tokenForRecord(self, uri, request):
         """
-        Create a dict of child resource tokens for any "recorded" during this request in the childCacheURIs attribute.
+        Get the current token for a particular principal URI's directory record.
         """
 
-        if hasattr(request, "childCacheURIs"):
-            tokens = dict([(uri, (yield self._tokenForURI(uri)),) for uri in request.childCacheURIs])
-            returnValue(tokens)
-        else:
-            returnValue({})
+        record = (yield self._getRecordForURI(uri, request))
+        returnValue(record.cacheToken())
 
     @inlineCallbacks
-    def _getTokens(self, request):
+    def _getTokens(self, request, childURIs=None):
         """
         Tokens are a principal token, directory record token, resource token and list
         of child resource tokens. A change to any one of those will cause cache invalidation.
+        All the tokens held in memcache are fetched together.
+
+        @param childURIs: the child resource URIs to get tokens for, or L{None} to use
+            any "recorded" during this request in the childCacheURIs attribute
+        @type childURIs: C{list}
         """
-        tokens = []
         pURI, rURI = (yield self._getURIs(request))
-        tokens.append((yield self._tokenForURI(pURI, "PrincipalToken")))
-        tokens.append((yield self._tokenForRecord(pURI, request)))
-        tokens.append((yield self._tokenForURI(rURI)))
-        tokens.append((yield self._tokensForChildren(rURI, request)))
-        returnValue(tokens)
+        if childURIs is None:
+            childURIs = getattr(request, "childCacheURIs", ())
+
+        uris = [(pURI, "PrincipalToken"), (rURI, None)]
+        uris.extend([(uri, None) for uri in childURIs])
+        uriTokens, recordToken = (yield gatherResults([
+            self._tokensForURIs(uris),
+            self._tokenForRecord(pURI, request),
+        ]))
+
+        returnValue([
+            uriTokens[(pURI, "PrincipalToken")],
+            recordToken,
+            uriTokens[(rURI, None)],
+            dict([(uri, uriTokens[(uri, None)]) for uri in childURIs]),
+        ])
 
     @inlineCallbacks
     def _hashedRequestKey(self, request):
@@ -337,6 +500,17 @@ class MemcacheResponseCache(BaseResponseCache, CachePoolUserMixIn):
         self.log.debug("hashing key for get: {old!r} to {new!r}", old=oldkey, new=key)
         returnValue(request.cacheKey)
 
+    def _recordStats(self, request, hit, saved=0.0):
+        """
+        Record the outcome of a cache lookup on the request for the access log
+        statistics.
+        """
+        request.responseCacheStats = {
+            "hit": 1 if hit else 0,
+            "miss": 0 if hit else 1,
+            "t-saved": saved,
+        }
+
     @inlineCallbacks
     def getResponseForRequest(self, request):
         """
@@ -344,17 +518,28 @@ class MemcacheResponseCache(BaseResponseCache, CachePoolUserMixIn):
         the cache entry and decompose it into tokens and response. We then compare the cached tokens with their current values.
         If all match, we can return the cached response data.
         """
+        started = time.time()
         try:
             key = (yield self._hashedRequestKey(request))
 
+            found, _ignore_value = self._localMisses.get(key, started)
+            if found:
+                self.log.debug("Recently not in cache: {key!r}", key=key)
+                self._recordStats(request, False)
+                returnValue(None)
+
             self.log.debug("Checking cache for: {key!r}", key=key)
             _ignore_flags, value = (yield self.getCachePool().get(key))
 
             if value is None:
                 self.log.debug("Not in cache: {key!r}", key=key)
+                self._localMisses.put(key, True, started, config.ResponseCacheNegativeTimeout)
+                self._recordStats(request, False)
                 returnValue(None)
 
-            (principalToken, directoryToken, uriToken, childTokens, (code, headers, body)) = cPickle.loads(value)
+            entry = cPickle.loads(value)
+            (principalToken, directoryToken, uriToken, childTokens, (code, headers, body)) = entry[:5]
+            elapsed = entry[5] if len(entry) > 5 else 0.0
             self.log.debug(
                 "Found in cache: {key!r} = {value!r}",
                 key=key,
@@ -366,7 +551,8 @@ class MemcacheResponseCache(BaseResponseCache, CachePoolUserMixIn):
                 )
             )
 
-            currentTokens = (yield self._getTokens(request))
+            self._recordStats(request, False)
+            currentTokens = (yield self._getTokens(request, childTokens.keys()))
 
             if currentTokens[0] != principalToken:
                 self.log.debug(
@@ -396,7 +582,7 @@ class MemcacheResponseCache(BaseResponseCache, CachePoolUserMixIn):
                 returnValue(None)
 
             for childuri, token in childTokens.items():
-                currentToken = (yield self._tokenForURI(childuri))
+                currentToken = currentTokens[3][childuri]
                 if currentToken != token:
                     self.log.debug(
                         "Child {uri} token doesn't match for {key!r}: {currentToken!r} != {token!r}",
@@ -408,6 +594,7 @@ class MemcacheResponseCache(BaseResponseCache, CachePoolUserMixIn):
                     returnValue(None)
 
             self.log.debug("Response cache matched")
+            self._recordStats(request, True, max(elapsed - (time.time() - started) * 1000, 0.0))
             r = Response(code, stream=MemoryStream(body))
 
             for key, value in headers.iteritems():
@@ -438,6 +625,12 @@ class MemcacheResponseCache(BaseResponseCache, CachePoolUserMixIn):
             response.stream = MemoryStream(responseBody)
             pToken, dToken, uToken, cTokens = (yield self._getTokens(request))
 
+            # Time taken to generate the response - a cache hit saves this
+            if hasattr(request, "timeStamps"):
+                elapsed = (time.time() - request.timeStamps[0][1]) * 1000
+            else:
+                elapsed = 0.0
+
             cacheEntry = cPickle.dumps((
                 pToken,
                 dToken,
@@ -447,7 +640,8 @@ class MemcacheResponseCache(BaseResponseCache, CachePoolUserMixIn):
                     response.code,
                     dict(list(response.headers.getAllRawHeaders())),
                     responseBody
-                )
+                ),
+                elapsed,
             ))
             self.log.debug(
                 "Adding to cache: {key!r} = tokens - {tokens!r}",
@@ -462,6 +656,7 @@ class MemcacheResponseCache(BaseResponseCache, CachePoolUserMixIn):
             yield self.getCachePool().set(
                 key, cacheEntry, expireTime=config.ResponseCacheTimeout * 60
             )
+            self._localMisses.forget(key)
 
         except URINotFoundException, e:
             self.log.debug("Could not locate URI: {e!r}", e=e)
@@ -532,6 +727,7 @@ class CacheStoreNotifierFactory(CachePoolUserMixIn):
         """
 
         self.log.debug("Changing Cache Token for {id!r}", id=cache_id)
+        localTokens.forget('cacheToken:%s' % (cache_id,))
         return self.getCachePool().set(
             'cacheToken:%s' % (cache_id,),
             self._newCacheToken(), expireTime=config.ResponseCacheTimeout * 60)
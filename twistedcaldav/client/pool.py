@@ -18,9 +18,12 @@ __all__ = [
     "installPools",
     "installPool",
     "getHTTPClientPool",
+    "getPersistentHTTPClientPool",
+    "persistentHTTPClientPoolStats",
 ]
 
 import OpenSSL
+import time
 import urlparse
 
 from twext.python.log import Logger
@@ -112,6 +115,14 @@ class HTTPClientPool(object):
 
     @ivar _pendingConnects: A C{int} indicating how many connections are in
         progress.
+
+    @ivar _persistent: A C{bool} indicating whether connections are kept open
+        between requests. Persistent clients report their own state to the
+        pool (as their L{IHTTPClientManager}) and are only freed once the
+        response body has been read.
+
+    @ivar _idleTimeout: A C{float} number of seconds after which an idle
+        persistent connection is closed, or C{None} to keep it open.
     """
     log = Logger()
 
@@ -119,7 +130,7 @@ class HTTPClientPool(object):
     maxRetries = 2
 
     def __init__(self, name, scheme, endpoint, secureEndpoint,
-                 maxClients=5, reactor=None):
+                 maxClients=5, reactor=None, persistent=False, idleTimeout=None):
         """
         @param endpoint: An L{IStreamClientEndpoint} indicating the server to
             connect to.
@@ -128,6 +139,12 @@ class HTTPClientPool(object):
 
         @param reactor: An L{IReactorTCP} provider used to initiate new
             connections.
+
+        @param persistent: A C{bool} indicating whether to keep connections
+            open between requests.
+
+        @param idleTimeout: A C{float} number of seconds after which an idle
+            persistent connection is closed.
         """
 
         self._name = name
@@ -135,6 +152,8 @@ class HTTPClientPool(object):
         self._endpoint = endpoint
         self._secureEndpoint = secureEndpoint
         self._maxClients = maxClients
+        self._persistent = persistent
+        self._idleTimeout = idleTimeout
 
         if reactor is None:
             from twisted.internet import reactor
@@ -148,6 +167,15 @@ class HTTPClientPool(object):
         self._freeClients = set([])
         self._pendingConnects = 0
         self._pendingRequests = []
+        self._idleTimers = {}
+
+        self._requests = 0
+        self._connects = 0
+        self._reused = 0
+        self._queued = 0
+        self._errors = 0
+        self._latencyTotal = 0.0
+        self._latencyMax = 0.0
 
     def _isIdle(self):
         return (
@@ -158,6 +186,8 @@ class HTTPClientPool(object):
 
     def _shutdownCallback(self):
         self.shutdown_requested = True
+        for client in tuple(self._freeClients):
+            self._closeClient(client)
         if self._isIdle():
             return None
         self.shutdown_deferred = Deferred()
@@ -170,6 +200,7 @@ class HTTPClientPool(object):
         @return: A L{Deferred} that fires with the L{IProtocol} instance.
         """
         self._pendingConnects += 1
+        self._connects += 1
 
         self.log.debug(
             "Initiating new client connection to: {endpoint!r}",
@@ -189,6 +220,8 @@ class HTTPClientPool(object):
 
         def _doneOK(client):
             self._pendingConnects -= 1
+            if self._persistent:
+                client.manager = self
 
             def _goneClientAfterError(f, client):
                 f.trap(ConnectionLost, ConnectionDone, ConnectError)
@@ -225,7 +258,10 @@ class HTTPClientPool(object):
         """
 
         def _freeClientAfterRequest(result):
-            self.clientFree(client)
+            # Persistent clients tell us themselves when the response has
+            # been read and they can be re-used
+            if not self._persistent:
+                self.clientFree(client)
             return result
 
         def _goneClientAfterError(result):
@@ -233,7 +269,7 @@ class HTTPClientPool(object):
             return result
 
         self.clientBusy(client)
-        d = client.submitRequest(request, closeAfter=True)
+        d = client.submitRequest(request, closeAfter=not self._persistent)
         d.addCallbacks(_freeClientAfterRequest, _goneClientAfterError)
         return d
 
@@ -257,6 +293,9 @@ class HTTPClientPool(object):
         # the request
         data = (yield allDataFromStream(request.stream))
 
+        self._requests += 1
+        started = time.time()
+
         # Try this maxRetries times
         for ctr in xrange(self.maxRetries + 1):
             try:
@@ -274,9 +313,17 @@ class HTTPClientPool(object):
                 self.log.error("HTTP pooled client connection assertion error (attempt: {ctr}) - retrying: {ex}", ctr=ctr + 1, ex=e)
                 continue
 
+            except Exception:
+                self._errors += 1
+                raise
+
             else:
+                latency = time.time() - started
+                self._latencyTotal += latency
+                self._latencyMax = max(self._latencyMax, latency)
                 returnValue(response)
         else:
+            self._errors += 1
             self.log.error("HTTP pooled client connection error - exhausted retry attempts.")
             raise HTTPError(StatusResponse(responsecode.BAD_GATEWAY, "Could not connect to HTTP pooled client host."))
 
@@ -294,11 +341,14 @@ class HTTPClientPool(object):
         @return: A L{Deferred} that fires with the result of the given command.
         """
 
-        if len(self._freeClients) > 0:
-            d = self._performRequestOnClient(self._freeClients.pop(), request, *args, **kwargs)
+        client = self._healthyFreeClient()
+        if client is not None:
+            self._reused += 1
+            d = self._performRequestOnClient(client, request, *args, **kwargs)
 
         elif len(self._busyClients) + self._pendingConnects >= self._maxClients:
             d = Deferred()
+            self._queued += 1
             self._pendingRequests.append((d, request, args, kwargs))
             self.log.debug("Request queued: {req}, {args!r}, {kwargs!r}", req=request, args=args, kwargs=kwargs)
             self._logClientStats()
@@ -309,6 +359,68 @@ class HTTPClientPool(object):
 
         return d
 
+    def _healthyFreeClient(self):
+        """
+        Remove and return a free client whose connection is still usable,
+        discarding any whose connection has been closed or is closing.
+
+        @return: a client, or C{None} if there are no usable free clients.
+        """
+        while self._freeClients:
+            client = self._freeClients.pop()
+            self._cancelIdleTimer(client)
+            transport = client.transport
+            if (
+                transport is not None and
+                not getattr(transport, "disconnecting", False) and
+                (client.readPersistent or not self._persistent)
+            ):
+                return client
+            self.log.debug("Discarding unusable client: {client!r}", client=client)
+            self._closeClient(client)
+        return None
+
+    def _cancelIdleTimer(self, client):
+        timer = self._idleTimers.pop(client, None)
+        if timer is not None and timer.active():
+            timer.cancel()
+
+    def _idleTimedOut(self, client):
+        self._idleTimers.pop(client, None)
+        if client in self._freeClients:
+            self.log.debug("Closing idle client: {client!r}", client=client)
+            self._freeClients.remove(client)
+            self._closeClient(client)
+
+    def _closeClient(self, client):
+        self._cancelIdleTimer(client)
+        self._freeClients.discard(client)
+        if client.transport is not None:
+            client.transport.loseConnection()
+
+    def stats(self):
+        """
+        Return the current state of the pool and its request counters.
+
+        @return: a C{dict} of statistics.
+        """
+        completed = self._requests - self._errors
+        return {
+            "name": self._name,
+            "persistent": self._persistent,
+            "free": len(self._freeClients),
+            "busy": len(self._busyClients),
+            "pending": self._pendingConnects,
+            "queued": len(self._pendingRequests),
+            "requests": self._requests,
+            "connects": self._connects,
+            "reused": self._reused,
+            "waited": self._queued,
+            "errors": self._errors,
+            "latency-avg": (self._latencyTotal / completed) if completed > 0 else 0.0,
+            "latency-max": self._latencyMax,
+        }
+
     def _logClientStats(self):
         self.log.debug(
             "Clients #free: {free}, #busy: {busy}, #pending: {pending}, #queued: {queued}",
@@ -330,6 +442,8 @@ class HTTPClientPool(object):
         elif client in self._freeClients:
             self._freeClients.remove(client)
 
+        self._cancelIdleTimer(client)
+
         self.log.debug("Removed client: {client!r}", client=client)
         self._logClientStats()
 
@@ -344,6 +458,7 @@ class HTTPClientPool(object):
 
         if client in self._freeClients:
             self._freeClients.remove(client)
+        self._cancelIdleTimer(client)
 
         self._busyClients.add(client)
 
@@ -360,6 +475,11 @@ class HTTPClientPool(object):
             self._busyClients.remove(client)
 
         self._freeClients.add(client)
+        if self._persistent and self._idleTimeout:
+            self._cancelIdleTimer(client)
+            self._idleTimers[client] = self._reactor.callLater(
+                self._idleTimeout, self._idleTimedOut, client
+            )
 
         if self.shutdown_deferred and self._isIdle():
             self.shutdown_deferred.callback(None)
@@ -369,6 +489,26 @@ class HTTPClientPool(object):
 
         self._processPending()
 
+    def clientIdle(self, client):
+        """
+        Notify that a persistent client has finished reading its response.
+
+        @param client: An instance of C{self.clientFactory}
+        """
+        if self.shutdown_requested:
+            self._busyClients.discard(client)
+            client.transport.loseConnection()
+            if self.shutdown_deferred and self._isIdle():
+                self.shutdown_deferred.callback(None)
+        else:
+            self.clientFree(client)
+
+    def clientPipelining(self, client):
+        """
+        Requests are never pipelined on pooled clients.
+        """
+        pass
+
     def _processPending(self):
         if len(self._pendingRequests) > 0:
             d, request, args, kwargs = self._pendingRequests.pop(0)
@@ -393,6 +533,7 @@ class HTTPClientPool(object):
         self._maxClients = maxClients
 
 _clientPools = {}     # Maps a host:port to a pool object
+_persistentClientPools = {}     # Maps a (host, port, ssl) to a pool object
 
 
 def installPools(hosts, maxClients=5, reactor=None):
@@ -439,3 +580,47 @@ def installPool(name, url, maxClients=5, reactor=None):
 
 def getHTTPClientPool(name):
     return _clientPools[name]
+
+
+def getPersistentHTTPClientPool(ssl, host, port, reactor=None):
+    """
+    Get the pool of persistent connections to the given server, creating it if
+    needed. Pool sizes and idle timeouts come from the
+    C{OutboundHTTPConnections} configuration.
+
+    @param ssl: whether to use TLS
+    @type ssl: C{bool}
+    @param host: server host name
+    @type host: C{str}
+    @param port: server port
+    @type port: C{int}
+
+    @rtype: L{HTTPClientPool}
+    """
+    key = (host, port, ssl,)
+    if key not in _persistentClientPools:
+        from twistedcaldav.config import config
+        if reactor is None:
+            from twisted.internet import reactor
+        scheme = "https" if ssl else "http"
+        _persistentClientPools[key] = HTTPClientPool(
+            "{}://{}:{}".format(scheme, host, port),
+            scheme,
+            GAIEndpoint(reactor, host, port),
+            GAIEndpoint(reactor, host, port, _configuredClientContextFactory(host)) if ssl else None,
+            config.OutboundHTTPConnections.MaxClientsPerHost,
+            reactor,
+            persistent=True,
+            idleTimeout=config.OutboundHTTPConnections.IdleTimeout,
+        )
+    return _persistentClientPools[key]
+
+
+def persistentHTTPClientPoolStats():
+    """
+    Return the statistics of each persistent connection pool.
+
+    @return: a C{dict} mapping pool names to the result of
+        L{HTTPClientPool.stats}.
+    """
+    return dict([(pool._name, pool.stats()) for pool in _persistentClientPools.values()])
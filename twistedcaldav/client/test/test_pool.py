@@ -0,0 +1,129 @@
+##
+# Copyright (c) 2017 Apple Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+##
+
+from twisted.internet.defer import succeed, inlineCallbacks
+from twisted.internet.task import Clock
+
+from txweb2.client.http import ClientRequest
+from txweb2.http_headers import Headers
+
+from twistedcaldav.client.pool import HTTPClientPool
+import twistedcaldav.test.util
+
+
+class FakeReactor(Clock):
+
+    def addSystemEventTrigger(self, *args, **kwargs):
+        pass
+
+
+class FakeTransport(object):
+
+    def __init__(self):
+        self.disconnecting = False
+
+    def loseConnection(self):
+        self.disconnecting = True
+
+
+class FakeClient(object):
+
+    readPersistent = 1
+
+    def __init__(self):
+        self.transport = FakeTransport()
+        self.requests = []
+
+    def submitRequest(self, request, closeAfter=True):
+        self.requests.append((request, closeAfter,))
+        return succeed("response")
+
+
+class PersistentHTTPClientPool(twistedcaldav.test.util.TestCase):
+    """
+    Keep-alive behavior of L{HTTPClientPool}
+    """
+
+    def setUp(self):
+        self.reactor = FakeReactor()
+        self.pool = HTTPClientPool(
+            "test", "http", None, None, maxClients=2,
+            reactor=self.reactor, persistent=True, idleTimeout=10,
+        )
+        return super(PersistentHTTPClientPool, self).setUp()
+
+    @inlineCallbacks
+    def test_reuse(self):
+        """
+        A free client is re-used without closing the connection, and is only
+        freed again once it reports it is idle.
+        """
+        client = FakeClient()
+        self.pool.clientFree(client)
+
+        response = yield self.pool.submitRequest(ClientRequest("POST", "/", Headers(), "data"))
+        self.assertEqual(response, "response")
+        self.assertEqual(client.requests[0][1], False)
+
+        stats = self.pool.stats()
+        self.assertEqual(stats["reused"], 1)
+        self.assertEqual(stats["connects"], 0)
+        self.assertEqual(stats["busy"], 1)
+        self.assertEqual(stats["free"], 0)
+
+        self.pool.clientIdle(client)
+        stats = self.pool.stats()
+        self.assertEqual(stats["busy"], 0)
+        self.assertEqual(stats["free"], 1)
+
+    def test_idleTimeout(self):
+        """
+        An idle client is closed after the idle timeout.
+        """
+        client = FakeClient()
+        self.pool.clientFree(client)
+
+        self.reactor.advance(5)
+        self.assertFalse(client.transport.disconnecting)
+        self.pool.clientBusy(client)
+        self.pool.clientIdle(client)
+
+        self.reactor.advance(5)
+        self.assertFalse(client.transport.disconnecting)
+        self.reactor.advance(5)
+        self.assertTrue(client.transport.disconnecting)
+        self.assertEqual(self.pool.stats()["free"], 0)
+
+    def test_unhealthyClientsDiscarded(self):
+        """
+        Free clients whose connection is closing are not handed out.
+        """
+        closing = FakeClient()
+        closing.transport.disconnecting = True
+        gone = FakeClient()
+        gone.transport = None
+        notPersistent = FakeClient()
+        notPersistent.readPersistent = False
+
+        for client in (closing, gone, notPersistent,):
+            self.pool.clientFree(client)
+        self.assertTrue(self.pool._healthyFreeClient() is None)
+
+        healthy = FakeClient()
+        self.pool.clientFree(closing)
+        self.pool.clientFree(healthy)
+        self.assertTrue(self.pool._healthyFreeClient() is healthy)
+        self.assertEqual(self.pool.stats()["free"], 0)
@@ -35,6 +35,7 @@ from twext.python.log import Logger
 from twisted.internet import reactor
 from twisted.internet.defer import succeed, inlineCallbacks, returnValue
 
+from twistedcaldav.client.pool import persistentHTTPClientPoolStats
 from twistedcaldav.config import config
 from twistedcaldav.extensions import DAVResource, \
     DAVResourceWithoutChildrenMixin
@@ -397,3 +398,60 @@ class ControlAPIResource (ReadOnlyNoCopyResourceMixIn, DAVResourceWithoutChildre
         ))
 
         returnValue(self._ok("ok", "RevisionCleanupWork done"))
+
+    def action_slowsqltraces(self, j):
+        """
+        Return the SQL traces of recent slow transactions in the worker process
+        handling this request. An optional "clear" member empties the buffer.
+        """
+        tracer = getattr(self._store, "sqlTracer", None)
+        if tracer is None:
+            self._error("error", "SQL tracing is not enabled.")
+
+        traces = tracer.recentSlowTraces(clear=bool(j.get("clear", False)))
+        return succeed(self._ok("ok", "Slow SQL traces", {
+            "pid": os.getpid(),
+            "traces": traces,
+        }))
+
+    @inlineCallbacks
+    def action_groupcacher(self, j):
+        """
+        Return the group refresh counts of the group cacher in the worker
+        process handling this request.
+        """
+        txn = self._store.newTransaction(label="ControlAPIResource.action_groupcacher")
+        groupCacher = getattr(txn, "_groupCacher", None)
+        yield txn.abort()
+        if groupCacher is None:
+            self._error("error", "Group caching is not enabled.")
+
+        returnValue(self._ok("ok", "Group cacher", {
+            "pid": os.getpid(),
+            "stats": groupCacher.stats(),
+        }))
+
+    def action_timezoneservice(self, j):
+        """
+        Return the expand cache statistics of the standard timezone service in
+        the worker process handling this request.
+        """
+        tzservice = self.parent.putChildren.get("stdtimezones")
+        if tzservice is None:
+            self._error("error", "Standard timezone service is not enabled.")
+
+        return succeed(self._ok("ok", "Timezone service", {
+            "pid": os.getpid(),
+            "expandcache": tzservice.expandcache.stats(),
+        }))
+
+    def action_httpclientpools(self, j):
+        """
+        Return the state and latency statistics of the persistent connection
+        pools used for iSchedule and cross-pod requests in the worker process
+        handling this request.
+        """
+        return succeed(self._ok("ok", "HTTP client pools", {
+            "pid": os.getpid(),
+            "pools": persistentHTTPClientPoolStats(),
+        }))
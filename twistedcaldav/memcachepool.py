@@ -14,9 +14,11 @@
 # limitations under the License.
 ##
 
+from collections import OrderedDict
+
 from twisted.python.failure import Failure
 
-from twisted.internet.defer import Deferred, fail
+from twisted.internet.defer import Deferred, fail, gatherResults, succeed
 from twisted.internet.protocol import ReconnectingClientFactory
 from twisted.protocols.memcache import MemCacheProtocol, NoSuchCommand
 
@@ -137,6 +139,9 @@ class MemCachePool(object):
 
     REQUEST_LOGGING_SIZE = 1024
 
+    # Maximum number of keys sent in one multi-key get request
+    MULTI_GET_CHUNK_SIZE = 250
+
     def __init__(self, endpoint, maxClients=5, reactor=None):
         """
         @param endpoint: An L{IStreamClientEndpoint} indicating the server to
@@ -237,7 +242,9 @@ class MemCachePool(object):
                 "Memcache error: {ex}; request: {cmd} {args}",
                 ex=failure.value,
                 cmd=command,
-                args=" ".join(args)[:self.REQUEST_LOGGING_SIZE],
+                args=" ".join(
+                    [" ".join(arg) if isinstance(arg, list) else str(arg) for arg in args]
+                )[:self.REQUEST_LOGGING_SIZE],
             )
             self.clientFree(client)
 
@@ -392,6 +399,93 @@ class MemCachePool(object):
     def flushAll(self, *args, **kwargs):
         return self.performRequest('flushAll', *args, **kwargs)
 
+    def getMany(self, keys, withIdentifier=False):
+        """
+        Get the values of several keys. The keys are split into chunks of at
+        most L{MULTI_GET_CHUNK_SIZE} keys, each of which is sent as a single
+        multi-key request. The chunks are issued concurrently, so they are
+        spread over the pooled clients rather than sent one after another.
+
+        @param keys: the keys to get
+        @type keys: iterable of C{str}
+        @param withIdentifier: if C{True} also return the check-and-set
+            identifier of each value
+        @type withIdentifier: C{bool}
+
+        @return: A L{Deferred} that fires with a C{dict} mapping each key to
+            the same result tuple that L{get} returns for it.
+        """
+        keys = list(OrderedDict.fromkeys(keys))
+        if not keys:
+            return succeed({})
+
+        ds = []
+        for ctr in xrange(0, len(keys), self.MULTI_GET_CHUNK_SIZE):
+            ds.append(self.performRequest(
+                'getMultiple',
+                keys[ctr:ctr + self.MULTI_GET_CHUNK_SIZE],
+                withIdentifier=withIdentifier,
+            ))
+
+        def _merge(results):
+            merged = {}
+            for result in results:
+                # A failed request is logged and results in None - treat as a miss
+                if result:
+                    merged.update(result)
+            missing = (0, "", None) if withIdentifier else (0, None)
+            for key in keys:
+                merged.setdefault(key, missing)
+            return merged
+
+        d = gatherResults(ds, consumeErrors=True)
+        d.addCallback(_merge)
+        return d
+
+    def setMany(self, mapping, expireTime=0):
+        """
+        Set the values of several keys, with the requests issued concurrently
+        over the pooled clients.
+
+        @param mapping: the keys and values to set
+        @type mapping: C{dict}
+
+        @return: A L{Deferred} that fires with a C{dict} mapping each key to
+            whether it was stored.
+        """
+        items = mapping.items()
+        return self._performMany(
+            [key for key, _ignore_value in items],
+            [('set', (key, value), {"expireTime": expireTime}) for key, value in items],
+        )
+
+    def deleteMany(self, keys):
+        """
+        Delete several keys, with the requests issued concurrently over the
+        pooled clients.
+
+        @param keys: the keys to delete
+        @type keys: iterable of C{str}
+
+        @return: A L{Deferred} that fires with a C{dict} mapping each key to
+            whether it was deleted.
+        """
+        keys = list(OrderedDict.fromkeys(keys))
+        return self._performMany(
+            keys,
+            [('delete', (key,), {}) for key in keys],
+        )
+
+    def _performMany(self, keys, requests):
+        if not requests:
+            return succeed({})
+        d = gatherResults(
+            [self.performRequest(command, *args, **kwargs) for command, args, kwargs in requests],
+            consumeErrors=True,
+        )
+        d.addCallback(lambda results: dict([(key, bool(result)) for key, result in zip(keys, results)]))
+        return d
+
 
 class CachePoolUserMixIn(object):
     """
@@ -125,7 +125,7 @@ class Memcacher(CachePoolUserMixIn):
                     identifier = ""
 
             if withIdentifier:
-                return succeed((0, value, str(identifier)))
+                return succeed((0, str(identifier), value))
             else:
                 return succeed((0, value,))
 
@@ -176,6 +176,24 @@ class Memcacher(CachePoolUserMixIn):
                     self._cache[key] = (str(value), expire, identifier,)
             return succeed(value)
 
+        def getMany(self, keys, withIdentifier=False):
+            results = {}
+            for key in keys:
+                results[key] = self.get(key, withIdentifier).result
+            return succeed(results)
+
+        def setMany(self, mapping, expireTime=0):
+            results = {}
+            for key, value in mapping.items():
+                results[key] = self.set(key, value, expireTime).result
+            return succeed(results)
+
+        def deleteMany(self, keys):
+            results = {}
+            for key in keys:
+                results[key] = self.delete(key).result
+            return succeed(results)
+
         def flushAll(self):
             self._cache = {}
             return succeed(True)
@@ -204,7 +222,7 @@ class Memcacher(CachePoolUserMixIn):
             return succeed(True)
 
         def get(self, key, withIdentifier=False):
-            return succeed((0, None,))
+            return succeed((0, "", None,) if withIdentifier else (0, None,))
 
         def delete(self, key):
             return succeed(True)
@@ -215,6 +233,15 @@ class Memcacher(CachePoolUserMixIn):
         def decr(self, key, delta=1):
             return succeed(None)
 
+        def getMany(self, keys, withIdentifier=False):
+            return succeed(dict([(key, (0, "", None,) if withIdentifier else (0, None,)) for key in keys]))
+
+        def setMany(self, mapping, expireTime=0):
+            return succeed(dict([(key, True) for key in mapping]))
+
+        def deleteMany(self, keys):
+            return succeed(dict([(key, True) for key in keys]))
+
         def flushAll(self):
             return succeed(True)
 
@@ -336,6 +363,71 @@ class Memcacher(CachePoolUserMixIn):
         self.log.debug("Decrementing Cache Token for {k!r}", k=key)
         return self._getMemcacheProtocol().incr('%s:%s' % (self._namespace, self._normalizeKey(key)), delta)
 
+    def getMany(self, keys):
+        """
+        Get the values of several keys with a single pipelined request rather
+        than one round trip per key.
+
+        @param keys: the keys to get
+        @type keys: iterable of C{str}
+
+        @return: a L{Deferred} that fires with a C{dict} mapping each of the
+            keys to its value, or L{None} if not cached
+        """
+        def _gotthem(results, keymap):
+            values = {}
+            for key, memcachekey in keymap.items():
+                value = results.get(memcachekey, (0, None,))[-1]
+                if self._pickle and value is not None:
+                    value = cPickle.loads(value)
+                values[key] = value
+            return values
+
+        keymap = dict([(key, '%s:%s' % (self._namespace, self._normalizeKey(key)),) for key in keys])
+        self.log.debug("Getting Cache Tokens for {k!r}", k=keymap.keys())
+        d = self._getMemcacheProtocol().getMany(keymap.values())
+        d.addCallback(_gotthem, keymap)
+        return d
+
+    def setMany(self, mapping, expireTime=0):
+        """
+        Set the values of several keys, with the requests issued concurrently.
+
+        @param mapping: the keys and values to set
+        @type mapping: C{dict}
+
+        @return: a L{Deferred} that fires with a C{dict} mapping each of the
+            keys to whether it was stored
+        """
+        proto = self._getMemcacheProtocol()
+
+        keymap = {}
+        values = {}
+        for key, value in mapping.items():
+            memcachekey = '%s:%s' % (self._namespace, self._normalizeKey(key))
+            keymap[memcachekey] = key
+            values[memcachekey] = cPickle.dumps(value) if self._pickle else value
+        self.log.debug("Setting Cache Tokens for {k!r}", k=mapping.keys())
+        d = proto.setMany(values, expireTime=expireTime)
+        d.addCallback(lambda results: dict([(keymap[memcachekey], result) for memcachekey, result in results.items()]))
+        return d
+
+    def deleteMany(self, keys):
+        """
+        Delete several keys, with the requests issued concurrently.
+
+        @param keys: the keys to delete
+        @type keys: iterable of C{str}
+
+        @return: a L{Deferred} that fires with a C{dict} mapping each of the
+            keys to whether it was deleted
+        """
+        keymap = dict([('%s:%s' % (self._namespace, self._normalizeKey(key)), key,) for key in keys])
+        self.log.debug("Deleting Cache Tokens for {k!r}", k=keymap.values())
+        d = self._getMemcacheProtocol().deleteMany(keymap.keys())
+        d.addCallback(lambda results: dict([(keymap[memcachekey], result) for memcachekey, result in results.items()]))
+        return d
+
     def flushAll(self):
         self.log.debug("Flushing All Cache Tokens")
         return self._getMemcacheProtocol().flushAll()
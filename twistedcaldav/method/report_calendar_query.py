@@ -41,6 +41,7 @@ from txdav.common.icommondatastore import IndexedSearchException, \
 from twistedcaldav.instance import TooManyInstancesError
 from twistedcaldav.method import report_common
 
+from txdav.caldav.datastore.query.builder import isExactFilter
 from txdav.caldav.datastore.query.filter import Filter
 from txdav.caldav.icalendarstore import TimeRangeLowerLimit, TimeRangeUpperLimit
 from txdav.xml import element as davxml
@@ -210,6 +211,11 @@ def report_urn_ietf_params_xml_ns_caldav_calendar_query(self, request, calendar_
                 except IndexedSearchException:
                     names = yield calresource.listChildren()
                     index_query_ok = False
+                else:
+                    # Prop-filters narrowed down by the index only give candidates, which
+                    # still need to be matched against the filter
+                    if not isExactFilter(filter):
+                        index_query_ok = False
 
                 if not names:
                     returnValue(True)
@@ -231,7 +237,8 @@ def report_urn_ietf_params_xml_ns_caldav_calendar_query(self, request, calendar_
                 for child, child_uri in ok_resources:
                     child_uri_name = child_uri[child_uri.rfind("/") + 1:]
 
-                    if generate_calendar_data or not index_query_ok:
+                    # Calendar data for an indexed query is generated from the resource when needed
+                    if not index_query_ok:
                         calendar = (yield child.componentForUser())
                         assert calendar is not None, "Calendar %s is missing from calendar collection %r" % (child_uri_name, self)
                     else:
@@ -40,10 +40,12 @@ from twistedcaldav import caldavxml
 from twistedcaldav import carddavxml
 from twistedcaldav.caldavxml import CalendarData
 from twistedcaldav.carddavxml import AddressData
+from twistedcaldav.config import config
 from twistedcaldav.datafilters.calendardata import CalendarDataFilter
 from twistedcaldav.datafilters.hiddeninstance import HiddenInstanceFilter
 from twistedcaldav.datafilters.privateevents import PrivateEventFilter
 from twistedcaldav.datafilters.addressdata import AddressDataFilter
+from twistedcaldav.ical import Component
 
 from txdav.xml import element
 
@@ -346,13 +348,21 @@ def _namedPropertiesForResource(request, props, resource, calendar=None, timezon
 
         if isinstance(property, caldavxml.CalendarData):
             if dataAllowed:
-                # Handle private events access restrictions
-                if calendar is None:
-                    calendar = (yield resource.componentForUser())
-                filtered = HiddenInstanceFilter().filter(calendar)
-                filtered = PrivateEventFilter(resource.accessMode, isowner).filter(filtered)
-                filtered = CalendarDataFilter(property, timezone).filter(filtered)
-                propvalue = CalendarData.fromCalendar(filtered, format=property.content_type)
+                # Use the stored data as-is when none of the filters would change it
+                propvalue = None
+                if calendar is None and _storedCalendarDataAllowed(resource, property, isowner):
+                    text = (yield resource.componentTextForUser())
+                    if text is not None and Component.HIDDEN_INSTANCE_PROPERTY not in text:
+                        propvalue = CalendarData.fromTextData(text)
+
+                if propvalue is None:
+                    # Handle private events access restrictions
+                    if calendar is None:
+                        calendar = (yield resource.componentForUser())
+                    filtered = HiddenInstanceFilter().filter(calendar)
+                    filtered = PrivateEventFilter(resource.accessMode, isowner).filter(filtered)
+                    filtered = CalendarDataFilter(property, timezone).filter(filtered)
+                    propvalue = CalendarData.fromCalendar(filtered, format=property.content_type)
                 properties_by_status[responsecode.OK].append(propvalue)
             else:
                 properties_by_status[responsecode.FORBIDDEN].append(propertyName(qname))
@@ -389,3 +399,27 @@ def _namedPropertiesForResource(request, props, resource, calendar=None, timezon
             properties_by_status[responsecode.NOT_FOUND].append(propertyName(qname))
 
     returnValue(properties_by_status)
+
+
+def _storedCalendarDataAllowed(resource, property, isowner):
+    """
+    Determine whether the stored calendar data of a resource can be returned for a
+    CALDAV:calendar-data element without parsing it. That requires that the element
+    asks for all of the data in iCalendar format, that the private event filter does
+    nothing, and that standard timezones are not to be added to the data (the store
+    strips them when timezones by reference is on).
+
+    @param resource: the L{CalDAVResource} for the targeted resource.
+    @param property: the L{CalendarData} element.
+    @param isowner: C{True} if the authorized principal making the request is the DAV:owner,
+        C{False} otherwise.
+
+    @rtype: C{bool}
+    """
+    return (
+        config.EnableTimezonesByReference and
+        not property.children and
+        property.content_type == "text/calendar" and
+        (isowner or resource.accessMode in (None, "", Component.ACCESS_PUBLIC)) and
+        hasattr(resource, "componentTextForUser")
+    )
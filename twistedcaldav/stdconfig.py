@@ -484,6 +484,13 @@ DEFAULT_CONFIG = {
         "StatisticsLogFile": "sqlstats.log",
         "SQLStatements": False,
         "TransactionWaitSeconds": 0,
+        "Tracing": {
+            "Enabled": True,            # Add per-request SQL statement, row and time totals to the access log
+            "SlowSeconds": 5.0,         # Keep the full SQL trace of transactions taking at least this long (0 to disable)
+            "SampleRate": 1.0,          # Fraction of transactions that record their statements
+            "MaxStatements": 500,       # Maximum number of statements recorded per transaction
+            "BufferSize": 20,           # Number of slow transaction traces kept in each process
+        },
     },
 
     #
@@ -565,6 +572,8 @@ DEFAULT_CONFIG = {
                                      # secondary service MUST define its own writable path if
                                      # not None
         "PrettyPrintJSON": True,    # User friendly JSON output
+        "ExpandCacheMaxEntries": 1000,  # Maximum number of cached observance expansions
+        "ExpandCacheMaxBytes": 10485760,  # Maximum total size of cached observance expansions (10 MB)
 
         "SecondaryService": {
             # Only one of these should be used when a secondary service is used
@@ -904,6 +913,9 @@ DEFAULT_CONFIG = {
         "Enabled": False,
         "SocketPath": "directory-proxy.sock",
         "InSidecarCachingSeconds": 120,
+        "ClientConnections": 2,             # Max connections from each worker to the proxy
+        "ClientReconnectSeconds": 0.5,      # Initial delay before reconnecting after a failure (doubles each time)
+        "ClientMaxReconnectSeconds": 30,    # Max delay before reconnecting after a failure
     },
 
     "DirectoryCaching": {
@@ -923,6 +935,13 @@ DEFAULT_CONFIG = {
         "ConduitName": "conduit",           # Name for top-level cross-pod resource
     },
 
+    # Persistent connections used for iSchedule and cross-pod requests
+    "OutboundHTTPConnections": {
+        "Enabled": True,                    # Keep connections open between requests
+        "MaxClientsPerHost": 5,             # Maximum concurrent connections to each host/port
+        "IdleTimeout": 60.0,                # Seconds before an idle connection is closed
+    },
+
     #
     # Performance tuning
     #
@@ -930,6 +949,10 @@ DEFAULT_CONFIG = {
     # Set the maximum number of outstanding requests to this server.
     "MaxRequests": 3,
     "MaxAccepts": 1,
+    "LoadReportInterval": 1.0,  # Seconds between load reports sent from
+                                # each worker to the master when MetaFD is
+                                # in use, so that new connections favor less
+                                # busy workers; 0 to disable
 
     "MaxDBConnectionsPerPool": 10,  # The maximum number of outstanding database
     # connections per database connection pool.
@@ -951,6 +974,7 @@ DEFAULT_CONFIG = {
     "UIDReservationTimeOut": 30 * 60,
 
     "MaxMultigetWithDataHrefs": 5000,
+    "MaxXMLRequestBodySize": 10 * 1024 * 1024,  # Max. size of an XML request body (in bytes) - 0 for no limit
     "MaxQueryWithDataResults": 1000,
 
     # How many results to return for principal search REPORT requests
@@ -1091,6 +1115,14 @@ DEFAULT_CONFIG = {
         "Enabled": True,
         "MemcachedPool": "Default",
         "ExpireSeconds": 3600,
+        "HomeSyncTokens": False,  # Share the latest calendar home sync token revision across processes
+    },
+
+    # Process-local cache of parsed calendar data
+    "ComponentCaching": {
+        "Enabled": False,
+        "MaxEntries": 1000,  # Maximum number of cached components
+        "MaxBytes": 16 * 1024 * 1024,  # Maximum total size of the cached calendar data
     },
 
     "GroupCaching": {
@@ -1131,16 +1163,21 @@ DEFAULT_CONFIG = {
 
     "EnableResponseCache": True,
     "ResponseCacheTimeout": 30,  # Minutes
+    "ResponseCacheTokenTimeout": 0,  # Seconds to keep a process-local copy of cache tokens (0 - always use memcache)
+    "ResponseCacheNegativeTimeout": 5,  # Seconds to remember a request is not in the cache
 
     "EnableFreeBusyCache": True,
     "FreeBusyCacheDaysBack": 7,
     "FreeBusyCacheDaysForward": 12 * 7,
+    "EnableBusyTimeIndex": False,  # Answer simple scheduling freebusy from a per-home busy time index
 
     "FreeBusyIndexLowerLimitDays": 365,
     "FreeBusyIndexExpandAheadDays": 365,
     "FreeBusyIndexExpandMaxDays": 5 * 365,
     "FreeBusyIndexDelayedExpand": False,
     "FreeBusyIndexSmartUpdate": True,
+    "FreeBusyIndexBulkInsertSize": 500,  # Max rows per multi-row instance index insert (0 to disable)
+    "FreeBusyIndexIncrementalUpdate": True,  # Only re-write changed instances when re-indexing
 
     # The RootResource uses a twext property store. Specify the class here
     "RootResourcePropStoreClass": "txweb2.dav.xattrprops.xattrPropertyStore",
@@ -24,7 +24,6 @@ from pycalendar.datetime import DateTime
 from twext.enterprise.locking import LockTimeout
 from twext.python.log import Logger
 from twisted.internet.defer import succeed, inlineCallbacks, returnValue, maybeDeferred
-from twisted.internet.protocol import Protocol
 from twisted.python.util import FancyEqMixin
 from twistedcaldav import customxml, carddavxml, caldavxml, ical
 from twistedcaldav.caldavxml import (
@@ -96,7 +95,7 @@ from txweb2.responsecode import (
     FORBIDDEN, NO_CONTENT, NOT_FOUND, CREATED, CONFLICT, PRECONDITION_FAILED,
     BAD_REQUEST, OK, INSUFFICIENT_STORAGE_SPACE, SERVICE_UNAVAILABLE
 )
-from txweb2.stream import ProducerStream, readStream, MemoryStream
+from txweb2.stream import FileStream, readStream, MemoryStream
 from twistedcaldav.timezones import TimezoneException
 
 
@@ -2102,27 +2101,30 @@ class CalendarAttachment(_NewStoreFileMetaDataHelper, _GetChildHelper):
             log.debug("Resource not found: {s!r}", s=self)
             raise HTTPError(NOT_FOUND)
 
-        stream = ProducerStream()
+        # The stored MD5 is a strong validator for the attachment data. Check
+        # conditional requests before opening the file, so a 304 costs nothing.
+        md5 = self._newStoreAttachment.md5()
+        etag = ETag(md5) if md5 else None
+        lastModified = self.lastModified()
+        http.checkPreconditions(request, etag=etag, lastModified=lastModified)
 
-        class StreamProtocol(Protocol):
-
-            def connectionMade(self):
-                stream.registerProducer(self.transport, False)
-
-            def dataReceived(self, data):
-                stream.write(data)
-
-            def connectionLost(self, reason):
-                stream.finish()
         try:
-            self._newStoreAttachment.retrieve(StreamProtocol())
+            f = self._newStoreAttachment.open()
         except IOError, e:
             log.error("Unable to read attachment: {s!r}, due to: {ex}", s=self, ex=e)
             raise HTTPError(NOT_FOUND)
 
+        # A FileStream has a known length, so the server's range filter can
+        # serve partial content, and data is sent from mmap'd chunks rather
+        # than copied through a producer
         headers = {"content-type": self.contentType()}
         headers["content-disposition"] = MimeDisposition("attachment", params={"filename": self.displayName()})
-        return Response(OK, headers, stream)
+        response = Response(OK, headers, FileStream(f))
+        if etag is not None:
+            response.headers.setHeader("etag", etag)
+        if lastModified is not None:
+            response.headers.setHeader("last-modified", lastModified)
+        return response
 
     @requiresPermissions(fromParent=[davxml.Unbind()])
     @inlineCallbacks
@@ -2540,6 +2542,9 @@ class CalendarObjectResource(_CalendarObjectMetaDataMixin, _CommonObjectResource
     def componentForUser(self):
         return self._newStoreObject.componentForUser()
 
+    def componentTextForUser(self):
+        return self._newStoreObject.componentTextForUser()
+
     def validIfScheduleMatch(self, request):
         """
         Check to see if the given request's C{If-Schedule-Tag-Match} header
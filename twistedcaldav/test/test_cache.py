@@ -20,19 +20,26 @@ import cPickle
 
 from twisted.internet.defer import succeed, maybeDeferred, inlineCallbacks
 
-from txweb2.dav.util import allDataFromStream
+from txweb2.dav.util import allDataFromStream, ParsedXMLStream, davXMLFromStream
 from txweb2.stream import MemoryStream
 from txweb2.http_headers import Headers
 
 from twistedcaldav.cache import MemcacheResponseCache, CacheStoreNotifier
-from twistedcaldav.cache import MemcacheChangeNotifier
-from twistedcaldav.cache import PropfindCacheMixin
+from twistedcaldav.cache import MemcacheChangeNotifier, localTokens
+from twistedcaldav.cache import PropfindCacheMixin, RequestBodyReader
+from twistedcaldav.config import config
 
 from twistedcaldav.test.util import InMemoryMemcacheProtocol
 from twistedcaldav.test.util import TestCase
 from txdav.xml import element
 
 
+def _bodyHash(body):
+    reader = RequestBodyReader()
+    reader.feed(body)
+    return reader.hash()
+
+
 def _newCacheToken(self):
     called = getattr(self, '_called', 0)
 
@@ -251,7 +258,7 @@ class BaseCacheTestMixin(object):
         return d
 
     def test_getResponseForRequestPrincipalTokenChanged(self):
-        self.tokens['/principals/__uids__/cdaboo/'] = 'principalToken1'
+        self.setToken('/principals/__uids__/cdaboo/', 'principalToken1')
 
         d = self.rc.getResponseForRequest(StubRequest(
             'PROPFIND',
@@ -263,7 +270,7 @@ class BaseCacheTestMixin(object):
         return d
 
     def test_getResponseForRequestUriTokenChanged(self):
-        self.tokens['/calendars/__uids__/cdaboo/'] = 'uriToken1'
+        self.setToken('/calendars/__uids__/cdaboo/', 'uriToken1')
 
         d = self.rc.getResponseForRequest(StubRequest(
             'PROPFIND',
@@ -275,7 +282,7 @@ class BaseCacheTestMixin(object):
         return d
 
     def test_getResponseForRequestChildTokenChanged(self):
-        self.tokens['/calendars/__uids__/cdaboo/calendars/'] = 'childToken1'
+        self.setToken('/calendars/__uids__/cdaboo/calendars/', 'childToken1')
 
         d = self.rc.getResponseForRequest(StubRequest(
             'PROPFIND',
@@ -383,17 +390,13 @@ class MemcacheResponseCacheTests(BaseCacheTestMixin, TestCase):
 
         memcacheStub = InMemoryMemcacheProtocol()
         self.rc = MemcacheResponseCache(None, cachePool=memcacheStub)
-        self.tokens = {}
-
-        self.tokens['/calendars/__uids__/cdaboo/'] = 'uriToken0'
-        self.tokens['/calendars/__uids__/cdaboo/calendars/'] = 'childToken0'
-        self.tokens['/principals/__uids__/cdaboo/'] = 'principalToken0'
-        self.tokens['/principals/__uids__/dreid/'] = 'principalTokenX'
-
-        def _getToken(uri, cachePoolHandle=None):
-            return succeed(self.tokens.get(uri))
+        self.memcacheStub = memcacheStub
+        localTokens.clear()
 
-        self.rc._tokenForURI = _getToken
+        self.setToken('/calendars/__uids__/cdaboo/', 'uriToken0')
+        self.setToken('/calendars/__uids__/cdaboo/calendars/', 'childToken0')
+        self.setToken('/principals/__uids__/cdaboo/', 'principalToken0')
+        self.setToken('/principals/__uids__/dreid/', 'principalTokenX')
 
         self.expected_response = (200, Headers({}), "Foo")
 
@@ -402,7 +405,7 @@ class MemcacheResponseCacheTests(BaseCacheTestMixin, TestCase):
             '/principals/__uids__/cdaboo/',
             '/calendars/__uids__/cdaboo/',
             '1',
-            hash('foobar'),
+            _bodyHash('foobar'),
         )])).hexdigest()
 
         memcacheStub._cache[expected_key] = (
@@ -420,11 +423,13 @@ class MemcacheResponseCacheTests(BaseCacheTestMixin, TestCase):
             ))
         )
 
-        self.memcacheStub = memcacheStub
-
     def tearDown(self):
         for call in self.memcacheStub._timeouts.itervalues():
             call.cancel()
+        localTokens.clear()
+
+    def setToken(self, uri, token):
+        self.memcacheStub._cache['cacheToken:%s' % (uri,)] = (0, token)
 
     def test_givenURIsForKeys(self):
         expected_response = (200, Headers({}), "Foobarbaz")
@@ -434,7 +439,7 @@ class MemcacheResponseCacheTests(BaseCacheTestMixin, TestCase):
             '/principals/__uids__/cdaboo/',
             '/calendars/users/cdaboo/',
             '1',
-            hash('foobar'),
+            _bodyHash('foobar'),
         )
 
         expected_key = hashlib.md5(':'.join([str(t) for t in _key])).hexdigest()
@@ -462,6 +467,171 @@ class MemcacheResponseCacheTests(BaseCacheTestMixin, TestCase):
         d.addCallback(self.assertResponse, expected_response)
         return d
 
+    @inlineCallbacks
+    def test_tokensFetchedTogether(self):
+        """
+        All the tokens held in memcache are fetched with one multi-key request,
+        and the outcome is recorded on the request.
+        """
+        requests = []
+        getMany = self.memcacheStub.getMany
+
+        def _getMany(keys):
+            requests.append(sorted(keys))
+            return getMany(keys)
+        self.memcacheStub.getMany = _getMany
+
+        request = StubRequest(
+            'PROPFIND',
+            '/calendars/__uids__/cdaboo/',
+            '/principals/__uids__/cdaboo/'
+        )
+        response = yield self.rc.getResponseForRequest(request)
+        yield self.assertResponse(response, self.expected_response)
+        self.assertEqual(requests, [[
+            'cacheToken:/calendars/__uids__/cdaboo/',
+            'cacheToken:/calendars/__uids__/cdaboo/calendars/',
+            'cacheToken:/principals/__uids__/cdaboo/',
+        ]])
+        self.assertEqual(request.responseCacheStats["hit"], 1)
+        self.assertEqual(request.responseCacheStats["miss"], 0)
+
+    @inlineCallbacks
+    def test_localTokens(self):
+        """
+        Tokens are kept locally for L{config.ResponseCacheTokenTimeout} seconds,
+        except that a change made by this process is seen straight away.
+        """
+        self.patch(config, "ResponseCacheTokenTimeout", 60)
+
+        def _request():
+            return StubRequest(
+                'PROPFIND',
+                '/calendars/__uids__/cdaboo/',
+                '/principals/__uids__/cdaboo/'
+            )
+
+        response = yield self.rc.getResponseForRequest(_request())
+        yield self.assertResponse(response, self.expected_response)
+
+        # Change made by another process is not seen
+        self.setToken('/calendars/__uids__/cdaboo/', 'uriToken1')
+        response = yield self.rc.getResponseForRequest(_request())
+        yield self.assertResponse(response, self.expected_response)
+
+        # Change made by this process is seen
+        notifier = MemcacheChangeNotifier(None, cachePool=self.memcacheStub)
+        yield notifier.changed('/calendars/__uids__/cdaboo/calendars/')
+        response = yield self.rc.getResponseForRequest(_request())
+        self.assertEqual(response, None)
+
+    @inlineCallbacks
+    def test_negativeCache(self):
+        """
+        A request that was not in the cache is not looked up again until the
+        negative cache entry expires, or the response is cached by this process.
+        """
+        self.patch(config, "ResponseCacheNegativeTimeout", 60)
+
+        def _request():
+            return StubRequest(
+                'PROPFIND',
+                '/principals/__uids__/dreid/',
+                '/principals/__uids__/dreid/'
+            )
+
+        gets = []
+        get = self.memcacheStub.get
+
+        def _get(key):
+            gets.append(key)
+            return get(key)
+        self.memcacheStub.get = _get
+
+        request = _request()
+        response = yield self.rc.getResponseForRequest(request)
+        self.assertEqual(response, None)
+        self.assertEqual(len(gets), 1)
+        self.assertEqual(request.responseCacheStats["miss"], 1)
+
+        response = yield self.rc.getResponseForRequest(_request())
+        self.assertEqual(response, None)
+        self.assertEqual(len(gets), 1)
+
+        expected_response = StubResponse(200, {}, "Foobar")
+        yield self.rc.cacheResponseForRequest(_request(), expected_response)
+        response = yield self.rc.getResponseForRequest(_request())
+        yield self.assertResponse(response, (expected_response.code, expected_response.headers, expected_response.body))
+        self.assertEqual(len(gets), 2)
+
+
+class RequestBodyReaderTests(TestCase):
+    """
+    Tests for L{RequestBodyReader}.
+    """
+
+    body = """<?xml version="1.0" encoding="utf-8" ?>
+<D:propfind xmlns:D="DAV:">
+<D:prop>
+<D:getetag/>
+<D:resourcetype/>
+</D:prop>
+</D:propfind>
+"""
+
+    def _read(self, chunks):
+        reader = RequestBodyReader()
+        for chunk in chunks:
+            reader.feed(chunk)
+        return reader
+
+    def test_hash(self):
+        """
+        The hash does not depend on the order of lines in the body or on how the
+        body is split into chunks.
+        """
+        reader = self._read([self.body])
+        lines = self.body.splitlines()
+        reordered = "\n".join(lines[:3] + [lines[4], lines[3]] + lines[5:]) + "\n"
+        self.assertEqual(self._read([reordered]).hash(), reader.hash())
+        self.assertEqual(self._read([self.body[:50], self.body[50:51], self.body[51:]]).hash(), reader.hash())
+        self.assertNotEqual(self._read([self.body.replace("getetag", "getctag")]).hash(), reader.hash())
+        self.assertEqual(reader.hash(), hashlib.md5("".join(sorted([hashlib.md5(line).digest() for line in lines]))).hexdigest())
+        self.assertTrue(RequestBodyReader().hash() is None)
+
+    def test_document(self):
+        """
+        The body is parsed as it is read, and a body that is not XML is
+        tolerated.
+        """
+        reader = self._read([self.body[:50], self.body[50:]])
+        document = reader.document()
+        self.assertTrue(isinstance(document.root_element, element.PropertyFind))
+
+        reader = self._read(["foobar"])
+        self.assertEqual(reader.document(), None)
+        self.assertTrue(reader.hash() is not None)
+
+    @inlineCallbacks
+    def test_requestKeyParsesBody(self):
+        """
+        The request body is parsed whilst computing the cache key, and the
+        parsed document is handed to L{davXMLFromStream}.
+        """
+        rc = MemcacheResponseCache(None, cachePool=InMemoryMemcacheProtocol())
+        request = StubRequest(
+            'PROPFIND',
+            '/calendars/__uids__/cdaboo/',
+            '/principals/__uids__/cdaboo/',
+            body=self.body,
+        )
+        yield rc._requestKey(request)
+        self.assertTrue(isinstance(request.stream, ParsedXMLStream))
+        document = yield davXMLFromStream(request.stream)
+        self.assertTrue(document is request.stream.document)
+        body = yield allDataFromStream(request.stream)
+        self.assertEqual(body, self.body)
+
 
 class StubResponseCacheResource(object):
 
@@ -380,3 +380,53 @@ class MemCachePoolTests(TestCase):
 
         self.pool.performRequest('get', 'bar')
         self.assertEquals(self.reactor.calls, [])
+
+    def test_getManyMergesChunks(self):
+        """
+        Test that L{MemCachePool.getMany} splits the keys into chunks, issues a
+        multi-key request for each, and merges the results, with missing keys
+        reported as misses.
+        """
+        def _checkResult(result):
+            self.assertEquals(result, {
+                'foo': (0, 'bar'),
+                'baz': (0, 'qux'),
+                'missing': (0, None),
+            })
+            self.assertEquals(self.reactor.calls, [])
+
+        p = InMemoryMemcacheProtocol()
+        p.set('foo', 'bar')
+        p.set('baz', 'qux')
+
+        requests = []
+        getMultiple = p.getMultiple
+
+        def _getMultiple(keys, withIdentifier=False):
+            requests.append(keys)
+            return getMultiple(keys, withIdentifier)
+        p.getMultiple = _getMultiple
+
+        self.pool.clientFree(p)
+        self.patch(self.pool, "MULTI_GET_CHUNK_SIZE", 2)
+
+        d = self.pool.getMany(['foo', 'baz', 'missing', 'foo'])
+        d.addCallback(_checkResult)
+        d.addCallback(lambda _: self.assertEquals(requests, [['foo', 'baz'], ['missing']]))
+        return d
+
+    def test_setManyDeleteMany(self):
+        """
+        Test that L{MemCachePool.setMany} and L{MemCachePool.deleteMany} store
+        and remove each key and report the result for each.
+        """
+        p = InMemoryMemcacheProtocol()
+        self.pool.clientFree(p)
+
+        d = self.pool.setMany({'foo': 'bar', 'baz': 'qux'})
+        d.addCallback(self.assertEquals, {'foo': True, 'baz': True})
+        d.addCallback(lambda _: self.assertEquals(p._cache, {'foo': (0, 'bar'), 'baz': (0, 'qux')}))
+        d.addCallback(lambda _: self.pool.deleteMany(['foo', 'missing']))
+        d.addCallback(self.assertEquals, {'foo': True, 'missing': False})
+        d.addCallback(lambda _: self.assertEquals(p._cache, {'baz': (0, 'qux')}))
+        return d
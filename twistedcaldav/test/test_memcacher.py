@@ -167,14 +167,14 @@ class MemcacherTestCase(TestCase):
         result = yield cacher.set("akey", "avalue")
         self.assertTrue(result)
 
-        value, identifier = yield cacher.get("akey", withIdentifier=True)
+        identifier, value = yield cacher.get("akey", withIdentifier=True)
         self.assertEquals("avalue", value)
         self.assertEquals(identifier, "0")
 
         # Make sure cas identifier changes (we know the test implementation increases
         # by 1 each time)
         result = yield cacher.set("akey", "anothervalue")
-        value, identifier = yield cacher.get("akey", withIdentifier=True)
+        identifier, value = yield cacher.get("akey", withIdentifier=True)
         self.assertEquals("anothervalue", value)
         self.assertEquals(identifier, "1")
 
@@ -185,6 +185,41 @@ class MemcacherTestCase(TestCase):
         # Should work because identifier does match:
         self.assertTrue((yield cacher.checkAndSet("akey", "yetanother", "1")))
 
+        config.ProcessType = "Combined"
+        cacher = Memcacher("testing")
+
+        result = yield cacher.set("akey", "avalue")
+        self.assertTrue(result)
+        self.assertTrue(isinstance(cacher._memcacheProtocol, Memcacher.nullCacher))
+
+        identifier, value = yield cacher.get("akey", withIdentifier=True)
+        self.assertEquals(value, None)
+        self.assertEquals(identifier, "")
+
+    @inlineCallbacks
+    def test_many(self):
+
+        for processType in ("Single", "Combined",):
+            config.ProcessType = processType
+
+            for pickle in (True, False,):
+                cacher = Memcacher("testing", pickle=pickle)
+
+                result = yield cacher.setMany({"akey": "avalue", "bkey": "bvalue"})
+                self.assertEquals(result, {"akey": True, "bkey": True})
+
+                result = yield cacher.getMany(["akey", "bkey", "ckey"])
+                if isinstance(cacher._memcacheProtocol, Memcacher.nullCacher):
+                    self.assertEquals(result, {"akey": None, "bkey": None, "ckey": None})
+                else:
+                    self.assertEquals(result, {"akey": "avalue", "bkey": "bvalue", "ckey": None})
+
+                result = yield cacher.deleteMany(["akey", "bkey"])
+                self.assertEquals(result, {"akey": True, "bkey": True})
+
+                result = yield cacher.getMany(["akey", "bkey"])
+                self.assertEquals(result, {"akey": None, "bkey": None})
+
     @inlineCallbacks
     def test_keyValueLimits(self):
 
@@ -198,7 +233,15 @@ class MemcacherTestCase(TestCase):
         result = yield cacher.set("*" * (Memcacher.MEMCACHE_KEY_LIMIT + 10), "*")
         self.assertFalse(result)
         value = yield cacher.get("*" * (Memcacher.MEMCACHE_KEY_LIMIT + 10), "*")
-        self.assertEquals(value, (None, "",))
+        self.assertEquals(value, ("", None,))
+
+        config.ProcessType = "Combined"
+        nullCacher = Memcacher("testing", key_normalization=False)
+        value = yield nullCacher.get("*", withIdentifier=True)
+        self.assertEquals(value, ("", None,))
+        value = yield nullCacher.get("*" * (Memcacher.MEMCACHE_KEY_LIMIT + 10), withIdentifier=True)
+        self.assertEquals(value, ("", None,))
+        config.ProcessType = "Single"
 
         # Value limits
         result = yield cacher.set("*", "*" * (Memcacher.MEMCACHE_VALUE_LIMIT + 10))
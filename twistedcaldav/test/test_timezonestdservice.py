@@ -16,7 +16,8 @@
 
 from twistedcaldav.timezones import TimezoneCache
 from twistedcaldav.timezonestdservice import TimezoneInfo, \
-    PrimaryTimezoneDatabase
+    PrimaryTimezoneDatabase, TimezoneExpandCache
+from txweb2.http_headers import ETag
 from xml.etree.ElementTree import Element
 import hashlib
 import os
@@ -149,3 +150,105 @@ class TestPrimaryTimezoneDatabase (twistedcaldav.test.util.TestCase):
         tz1 = db.getTimezone("US/Eastern")
         self.assertTrue(str(tz1).find("VTIMEZONE") != -1)
         self.assertTrue(str(tz1).find("TZID:US/Eastern") != -1)
+
+    def testGetTimezoneData(self):
+
+        xmlfile = self.mktemp()
+        db = PrimaryTimezoneDatabase(TimezoneCache.getDBPath(), xmlfile)
+        db.createNewDatabase()
+
+        self.assertEqual(db.getTimezoneData("Bogus", "text/calendar"), None)
+
+        data1, etag1 = db.getTimezoneData("America/New_York", "text/calendar")
+        self.assertTrue(data1.find("TZID:America/New_York") != -1)
+        self.assertEqual(etag1, ETag(hashlib.md5("text/calendar\n" + data1).hexdigest()))
+        self.assertFalse(etag1.weak)
+
+        # Same rendered data is returned again
+        data2, etag2 = db.getTimezoneData("America/New_York", "text/calendar")
+        self.assertTrue(data2 is data1)
+        self.assertEqual(etag2, etag1)
+
+        # Same data as text/plain has a different ETag
+        data3, etag3 = db.getTimezoneData("America/New_York", "text/plain")
+        self.assertTrue(data3.find("TZID:America/New_York") != -1)
+        self.assertNotEqual(etag3, etag1)
+
+        # Alias
+        data4, _ignore_etag4 = db.getTimezoneData("US/Eastern", "text/calendar")
+        self.assertTrue(data4.find("TZID:US/Eastern") != -1)
+
+    def testPrerender(self):
+
+        xmlfile = self.mktemp()
+        db = PrimaryTimezoneDatabase(TimezoneCache.getDBPath(), xmlfile)
+        db.createNewDatabase()
+
+        db.prerender(("text/calendar",))
+        self.assertTrue(("America/New_York", "text/calendar",) in db.rendered)
+        self.assertTrue(("US/Eastern", "text/calendar",) in db.rendered)
+        self.assertEqual(len(db.rendered), len(set(db.timezones) | set(db.aliases)))
+
+        # Reading the database discards the rendered data
+        db.readDatabase()
+        self.assertEqual(len(db.rendered), 0)
+
+
+class TestTimezoneExpandCache (twistedcaldav.test.util.TestCase):
+    """
+    Timezone expansion cache tests
+    """
+
+    def _rendered(self, data):
+        return (data, ETag(hashlib.md5(data).hexdigest()),)
+
+    def test_getPut(self):
+
+        cache = TimezoneExpandCache(10, 1000)
+        self.assertEqual(cache.get(("a",)), None)
+        cache.put(("a",), self._rendered("1234"))
+        self.assertEqual(cache.get(("a",))[0], "1234")
+        self.assertEqual(cache.stats(), {
+            "entries": 1,
+            "bytes": 4,
+            "hits": 1,
+            "misses": 1,
+            "evictions": 0,
+        })
+
+        # Replacing an entry adjusts the size
+        cache.put(("a",), self._rendered("12"))
+        self.assertEqual(cache.stats()["bytes"], 2)
+        self.assertEqual(len(cache), 1)
+
+    def test_evictEntries(self):
+
+        cache = TimezoneExpandCache(2, 1000)
+        cache.put(("a",), self._rendered("1"))
+        cache.put(("b",), self._rendered("2"))
+
+        # Make "a" the most recently used
+        self.assertNotEqual(cache.get(("a",)), None)
+        cache.put(("c",), self._rendered("3"))
+
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.get(("b",)), None)
+        self.assertNotEqual(cache.get(("a",)), None)
+        self.assertNotEqual(cache.get(("c",)), None)
+        self.assertEqual(cache.evictions, 1)
+
+    def test_evictBytes(self):
+
+        cache = TimezoneExpandCache(10, 10)
+        cache.put(("a",), self._rendered("12345"))
+        cache.put(("b",), self._rendered("12345"))
+        cache.put(("c",), self._rendered("12"))
+
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.get(("a",)), None)
+        self.assertEqual(cache.stats()["bytes"], 7)
+
+        # Too big to cache at all
+        cache.put(("d",), self._rendered("x" * 11))
+        self.assertEqual(cache.get(("d",)), None)
+        self.assertEqual(len(cache), 2)
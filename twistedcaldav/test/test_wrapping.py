@@ -22,6 +22,7 @@ Tests for the interaction between model-level and protocol-level logic.
 from twext.enterprise.ienterprise import AlreadyFinishedError
 from twext.enterprise.locking import NamedLock
 from txweb2 import responsecode
+from txweb2.dav.util import allDataFromStream
 from txweb2.http import HTTPError
 from txweb2.http_headers import Headers, MimeType
 from txweb2.responsecode import INSUFFICIENT_STORAGE_SPACE
@@ -51,6 +52,7 @@ from txdav.idav import IDataStore
 from txdav.xml import element as davxml
 
 import hashlib
+import urlparse
 
 
 def _todo(f, why):
@@ -619,3 +621,109 @@ END:VCALENDAR
         )
         response = yield self.send(request)
         self.assertEqual(response.code, responsecode.SERVICE_UNAVAILABLE)
+
+
+class AttachmentTests(StoreTestCase):
+    """
+    Tests for L{twistedcaldav.storebridge.CalendarAttachment} GET.
+    """
+
+    data = "0123456789" * 10
+
+    def configure(self):
+        """
+        Override configuration hook to turn on managed attachments.
+        """
+        super(AttachmentTests, self).configure()
+        self.patch(config, "EnableDropBox", False)
+        self.patch(config, "EnableManagedAttachments", True)
+
+    @inlineCallbacks
+    def _createAttachment(self):
+        """
+        Create an event with a managed attachment owned by wsanchez.
+
+        @return: a L{Deferred} that fires with the path of the attachment.
+        """
+        record = yield self.directory.recordWithShortName(RecordType.user, u"wsanchez")
+        txn = self.transactionUnderTest()
+        home = yield txn.calendarHomeWithUID(record.uid, create=True)
+        cal = yield home.calendarWithName("calendar")
+        obj = yield cal.createCalendarObjectWithName("1.ics", VComponent.fromString(test_event_text))
+        _ignore_attachment, location = yield obj.addAttachment(None, MimeType("text", "plain"), "new.txt", MemoryStream(self.data))
+        yield self.commit()
+        returnValue(urlparse.urlparse(location)[2])
+
+    @inlineCallbacks
+    def _get(self, path, headers=None):
+        """
+        GET the attachment as wsanchez, returning error responses rather than
+        raising them.
+        """
+        principal = yield self.actualRoot.findPrincipalForAuthID("wsanchez")
+        request = SimpleStoreRequest(
+            self,
+            "GET",
+            path,
+            headers=headers,
+            authPrincipal=principal
+        )
+        try:
+            response = yield self.send(request)
+        except HTTPError, e:
+            response = e.response
+        returnValue(response)
+
+    @inlineCallbacks
+    def test_validators(self):
+        """
+        GET returns the attachment data with ETag and Last-Modified headers.
+        """
+        path = yield self._createAttachment()
+        response = yield self._get(path)
+        self.assertEqual(response.code, responsecode.OK)
+        self.assertEqual(response.headers.getHeader("etag").tag, hashlib.md5(self.data).hexdigest())
+        self.assertTrue(response.headers.getHeader("last-modified") is not None)
+        body = yield allDataFromStream(response.stream)
+        self.assertEqual(body, self.data)
+
+    @inlineCallbacks
+    def test_conditionalGET(self):
+        """
+        A conditional GET using the attachment's ETag or Last-Modified is
+        answered with a 304.
+        """
+        path = yield self._createAttachment()
+        response = yield self._get(path)
+        etag = response.headers.getRawHeaders("etag")
+        lastModified = response.headers.getRawHeaders("last-modified")
+        yield allDataFromStream(response.stream)
+
+        response = yield self._get(path, Headers(rawHeaders={"if-none-match": etag}))
+        self.assertEqual(response.code, responsecode.NOT_MODIFIED)
+
+        response = yield self._get(path, Headers(rawHeaders={"if-modified-since": lastModified}))
+        self.assertEqual(response.code, responsecode.NOT_MODIFIED)
+
+        response = yield self._get(path, Headers(rawHeaders={"if-none-match": ['"bogus"']}))
+        self.assertEqual(response.code, responsecode.OK)
+        yield allDataFromStream(response.stream)
+
+    @inlineCallbacks
+    def test_rangeGET(self):
+        """
+        A Range GET returns a 206 with the matching Content-Range and slice of
+        the attachment data.
+        """
+        path = yield self._createAttachment()
+        response = yield self._get(path, Headers(rawHeaders={"range": ["bytes=10-24"]}))
+        self.assertEqual(response.code, responsecode.PARTIAL_CONTENT)
+        self.assertEqual(response.headers.getHeader("content-range"), ("bytes", 10, 24, len(self.data),))
+        body = yield allDataFromStream(response.stream)
+        self.assertEqual(body, self.data[10:25])
+
+        response = yield self._get(path, Headers(rawHeaders={"range": ["bytes=-5"]}))
+        self.assertEqual(response.code, responsecode.PARTIAL_CONTENT)
+        self.assertEqual(response.headers.getHeader("content-range"), ("bytes", len(self.data) - 5, len(self.data) - 1, len(self.data),))
+        body = yield allDataFromStream(response.stream)
+        self.assertEqual(body, self.data[-5:])
@@ -448,6 +448,12 @@ class InMemoryMemcacheProtocol(object):
 
         return succeed(self._cache[key])
 
+    def getMultiple(self, keys, withIdentifier=False):
+        return succeed(dict([(key, self._cache.get(key, (0, None))) for key in keys]))
+
+    def getMany(self, keys):
+        return self.getMultiple(keys)
+
     def _timeoutKey(self, expireTime, key):
         def _removeKey():
             del self._cache[key]
@@ -23,6 +23,7 @@ proposal for a standard timezone service.
 
 __all__ = [
     "TimezoneStdServiceResource",
+    "TimezoneExpandCache",
 ]
 
 from twext.python.log import Logger
@@ -32,7 +33,7 @@ from txweb2.dav.noneprops import NonePropertyStore
 from txweb2.dav.util import joinURL
 from txweb2.http import HTTPError, JSONResponse, StatusResponse
 from txweb2.http import Response
-from txweb2.http_headers import MimeType
+from txweb2.http_headers import ETag, MimeType
 from txweb2.stream import MemoryStream
 from txdav.xml import element as davxml
 
@@ -55,6 +56,8 @@ from pycalendar.icalendar.calendar import Calendar
 from pycalendar.datetime import DateTime
 from pycalendar.exceptions import InvalidData
 
+from collections import OrderedDict
+
 import hashlib
 import itertools
 import json
@@ -80,7 +83,11 @@ class TimezoneStdServiceResource (ReadOnlyNoCopyResourceMixIn, DAVResourceWithou
         DAVResource.__init__(self, principalCollections=parent.principalCollections())
 
         self.parent = parent
-        self.expandcache = {}
+        self.expandcache = TimezoneExpandCache(
+            config.TimezoneService.ExpandCacheMaxEntries,
+            config.TimezoneService.ExpandCacheMaxBytes,
+        )
+        self.listcache = None
         self.primary = True
         self.info_source = None
 
@@ -124,8 +131,13 @@ class TimezoneStdServiceResource (ReadOnlyNoCopyResourceMixIn, DAVResourceWithou
         self.info_source = "Secondary"
         self.primary = False
 
+    @inlineCallbacks
     def onStartup(self):
-        return self.timezones.onStartup()
+        yield self.timezones.onStartup()
+
+        # Render every timezone in each format we serve up front, so that GETs
+        # are served straight from memory
+        self.timezones.prerender(self.formats)
 
     def deadProperties(self):
         if not hasattr(self, "_dead_properties"):
@@ -202,6 +214,31 @@ class TimezoneStdServiceResource (ReadOnlyNoCopyResourceMixIn, DAVResourceWithou
     def http_POST(self, request):
         raise HTTPError(StatusResponse(responsecode.NOT_ALLOWED, "Method not allowed"))
 
+    def _renderJSON(self, result):
+        """
+        Render a JSON result the same way L{JSONResponse} would.
+
+        @return: C{tuple} of the rendered data and its L{ETag}
+        """
+        kwargs = {}
+        if config.TimezoneService.PrettyPrintJSON:
+            kwargs["indent"] = 2
+            kwargs["separators"] = (',', ':')
+        data = json.dumps(result, **kwargs)
+        return data, ETag(hashlib.md5(data).hexdigest())
+
+    def _dataResponse(self, data, etag, contentType):
+        """
+        Build a response for pre-rendered data. Since the ETag is set,
+        If-None-Match requests are answered with a 304 by the server's
+        precondition filter.
+        """
+        response = Response()
+        response.stream = MemoryStream(data)
+        response.headers.setHeader("content-type", MimeType.fromString(contentType))
+        response.headers.setHeader("etag", etag)
+        return response
+
     @inlineCallbacks
     def http_GET(self, request):
         """
@@ -342,6 +379,10 @@ class TimezoneStdServiceResource (ReadOnlyNoCopyResourceMixIn, DAVResourceWithou
             if not dt.utc():
                 self.problemReport("invalid-changedsince", "Invalid changedsince request-URI query parameter value - not UTC", responsecode.BAD_REQUEST)
 
+        # The full list only changes with the database, so keep it rendered
+        if not changedsince and self.listcache is not None and self.listcache[0] == self.timezones.dtstamp:
+            return self._dataResponse(self.listcache[1], self.listcache[2], "application/json")
+
         timezones = []
         for tz in self.timezones.listTimezones(changedsince):
             timezones.append({
@@ -353,7 +394,10 @@ class TimezoneStdServiceResource (ReadOnlyNoCopyResourceMixIn, DAVResourceWithou
             "dtstamp": self.timezones.dtstamp,
             "timezones": timezones,
         }
-        return JSONResponse(responsecode.OK, result, pretty=config.TimezoneService.PrettyPrintJSON)
+        data, etag = self._renderJSON(result)
+        if not changedsince:
+            self.listcache = (self.timezones.dtstamp, data, etag,)
+        return self._dataResponse(data, etag, "application/json")
 
     def actionGet(self, request, tzid):
         """
@@ -367,16 +411,12 @@ class TimezoneStdServiceResource (ReadOnlyNoCopyResourceMixIn, DAVResourceWithou
         if accepted_type is None:
             self.problemReport("invalid-format", "Accept header does not match available media types", responsecode.NOT_ACCEPTABLE)
 
-        calendar = self.timezones.getTimezone(tzid)
-        if calendar is None:
+        rendered = self.timezones.getTimezoneData(tzid, accepted_type)
+        if rendered is None:
             self.problemReport("tzid-not-found", "Time zone identifier not found", responsecode.NOT_FOUND)
 
-        tzdata = calendar.getText(format=accepted_type if accepted_type != "text/plain" else None)
-
-        response = Response()
-        response.stream = MemoryStream(tzdata)
-        response.headers.setHeader("content-type", MimeType.fromString("%s; charset=utf-8" % (accepted_type,)))
-        return response
+        tzdata, etag = rendered
+        return self._dataResponse(tzdata, etag, "%s; charset=utf-8" % (accepted_type,))
 
     def actionExpand(self, request, tzid):
         """
@@ -414,30 +454,36 @@ class TimezoneStdServiceResource (ReadOnlyNoCopyResourceMixIn, DAVResourceWithou
             if end <= start:
                 self.problemReport("invalid-end", "Invalid end request-URI query parameter value - earlier than start", responsecode.BAD_REQUEST)
 
-        tzdata = self.timezones.getTimezone(tzid)
-        if tzdata is None:
-            self.problemReport("tzid-not-found", "Time zone identifier not found", responsecode.NOT_FOUND)
+        # Use the cache to avoid re-calculating TZs - the database dtstamp is
+        # part of the key so entries from before a change simply age out
+        key = (tzid, start, end, self.timezones.dtstamp,)
+        rendered = self.expandcache.get(key)
+        if rendered is None:
+            tzdata = self.timezones.getTimezone(tzid)
+            if tzdata is None:
+                self.problemReport("tzid-not-found", "Time zone identifier not found", responsecode.NOT_FOUND)
 
-        # Now do the expansion (but use a cache to avoid re-calculating TZs)
-        observances = self.expandcache.get((tzid, start, end), None)
-        if observances is None:
+            # Now do the expansion
             observances = tzexpandlocal(tzdata, start, end, utc_onset=True)
-            self.expandcache[(tzid, start, end)] = observances
 
-        # Turn into JSON
-        result = {
-            "dtstamp": self.timezones.dtstamp,
-            "tzid": tzid,
-            "observances": [
-                {
-                    "name": name,
-                    "onset": onset.getXMLText(),
-                    "utc-offset-from": utc_offset_from,
-                    "utc-offset-to": utc_offset_to,
-                } for onset, utc_offset_from, utc_offset_to, name in observances
-            ],
-        }
-        return JSONResponse(responsecode.OK, result, pretty=config.TimezoneService.PrettyPrintJSON)
+            # Turn into JSON
+            result = {
+                "dtstamp": self.timezones.dtstamp,
+                "tzid": tzid,
+                "observances": [
+                    {
+                        "name": name,
+                        "onset": onset.getXMLText(),
+                        "utc-offset-from": utc_offset_from,
+                        "utc-offset-to": utc_offset_to,
+                    } for onset, utc_offset_from, utc_offset_to, name in observances
+                ],
+            }
+            rendered = self._renderJSON(result)
+            self.expandcache.put(key, rendered)
+
+        data, etag = rendered
+        return self._dataResponse(data, etag, "application/json")
 
     def actionFind(self, request):
         """
@@ -507,6 +553,101 @@ class TimezoneStdServiceResource (ReadOnlyNoCopyResourceMixIn, DAVResourceWithou
         return JSONResponse(responsecode.OK, result, pretty=config.TimezoneService.PrettyPrintJSON)
 
 
+class TimezoneExpandCache(object):
+    """
+    A bounded LRU cache of rendered timezone expansions, keyed by tzid, start,
+    end and database dtstamp. The cache is bounded both by the number of
+    entries and by the total size of the rendered data.
+    """
+
+    def __init__(self, maxEntries, maxBytes):
+        """
+        @param maxEntries: maximum number of cached expansions
+        @type maxEntries: C{int}
+        @param maxBytes: maximum total size of the cached expansions
+        @type maxBytes: C{int}
+        """
+        self.maxEntries = maxEntries
+        self.maxBytes = maxBytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """
+        Get a cached expansion.
+
+        @param key: the cache key
+        @type key: C{tuple}
+
+        @return: C{tuple} of rendered data and L{ETag}, or L{None} if not cached
+        @rtype: C{tuple}
+        """
+        try:
+            rendered = self._entries.pop(key)
+        except KeyError:
+            self.misses += 1
+            return None
+
+        # Re-insert to mark as most recently used
+        self._entries[key] = rendered
+        self.hits += 1
+        return rendered
+
+    def put(self, key, rendered):
+        """
+        Cache an expansion, evicting the least recently used entries as needed
+        to stay within the limits.
+
+        @param key: the cache key
+        @type key: C{tuple}
+        @param rendered: C{tuple} of rendered data and L{ETag}
+        @type rendered: C{tuple}
+        """
+
+        size = len(rendered[0])
+
+        # Too big to ever fit
+        if size > self.maxBytes or self.maxEntries <= 0:
+            return
+
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._bytes -= len(old[0])
+
+        self._entries[key] = rendered
+        self._bytes += size
+
+        while len(self._entries) > self.maxEntries or self._bytes > self.maxBytes:
+            _ignore_key, (olddata, _ignore_etag) = self._entries.popitem(last=False)
+            self._bytes -= len(olddata)
+            self.evictions += 1
+
+    def clear(self):
+        self._entries.clear()
+        self._bytes = 0
+
+    def stats(self):
+        """
+        Size and activity of the cache.
+
+        @rtype: C{dict}
+        """
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
 class TimezoneInfo(object):
     """
     Maintains information from an on-disk store of timezone files.
@@ -554,6 +695,7 @@ class CommonTimezoneDatabase(object):
         self.dtstamp = None
         self.timezones = {}
         self.aliases = {}
+        self.rendered = {}
 
     def onStartup(self):
         return succeed(None)
@@ -562,6 +704,7 @@ class CommonTimezoneDatabase(object):
         """
         Read in XML data.
         """
+        self.rendered = {}
         _ignore, root = xmlutil.readXML(self.xmlfile, "timezones")
         self.dtstamp = root.findtext("dtstamp")
         for child in root:
@@ -617,6 +760,47 @@ class CommonTimezoneDatabase(object):
 
         return calendar
 
+    def getTimezoneData(self, tzid, mediaType):
+        """
+        Get the rendered data for the requested timezone. Each timezone is
+        rendered for each media type once and the result cached until the
+        database changes. The media type is part of the L{ETag}, as the same
+        data served as different media types is a different representation.
+
+        @param tzid: the timezone to render
+        @type tzid: C{str}
+        @param mediaType: the media type to render, text/plain is rendered as
+            iCalendar data
+        @type mediaType: C{str}
+
+        @return: C{tuple} of the rendered data and its L{ETag}, or L{None} if
+            the timezone does not exist
+        @rtype: C{tuple}
+        """
+        key = (tzid, mediaType,)
+        rendered = self.rendered.get(key)
+        if rendered is None:
+            calendar = self.getTimezone(tzid)
+            if calendar is None:
+                return None
+            data = calendar.getText(format=mediaType if mediaType != "text/plain" else None)
+            rendered = (data, ETag(hashlib.md5(mediaType + "\n" + data).hexdigest()),)
+            self.rendered[key] = rendered
+        return rendered
+
+    def prerender(self, mediaTypes):
+        """
+        Render every timezone and alias for each of the given media types.
+
+        @param mediaTypes: the media types to render
+        @type mediaTypes: iterable of C{str}
+        """
+        self.rendered = {}
+        for tzid in itertools.chain(sorted(self.timezones.keys()), sorted(self.aliases.keys())):
+            for mediaType in mediaTypes:
+                self.getTimezoneData(tzid, mediaType)
+        log.info("Pre-rendered {count} timezone responses", count=len(self.rendered))
+
     def _dumpTZs(self):
 
         _ignore, root = xmlutil.newElementTreeWithRoot("timezones")
@@ -709,6 +893,7 @@ class PrimaryTimezoneDatabase(CommonTimezoneDatabase):
         self.changed = set()
         self._scanTZs("", checkIfChanged=True)
         if self.changeCount:
+            self.rendered = {}
             self._dumpTZs()
 
 
@@ -773,6 +958,7 @@ class SecondaryTimezoneDatabase(CommonTimezoneDatabase):
             tzids = tzids[BATCH:]
 
         self.dtstamp = newdtstamp
+        self.rendered = {}
         self._dumpTZs()
         self._buildAliases()
 
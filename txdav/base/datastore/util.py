@@ -60,13 +60,25 @@ class QueryCacher(Memcacher):
     A Memcacher for the object-with-name query (more to come)
     """
 
+    # Cached value for a home sync token revision that needs to be recomputed
+    SYNC_REVISION_CHANGED = -1
+
     def __init__(self, cachePool="Default", cacheExpireSeconds=3600):
         super(QueryCacher, self).__init__(cachePool, pickle=True)
         self.cacheExpireSeconds = cacheExpireSeconds
 
+    def add(self, key, value):
+        return super(QueryCacher, self).add(key, value, expireTime=self.cacheExpireSeconds)
+
     def set(self, key, value):
         return super(QueryCacher, self).set(key, value, expireTime=self.cacheExpireSeconds)
 
+    def checkAndSet(self, key, value, cas):
+        return super(QueryCacher, self).checkAndSet(key, value, cas, expireTime=self.cacheExpireSeconds)
+
+    def setMany(self, mapping):
+        return super(QueryCacher, self).setMany(mapping, expireTime=self.cacheExpireSeconds)
+
     def delete(self, key):
         return super(QueryCacher, self).delete(key)
 
@@ -115,6 +127,11 @@ class QueryCacher(Memcacher):
     def keyForHomeChildMetaData(self, resourceID):
         return "homeChildMetaData:%s" % (resourceID)
 
+    # Home sync token revision
+
+    def keyForHomeSyncRevision(self, homeResourceID):
+        return "homeSyncRevision:%s" % (homeResourceID)
+
 
 def normalizeUUIDOrNot(somestr):
     """
@@ -78,22 +78,31 @@ class PropertyStore(AbstractPropertyStore):
         Load, or re-load, this object with the given transaction; first from
         memcache, then pulling from the database again.
         """
-        # Cache existing properties in this object
-        # Look for memcache entry first
-
-        @inlineCallbacks
-        def _cache_user_props(uid):
+        # Cache existing properties in this object, for the owner first, then
+        # the sharee and proxy if different
+        uids = [self._defaultUser]
+        if self._perUser != self._defaultUser:
+            uids.append(self._perUser)
+        if self._proxyUser != self._perUser and self._proxyUser not in uids:
+            uids.append(self._proxyUser)
+
+        # Look for memcache entries first - the valid user list and the cached
+        # data for each user are all fetched in one request
+        valid_cached_users = set()
+        cached = {}
+        if self._cacher is not None:
+            cached = yield self._cacher.getMany(
+                [str(self._resourceID)] + [self._cacheToken(uid) for uid in uids]
+            )
+            if cached[str(self._resourceID)] is not None:
+                valid_cached_users = cached[str(self._resourceID)]
 
-            # First check whether uid already has a valid cached entry
+        changed = {}
+        for uid in uids:
+            # Use cached user data if valid and present
             rows = None
-            if self._cacher is not None:
-                valid_cached_users = yield self._cacher.get(str(self._resourceID))
-                if valid_cached_users is None:
-                    valid_cached_users = set()
-
-                # Fetch cached user data if valid and present
-                if uid in valid_cached_users:
-                    rows = yield self._cacher.get(self._cacheToken(uid))
+            if uid in valid_cached_users:
+                rows = cached[self._cacheToken(uid)]
 
             # If no cached data, fetch from SQL DB and cache
             if rows is None:
@@ -103,21 +112,17 @@ class PropertyStore(AbstractPropertyStore):
                     viewerID=uid,
                 )
                 if self._cacher is not None:
-                    yield self._cacher.set(self._cacheToken(uid), rows if rows is not None else ())
+                    changed[self._cacheToken(uid)] = rows if rows is not None else ()
 
                     # Mark this uid as valid
                     valid_cached_users.add(uid)
-                    yield self._cacher.set(str(self._resourceID), valid_cached_users)
 
             for name, value in rows:
                 self._cached[(name, uid)] = value
 
-        # Cache for the owner first, then the sharee if different
-        yield _cache_user_props(self._defaultUser)
-        if self._perUser != self._defaultUser:
-            yield _cache_user_props(self._perUser)
-        if self._proxyUser != self._perUser:
-            yield _cache_user_props(self._proxyUser)
+        if changed:
+            changed[str(self._resourceID)] = valid_cached_users
+            yield self._cacher.setMany(changed)
 
     @classmethod
     @inlineCallbacks
@@ -0,0 +1,160 @@
+##
+# Copyright (c) 2017 Apple Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+##
+
+"""
+Process-local cache of parsed and validated calendar data, so that frequently
+read resources (e.g. shared holiday or room calendars) are not re-parsed on
+every request.
+"""
+
+from twistedcaldav.config import config
+
+from collections import OrderedDict
+
+__all__ = [
+    "ComponentCache",
+    "componentCache",
+]
+
+
+class ComponentCache(object):
+    """
+    A bounded LRU cache of L{twistedcaldav.ical.Component} objects keyed by
+    calendar object resource-id, MD5 and data version. Since a change to the
+    calendar data always changes the MD5, entries never need to be explicitly
+    invalidated - stale ones simply age out.
+
+    The cache is bounded both by the number of entries and by the total size of
+    the calendar data text the entries were parsed from (used as an approximation
+    of the memory used by the parsed components).
+
+    Components are copied on the way in and on the way out so that callers can
+    freely modify what they get back.
+    """
+
+    def __init__(self, maxEntries, maxBytes):
+        """
+        @param maxEntries: maximum number of cached components
+        @type maxEntries: C{int}
+        @param maxBytes: maximum total size of the cached calendar data
+        @type maxBytes: C{int}
+        """
+        self.maxEntries = maxEntries
+        self.maxBytes = maxBytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._reported = (0, 0, 0,)
+
+    def __len__(self):
+        return len(self._entries)
+
+    @staticmethod
+    def key(resourceID, md5, dataversion):
+        return (resourceID, md5, dataversion,)
+
+    def get(self, key):
+        """
+        Get a copy of the cached component.
+
+        @param key: the cache key, see L{key}
+        @type key: C{tuple}
+
+        @return: the component or L{None} if not cached
+        @rtype: L{twistedcaldav.ical.Component}
+        """
+        try:
+            component, size = self._entries.pop(key)
+        except KeyError:
+            self.misses += 1
+            return None
+
+        # Re-insert to mark as most recently used
+        self._entries[key] = (component, size,)
+        self.hits += 1
+        return component.duplicate()
+
+    def put(self, key, component, size):
+        """
+        Cache a copy of a component, evicting the least recently used entries
+        as needed to stay within the limits.
+
+        @param key: the cache key, see L{key}
+        @type key: C{tuple}
+        @param component: the component to cache
+        @type component: L{twistedcaldav.ical.Component}
+        @param size: the size of the calendar data the component was parsed from
+        @type size: C{int}
+        """
+
+        # Too big to ever fit
+        if size > self.maxBytes or self.maxEntries <= 0:
+            return
+
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._bytes -= old[1]
+
+        self._entries[key] = (component.duplicate(), size,)
+        self._bytes += size
+
+        while len(self._entries) > self.maxEntries or self._bytes > self.maxBytes:
+            _ignore_key, (_ignore_component, oldsize) = self._entries.popitem(last=False)
+            self._bytes -= oldsize
+            self.evictions += 1
+
+    def clear(self):
+        self._entries.clear()
+        self._bytes = 0
+
+    def takeCounts(self):
+        """
+        Return the change in the hit, miss and eviction counters since the last
+        time this method was called.
+
+        @rtype: C{dict}
+        """
+        hits, misses, evictions = self._reported
+        self._reported = (self.hits, self.misses, self.evictions,)
+        return {
+            "hit": self.hits - hits,
+            "miss": self.misses - misses,
+            "evict": self.evictions - evictions,
+        }
+
+
+_componentCache = None
+
+
+def componentCache():
+    """
+    Get the process-wide L{ComponentCache}, or L{None} if component caching is
+    not enabled.
+
+    @rtype: L{ComponentCache}
+    """
+    global _componentCache
+    if not config.ComponentCaching.Enabled:
+        return None
+    if _componentCache is None:
+        _componentCache = ComponentCache(
+            config.ComponentCaching.MaxEntries,
+            config.ComponentCaching.MaxBytes,
+        )
+    return _componentCache
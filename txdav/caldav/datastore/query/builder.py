@@ -26,9 +26,20 @@ SQL statement generator from query expressions.
 
 __all__ = [
     "buildExpression",
+    "isExactFilter",
 ]
 
 
+# Properties and sub-components recorded in the property index. Values are
+# lower-cased so that any text-match on these can be narrowed down by the
+# index, with the full filter then being applied to the candidates.
+INDEXED_PROPERTIES = ("SUMMARY", "LOCATION", "STATUS", "CATEGORIES", "CLASS",)
+INDEXED_COMPONENTS = ("VALARM",)
+
+# Characters with special meaning in an SQL LIKE pattern
+LIKE_SPECIAL = ("\\", "%", "_",)
+
+
 # SQL Index column (field) names
 
 def buildExpression(filter, fields):
@@ -112,10 +123,10 @@ def compfilterExpression(compfilter, fields):
     else:
         propsExpression = None
 
-    # Handle embedded components - we do not right now as our Index does not handle them
+    # Handle embedded components - only the presence of indexed components
     comps = []
-    for _ignore in [x for x in compfilter.filters if isinstance(x, ComponentFilter)]:
-        raise ValueError
+    for c in [x for x in compfilter.filters if isinstance(x, ComponentFilter)]:
+        comps.append(subcompfilterExpression(c, fields))
     if len(comps) > 1:
         compsExpression = logical(comps)
     elif len(comps) == 1:
@@ -135,6 +146,64 @@ def compfilterExpression(compfilter, fields):
     return expression.andExpression(expressions)
 
 
+def subcompfilterExpression(compfilter, fields):
+    """
+    Create an expression for a comp-filter element nested inside a top-level
+    component's comp-filter. Only the presence of an indexed component can be
+    tested, so the resulting expression can match more resources than the
+    filter itself.
+
+    @param compfilter: the L{ComponentFilter} element.
+    @return: a L{baseExpression} for the expression tree.
+    """
+
+    if "PROPERTY" not in fields or compfilter.filter_name not in INDEXED_COMPONENTS or not compfilter.defined:
+        raise ValueError
+
+    return expression.propertyExpression(fields["PROPERTY"], compfilter.filter_name)
+
+
+def indexedpropfilterExpression(propfilter, fields):
+    """
+    Create an expression for a prop-filter element on an indexed property.
+    Only a non-negated text-match can be used to narrow down the search beyond
+    the presence of the property, so the resulting expression can match more
+    resources than the filter itself.
+
+    @param propfilter: the L{PropertyFilter} element.
+    @return: a L{baseExpression} for the expression tree.
+    """
+
+    # Cannot tell which resources are missing a property as the index only
+    # covers top-level components
+    if not propfilter.defined:
+        raise ValueError
+
+    # Handle time-range - we cannot do this with our Index right now
+    if propfilter.qualifier and isinstance(propfilter.qualifier, TimeRange):
+        raise ValueError
+
+    if (
+        propfilter.qualifier and
+        isinstance(propfilter.qualifier, TextMatch) and
+        not propfilter.qualifier.negate and
+        not propfilter.filters
+    ):
+        text = propfilter.qualifier.text
+        if not isinstance(text, unicode):
+            text = text.decode("utf-8")
+        text = text.lower()
+        if not any([c in text for c in LIKE_SPECIAL]):
+            return expression.propertyExpression(
+                fields["PROPERTY"],
+                propfilter.filter_name,
+                propfilter.qualifier.match_type,
+                text.encode("utf-8"),
+            )
+
+    return expression.propertyExpression(fields["PROPERTY"], propfilter.filter_name)
+
+
 def propfilterExpression(propfilter, fields):
     """
     Create an expression for a single prop-filter element.
@@ -143,7 +212,11 @@ def propfilterExpression(propfilter, fields):
     @return: a L{baseExpression} for the expression tree.
     """
 
-    # Only handle UID right now
+    # Indexed properties can narrow down the search
+    if "PROPERTY" in fields and propfilter.filter_name in INDEXED_PROPERTIES:
+        return indexedpropfilterExpression(propfilter, fields)
+
+    # Only handle UID otherwise
     if propfilter.filter_name != "UID":
         raise ValueError
 
@@ -194,6 +267,29 @@ def propfilterExpression(propfilter, fields):
         return None
 
 
+def isExactFilter(filter):
+    """
+    Determine whether the expression built by L{buildExpression} for the
+    supplied calendar-query matches exactly the resources the filter itself
+    matches. When it does not, the results of a search are candidates that
+    need to be checked against the filter.
+
+    @param filter: the L{Filter} for the calendar-query.
+    @return: C{True} if search results need no further matching, C{False}
+        otherwise.
+    """
+
+    vcalfilter = filter.child
+    for compfilter in [x for x in vcalfilter.filters if isinstance(x, ComponentFilter)]:
+        for subfilter in compfilter.filters:
+            if isinstance(subfilter, ComponentFilter):
+                return False
+            elif isinstance(subfilter, PropertyFilter) and subfilter.filter_name != "UID":
+                return False
+
+    return True
+
+
 def getTimerangeArguments(timerange):
     """
     Get start/end and floating start/end (adjusted for timezone offset) values from the
@@ -14,7 +14,7 @@
 # limitations under the License.
 ##
 
-from twext.enterprise.dal.syntax import Select, Coalesce
+from twext.enterprise.dal.syntax import Select, Coalesce, Parameter
 
 from txdav.common.datastore.query import expression
 from txdav.common.datastore.query.generator import SQLQueryGenerator
@@ -41,6 +41,10 @@ class CalDAVSQLQueryGenerator(SQLQueryGenerator):
         @type expr: L{expression}
         @param collection: the resource targeted by the query
         @type collection: L{CommonHomeChild}
+        @param whereid: the calendar resource-id to restrict the query to, or a C{list} of resource-ids
+            to search several calendars at once - in that case the calendar resource-id is returned as
+            the first column of each row
+        @type whereid: C{int} or C{list}
         @param userid: user for whom query is being done - query will be scoped to that user's privileges and their per-user data
         @type userid: C{str}
         @param freebusy: whether or not a freebusy query is being done - if it is, additional time range and peruser information is returned
@@ -50,6 +54,7 @@ class CalDAVSQLQueryGenerator(SQLQueryGenerator):
         self.userid = userid if userid else "."
         self.freebusy = freebusy
         self.usedtimerange = False
+        self.multiple = isinstance(whereid, (list, tuple,))
 
     def generate(self):
         """
@@ -65,6 +70,8 @@ class CalDAVSQLQueryGenerator(SQLQueryGenerator):
         obj = self.collection._objectSchema
 
         columns = [obj.RESOURCE_NAME, obj.ICALENDAR_UID, obj.ICALENDAR_TYPE]
+        if self.multiple:
+            columns.insert(0, obj.CALENDAR_RESOURCE_ID)
         if self.freebusy:
             columns.extend([
                 obj.ORGANIZER,
@@ -79,7 +86,10 @@ class CalDAVSQLQueryGenerator(SQLQueryGenerator):
         # For SQL data DB we need to restrict the query to just the targeted calendar resource-id if provided
         if self.whereid:
 
-            test = expression.isExpression(obj.CALENDAR_RESOURCE_ID, self.whereid, True)
+            if self.multiple:
+                test = expression.inExpression(obj.CALENDAR_RESOURCE_ID, self.whereid, True)
+            else:
+                test = expression.isExpression(obj.CALENDAR_RESOURCE_ID, self.whereid, True)
 
             # Since timerange expression already have the calendar resource-id test in them, do not
             # add the additional term to those. When the additional term is added, add it as the first
@@ -128,7 +138,12 @@ class CalDAVSQLQueryGenerator(SQLQueryGenerator):
         where = self.generateExpression(self.expression)
 
         if self.usedtimerange:
-            where = where.And(self._timerange.CALENDAR_OBJECT_RESOURCE_ID == obj.RESOURCE_ID).And(self._timerange.CALENDAR_RESOURCE_ID == self.whereid)
+            if self.multiple:
+                argname = self.addArgument(self.whereid)
+                calendarTest = self._timerange.CALENDAR_RESOURCE_ID.In(Parameter(argname, len(self.whereid)))
+            else:
+                calendarTest = self._timerange.CALENDAR_RESOURCE_ID == self.whereid
+            where = where.And(self._timerange.CALENDAR_OBJECT_RESOURCE_ID == obj.RESOURCE_ID).And(calendarTest)
 
         # Set of tables depends on use of timespan and fb use
         if self.usedtimerange:
@@ -194,6 +209,26 @@ class CalDAVSQLQueryGenerator(SQLQueryGenerator):
                 )
             self.usedtimerange = True
 
+        # property index
+        elif isinstance(expr, expression.propertyExpression):
+            prop = expr.field
+            test = prop.NAME == expr.name
+            if expr.match is not None:
+                if expr.match == "equals":
+                    value = prop.VALUE == expr.text
+                elif expr.match == "contains":
+                    value = prop.VALUE.Contains(expr.text)
+                elif expr.match == "starts-with":
+                    value = prop.VALUE.StartsWith(expr.text)
+                elif expr.match == "ends-with":
+                    value = prop.VALUE.EndsWith(expr.text)
+                test = test.And((prop.VALUE == None).Or(value))
+            partial = self.collection._objectSchema.RESOURCE_ID.In(Select(
+                [prop.CALENDAR_OBJECT_RESOURCE_ID],
+                From=prop,
+                Where=test,
+            ))
+
         else:
             partial = super(CalDAVSQLQueryGenerator, self).generateExpression(expr)
 
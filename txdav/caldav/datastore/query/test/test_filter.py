@@ -23,11 +23,13 @@ from twistedcaldav import caldavxml
 from twistedcaldav.timezones import TimezoneCache
 
 from txdav.caldav.datastore.index_file import sqlcalendarquery
-from txdav.caldav.datastore.query.builder import buildExpression
+from txdav.caldav.datastore.query.builder import buildExpression, isExactFilter
 from txdav.caldav.datastore.query.filter import Filter, FilterBase, TimeRange, \
     PropertyFilter, TextMatch
 from txdav.caldav.datastore.query.generator import CalDAVSQLQueryGenerator
+from txdav.common.datastore.query import expression as qexpression
 from txdav.common.datastore.sql_tables import schema
+from txdav.xml.element import PCDATAElement
 
 import datetime
 from twistedcaldav.ical import Component
@@ -128,6 +130,34 @@ class TestQueryFilter(TestCase):
         self.assertEqual(args, {"arg1": ("VEVENT", "VFREEBUSY", "VAVAILABILITY")})
         self.assertEqual(usedtimerange, True)
 
+    def test_query_freebusy_multiple(self):
+        """
+        Basic query test - with time range across several calendars
+        """
+
+        filter = caldavxml.Filter(
+            caldavxml.ComponentFilter(
+                *[caldavxml.ComponentFilter(
+                    *[caldavxml.TimeRange(**{"start": "20060605T160000Z", "end": "20060605T170000Z"})],
+                    **{"name": ("VEVENT", "VFREEBUSY", "VAVAILABILITY")}
+                )],
+                **{"name": "VCALENDAR"}
+            )
+        )
+        filter = Filter(filter)
+        filter.child.settzinfo(Timezone(tzid="America/New_York"))
+
+        expression = buildExpression(filter, self._queryFields)
+        sql = CalDAVSQLQueryGenerator(expression, self, [1234, 1235], "user01", True)
+        select, args, usedtimerange = sql.generate()
+
+        self.assertEqual(select.toSQL(), SQLFragment(
+            "select distinct CALENDAR_OBJECT.CALENDAR_RESOURCE_ID, RESOURCE_NAME, ICALENDAR_UID, ICALENDAR_TYPE, ORGANIZER, FLOATING, coalesce(ADJUSTED_START_DATE, START_DATE), coalesce(ADJUSTED_END_DATE, END_DATE), FBTYPE, TIME_RANGE.TRANSPARENT, PERUSER.TRANSPARENT from CALENDAR_OBJECT, TIME_RANGE left outer join PERUSER on INSTANCE_ID = TIME_RANGE_INSTANCE_ID and USER_ID = ? where ICALENDAR_TYPE in (?, ?, ?) and (FLOATING = ? and coalesce(ADJUSTED_START_DATE, START_DATE) < ? and coalesce(ADJUSTED_END_DATE, END_DATE) > ? or FLOATING = ? and coalesce(ADJUSTED_START_DATE, START_DATE) < ? and coalesce(ADJUSTED_END_DATE, END_DATE) > ?) and CALENDAR_OBJECT_RESOURCE_ID = RESOURCE_ID and TIME_RANGE.CALENDAR_RESOURCE_ID in (?, ?)",
+            ['user01', Parameter('arg1', 3), False, datetime.datetime(2006, 6, 5, 17, 0), datetime.datetime(2006, 6, 5, 16, 0), True, datetime.datetime(2006, 6, 5, 13, 0), datetime.datetime(2006, 6, 5, 12, 0), Parameter('arg2', 2)]
+        ))
+        self.assertEqual(args, {"arg1": ("VEVENT", "VFREEBUSY", "VAVAILABILITY"), "arg2": [1234, 1235]})
+        self.assertEqual(usedtimerange, True)
+
     def test_query_not_extended(self):
         """
         Query test - two terms not anyof
@@ -193,6 +223,119 @@ class TestQueryFilter(TestCase):
         self.assertEqual(args, {})
         self.assertEqual(usedtimerange, True)
 
+    def test_query_property(self):
+        """
+        Query test - text-match on an indexed property is narrowed down using
+        the property index
+        """
+
+        filter = caldavxml.Filter(
+            caldavxml.ComponentFilter(
+                *[caldavxml.ComponentFilter(
+                    caldavxml.PropertyFilter(
+                        caldavxml.TextMatch.fromString("Lunch"),
+                        name="SUMMARY",
+                    ),
+                    **{"name": ("VEVENT")}
+                )],
+                **{"name": "VCALENDAR"}
+            )
+        )
+        filter = Filter(filter)
+        filter.child.settzinfo(Timezone(tzid="America/New_York"))
+
+        # Not possible without the property index
+        self.assertRaises(ValueError, buildExpression, filter, self._queryFields)
+
+        fields = dict(self._queryFields)
+        fields["PROPERTY"] = schema.CALENDAR_OBJECT_PROPERTY
+        expression = buildExpression(filter, fields)
+        self.assertTrue(isinstance(expression, qexpression.andExpression))
+        propexpr = expression.expressions[1]
+        self.assertTrue(isinstance(propexpr, qexpression.propertyExpression))
+        self.assertEqual(propexpr.name, "SUMMARY")
+        self.assertEqual(propexpr.match, "contains")
+        self.assertEqual(propexpr.text, "lunch")
+
+        sql = CalDAVSQLQueryGenerator(expression, self, 1234)
+        select, args, usedtimerange = sql.generate()
+        fragment = select.toSQL()
+        self.assertTrue("CALENDAR_OBJECT_PROPERTY" in fragment.text)
+        self.assertTrue("lunch" in fragment.parameters)
+        self.assertEqual(usedtimerange, False)
+
+        self.assertFalse(isExactFilter(filter))
+
+    def test_query_property_existence(self):
+        """
+        Query test - negated text-match and VALARM comp-filter only test for the
+        presence of the property or component
+        """
+
+        filter = caldavxml.Filter(
+            caldavxml.ComponentFilter(
+                *[caldavxml.ComponentFilter(
+                    caldavxml.PropertyFilter(
+                        caldavxml.TextMatch(PCDATAElement("Lunch"), **{"negate-condition": "yes"}),
+                        name="LOCATION",
+                    ),
+                    caldavxml.ComponentFilter(
+                        **{"name": "VALARM"}
+                    ),
+                    **{"name": ("VEVENT")}
+                )],
+                **{"name": "VCALENDAR"}
+            )
+        )
+        filter = Filter(filter)
+        filter.child.settzinfo(Timezone(tzid="America/New_York"))
+
+        fields = dict(self._queryFields)
+        fields["PROPERTY"] = schema.CALENDAR_OBJECT_PROPERTY
+        expression = buildExpression(filter, fields)
+        propexpr, compexpr = expression.expressions[1].expressions
+        self.assertEqual(propexpr.name, "LOCATION")
+        self.assertEqual(propexpr.match, None)
+        self.assertEqual(compexpr.name, "VALARM")
+        self.assertEqual(compexpr.match, None)
+        self.assertFalse(isExactFilter(filter))
+
+        # Cannot use the index to find missing VALARMs
+        filter = caldavxml.Filter(
+            caldavxml.ComponentFilter(
+                *[caldavxml.ComponentFilter(
+                    caldavxml.ComponentFilter(
+                        caldavxml.IsNotDefined(),
+                        **{"name": "VALARM"}
+                    ),
+                    **{"name": ("VEVENT")}
+                )],
+                **{"name": "VCALENDAR"}
+            )
+        )
+        filter = Filter(filter)
+        self.assertRaises(ValueError, buildExpression, filter, fields)
+
+    def test_exact_filter(self):
+        """
+        Filters using only component types, time-ranges and UID do not need
+        further matching
+        """
+
+        filter = caldavxml.Filter(
+            caldavxml.ComponentFilter(
+                *[caldavxml.ComponentFilter(
+                    caldavxml.PropertyFilter(
+                        caldavxml.TextMatch.fromString("1234"),
+                        name="UID",
+                    ),
+                    **{"name": ("VEVENT")}
+                )],
+                **{"name": "VCALENDAR"}
+            )
+        )
+        self.assertTrue(isExactFilter(Filter(filter)))
+
     def test_sqllite_query(self):
         """
         Basic query test - single term.
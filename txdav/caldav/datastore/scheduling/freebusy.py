@@ -34,6 +34,7 @@ from twistedcaldav.instance import InstanceList
 from twistedcaldav.memcacher import Memcacher
 
 from txdav.caldav.datastore.query.filter import Filter
+from txdav.caldav.datastore.scheduling.freebusyindex import FBBusyIndex
 from txdav.caldav.icalendarstore import QueryMaxResources
 from txdav.caldav.datastore.scheduling.cuaddress import LocalCalendarUser
 from txdav.common.icommondatastore import IndexedSearchException, \
@@ -372,6 +373,12 @@ class FreebusyQuery(object):
 
         yield self.checkRichOptions(fbset[0]._txn)
 
+        # Try the busy time index first
+        if self._useBusyIndex():
+            indexed_matchtotal = yield self._indexedFreeBusyInfo(fbset, fbinfo, matchtotal)
+            if indexed_matchtotal is not None:
+                returnValue(indexed_matchtotal)
+
         calidmap = dict([(fbcalendar.id(), fbcalendar,) for fbcalendar in fbset])
         directoryService = fbset[0].directoryService()
 
@@ -489,109 +496,296 @@ class FreebusyQuery(object):
 
         returnValue(matchtotal)
 
+    def _useBusyIndex(self):
+        """
+        Determine whether the busy time index can be used to answer this request. The index only
+        has busy time, so anything that needs the underlying events cannot use it.
+
+        @rtype: C{bool}
+        """
+
+        if not config.EnableBusyTimeIndex:
+            return False
+        if self.excludeuid is not None or self.event_details is not None or self.accountingItems is not None:
+            return False
+        if any(self.rich_options.values()):
+            return False
+        return self._cacheWindow() is not None
+
+    @inlineCallbacks
+    def _indexedFreeBusyInfo(self, fbset, fbinfo, matchtotal):
+        """
+        Accumulate free busy info for a set of calendars using the busy time index of the
+        viewer's home, building the index if needed.
+
+        See L{_internalGenerateFreeBusyInfo} for argument description.
+
+        @return: the new match total, or L{None} if the index cannot be used
+        @rtype: C{int}
+        """
+
+        home = fbset[0].viewerHome()
+        index, token = yield FBBusyIndex.getIndex(home, self.attendee_uid, fbset)
+        if index is None or not index.covers(self.timerange):
+            window = self._cacheWindow()
+            bytz = {}
+            for calresource in fbset:
+                tz = calresource.getTimezone()
+                bytz.setdefault(str(tz) if tz is not None else None, []).append(calresource)
+
+            results = []
+            try:
+                for calresources in bytz.values():
+                    filter, tzinfo = self._freebusyFilter(calresources[0].getTimezone(), window)
+                    resources = yield calresources[0].searchCalendars(calresources, filter, useruid=self.attendee_uid, fbtype=True)
+                    for calresource in calresources:
+                        results.append((self._aggregateResources(resources[calresource.id()]), tzinfo,))
+            except IndexedSearchException:
+                raise InternalDataStoreError("Invalid indexedSearch query")
+
+            index = yield FBBusyIndex.makeIndex(home, self.attendee_uid, fbset, token, window, results)
+
+        if not index.indexable():
+            returnValue(None)
+
+        # Check size of results is within limit
+        matchtotal += index.matchCount(self.timerange)
+        if matchtotal > config.MaxQueryWithDataResults:
+            raise QueryMaxResources(config.MaxQueryWithDataResults, matchtotal)
+
+        for fbtype, attr in self.FBInfo_index_mapper.items():
+            getattr(fbinfo, attr).extend(index.busyPeriods(fbtype, self.timerange))
+
+        # Log extended item
+        if self.logItems is not None:
+            self.logItems["fb-indexed"] = self.logItems.get("fb-indexed", 0) + len(fbset)
+
+        returnValue(matchtotal)
+
     @inlineCallbacks
     def _matchResources(self, fbset):
         """
-        For now iterate over each calendar and collect the results. In the longer term we might want to consider
-        doing a single DB query in the case where multiple calendars need to be searched.
+        Collect the results for each calendar. Calendars with valid FBCache entries use those, the remaining
+        calendars are searched with a single DB query for each distinct calendar timezone (the timezone
+        determines how floating times are matched, so it has to be the same for all calendars in one query).
 
         @param fbset: list of calendars to process
         @type fbset: L{list} of L{Calendar}
         """
 
         results = {}
+        uncached = {}
         for calresource in fbset:
-            aggregated_resources, tzinfo, filter = yield self._matchCalendarResources(calresource)
-            results[calresource.id()] = (aggregated_resources, tzinfo, filter,)
+            result = yield self._cachedCalendarResources(calresource)
+            if result is not None:
+                results[calresource.id()] = result
+            else:
+                tz = calresource.getTimezone()
+                uncached.setdefault(str(tz) if tz is not None else None, []).append(calresource)
+
+        for calresources in uncached.values():
+            if len(calresources) == 1:
+                calresource = calresources[0]
+                results[calresource.id()] = yield self._uncachedCalendarResources(calresource)
+            else:
+                results.update((yield self._uncachedMultipleCalendarResources(calresources)))
 
         returnValue(results)
 
     @inlineCallbacks
     def _matchCalendarResources(self, calresource):
 
-        # Get the timezone property from the collection.
-        tz = calresource.getTimezone()
+        result = yield self._cachedCalendarResources(calresource)
+        if result is None:
+            result = yield self._uncachedCalendarResources(calresource)
+        returnValue(result)
 
-        # Try cache
-        aggregated_resources = (yield FBCacheEntry.getCacheEntry(calresource, self.attendee_uid, self.timerange)) if config.EnableFreeBusyCache else None
+    @inlineCallbacks
+    def _cachedCalendarResources(self, calresource):
+        """
+        Get the matching resources for a calendar from the FBCache.
+
+        @param calresource: calendar to process
+        @type calresource: L{Calendar}
 
+        @return: a C{tuple} of the aggregated resources, timezone and filter, or L{None}
+            if there is no valid cache entry
+        """
+
+        if not config.EnableFreeBusyCache:
+            returnValue(None)
+
+        aggregated_resources = (yield FBCacheEntry.getCacheEntry(calresource, self.attendee_uid, self.timerange))
         if aggregated_resources is None:
+            returnValue(None)
 
-            if self.accountingItems is not None:
-                self.accountingItems["fb-uncached"] = self.accountingItems.get("fb-uncached", 0) + 1
-
-            caching = False
-            if config.EnableFreeBusyCache:
-                # Log extended item
-                if self.logItems is not None:
-                    self.logItems["fb-uncached"] = self.logItems.get("fb-uncached", 0) + 1
-
-                # We want to cache a large range of time based on the current date
-                cache_start = normalizeToUTC(DateTime.getToday() + Duration(days=0 - config.FreeBusyCacheDaysBack))
-                cache_end = normalizeToUTC(DateTime.getToday() + Duration(days=config.FreeBusyCacheDaysForward))
-
-                # If the requested time range would fit in our allowed cache range, trigger the cache creation
-                if compareDateTime(self.timerange.getStart(), cache_start) >= 0 and compareDateTime(self.timerange.getEnd(), cache_end) <= 0:
-                    cache_timerange = Period(cache_start, cache_end)
-                    caching = True
-
-            #
-            # What we do is a fake calendar-query for VEVENT/VFREEBUSYs in the specified time-range.
-            # We then take those results and merge them into one VFREEBUSY component
-            # with appropriate FREEBUSY properties, and return that single item as iCal data.
-            #
-
-            # Create fake filter element to match time-range
-            tr = TimeRange(
-                start=(cache_timerange if caching else self.timerange).getStart().getText(),
-                end=(cache_timerange if caching else self.timerange).getEnd().getText(),
-            )
-            filter = caldavxml.Filter(
-                caldavxml.ComponentFilter(
-                    caldavxml.ComponentFilter(
-                        tr,
-                        name=("VEVENT", "VFREEBUSY", "VAVAILABILITY"),
-                    ),
-                    name="VCALENDAR",
-                )
-            )
-            filter = Filter(filter)
-            tzinfo = filter.settimezone(tz)
-            if self.accountingItems is not None:
-                self.accountingItems["fb-query-timerange"] = (str(tr.start), str(tr.end),)
+        if self.accountingItems is not None:
+            self.accountingItems["fb-cached"] = self.accountingItems.get("fb-cached", 0) + 1
 
-            try:
-                resources = yield calresource.search(filter, useruid=self.attendee_uid, fbtype=True)
-
-                aggregated_resources = {}
-                for name, uid, comptype, test_organizer, float, start, end, fbtype, transp in resources:
-                    if transp == 'T' and fbtype != '?':
-                        fbtype = 'F'
-                    aggregated_resources.setdefault((name, uid, comptype, test_organizer,), []).append((
-                        float,
-                        tupleFromDateTime(parseSQLTimestampToPyCalendar(start)),
-                        tupleFromDateTime(parseSQLTimestampToPyCalendar(end)),
-                        fbtype,
-                    ))
-
-                if caching:
+        # Log extended item
+        if self.logItems is not None:
+            self.logItems["fb-cached"] = self.logItems.get("fb-cached", 0) + 1
+
+        # Determine appropriate timezone (UTC is the default)
+        tz = calresource.getTimezone()
+        tzinfo = tz.gettimezone() if tz is not None else Timezone.UTCTimezone
+
+        returnValue((aggregated_resources, tzinfo, None,))
+
+    @inlineCallbacks
+    def _uncachedCalendarResources(self, calresource):
+        """
+        Search a calendar for matching resources and cache the results.
+
+        @param calresource: calendar to process
+        @type calresource: L{Calendar}
+
+        @return: a C{tuple} of the aggregated resources, timezone and filter
+        """
+
+        cache_timerange = self._cacheTimeRange()
+        filter, tzinfo = self._freebusyFilter(calresource.getTimezone(), cache_timerange)
+
+        try:
+            resources = yield calresource.search(filter, useruid=self.attendee_uid, fbtype=True)
+            aggregated_resources = self._aggregateResources(resources)
+
+            if cache_timerange is not None:
+                yield FBCacheEntry.makeCacheEntry(calresource, self.attendee_uid, cache_timerange, aggregated_resources)
+        except IndexedSearchException:
+            raise InternalDataStoreError("Invalid indexedSearch query")
+
+        returnValue((aggregated_resources, tzinfo, filter,))
+
+    @inlineCallbacks
+    def _uncachedMultipleCalendarResources(self, calresources):
+        """
+        Search a set of calendars, which all have the same timezone, for matching resources using a
+        single query, and cache the results for each calendar.
+
+        @param calresources: calendars to process
+        @type calresources: L{list} of L{Calendar}
+
+        @return: a C{dict} mapping each calendar id to a C{tuple} of the aggregated resources,
+            timezone and filter
+        """
+
+        cache_timerange = self._cacheTimeRange(len(calresources))
+        filter, tzinfo = self._freebusyFilter(calresources[0].getTimezone(), cache_timerange)
+
+        results = {}
+        try:
+            resources = yield calresources[0].searchCalendars(calresources, filter, useruid=self.attendee_uid, fbtype=True)
+            for calresource in calresources:
+                aggregated_resources = self._aggregateResources(resources[calresource.id()])
+                if cache_timerange is not None:
                     yield FBCacheEntry.makeCacheEntry(calresource, self.attendee_uid, cache_timerange, aggregated_resources)
-            except IndexedSearchException:
-                raise InternalDataStoreError("Invalid indexedSearch query")
+                results[calresource.id()] = (aggregated_resources, tzinfo, filter,)
+        except IndexedSearchException:
+            raise InternalDataStoreError("Invalid indexedSearch query")
 
-        else:
-            if self.accountingItems is not None:
-                self.accountingItems["fb-cached"] = self.accountingItems.get("fb-cached", 0) + 1
+        returnValue(results)
+
+    def _cacheTimeRange(self, count=1):
+        """
+        Determine whether the search results for calendars can be cached. If they can, the search will be
+        done over the larger cache time range.
+
+        @param count: the number of calendars being searched
+        @type count: C{int}
 
+        @return: the time range to cache, or L{None} if no caching is to be done
+        @rtype: L{Period}
+        """
+
+        if self.accountingItems is not None:
+            self.accountingItems["fb-uncached"] = self.accountingItems.get("fb-uncached", 0) + count
+
+        if config.EnableFreeBusyCache:
             # Log extended item
             if self.logItems is not None:
-                self.logItems["fb-cached"] = self.logItems.get("fb-cached", 0) + 1
+                self.logItems["fb-uncached"] = self.logItems.get("fb-uncached", 0) + count
 
-            # Determine appropriate timezone (UTC is the default)
-            tzinfo = tz.gettimezone() if tz is not None else Timezone.UTCTimezone
-            filter = None
+            return self._cacheWindow()
 
-        returnValue((aggregated_resources, tzinfo, filter,))
+        return None
+
+    def _cacheWindow(self):
+        """
+        Determine the large range of time, based on the current date, over which freebusy results
+        are cached.
+
+        @return: the time range to cache, or L{None} if the requested time range does not fit in it
+        @rtype: L{Period}
+        """
+
+        cache_start = normalizeToUTC(DateTime.getToday() + Duration(days=0 - config.FreeBusyCacheDaysBack))
+        cache_end = normalizeToUTC(DateTime.getToday() + Duration(days=config.FreeBusyCacheDaysForward))
+
+        # If the requested time range would fit in our allowed cache range, trigger the cache creation
+        if compareDateTime(self.timerange.getStart(), cache_start) >= 0 and compareDateTime(self.timerange.getEnd(), cache_end) <= 0:
+            return Period(cache_start, cache_end)
+        else:
+            return None
+
+    def _freebusyFilter(self, tz, cache_timerange):
+        """
+        What we do is a fake calendar-query for VEVENT/VFREEBUSYs in the specified time-range.
+        We then take those results and merge them into one VFREEBUSY component
+        with appropriate FREEBUSY properties, and return that single item as iCal data.
+
+        @param tz: the calendar timezone used for floating times
+        @type tz: L{Component} or L{None}
+        @param cache_timerange: the time range being cached, or L{None}
+        @type cache_timerange: L{Period}
+
+        @return: a C{tuple} of the L{Filter} and the timezone
+        """
+
+        # Create fake filter element to match time-range
+        timerange = cache_timerange if cache_timerange is not None else self.timerange
+        tr = TimeRange(
+            start=timerange.getStart().getText(),
+            end=timerange.getEnd().getText(),
+        )
+        filter = caldavxml.Filter(
+            caldavxml.ComponentFilter(
+                caldavxml.ComponentFilter(
+                    tr,
+                    name=("VEVENT", "VFREEBUSY", "VAVAILABILITY"),
+                ),
+                name="VCALENDAR",
+            )
+        )
+        filter = Filter(filter)
+        tzinfo = filter.settimezone(tz)
+        if self.accountingItems is not None:
+            self.accountingItems["fb-query-timerange"] = (str(tr.start), str(tr.end),)
+
+        return filter, tzinfo
+
+    def _aggregateResources(self, resources):
+        """
+        Aggregate the instances returned by a freebusy search by resource.
+
+        @param resources: the search results
+        @type resources: C{list}
+
+        @return: the instances for each resource
+        @rtype: C{dict}
+        """
+
+        aggregated_resources = {}
+        for name, uid, comptype, test_organizer, float, start, end, fbtype, transp in resources:
+            if transp == 'T' and fbtype != '?':
+                fbtype = 'F'
+            aggregated_resources.setdefault((name, uid, comptype, test_organizer,), []).append((
+                float,
+                tupleFromDateTime(parseSQLTimestampToPyCalendar(start)),
+                tupleFromDateTime(parseSQLTimestampToPyCalendar(end)),
+                fbtype,
+            ))
+        return aggregated_resources
 
     @inlineCallbacks
     def _testIgnoreExcludeUID(self, uid, test_organizer, recordUIDCache, dirservice):
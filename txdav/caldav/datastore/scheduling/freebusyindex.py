@@ -0,0 +1,327 @@
+##
+# Copyright (c) 2017 Apple Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+##
+
+"""
+Compact per-home index of busy time used to answer scheduling freebusy requests
+without building pycalendar objects for each instance.
+"""
+
+from pycalendar.period import Period
+from pycalendar.timezone import Timezone
+
+from twisted.internet.defer import inlineCallbacks, returnValue
+
+from twistedcaldav.dateops import tupleToDateTime
+from twistedcaldav.memcacher import Memcacher
+
+from array import array
+from bisect import bisect_right
+import calendar
+import hashlib
+import time
+
+__all__ = [
+    "FBBusyIndex",
+]
+
+
+class FBBusyIndex(object):
+    """
+    Busy time for all the calendars used for a calendar user's freebusy, over the
+    same window as L{FBCacheEntry}. Busy time is held as sorted, merged runs of
+    fixed size time slots, one set of runs per busy fbtype, plus the merged runs
+    for each individual resource (needed to count the number of matching
+    resources). Requests are answered with a binary search and a scan of the
+    runs that overlap the requested time range.
+
+    An index is only built when it can exactly reproduce the result of the
+    normal freebusy processing: all resources must be VEVENTs with a known
+    fbtype, and all instances must start and end on a slot boundary. If that is
+    not the case an "unindexable" entry is cached so that the index is not
+    rebuilt until the home changes.
+
+    The index is invalidated by a change to the home's sync token, or to the set
+    of calendars (or their timezones) used for freebusy.
+    """
+
+    # Size of each time slot in seconds
+    SLOT_SECONDS = 60
+
+    # Offset one day at either end to account for floating
+    CACHE_DAYS_FLOATING_ADJUST = 1
+
+    fbcacher = Memcacher("FBBusyIndex", pickle=True)
+
+    def __init__(self, token, signature, windowStart, windowEnd, runs=None, resources=None):
+        """
+        @param token: the home sync token the index was built from
+        @type token: C{str}
+        @param signature: the signature of the set of calendars used
+        @type signature: C{str}
+        @param windowStart: start of the indexed window (POSIX time)
+        @type windowStart: C{int}
+        @param windowEnd: end of the indexed window (POSIX time)
+        @type windowEnd: C{int}
+        @param runs: map of fbtype to a C{tuple} of the start and end slot L{array}s
+            of the busy runs, or L{None} if the calendars cannot be indexed
+        @type runs: C{dict}
+        @param resources: the start and end slot L{array}s for each resource
+        @type resources: C{list} of C{tuple}
+        """
+        self.token = token
+        self.signature = signature
+        self.windowStart = windowStart
+        self.windowEnd = windowEnd
+        self.runs = runs
+        self.resources = resources
+
+    @staticmethod
+    def _key(home, useruid):
+        return "{}/{}".format(home.id(), useruid)
+
+    @staticmethod
+    def calendarSignature(fbset):
+        """
+        Generate a signature for the set of calendars used for freebusy. This
+        includes the calendar timezones which determine how floating times are
+        mapped.
+
+        @param fbset: the calendars
+        @type fbset: C{list} of L{Calendar}
+
+        @return: the signature
+        @rtype: C{str}
+        """
+        details = []
+        for calresource in sorted(fbset, key=lambda x: x.id()):
+            tz = calresource.getTimezone()
+            details.append("{}:{}".format(calresource.id(), hashlib.md5(str(tz)).hexdigest() if tz is not None else ""))
+        return hashlib.md5(",".join(details)).hexdigest()
+
+    @classmethod
+    @inlineCallbacks
+    def getIndex(cls, home, useruid, fbset):
+        """
+        Get a valid index for the calendar user.
+
+        @param home: the calendar home of the user whose freebusy is being determined
+        @type home: L{CalendarHome}
+        @param useruid: the user whose freebusy is being determined
+        @type useruid: C{str}
+        @param fbset: the calendars used for freebusy
+        @type fbset: C{list} of L{Calendar}
+
+        @return: a C{tuple} of the L{FBBusyIndex} (or L{None} if there is no valid
+            index) and the current home sync token
+        """
+        token = yield home.syncToken()
+        entry = yield cls.fbcacher.get(cls._key(home, useruid))
+        if entry is not None and (entry.token != token or entry.signature != cls.calendarSignature(fbset)):
+            entry = None
+        returnValue((entry, token,))
+
+    @classmethod
+    @inlineCallbacks
+    def makeIndex(cls, home, useruid, fbset, token, window, results):
+        """
+        Build and cache the index for the calendar user.
+
+        @param home: the calendar home of the user whose freebusy is being determined
+        @type home: L{CalendarHome}
+        @param useruid: the user whose freebusy is being determined
+        @type useruid: C{str}
+        @param fbset: the calendars used for freebusy
+        @type fbset: C{list} of L{Calendar}
+        @param token: the home sync token read before L{results} were determined
+        @type token: C{str}
+        @param window: the time range searched to produce L{results}
+        @type window: L{Period}
+        @param results: the aggregated freebusy resources and timezone for each calendar
+        @type results: C{list} of C{tuple}
+
+        @return: the new index
+        @rtype: L{FBBusyIndex}
+        """
+        index = cls.fromResources(token, cls.calendarSignature(fbset), window, results)
+        yield cls.fbcacher.set(cls._key(home, useruid), index)
+        returnValue(index)
+
+    @classmethod
+    def fromResources(cls, token, signature, window, results):
+        """
+        Build an index from the aggregated freebusy resources of a set of calendars.
+
+        @param results: the aggregated freebusy resources and timezone for each calendar
+        @type results: C{list} of C{tuple}
+
+        @return: the new index
+        @rtype: L{FBBusyIndex}
+        """
+
+        windowStart = window.getStart().getPosixTime()
+        windowEnd = window.getEnd().getPosixTime()
+
+        intervals = {"B": [], "T": [], "U": []}
+        resources = []
+        for aggregated_resources, tzinfo in results:
+            for key, instances in aggregated_resources.iteritems():
+                comptype = key[2]
+
+                # Anything that requires full processing of the resource cannot be indexed
+                if comptype != "VEVENT" or instances[0][3] == '?':
+                    return cls(token, signature, windowStart, windowEnd)
+
+                spans = []
+                for float, start, end, fbtype in instances:
+                    # Ignore free time or unknown
+                    if fbtype in ('F', '?'):
+                        continue
+
+                    start = cls._posixTime(start, tzinfo if float == 'Y' else None)
+                    end = cls._posixTime(end, tzinfo if float == 'Y' else None)
+                    if start % cls.SLOT_SECONDS or end % cls.SLOT_SECONDS:
+                        return cls(token, signature, windowStart, windowEnd)
+
+                    # Clip to window
+                    start = max(start, windowStart)
+                    end = min(end, windowEnd)
+                    if start >= end:
+                        continue
+
+                    span = ((start - windowStart) // cls.SLOT_SECONDS, (end - windowStart) // cls.SLOT_SECONDS,)
+                    intervals.get(fbtype, intervals["B"]).append(span)
+                    spans.append(span)
+
+                if spans:
+                    resources.append(cls._mergeRuns(spans))
+
+        runs = dict([(fbtype, cls._mergeRuns(fbspans),) for fbtype, fbspans in intervals.items()])
+        return cls(token, signature, windowStart, windowEnd, runs, resources)
+
+    @staticmethod
+    def _posixTime(dt, tzinfo):
+        """
+        Convert a date-time tuple to a POSIX time. Only floating values need a
+        timezone conversion, the rest are UTC.
+        """
+        if tzinfo is None:
+            return calendar.timegm(dt)
+        else:
+            return tupleToDateTime(dt, withTimezone=tzinfo).getPosixTime()
+
+    @staticmethod
+    def _mergeRuns(spans):
+        """
+        Sort and merge overlapping or adjacent spans into runs.
+
+        @param spans: the (start, end) slot spans
+        @type spans: C{list} of C{tuple}
+
+        @return: the start and end slots of each run
+        @rtype: C{tuple} of L{array}
+        """
+        starts = array("l")
+        ends = array("l")
+        for start, end in sorted(spans):
+            if ends and start <= ends[-1]:
+                if end > ends[-1]:
+                    ends[-1] = end
+            else:
+                starts.append(start)
+                ends.append(end)
+        return (starts, ends,)
+
+    def indexable(self):
+        """
+        Whether the calendars could be indexed.
+        """
+        return self.runs is not None
+
+    def covers(self, timerange):
+        """
+        Whether the requested time range lies within the indexed window.
+
+        @param timerange: the time range to test
+        @type timerange: L{Period}
+        """
+        adjust = self.CACHE_DAYS_FLOATING_ADJUST * 24 * 60 * 60
+        return (
+            timerange.getStart().getPosixTime() >= self.windowStart + adjust and
+            timerange.getEnd().getPosixTime() <= self.windowEnd - adjust
+        )
+
+    def _overlapping(self, runs, start, end):
+        """
+        Generate the runs that overlap a time range, clipped to the time range.
+
+        @param runs: the start and end slots of each run
+        @type runs: C{tuple} of L{array}
+        @param start: start of the range (POSIX time)
+        @type start: C{int}
+        @param end: end of the range (POSIX time)
+        @type end: C{int}
+        """
+        starts, ends = runs
+        ctr = bisect_right(ends, (start - self.windowStart) // self.SLOT_SECONDS)
+        while ctr < len(starts):
+            runStart = self.windowStart + starts[ctr] * self.SLOT_SECONDS
+            if runStart >= end:
+                break
+            yield (max(runStart, start), min(self.windowStart + ends[ctr] * self.SLOT_SECONDS, end),)
+            ctr += 1
+
+    def matchCount(self, timerange):
+        """
+        Count the number of resources with busy time in the requested time range.
+
+        @param timerange: the time range to test
+        @type timerange: L{Period}
+
+        @rtype: C{int}
+        """
+        start = timerange.getStart().getPosixTime()
+        end = timerange.getEnd().getPosixTime()
+        count = 0
+        for runs in self.resources:
+            for _ignore in self._overlapping(runs, start, end):
+                count += 1
+                break
+        return count
+
+    def busyPeriods(self, fbtype, timerange):
+        """
+        Get the busy periods of one fbtype in the requested time range.
+
+        @param fbtype: the fbtype ("B", "T" or "U")
+        @type fbtype: C{str}
+        @param timerange: the time range to return
+        @type timerange: L{Period}
+
+        @return: the busy periods, clipped to the time range
+        @rtype: C{list} of L{Period}
+        """
+        start = timerange.getStart().getPosixTime()
+        end = timerange.getEnd().getPosixTime()
+        periods = []
+        for runStart, runEnd in self._overlapping(self.runs[fbtype], start, end):
+            period = Period(self._dateTime(runStart), end=self._dateTime(runEnd))
+            period.setUseDuration(True)
+            periods.append(period)
+        return periods
+
+    @staticmethod
+    def _dateTime(posix):
+        return tupleToDateTime(time.gmtime(posix)[:6], withTimezone=Timezone.UTCTimezone)
@@ -38,6 +38,7 @@ from txdav.caldav.datastore.scheduling.utils import getCalendarObjectForRecord
 from txdav.caldav.datastore.scheduling.work import ScheduleReplyWork, \
     ScheduleOrganizerWork, ScheduleOrganizerSendWork
 from txdav.caldav.icalendarstore import SetComponentOptions
+from txdav.who.cache import isCachingDirectory
 
 import collections
 
@@ -385,6 +386,8 @@ class ImplicitScheduler(object):
             if attendee.parameterValue("PARTSTAT", "NEEDS-ACTION").upper() == "NEEDS-ACTION":
                 self.suppress_refresh = True
 
+        yield self.prefetchAttendees(self.attendees)
+
         if hasattr(self.txn, "doing_attendee_refresh"):
             self.txn.doing_attendee_refresh += 1
         else:
@@ -569,6 +572,22 @@ class ImplicitScheduler(object):
         for attendee, _ignore in self.attendeesByInstance:
             self.attendees.add(attendee)
 
+    @inlineCallbacks
+    def prefetchAttendees(self, attendees):
+        """
+        Look up all the attendees the organizer is scheduling with in one
+        directory request, so the lookups done for each attendee are answered
+        from the directory cache. Without a caching directory the records would
+        not be kept, so nothing is done.
+
+        @param attendees: calendar user addresses of the attendees
+        @type attendees: iterable of C{str}
+        """
+        directory = self.txn.directoryService()
+        attendees = set(attendees)
+        if attendees and isCachingDirectory(directory):
+            yield directory.recordsWithCalendarUserAddresses(attendees)
+
     @inlineCallbacks
     def hasCalendarResourceUIDSomewhereElse(self, check_resource, mode):
         """
@@ -796,6 +815,9 @@ class ImplicitScheduler(object):
         # If processing a queue item, actually execute the scheduling operations, else queue it.
         # Note a split is always a queued execution, so we do not need to re-queue
         if queued or not config.Scheduling.Options.WorkQueues.Enabled or self.split_details is not None:
+            yield self.prefetchAttendees(
+                self.attendees | set([attendee for attendee, _ignore_rid in self.cancelledAttendees])
+            )
             yield self.scheduleWithAttendees()
         else:
             yield self.queuedScheduleWithAttendees()
@@ -36,7 +36,8 @@ from twisted.internet.protocol import Factory
 from twisted.python.failure import Failure
 
 from twistedcaldav.accounting import accountingEnabledForCategory, emitAccounting
-from twistedcaldav.client.pool import _configuredClientContextFactory
+from twistedcaldav.client.pool import _configuredClientContextFactory, \
+    getPersistentHTTPClientPool
 from twistedcaldav.config import config
 from twistedcaldav.ical import normalizeCUAddress, Component
 from twistedcaldav.util import utf8String
@@ -243,6 +244,9 @@ class IScheduleRequest(object):
                 if accountingEnabledForCategory("iSchedule"):
                     self.loggedResponse = yield self.logResponse(response)
                     emitAccounting("iSchedule", "", self.loggedRequest + "\n" + self.loggedResponse, "POST")
+
+                # Read the redirect body so a persistent connection can be re-used
+                yield allDataFromStream(response.stream)
             else:
                 raise ValueError("Too many redirects")
 
@@ -254,6 +258,7 @@ class IScheduleRequest(object):
                 xml = (yield davXMLFromStream(response.stream))
                 self._parseResponse(xml)
             else:
+                yield allDataFromStream(response.stream)
                 raise ValueError("Incorrect server response status code: {code}".format(code=response.code))
 
         except Exception, e:
@@ -489,6 +494,10 @@ class IScheduleRequest(object):
 
     @inlineCallbacks
     def _submitRequest(self, ssl, host, port, request):
+        if config.OutboundHTTPConnections.Enabled:
+            response = (yield getPersistentHTTPClientPool(ssl, host, port).submitRequest(request))
+            returnValue(response)
+
         from twisted.internet import reactor
         f = Factory()
         f.protocol = HTTPClientProtocol
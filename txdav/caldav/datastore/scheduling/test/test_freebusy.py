@@ -19,13 +19,15 @@ from pycalendar.period import Period
 
 from twext.python.clsprop import classproperty
 
-from twisted.internet.defer import inlineCallbacks
+from twisted.internet.defer import inlineCallbacks, returnValue
 from twisted.trial.unittest import TestCase
 
+from twistedcaldav.config import config
 from twistedcaldav.ical import Component, Property
 
 from txdav.caldav.datastore.scheduling.cuaddress import calendarUserFromCalendarUserAddress
 from txdav.caldav.datastore.scheduling.freebusy import FreebusyQuery
+from txdav.caldav.datastore.sql import Calendar
 from txdav.common.datastore.test.util import CommonCommonTests, populateCalendarsFrom
 
 
@@ -256,6 +258,9 @@ class GenerateFreeBusyInfo(CommonCommonTests, TestCase):
         self.now_13H = self.now.duplicate()
         self.now_13H.offsetHours(13)
 
+        self.now_14H = self.now.duplicate()
+        self.now_14H.offsetHours(14)
+
         self.now_1D = self.now.duplicate()
         self.now_1D.offsetDay(1)
 
@@ -270,6 +275,8 @@ class GenerateFreeBusyInfo(CommonCommonTests, TestCase):
             "user01": {
                 "calendar_1": {
                 },
+                "calendar_2": {
+                },
                 "inbox": {
                 },
             },
@@ -294,8 +301,8 @@ class GenerateFreeBusyInfo(CommonCommonTests, TestCase):
         return self._sqlCalendarStore
 
     @inlineCallbacks
-    def _createCalendarObject(self, data, user, name):
-        calendar_collection = (yield self.calendarUnderTest(home=user))
+    def _createCalendarObject(self, data, user, name, calendar_name="calendar_1"):
+        calendar_collection = (yield self.calendarUnderTest(home=user, name=calendar_name))
         yield calendar_collection.createCalendarObjectWithName("test.ics", Component.fromString(data))
         yield self.commit()
 
@@ -382,3 +389,154 @@ END:VCALENDAR
         self.assertEqual(len(fbinfo.unavailable), 0)
         self.assertEqual(len(event_details), 1)
         self.assertEqual(str(event_details[0]), str(tuple(Component.fromString(data).subcomponents())[0]))
+
+    @inlineCallbacks
+    def test_multiple_calendars(self):
+        """
+        Test that events in several calendars are found with a single query.
+        """
+
+        data = """BEGIN:VCALENDAR
+VERSION:2.0
+PRODID:-//CALENDARSERVER.ORG//NONSGML Version 1//EN
+BEGIN:VEVENT
+UID:%s
+DTSTAMP:20080601T000000Z
+DTSTART:%s
+DTEND:%s
+END:VEVENT
+END:VCALENDAR
+"""
+
+        yield self._createCalendarObject(data % ("1234-5678", self.now_12H.getText(), self.now_13H.getText(),), "user01", "test.ics")
+        yield self._createCalendarObject(data % ("1234-5679", self.now_13H.getText(), self.now_14H.getText(),), "user01", "test.ics", "calendar_2")
+
+        searches = []
+        self.patch(Calendar, "search", lambda *args, **kwargs: searches.append(args))
+
+        calendar1 = (yield self.calendarUnderTest(home="user01", name="calendar_1"))
+        calendar2 = (yield self.calendarUnderTest(home="user01", name="calendar_2"))
+        fbinfo = FreebusyQuery.FBInfo([], [], [])
+        timerange = Period(self.now, self.now_1D)
+
+        organizer = recipient = yield calendarUserFromCalendarUserAddress("mailto:user01@example.com", self.transactionUnderTest())
+        freebusy = FreebusyQuery(organizer=organizer, recipient=recipient, timerange=timerange)
+        result = (yield freebusy.generateFreeBusyInfo([calendar1, calendar2, ], fbinfo))
+        self.assertEqual(result, 2)
+        self.assertEqual(len(searches), 0)
+        self.assertEqual(
+            sorted(fbinfo.busy, key=lambda period: period.getStart()),
+            [Period(self.now_12H, self.now_13H), Period(self.now_13H, self.now_14H), ],
+        )
+        self.assertEqual(len(fbinfo.tentative), 0)
+        self.assertEqual(len(fbinfo.unavailable), 0)
+
+    @inlineCallbacks
+    def test_busy_index(self):
+        """
+        Test that the busy time index gives the same result as the normal processing, is re-used
+        without a search, and is rebuilt when the home changes.
+        """
+
+        data = """BEGIN:VCALENDAR
+VERSION:2.0
+PRODID:-//CALENDARSERVER.ORG//NONSGML Version 1//EN
+BEGIN:VEVENT
+UID:%s
+DTSTAMP:20080601T000000Z
+DTSTART:%s
+DTEND:%s
+STATUS:%s
+END:VEVENT
+END:VCALENDAR
+"""
+
+        self.patch(config, "EnableBusyTimeIndex", True)
+
+        yield self._createCalendarObject(data % ("1234-5678", self.now_12H.getText(), self.now_13H.getText(), "CONFIRMED",), "user01", "test.ics")
+        yield self._createCalendarObject(data % ("1234-5679", self.now_13H.getText(), self.now_14H.getText(), "TENTATIVE",), "user01", "test.ics", "calendar_2")
+
+        @inlineCallbacks
+        def _freebusy(start, end):
+            calendar1 = (yield self.calendarUnderTest(home="user01", name="calendar_1"))
+            calendar2 = (yield self.calendarUnderTest(home="user01", name="calendar_2"))
+            fbinfo = FreebusyQuery.FBInfo([], [], [])
+            logItems = {}
+
+            organizer = recipient = yield calendarUserFromCalendarUserAddress("mailto:user01@example.com", self.transactionUnderTest())
+            freebusy = FreebusyQuery(organizer=organizer, recipient=recipient, timerange=Period(start, end), logItems=logItems)
+            result = (yield freebusy.generateFreeBusyInfo([calendar1, calendar2, ], fbinfo))
+            yield self.commit()
+            returnValue((result, fbinfo, logItems,))
+
+        result, fbinfo, logItems = yield _freebusy(self.now, self.now_1D)
+        self.assertEqual(result, 2)
+        self.assertEqual(logItems.get("fb-indexed"), 2)
+        self.assertEqual(fbinfo.busy, [Period(self.now_12H, self.now_13H), ])
+        self.assertEqual(fbinfo.tentative, [Period(self.now_13H, self.now_14H), ])
+        self.assertEqual(len(fbinfo.unavailable), 0)
+
+        # Index is re-used and clipped to the requested time range
+        searchCalendars = Calendar.__dict__["searchCalendars"]
+        searches = []
+        self.patch(Calendar, "searchCalendars", classmethod(lambda *args, **kwargs: searches.append(args)))
+        now_12H30M = self.now_12H.duplicate()
+        now_12H30M.offsetSeconds(30 * 60)
+        result, fbinfo, logItems = yield _freebusy(now_12H30M, self.now_14H)
+        self.assertEqual(len(searches), 0)
+        self.assertEqual(result, 2)
+        self.assertEqual(fbinfo.busy, [Period(now_12H30M, self.now_13H), ])
+        self.assertEqual(fbinfo.tentative, [Period(self.now_13H, self.now_14H), ])
+
+        result, fbinfo, logItems = yield _freebusy(self.now_14H, self.now_1D)
+        self.assertEqual(result, 0)
+        self.assertEqual(len(fbinfo.busy), 0)
+        self.assertEqual(len(fbinfo.tentative), 0)
+        self.patch(Calendar, "searchCalendars", searchCalendars)
+
+        # A change to the home rebuilds the index
+        now_15H = self.now.duplicate()
+        now_15H.offsetHours(15)
+        yield self._createCalendarObject(data % ("1234-5680", self.now_14H.getText(), now_15H.getText(), "CONFIRMED",), "user01", "test2.ics")
+        result, fbinfo, logItems = yield _freebusy(self.now, self.now_1D)
+        self.assertEqual(result, 3)
+        self.assertEqual(
+            fbinfo.busy,
+            [Period(self.now_12H, self.now_13H), Period(self.now_14H, now_15H), ],
+        )
+        self.assertEqual(fbinfo.tentative, [Period(self.now_13H, self.now_14H), ])
+
+    @inlineCallbacks
+    def test_busy_index_not_indexable(self):
+        """
+        Test that events that are not on a minute boundary fall back to the normal processing.
+        """
+
+        self.patch(config, "EnableBusyTimeIndex", True)
+
+        now_12H30S = self.now_12H.duplicate()
+        now_12H30S.offsetSeconds(30)
+        data = """BEGIN:VCALENDAR
+VERSION:2.0
+PRODID:-//CALENDARSERVER.ORG//NONSGML Version 1//EN
+BEGIN:VEVENT
+UID:1234-5678
+DTSTAMP:20080601T000000Z
+DTSTART:%s
+DTEND:%s
+END:VEVENT
+END:VCALENDAR
+""" % (now_12H30S.getText(), self.now_13H.getText(),)
+
+        yield self._createCalendarObject(data, "user01", "test.ics")
+        calendar = (yield self.calendarUnderTest(home="user01", name="calendar_1"))
+        fbinfo = FreebusyQuery.FBInfo([], [], [])
+        timerange = Period(self.now, self.now_1D)
+        logItems = {}
+
+        organizer = recipient = yield calendarUserFromCalendarUserAddress("mailto:user01@example.com", self.transactionUnderTest())
+        freebusy = FreebusyQuery(organizer=organizer, recipient=recipient, timerange=timerange, logItems=logItems)
+        result = (yield freebusy.generateFreeBusyInfo([calendar, ], fbinfo))
+        self.assertEqual(result, 1)
+        self.assertTrue("fb-indexed" not in logItems)
+        self.assertEqual(fbinfo.busy, [Period(now_12H30S, self.now_13H), ])
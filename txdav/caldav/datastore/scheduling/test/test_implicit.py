@@ -29,6 +29,7 @@ from twistedcaldav.config import config
 from twistedcaldav.ical import Component
 from twistedcaldav.timezones import TimezoneCache
 
+from txdav.caldav.datastore.scheduling import implicit
 from txdav.caldav.datastore.scheduling.cuaddress import LocalCalendarUser
 from txdav.caldav.datastore.scheduling.implicit import ImplicitScheduler
 from txdav.caldav.datastore.scheduling.scheduler import ScheduleResponseQueue
@@ -806,6 +807,35 @@ END:VCALENDAR
             self.assertEqual(scheduler.cancelledAttendees, set(result), msg=description)
             yield self.commit()
 
+    @inlineCallbacks
+    def test_prefetchAttendees(self):
+        """
+        Test that prefetchAttendees only looks up the attendees in bulk when
+        the directory is a caching one.
+        """
+
+        scheduler = ImplicitScheduler()
+        scheduler.txn = self.transactionUnderTest()
+        directory = scheduler.txn.directoryService()
+
+        lookups = []
+
+        def recordsWithCalendarUserAddresses(addresses, timeoutSeconds=None):
+            lookups.append(set(addresses))
+            return succeed(())
+        self.patch(directory, "recordsWithCalendarUserAddresses", recordsWithCalendarUserAddresses)
+
+        attendees = ("mailto:user02@example.com", "mailto:user03@example.com",)
+        yield scheduler.prefetchAttendees(attendees)
+        self.assertEqual(lookups, [])
+
+        self.patch(implicit, "isCachingDirectory", lambda directory: True)
+        yield scheduler.prefetchAttendees(())
+        self.assertEqual(lookups, [])
+        yield scheduler.prefetchAttendees(attendees)
+        self.assertEqual(lookups, [set(attendees)])
+        yield self.commit()
+
     @inlineCallbacks
     def test_process_request_excludes_includes(self):
         """
@@ -48,12 +48,15 @@ from twistedcaldav.stdconfig import config
 from twistedcaldav.datafilters.peruserdata import PerUserDataFilter
 from twistedcaldav.dateops import normalizeForIndex, \
     pyCalendarToSQLTimestamp, parseSQLDateToPyCalendar
-from twistedcaldav.ical import Component, InvalidICalendarDataError, Property, ATTENDEE_COMMENT
+from twistedcaldav.ical import Component, InvalidICalendarDataError, Property, ATTENDEE_COMMENT, \
+    PERUSER_COMPONENT, PRIVATE_COMMENT
 from twistedcaldav.instance import InvalidOverriddenInstanceError
 from twistedcaldav.timezones import TimezoneException, readVTZ, hasTZ
 
 from txdav.base.propertystore.base import PropertyName
-from txdav.caldav.datastore.query.builder import buildExpression
+from txdav.caldav.datastore.componentcache import componentCache
+from txdav.caldav.datastore.query.builder import buildExpression, \
+    INDEXED_PROPERTIES, INDEXED_COMPONENTS
 from txdav.caldav.datastore.query.filter import Filter
 from txdav.caldav.datastore.query.generator import CalDAVSQLQueryGenerator
 from txdav.caldav.datastore.scheduling.cuaddress import calendarUserFromCalendarUserAddress
@@ -91,6 +94,7 @@ from txdav.common.datastore.sql_tables import _ATTACHMENTS_MODE_NONE, \
     _TRANSP_OPAQUE, _TRANSP_TRANSPARENT, schema, _CHILD_TYPE_TRASH, \
     _HOME_STATUS_NORMAL
 from txdav.common.datastore.sql_sharing import SharingInvitation
+from txdav.common.datastore.sql_util import allocateSequenceValues, bulkInsert
 from txdav.common.icommondatastore import IndexedSearchException, \
     InternalDataStoreError, HomeChildNameAlreadyExistsError, \
     HomeChildNameNotAllowedError, ObjectResourceTooBigError, \
@@ -99,6 +103,7 @@ from txdav.common.icommondatastore import IndexedSearchException, \
     InvalidUIDError, UIDExistsError, UIDExistsElsewhereError, \
     InvalidResourceMove, InvalidComponentForStoreError, \
     NoSuchObjectResourceError, ConcurrentModification
+from txdav.who.cache import isCachingDirectory
 from txdav.xml import element
 from txdav.xml.parser import WebDAVDocument
 
@@ -475,6 +480,8 @@ class CalendarHome(CommonHome):
     _notifierPrefix = "CalDAV"
     _dataVersionKey = "CALENDAR-DATAVERSION"
 
+    _syncTokenCacheable = True
+
     _componentCalendarName = {
         "VEVENT": "calendar",
         "VTODO": "tasks",
@@ -1153,6 +1160,7 @@ class Calendar(CommonHomeChild):
     _queryFields = {
         "UID": _objectSchema.UID,
         "TYPE": _objectSchema.ICALENDAR_TYPE,
+        "PROPERTY": schema.CALENDAR_OBJECT_PROPERTY,
     }
 
     _supportedComponents = None
@@ -1710,7 +1718,10 @@ class Calendar(CommonHomeChild):
     @inlineCallbacks
     def search(self, filter, useruid=None, fbtype=False):
         """
-        Finds resources matching the given qualifiers.
+        Finds resources matching the given qualifiers. When the filter is not
+        exact (see L{txdav.caldav.datastore.query.builder.isExactFilter}) the
+        results are candidates that still need to be matched against the
+        filter.
         @param filter: the L{Filter} for the calendar-query to execute.
         @return: an iterable of tuples for each resource matching the
             given C{qualifiers}. The tuples are C{(name, uid)}, where
@@ -1734,36 +1745,7 @@ class Calendar(CommonHomeChild):
 
         # Check for time-range re-expand
         if usedtimerange is not None:
-
-            today = DateTime.getToday()
-
-            # Determine how far we need to extend the current expansion of
-            # events. If we have an open-ended time-range we will expand
-            # one year past the start. That should catch bounded
-            # recurrences - unbounded will have been indexed with an
-            # "infinite" value always included.
-            maxDate, isStartDate = filter.getmaxtimerange()
-            if maxDate:
-                maxDate = maxDate.duplicate()
-                maxDate.offsetDay(1)
-                maxDate.setDateOnly(True)
-                upperLimit = today + Duration(days=config.FreeBusyIndexExpandMaxDays)
-                if maxDate > upperLimit:
-                    raise TimeRangeUpperLimit(upperLimit)
-                if isStartDate:
-                    maxDate += Duration(days=365)
-
-            # Determine if the start date is too early for the restricted range we
-            # are applying. If it is today or later we don't need to worry about truncation
-            # in the past.
-            minDate, _ignore_isEndDate = filter.getmintimerange()
-            if minDate >= today:
-                minDate = None
-            if minDate is not None and config.FreeBusyIndexLowerLimitDays:
-                truncateLowerLimit = today - Duration(days=config.FreeBusyIndexLowerLimitDays)
-                if minDate < truncateLowerLimit:
-                    raise TimeRangeLowerLimit(truncateLowerLimit)
-
+            minDate, maxDate = self._searchIndexRange(filter)
             if maxDate is not None or minDate is not None:
                 yield self.testAndUpdateIndex(minDate, maxDate)
 
@@ -1772,18 +1754,117 @@ class Calendar(CommonHomeChild):
         # Check result for missing resources
         results = []
         for row in rowiter:
-            if fbtype:
-                row = list(row)
-                row[4] = 'Y' if row[4] else 'N'
-                row[7] = indexfbtype_to_icalfbtype[row[7]]
-                if row[9] is not None:
-                    row[8] = row[9]
-                row[8] = 'T' if row[8] else 'F'
-                del row[9]
-            results.append(row)
+            results.append(self._searchResultRow(row, fbtype))
+
+        returnValue(results)
+
+    @classmethod
+    @inlineCallbacks
+    def searchCalendars(cls, calendars, filter, useruid=None, fbtype=False):
+        """
+        Finds resources matching the given qualifiers in a set of calendars, using
+        a single query rather than one L{search} per calendar. Any time-range in the
+        filter will have been set up with a single timezone for floating times, so
+        all the calendars need to have the same timezone.
+
+        @param calendars: the calendars to search - these must all use the same transaction
+        @type calendars: C{list} of L{Calendar}
+        @param filter: the L{Filter} for the calendar-query to execute.
+        @return: a C{dict} mapping each calendar resource ID to the L{search} results
+            for that calendar.
+        """
+
+        # We might be passed an L{Filter} or a serialization of one
+        if isinstance(filter, dict):
+            try:
+                filter = Filter.deserialize(filter)
+            except Exception:
+                filter = None
+
+        # No result means it is too complex for us
+        if not isinstance(filter, Filter):
+            raise IndexedSearchException()
+
+        calendarIDs = [calendar.id() for calendar in calendars]
+        try:
+            expression = buildExpression(filter, cls._queryFields)
+            sql_stmt, args, usedtimerange = CalDAVSQLQueryGenerator(expression, calendars[0], calendarIDs, useruid, fbtype).generate()
+        except ValueError:
+            raise IndexedSearchException()
+
+        # Check for time-range re-expand
+        if usedtimerange:
+            minDate, maxDate = cls._searchIndexRange(filter)
+            if maxDate is not None or minDate is not None:
+                yield cls._testAndUpdateIndexes(calendars, minDate, maxDate)
+
+        rowiter = yield sql_stmt.on(calendars[0]._txn, **args)
+
+        # Split results by calendar
+        results = dict([(calendarID, [],) for calendarID in calendarIDs])
+        for row in rowiter:
+            results[row[0]].append(cls._searchResultRow(row[1:], fbtype))
 
         returnValue(results)
 
+    @staticmethod
+    def _searchIndexRange(filter):
+        """
+        Determine the range that the instance index needs to be expanded to for a
+        time-range query.
+
+        @param filter: the L{Filter} for the calendar-query being executed.
+        @return: a C{tuple} of the minimum and maximum dates, either of which may be
+            L{None} if the index does not need to be expanded
+        @rtype: C{tuple} of L{DateTime}
+        """
+
+        today = DateTime.getToday()
+
+        # Determine how far we need to extend the current expansion of
+        # events. If we have an open-ended time-range we will expand
+        # one year past the start. That should catch bounded
+        # recurrences - unbounded will have been indexed with an
+        # "infinite" value always included.
+        maxDate, isStartDate = filter.getmaxtimerange()
+        if maxDate:
+            maxDate = maxDate.duplicate()
+            maxDate.offsetDay(1)
+            maxDate.setDateOnly(True)
+            upperLimit = today + Duration(days=config.FreeBusyIndexExpandMaxDays)
+            if maxDate > upperLimit:
+                raise TimeRangeUpperLimit(upperLimit)
+            if isStartDate:
+                maxDate += Duration(days=365)
+
+        # Determine if the start date is too early for the restricted range we
+        # are applying. If it is today or later we don't need to worry about truncation
+        # in the past.
+        minDate, _ignore_isEndDate = filter.getmintimerange()
+        if minDate >= today:
+            minDate = None
+        if minDate is not None and config.FreeBusyIndexLowerLimitDays:
+            truncateLowerLimit = today - Duration(days=config.FreeBusyIndexLowerLimitDays)
+            if minDate < truncateLowerLimit:
+                raise TimeRangeLowerLimit(truncateLowerLimit)
+
+        return minDate, maxDate
+
+    @staticmethod
+    def _searchResultRow(row, fbtype):
+        """
+        Convert a row returned by a search query into its result form.
+        """
+        if fbtype:
+            row = list(row)
+            row[4] = 'Y' if row[4] else 'N'
+            row[7] = indexfbtype_to_icalfbtype[row[7]]
+            if row[9] is not None:
+                row[8] = row[9]
+            row[8] = 'T' if row[8] else 'F'
+            del row[9]
+        return row
+
     def _sqlquery(self, filter, useruid, fbtype):
         """
         Convert the supplied addressbook-query into a partial SQL statement.
@@ -1892,6 +1973,42 @@ class Calendar(CommonHomeChild):
             self.log.info("Search falls outside range of index for {name} {min} to {max}", name=name, min=minDate, max=maxDate)
             yield self.reExpandResource(name, minDate, maxDate)
 
+    @classmethod
+    def _notExpandedWithinCalendarsQuery(cls, resourceIDs):
+        """
+        Query to find resources in a set of calendars that need to be re-expanded
+        """
+        co = cls._objectSchema
+        return Select(
+            [co.CALENDAR_RESOURCE_ID, co.RESOURCE_NAME],
+            From=co,
+            Where=(
+                (co.RECURRANCE_MIN > Parameter("minDate"))
+                .Or(co.RECURRANCE_MAX < Parameter("maxDate"))
+            ).And(co.CALENDAR_RESOURCE_ID.In(Parameter("resourceIDs", len(resourceIDs))))
+        )
+
+    @classmethod
+    @inlineCallbacks
+    def _testAndUpdateIndexes(cls, calendars, minDate, maxDate):
+        """
+        Same as L{testAndUpdateIndex} but for a set of calendars, using one query to
+        find the resources that need to be re-expanded.
+        """
+        calendarsByID = dict([(calendar.id(), calendar,) for calendar in calendars])
+        rows = yield cls._notExpandedWithinCalendarsQuery(calendarsByID.keys()).on(
+            calendars[0]._txn,
+            minDate=pyCalendarToSQLTimestamp(normalizeForIndex(minDate)) if minDate is not None else None,
+            maxDate=pyCalendarToSQLTimestamp(normalizeForIndex(maxDate)),
+            resourceIDs=calendarsByID.keys(),
+        )
+
+        # Actually expand recurrence max
+        for calendarID, name in rows:
+            calendar = calendarsByID[calendarID]
+            calendar.log.info("Search falls outside range of index for {name} {min} to {max}", name=name, min=minDate, max=maxDate)
+            yield calendar.reExpandResource(name, minDate, maxDate)
+
     @inlineCallbacks
     def splitCollectionByComponentTypes(self):
         """
@@ -2152,6 +2269,13 @@ class Calendar(CommonHomeChild):
                         }.get(shareeBindMode),
                     )
 
+            # Look up all the new sharees with one directory request, so the
+            # lookups done for each one while sharing are answered from the cache
+            newUIDs = memberUIDs - boundUIDs - set((self._home.uid(),))
+            directory = self._txn.directoryService()
+            if newUIDs and isCachingDirectory(directory):
+                yield directory.recordsWithUIDs(newUIDs)
+
             for memberUID in memberUIDs - boundUIDs:
                 # Never reconcile the sharer
                 if memberUID != self._home.uid():
@@ -2574,6 +2698,28 @@ accessMode_to_type = {
 accesstype_to_accessMode = dict([(v, k) for k, v in accessMode_to_type.items()])
 
 
+def _normalizeIndexTimestamp(value):
+    """
+    Normalize a TIME_RANGE or PERUSER timestamp value, which may be a C{str},
+    C{date} or C{datetime} depending on where it came from, so that values read
+    from the database can be compared with ones about to be written.
+
+    @param value: the timestamp value
+    @type value: C{str}, C{date}, C{datetime} or L{None}
+
+    @return: the normalized value
+    @rtype: C{datetime} or L{None}
+    """
+    if value is None:
+        return None
+    elif isinstance(value, datetime.datetime):
+        return value.replace(tzinfo=None, microsecond=0)
+    elif isinstance(value, datetime.date):
+        return datetime.datetime(value.year, value.month, value.day)
+    else:
+        return parseSQLTimestamp(value).replace(microsecond=0)
+
+
 class CalendarObject(CommonObjectResource, CalendarObjectBase):
     implements(ICalendarObject)
 
@@ -2582,6 +2728,9 @@ class CalendarObject(CommonObjectResource, CalendarObjectBase):
 
     _currentDataVersion = 1
 
+    # Maximum number of instance IDs in a single "in" clause
+    _instanceIDBatchSize = 500
+
     def __init__(self, calendar, name, uid, resourceID=None, options=None):
 
         super(CalendarObject, self).__init__(calendar, name, uid, resourceID)
@@ -4030,12 +4179,7 @@ class CalendarObject(CommonObjectResource, CalendarObjectBase):
                     ).on(txn)
                 )[0][0])
 
-                # Need to wipe the existing time-range for this and rebuild if required
-                if instanceIndexingRequired:
-                    yield Delete(
-                        From=tr,
-                        Where=tr.CALENDAR_OBJECT_RESOURCE_ID == self._resourceID
-                    ).on(txn)
+            yield self._updatePropertyIndex(txn, self._resourceID, component, inserting)
         else:
             # Keep MODIFIED the same when doing an index-only update
             values = {
@@ -4049,19 +4193,79 @@ class CalendarObject(CommonObjectResource, CalendarObjectBase):
                 Where=co.RESOURCE_ID == self._resourceID
             ).on(txn)
 
-            # Need to wipe the existing time-range for this and rebuild
+        if instanceIndexingRequired:
+            if inserting:
+                if doInstanceIndexing:
+                    yield self._addInstances(component, instances, truncateLowerLimit, isInboxItem, txn)
+            elif doInstanceIndexing and config.FreeBusyIndexIncrementalUpdate:
+                # Only change the existing time-range rows that differ from the new ones
+                yield self._addInstances(component, instances, truncateLowerLimit, isInboxItem, txn, replace=True)
+            else:
+                # Need to wipe the existing time-range for this and rebuild if required
+                yield Delete(
+                    From=tr,
+                    Where=tr.CALENDAR_OBJECT_RESOURCE_ID == self._resourceID
+                ).on(txn)
+                if doInstanceIndexing:
+                    yield self._addInstances(component, instances, truncateLowerLimit, isInboxItem, txn)
+
+        yield self.removeOldEventGroupLink(component, instances, inserting, txn)
+
+    @classmethod
+    @inlineCallbacks
+    def _updatePropertyIndex(cls, txn, resourceID, component, inserting):
+        """
+        Write the CALENDAR_OBJECT_PROPERTY rows used to narrow down calendar-query
+        searches with prop-filters. Each indexed property of the top-level
+        components is stored lower-cased, with a C{None} value when too long to
+        index, and each indexed sub-component present is stored with a C{None}
+        value.
+
+        @param txn: transaction to use
+        @type txn: L{Transaction}
+        @param resourceID: resource id of the calendar object
+        @type resourceID: C{int}
+        @param component: the component being stored
+        @type component: L{Component}
+        @param inserting: C{True} if this is a new resource with no existing rows
+        @type inserting: C{bool}
+        """
+
+        cop = schema.CALENDAR_OBJECT_PROPERTY
+        if not inserting:
             yield Delete(
-                From=tr,
-                Where=tr.CALENDAR_OBJECT_RESOURCE_ID == self._resourceID
+                From=cop,
+                Where=cop.CALENDAR_OBJECT_RESOURCE_ID == resourceID
             ).on(txn)
 
-        if instanceIndexingRequired and doInstanceIndexing:
-            yield self._addInstances(component, instances, truncateLowerLimit, isInboxItem, txn)
-
-        yield self.removeOldEventGroupLink(component, instances, inserting, txn)
+        entries = set()
+        for subcomponent in component.subcomponents(ignore=True):
+            for prop in subcomponent.properties():
+                if prop.name() not in INDEXED_PROPERTIES:
+                    continue
+                value = prop.strvalue().decode("utf-8").lower()
+                entries.add((prop.name(), value.encode("utf-8") if len(value) <= 255 else None,))
+
+        def _findComponents(comp):
+            for subcomponent in comp.subcomponents():
+                if subcomponent.name() in INDEXED_COMPONENTS:
+                    entries.add((subcomponent.name(), None,))
+                _findComponents(subcomponent)
+        _findComponents(component)
+
+        yield bulkInsert(
+            txn,
+            (
+                cop.CALENDAR_OBJECT_RESOURCE_ID,
+                cop.NAME,
+                cop.VALUE,
+            ),
+            [(resourceID, entry_name, entry_value,) for entry_name, entry_value in sorted(entries)],
+            config.FreeBusyIndexBulkInsertSize,
+        )
 
     @inlineCallbacks
-    def _addInstances(self, component, instances, truncateLowerLimit, isInboxItem, txn):
+    def _addInstances(self, component, instances, truncateLowerLimit, isInboxItem, txn, replace=False):
         """
         Add the set of supplied instances to the store.
 
@@ -4075,10 +4279,14 @@ class CalendarObject(CommonObjectResource, CalendarObjectBase):
         @type isInboxItem: C{bool}
         @param txn: transaction to use
         @type txn: L{Transaction}
+        @param replace: if C{True} the supplied instances replace any existing ones
+            for this resource, with only the differences being written
+        @type replace: C{bool}
         """
 
         # TIME_RANGE table update
         lowerLimitApplied = False
+        details = []
         for key in instances:
             instance = instances[key]
             start = instance.start
@@ -4094,14 +4302,14 @@ class CalendarObject(CommonObjectResource, CalendarObjectBase):
                 lowerLimitApplied = True
                 continue
 
-            yield self._addInstanceDetails(component, instance.rid, start, end, floating, transp, fbtype, isInboxItem, txn)
+            details.append((instance.rid, start, end, floating, transp, fbtype,))
 
         # For truncated items we insert a tomb stone lower bound so that a time-range
         # query with just an end bound will match
         if lowerLimitApplied or instances.lowerLimit and len(instances.instances) == 0:
             start = DateTime(1901, 1, 1, 0, 0, 0, tzid=Timezone.UTCTimezone)
             end = DateTime(1901, 1, 1, 1, 0, 0, tzid=Timezone.UTCTimezone)
-            yield self._addInstanceDetails(component, None, start, end, False, True, "UNKNOWN", isInboxItem, txn)
+            details.append((None, start, end, False, True, "UNKNOWN",))
 
         # Special - for unbounded recurrence we insert a value for "infinity"
         # that will allow an open-ended time-range to always match it.
@@ -4110,7 +4318,17 @@ class CalendarObject(CommonObjectResource, CalendarObjectBase):
         if component.isRecurringUnbounded() or instances.limit and len(instances.instances) == 0:
             start = DateTime(2100, 1, 1, 0, 0, 0, tzid=Timezone.UTCTimezone)
             end = DateTime(2100, 1, 1, 1, 0, 0, tzid=Timezone.UTCTimezone)
-            yield self._addInstanceDetails(component, None, start, end, False, True, "UNKNOWN", isInboxItem, txn)
+            details.append((None, start, end, False, True, "UNKNOWN",))
+
+        # Use multi-row inserts when there is more than one instance, otherwise
+        # one insert per instance
+        if replace:
+            yield self._replaceInstanceDetails(component, details, isInboxItem, txn)
+        elif config.FreeBusyIndexBulkInsertSize and len(details) > 1:
+            yield self._addInstanceDetailsBulk(component, details, isInboxItem, txn)
+        else:
+            for rid, start, end, floating, transp, fbtype in details:
+                yield self._addInstanceDetails(component, rid, start, end, floating, transp, fbtype, isInboxItem, txn)
 
     @inlineCallbacks
     def _addInstanceDetails(self, component, rid, start, end, floating, transp, fbtype, isInboxItem, txn):
@@ -4130,25 +4348,265 @@ class CalendarObject(CommonObjectResource, CalendarObjectBase):
 
         # Don't do transparency for inbox items - we never do freebusy on inbox
         if not isInboxItem:
-            peruserdata = component.perUserData(rid)
-            for useruid, (usertransp, adjusted_start, adjusted_end) in peruserdata:
-
-                def _adjustDateTime(dt, adjustment, add_duration):
-                    if isinstance(adjustment, Duration):
-                        return pyCalendarToSQLTimestamp((dt + adjustment) if add_duration else (dt - adjustment))
-                    elif isinstance(adjustment, DateTime):
-                        return pyCalendarToSQLTimestamp(normalizeForIndex(adjustment))
-                    else:
-                        return None
+            for useruid, usertransp, adjusted_start, adjusted_end in self._perUserInstanceDetails(component, rid, start, end, transp):
+                (yield Insert({
+                    tpy.TIME_RANGE_INSTANCE_ID: instanceid,
+                    tpy.USER_ID: useruid,
+                    tpy.TRANSPARENT: usertransp,
+                    tpy.ADJUSTED_START_DATE: adjusted_start,
+                    tpy.ADJUSTED_END_DATE: adjusted_end,
+                }).on(txn))
+
+    @inlineCallbacks
+    def _addInstanceDetailsBulk(self, component, details, isInboxItem, txn):
+        """
+        Add a set of instances to the TIME_RANGE and PERUSER tables using
+        multi-row inserts. The instance IDs are allocated up front in one query
+        so that the PERUSER rows can be matched to their TIME_RANGE rows without
+        a round trip per instance.
+
+        @param component: the component whose instances are being added
+        @type component: L{Component}
+        @param details: the instance details: each item is a C{tuple} of rid, start,
+            end, floating, transp, fbtype
+        @type details: C{list} of C{tuple}
+        @param isInboxItem: indicates if an inbox item
+        @type isInboxItem: C{bool}
+        @param txn: transaction to use
+        @type txn: L{Transaction}
+        """
+
+        tr = schema.TIME_RANGE
+        tpy = schema.PERUSER
+
+        instanceids = yield allocateSequenceValues(txn, schema.INSTANCE_ID_SEQ, len(details))
+
+        trRows = []
+        peruserRows = []
+        for instanceid, (rid, start, end, floating, transp, fbtype) in zip(instanceids, details):
+            trRows.append((
+                instanceid,
+                self._calendar._resourceID,
+                self._resourceID,
+                floating,
+                pyCalendarToSQLTimestamp(start),
+                pyCalendarToSQLTimestamp(end),
+                icalfbtype_to_indexfbtype.get(fbtype, icalfbtype_to_indexfbtype["FREE"]),
+                transp,
+            ))
+
+            # Don't do transparency for inbox items - we never do freebusy on inbox
+            if not isInboxItem:
+                for useruid, usertransp, adjusted_start, adjusted_end in self._perUserInstanceDetails(component, rid, start, end, transp):
+                    peruserRows.append((instanceid, useruid, usertransp, adjusted_start, adjusted_end,))
+
+        yield bulkInsert(
+            txn,
+            (
+                tr.INSTANCE_ID,
+                tr.CALENDAR_RESOURCE_ID,
+                tr.CALENDAR_OBJECT_RESOURCE_ID,
+                tr.FLOATING,
+                tr.START_DATE,
+                tr.END_DATE,
+                tr.FBTYPE,
+                tr.TRANSPARENT,
+            ),
+            trRows,
+            config.FreeBusyIndexBulkInsertSize,
+        )
+
+        yield bulkInsert(
+            txn,
+            (
+                tpy.TIME_RANGE_INSTANCE_ID,
+                tpy.USER_ID,
+                tpy.TRANSPARENT,
+                tpy.ADJUSTED_START_DATE,
+                tpy.ADJUSTED_END_DATE,
+            ),
+            peruserRows,
+            config.FreeBusyIndexBulkInsertSize,
+        )
+
+    @inlineCallbacks
+    def _replaceInstanceDetails(self, component, details, isInboxItem, txn):
+        """
+        Make the TIME_RANGE and PERUSER rows for this resource match the supplied
+        instances, by comparing against the existing rows and only deleting,
+        inserting or updating the instances that differ. This gives the same result
+        as deleting all the existing rows and adding the new ones, but avoids
+        re-writing every row of a long recurring series when only a few instances
+        have changed.
+
+        TIME_RANGE does not store the RECURRENCE-ID of an instance, so instances are
+        matched on their start, end, floating, fbtype and transparency values. If
+        such a match has different PERUSER rows, only the PERUSER rows are updated.
+
+        @param component: the component whose instances are being added
+        @type component: L{Component}
+        @param details: the instance details: each item is a C{tuple} of rid, start,
+            end, floating, transp, fbtype
+        @type details: C{list} of C{tuple}
+        @param isInboxItem: indicates if an inbox item
+        @type isInboxItem: C{bool}
+        @param txn: transaction to use
+        @type txn: L{Transaction}
+        """
+
+        tr = schema.TIME_RANGE
+        tpy = schema.PERUSER
+
+        # Get the existing instances and their per-user rows
+        rows = yield Select(
+            [
+                tr.INSTANCE_ID,
+                tr.FLOATING,
+                tr.START_DATE,
+                tr.END_DATE,
+                tr.FBTYPE,
+                tr.TRANSPARENT,
+                tpy.USER_ID,
+                tpy.TRANSPARENT,
+                tpy.ADJUSTED_START_DATE,
+                tpy.ADJUSTED_END_DATE,
+            ],
+            From=tr.join(tpy, tr.INSTANCE_ID == tpy.TIME_RANGE_INSTANCE_ID, "left outer"),
+            Where=tr.CALENDAR_OBJECT_RESOURCE_ID == self._resourceID,
+        ).on(txn)
+
+        existingKeys = {}
+        existingPerUser = collections.defaultdict(set)
+        for instanceid, floating, start, end, fbtype, transp, useruid, usertransp, adjusted_start, adjusted_end in rows:
+            existingKeys[instanceid] = (
+                bool(floating),
+                _normalizeIndexTimestamp(start),
+                _normalizeIndexTimestamp(end),
+                fbtype,
+                bool(transp),
+            )
+            if useruid is not None:
+                existingPerUser[instanceid].add((
+                    useruid,
+                    bool(usertransp),
+                    _normalizeIndexTimestamp(adjusted_start),
+                    _normalizeIndexTimestamp(adjusted_end),
+                ))
+
+        existing = collections.defaultdict(list)
+        for instanceid, key in existingKeys.items():
+            existing[key].append((instanceid, frozenset(existingPerUser[instanceid]),))
+
+        # Match each new instance to an existing one
+        added = []
+        changedPerUser = []
+        for detail in details:
+            rid, start, end, floating, transp, fbtype = detail
+            key = (
+                bool(floating),
+                _normalizeIndexTimestamp(pyCalendarToSQLTimestamp(start)),
+                _normalizeIndexTimestamp(pyCalendarToSQLTimestamp(end)),
+                icalfbtype_to_indexfbtype.get(fbtype, icalfbtype_to_indexfbtype["FREE"]),
+                bool(transp),
+            )
+            peruser = [] if isInboxItem else self._perUserInstanceDetails(component, rid, start, end, transp)
+            perUserKey = frozenset([
+                (useruid, bool(usertransp), _normalizeIndexTimestamp(adjusted_start), _normalizeIndexTimestamp(adjusted_end),)
+                for useruid, usertransp, adjusted_start, adjusted_end in peruser
+            ])
+
+            candidates = existing.get(key)
+            if not candidates:
+                added.append(detail)
+                continue
+
+            # Prefer an existing instance with identical per-user data
+            for ctr, (instanceid, existingPerUserKey) in enumerate(candidates):
+                if existingPerUserKey == perUserKey:
+                    del candidates[ctr]
+                    break
+            else:
+                instanceid, _ignore_peruser = candidates.pop(0)
+                changedPerUser.append((instanceid, peruser,))
 
-                if usertransp != transp or adjusted_start is not None or adjusted_end is not None:
-                    (yield Insert({
-                        tpy.TIME_RANGE_INSTANCE_ID: instanceid,
-                        tpy.USER_ID: useruid if useruid else ".",
-                        tpy.TRANSPARENT: usertransp,
-                        tpy.ADJUSTED_START_DATE: _adjustDateTime(start, adjusted_start, add_duration=False),
-                        tpy.ADJUSTED_END_DATE: _adjustDateTime(end, adjusted_end, add_duration=True),
-                    }).on(txn))
+        removed = [unmatched[0] for remaining in existing.values() for unmatched in remaining]
+
+        # Remove instances no longer present (PERUSER rows cascade) and per-user data that changed
+        for table, column, instanceids in (
+            (tr, tr.INSTANCE_ID, removed),
+            (tpy, tpy.TIME_RANGE_INSTANCE_ID, [changed[0] for changed in changedPerUser]),
+        ):
+            for offset in range(0, len(instanceids), self._instanceIDBatchSize):
+                batch = instanceids[offset:offset + self._instanceIDBatchSize]
+                yield Delete(
+                    From=table,
+                    Where=column.In(Parameter("instanceIDs", len(batch))),
+                ).on(txn, instanceIDs=batch)
+
+        # Re-write changed per-user data
+        peruserRows = []
+        for instanceid, peruser in changedPerUser:
+            for useruid, usertransp, adjusted_start, adjusted_end in peruser:
+                peruserRows.append((instanceid, useruid, usertransp, adjusted_start, adjusted_end,))
+        if config.FreeBusyIndexBulkInsertSize:
+            yield bulkInsert(
+                txn,
+                (
+                    tpy.TIME_RANGE_INSTANCE_ID,
+                    tpy.USER_ID,
+                    tpy.TRANSPARENT,
+                    tpy.ADJUSTED_START_DATE,
+                    tpy.ADJUSTED_END_DATE,
+                ),
+                peruserRows,
+                config.FreeBusyIndexBulkInsertSize,
+            )
+        else:
+            for instanceid, useruid, usertransp, adjusted_start, adjusted_end in peruserRows:
+                yield Insert({
+                    tpy.TIME_RANGE_INSTANCE_ID: instanceid,
+                    tpy.USER_ID: useruid,
+                    tpy.TRANSPARENT: usertransp,
+                    tpy.ADJUSTED_START_DATE: adjusted_start,
+                    tpy.ADJUSTED_END_DATE: adjusted_end,
+                }).on(txn)
+
+        # Add new instances
+        if config.FreeBusyIndexBulkInsertSize and len(added) > 1:
+            yield self._addInstanceDetailsBulk(component, added, isInboxItem, txn)
+        else:
+            for rid, start, end, floating, transp, fbtype in added:
+                yield self._addInstanceDetails(component, rid, start, end, floating, transp, fbtype, isInboxItem, txn)
+
+    def _perUserInstanceDetails(self, component, rid, start, end, transp):
+        """
+        Determine the PERUSER table values for an instance. Only users whose transparency
+        or adjusted times differ from the instance need a PERUSER row.
+
+        @return: the per-user values - each item is a C{tuple} of user id, transparency,
+            adjusted start, adjusted end
+        @rtype: C{list} of C{tuple}
+        """
+
+        def _adjustDateTime(dt, adjustment, add_duration):
+            if isinstance(adjustment, Duration):
+                return pyCalendarToSQLTimestamp((dt + adjustment) if add_duration else (dt - adjustment))
+            elif isinstance(adjustment, DateTime):
+                return pyCalendarToSQLTimestamp(normalizeForIndex(adjustment))
+            else:
+                return None
+
+        results = []
+        peruserdata = component.perUserData(rid)
+        for useruid, (usertransp, adjusted_start, adjusted_end) in peruserdata:
+            if usertransp != transp or adjusted_start is not None or adjusted_end is not None:
+                results.append((
+                    useruid if useruid else ".",
+                    usertransp,
+                    _adjustDateTime(start, adjusted_start, add_duration=False),
+                    _adjustDateTime(end, adjusted_end, add_duration=True),
+                ))
+        return results
 
     @inlineCallbacks
     def copyMetadata(self, other):
@@ -4184,6 +4642,16 @@ class CalendarObject(CommonObjectResource, CalendarObjectBase):
 
         if self._cachedComponent is None:
 
+            # Try the process-local cache of parsed data
+            cache = componentCache() if self._md5 is not None else None
+            if cache is not None:
+                cacheKey = cache.key(self._resourceID, self._md5, self._dataversion)
+                component = cache.get(cacheKey)
+                if component is not None:
+                    self._cachedComponent = component
+                    self._cachedCommponentPerUser = {}
+                    returnValue(self._cachedComponent)
+
             text = yield self._text()
 
             try:
@@ -4214,6 +4682,8 @@ class CalendarObject(CommonObjectResource, CalendarObjectBase):
             # Check for on-demand data upgrade
             if self._dataversion < self._currentDataVersion:
                 yield self.upgradeData(component, doUpdate)
+            elif cache is not None:
+                cache.put(cacheKey, component, len(text))
 
             self._cachedComponent = component
             self._cachedCommponentPerUser = {}
@@ -4241,6 +4711,43 @@ class CalendarObject(CommonObjectResource, CalendarObjectBase):
             self._cachedCommponentPerUser[user_uuid] = filtered
         returnValue(self._cachedCommponentPerUser[user_uuid])
 
+    @inlineCallbacks
+    def componentTextForUser(self):
+        """
+        Return the stored iCalendar text when it is known to be the same as the text of
+        L{componentForUser}, so that a caller only wanting the text can avoid parsing it.
+        That is the case when there is no pending data upgrade, no per-user data, no private
+        comments, and no all-day values for which a default per-user TRANSP could be added.
+
+        The C{validCalendarData(doFix=True)} step of L{component} is skipped: every store
+        write runs that same validation and fixing (see L{validCalendarDataCheck}) before
+        the text is stored, and L{component} never writes its fixes back, so it only
+        changes data that was put into the database without going through the store.
+
+        @return: the calendar text, or L{None} if L{componentForUser} has to be used
+        @rtype: C{str}
+        """
+
+        if self._cachedComponent is not None or self._dataversion < self._currentDataVersion:
+            returnValue(None)
+
+        text = yield self._text()
+        if any([marker in text for marker in self._componentTextUnsafeMarkers]):
+            returnValue(None)
+        if type(text) is unicode:
+            text = text.encode("utf-8")
+        returnValue(text)
+
+    # Text that indicates per-user filtering (see L{PerUserDataFilter}) or fixing of
+    # private comments could change the data
+    _componentTextUnsafeMarkers = (
+        "BEGIN:{}".format(PERUSER_COMPONENT),
+        PRIVATE_COMMENT,
+        ATTENDEE_COMMENT,
+        "VALUE=DATE:",
+        "VALUE=DATE;",
+    )
+
     @inlineCallbacks
     def upgradeData(self, component, doUpdate=False):
         """
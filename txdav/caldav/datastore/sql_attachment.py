@@ -21,6 +21,7 @@ from twext.enterprise.dal.syntax import Select, Insert, Delete, Parameter, \
     Update, utcNowSQL
 from twext.enterprise.util import parseSQLTimestamp
 from twext.python.filepath import CachingFilePath
+from twext.python.log import Logger
 
 from twisted.internet.defer import inlineCallbacks, returnValue
 
@@ -39,6 +40,7 @@ from txweb2.http_headers import MimeType, generateContentType
 
 from zope.interface.declarations import implements
 
+import errno
 import hashlib
 import itertools
 import os
@@ -50,6 +52,8 @@ import uuid
 Classes and methods that relate to CalDAV attachments in the SQL store.
 """
 
+log = Logger()
+
 
 class AttachmentStorageTransport(StorageTransportBase):
 
@@ -64,6 +68,7 @@ class AttachmentStorageTransport(StorageTransportBase):
         self._file = os.fdopen(fileDescriptor, "w")
         self._path = CachingFilePath(fileName)
         self._hash = hashlib.md5()
+        self._contentHash = hashlib.sha256()
         self._creating = creating
         self._migrating = migrating
 
@@ -98,6 +103,7 @@ class AttachmentStorageTransport(StorageTransportBase):
             data = str(data)
         self._file.write(data)
         self._hash.update(data)
+        self._contentHash.update(data)
 
     @inlineCallbacks
     def loseConnection(self):
@@ -136,7 +142,7 @@ class AttachmentStorageTransport(StorageTransportBase):
                     yield self._attachment._internalRemove()
                 raise QuotaExceeded()
 
-        self._path.moveTo(self._attachment._path)
+        self._attachment._storeData(self._path, self._contentHash.hexdigest())
 
         yield self._attachment.changed(
             self._contentType,
@@ -309,6 +315,7 @@ class Attachment(object):
             att.CREATED,
             att.MODIFIED,
             att.PATH,
+            att.CONTENT_HASH,
         ]
 
     @classmethod
@@ -327,6 +334,7 @@ class Attachment(object):
             "_created",
             "_modified",
             "_name",
+            "_contentHash",
         )
 
     @classmethod
@@ -408,6 +416,7 @@ class Attachment(object):
         self._created = None
         self._modified = None
         self._name = name
+        self._contentHash = None
         self._justCreated = justCreated
 
     def __repr__(self):
@@ -416,9 +425,96 @@ class Attachment(object):
             .format(self=self)
         )
 
+    _BLOBS_DIRECTORY = "Blobs"
+
     def _attachmentPathRoot(self):
         return self._txn._store.attachmentsPath
 
+    def _blobPathRoot(self):
+        return self._attachmentPathRoot().child(self._BLOBS_DIRECTORY)
+
+    def _blobPath(self, contentHash):
+        """
+        The path of the shared blob file holding the data with the specified
+        content hash.
+        """
+        return self._blobPathRoot().child(contentHash[0:2]).child(contentHash[2:4]).child(contentHash)
+
+    def _storeData(self, uploadPath, contentHash):
+        """
+        Move newly uploaded data into place. Attachment data is stored once in
+        a blob file named by its SHA-256, and the attachment path is a hard link
+        to that blob, so identical uploads share the same disk space. When a
+        blob with the same content already exists, the uploaded data is
+        discarded and the attachment path is linked to the existing blob.
+
+        The file system link count of a blob acts as its reference count - once
+        only the blob link itself is left, nothing refers to it and it can be
+        removed (see L{_releaseBlob}). If hard links cannot be used, the data
+        is simply moved into place as before.
+
+        @param uploadPath: the path of the uploaded data
+        @type uploadPath: L{CachingFilePath}
+        @param contentHash: the SHA-256 hex digest of the uploaded data
+        @type contentHash: C{str}
+        """
+        oldContentHash = self._contentHash
+        blob = self._blobPath(contentHash)
+        try:
+            blob.parent().makedirs()
+        except OSError:
+            pass
+
+        try:
+            try:
+                # Publish the uploaded data as the blob - this fails if the blob
+                # already exists
+                os.link(uploadPath.path, blob.path)
+            except OSError as e:
+                if e.errno != errno.EEXIST:
+                    raise
+
+                # Identical data already stored: link to that (via a temporary
+                # link so that any existing attachment data is replaced
+                # atomically) and throw away the upload
+                linkPath = uploadPath.siblingExtension(".link")
+                os.link(blob.path, linkPath.path)
+                linkPath.moveTo(self._path)
+                if os.path.exists(linkPath.path):
+                    # Renaming is a no-op when the attachment is already linked to the blob
+                    os.remove(linkPath.path)
+                uploadPath.remove()
+            else:
+                uploadPath.moveTo(self._path)
+        except OSError as e:
+            log.debug("Unable to link attachment data for {attachment} to blob {blob}: {ex}", attachment=self, blob=contentHash, ex=e)
+            if uploadPath.exists():
+                uploadPath.moveTo(self._path)
+
+        self._contentHash = contentHash
+
+        # Existing data that was replaced may have left its blob unreferenced
+        if oldContentHash and oldContentHash != contentHash:
+            self._releaseBlob(oldContentHash)
+
+    def _releaseBlob(self, contentHash):
+        """
+        Remove the blob with the specified content hash if no attachment paths
+        link to it any more.
+
+        @param contentHash: the SHA-256 hex digest of the blob
+        @type contentHash: C{str}
+        """
+        blob = self._blobPath(contentHash)
+        try:
+            if os.stat(blob.path).st_nlink > 1:
+                return
+            blob.remove()
+        except OSError:
+            # Already gone
+            return
+        self._removeEmptyParents(blob, self._blobPathRoot())
+
     @inlineCallbacks
     def initFromStore(self):
         """
@@ -481,6 +577,9 @@ class Attachment(object):
     def retrieve(self, protocol):
         return AttachmentRetrievalTransport(self._path).start(protocol)
 
+    def open(self):
+        return self._path.open()
+
     def changed(self, contentType, dispositionName, md5, size):
         raise NotImplementedError
 
@@ -506,18 +605,29 @@ class Attachment(object):
 
     def removePaths(self):
         """
-        Remove the actual file and up to attachment parent directory if empty.
+        Remove the actual file and up to attachment parent directory if empty,
+        and remove the blob holding the data if nothing else references it.
         """
         if self._path.exists():
             self._path.remove()
         self.removeParentPaths()
+        if self._contentHash:
+            self._releaseBlob(self._contentHash)
 
     def removeParentPaths(self):
         """
         Remove up to attachment parent directory if empty.
         """
-        parent = self._path.parent()
-        toppath = self._attachmentPathRoot().path
+        self._removeEmptyParents(self._path, self._attachmentPathRoot())
+
+    @staticmethod
+    def _removeEmptyParents(path, top):
+        """
+        Remove the empty parent directories of a path, up to (but not including)
+        a top directory.
+        """
+        parent = path.parent()
+        toppath = top.path
         while parent.path != toppath:
             if len(parent.listdir()) == 0:
                 parent.remove()
@@ -712,6 +822,7 @@ class DropBoxAttachment(Attachment):
                     att.SIZE: self._size,
                     att.MD5: self._md5,
                     att.MODIFIED: utcNowSQL,
+                    att.CONTENT_HASH: self._contentHash,
                 },
                 Where=(att.ATTACHMENT_ID == self._attachmentID),
                 Return=(att.CREATED, att.MODIFIED)).on(self._txn))[0]
@@ -1063,6 +1174,7 @@ class ManagedAttachment(Attachment):
                     att.MD5: self._md5,
                     att.MODIFIED: utcNowSQL,
                     att.PATH: self._name,
+                    att.CONTENT_HASH: self._contentHash,
                 },
                 Where=(att.ATTACHMENT_ID == self._attachmentID),
                 Return=(att.CREATED, att.MODIFIED)).on(self._txn))[0]
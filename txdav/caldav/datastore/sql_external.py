@@ -19,7 +19,7 @@ from txdav.caldav.datastore.scheduling.work import ScheduleWork
 SQL backend for CalDAV storage when resources are external.
 """
 
-from twisted.internet.defer import inlineCallbacks, returnValue
+from twisted.internet.defer import inlineCallbacks, returnValue, succeed
 
 from twext.python.log import Logger
 
@@ -225,6 +225,12 @@ class CalendarObjectExternal(CommonObjectResourceExternal, CalendarObject):
     ):
         raise AssertionError("CalendarObjectExternal: not supported")
 
+    def componentTextForUser(self):
+        """
+        The stored text is on the other pod, so always use L{componentForUser}.
+        """
+        return succeed(None)
+
     @inlineCallbacks
     def addAttachment(self, rids, content_type, filename, stream):
         result = yield self._txn.store().conduit.send_add_attachment(self, rids, content_type, filename, stream)
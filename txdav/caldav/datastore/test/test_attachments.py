@@ -952,6 +952,59 @@ class ManagedAttachmentTests(AttachmentTests):
         self.assertEquals(data1, "test data 1")
         self.assertEquals(data2, "test data 2")
 
+    @inlineCallbacks
+    def test_identicalDataShared(self):
+        """
+        Attachments with identical data share a single blob file, which is only
+        removed once no attachment uses it. Quota is still charged for each
+        attachment.
+        """
+        home = yield self.homeUnderTest()
+        quota = yield home.quotaUsedBytes()
+
+        obj = yield self.calendarObjectUnderTest()
+        obj2 = yield self.calendarObjectUnderTest(name="2.ics")
+        att1 = yield self.stringToAttachment(obj, "sample.attachment",
+                                             "test data")
+        att2 = yield self.stringToAttachment(obj2, "other.attachment",
+                                             "test data")
+        mid1 = att1.managedID()
+        mid2 = att2.managedID()
+        self.assertEqual(att1._contentHash, hashlib.sha256("test data").hexdigest())
+        self.assertEqual(att2._contentHash, att1._contentHash)
+
+        blobPath = att1._blobPath(att1._contentHash).path
+        path1 = att1._path.path
+        path2 = att2._path.path
+        self.assertNotEqual(path1, path2)
+        self.assertEqual(os.stat(path1).st_ino, os.stat(blobPath).st_ino)
+        self.assertEqual(os.stat(path2).st_ino, os.stat(blobPath).st_ino)
+        self.assertEqual(os.stat(blobPath).st_nlink, 3)
+
+        home = yield self.homeUnderTest()
+        self.assertEqual((yield home.quotaUsedBytes()), quota + 2 * len("test data"))
+        yield self.commit()
+
+        # Removing one attachment leaves the blob for the other
+        obj = yield self.calendarObjectUnderTest()
+        yield obj.removeManagedAttachmentWithID(mid1)
+        yield self.commit()
+
+        self.assertFalse(os.path.exists(path1))
+        self.assertTrue(os.path.exists(blobPath))
+        obj2 = yield self.calendarObjectUnderTest(name="2.ics")
+        att2 = yield obj2.attachmentWithManagedID(mid2)
+        self.assertEqual(att2._contentHash, hashlib.sha256("test data").hexdigest())
+        data2 = yield self.attachmentToString(att2)
+        self.assertEquals(data2, "test data")
+
+        # Removing the last one removes the blob
+        yield obj2.removeManagedAttachmentWithID(mid2)
+        yield self.commit()
+
+        self.assertFalse(os.path.exists(path2))
+        self.assertFalse(os.path.exists(blobPath))
+
     @inlineCallbacks
     def test_dropboxIDs(self):
         """
@@ -0,0 +1,108 @@
+##
+# Copyright (c) 2017 Apple Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+##
+
+from twisted.trial.unittest import TestCase
+
+from twistedcaldav.ical import Component, Property
+
+from txdav.caldav.datastore.componentcache import ComponentCache
+
+data = """BEGIN:VCALENDAR
+VERSION:2.0
+PRODID:-//CALENDARSERVER.ORG//NONSGML Version 1//EN
+BEGIN:VEVENT
+UID:12345-67890-%d
+DTSTART:20130806T000000Z
+DURATION:PT1H
+DTSTAMP:20051222T210507Z
+SUMMARY:1
+END:VEVENT
+END:VCALENDAR
+"""
+
+
+class ComponentCacheTests(TestCase):
+    """
+    Tests for L{ComponentCache}.
+    """
+
+    def _component(self, ctr):
+        return Component.fromString(data % (ctr,))
+
+    def test_getPut(self):
+        """
+        L{ComponentCache.get} returns a copy of what was cached with L{ComponentCache.put}.
+        """
+        cache = ComponentCache(10, 1024)
+        key = cache.key(1, "abc", 6)
+        self.assertTrue(cache.get(key) is None)
+
+        component = self._component(1)
+        cache.put(key, component, 100)
+
+        # Changes to the original are not seen in the cache
+        component.mainComponent().replaceProperty(Property("SUMMARY", "2"))
+        cached1 = cache.get(key)
+        self.assertEqual(cached1.mainComponent().propertyValue("SUMMARY"), "1")
+
+        # Changes to what is returned are not seen in the cache
+        cached1.mainComponent().replaceProperty(Property("SUMMARY", "3"))
+        cached2 = cache.get(key)
+        self.assertEqual(cached2.mainComponent().propertyValue("SUMMARY"), "1")
+
+        self.assertTrue(cache.get(cache.key(1, "def", 6)) is None)
+        self.assertTrue(cache.get(cache.key(1, "abc", 5)) is None)
+        self.assertEqual(cache.takeCounts(), {"hit": 2, "miss": 3, "evict": 0})
+        self.assertEqual(cache.takeCounts(), {"hit": 0, "miss": 0, "evict": 0})
+
+    def test_evictEntries(self):
+        """
+        L{ComponentCache} evicts the least recently used entries when the maximum
+        number of entries is exceeded.
+        """
+        cache = ComponentCache(2, 1024)
+        cache.put(cache.key(1, "a", 6), self._component(1), 10)
+        cache.put(cache.key(2, "b", 6), self._component(2), 10)
+        self.assertTrue(cache.get(cache.key(1, "a", 6)) is not None)
+
+        cache.put(cache.key(3, "c", 6), self._component(3), 10)
+        self.assertEqual(len(cache), 2)
+        self.assertTrue(cache.get(cache.key(2, "b", 6)) is None)
+        self.assertTrue(cache.get(cache.key(1, "a", 6)) is not None)
+        self.assertTrue(cache.get(cache.key(3, "c", 6)) is not None)
+        self.assertEqual(cache.takeCounts()["evict"], 1)
+
+    def test_evictBytes(self):
+        """
+        L{ComponentCache} evicts the least recently used entries when the maximum
+        size is exceeded, and does not cache anything larger than the maximum size.
+        """
+        cache = ComponentCache(10, 100)
+        cache.put(cache.key(1, "a", 6), self._component(1), 40)
+        cache.put(cache.key(2, "b", 6), self._component(2), 40)
+        cache.put(cache.key(3, "c", 6), self._component(3), 40)
+        self.assertEqual(len(cache), 2)
+        self.assertTrue(cache.get(cache.key(1, "a", 6)) is None)
+
+        cache.put(cache.key(4, "d", 6), self._component(4), 101)
+        self.assertEqual(len(cache), 2)
+        self.assertTrue(cache.get(cache.key(4, "d", 6)) is None)
+
+        # Replacing an entry does not count its old size
+        cache.put(cache.key(3, "c", 6), self._component(3), 60)
+        self.assertEqual(len(cache), 1)
+        self.assertTrue(cache.get(cache.key(3, "c", 6)) is not None)
+        self.assertEqual(cache.takeCounts()["evict"], 2)
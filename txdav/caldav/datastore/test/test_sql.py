@@ -44,6 +44,8 @@ from twistedcaldav.instance import InvalidOverriddenInstanceError
 from twistedcaldav.timezones import TimezoneCache, readVTZ, TimezoneException
 
 from txdav.base.propertystore.base import PropertyName
+from txdav.caldav.datastore import componentcache
+from txdav.caldav.datastore.componentcache import ComponentCache
 from txdav.caldav.datastore.query.filter import Filter
 from txdav.caldav.datastore.scheduling.caldav.scheduler import CalDAVScheduler
 from txdav.caldav.datastore.scheduling.cuaddress import RemoteCalendarUser, \
@@ -2161,6 +2163,224 @@ END:VCALENDAR
         self.assertEqual(obj._dataversion, obj._currentDataVersion)
         yield self.commit()
 
+    @inlineCallbacks
+    def test_componentTextForUser(self):
+        """
+        Make sure L{CalendarObject.componentTextForUser} returns the stored text only
+        when it matches L{CalendarObject.componentForUser}.
+        """
+        data = """BEGIN:VCALENDAR
+VERSION:2.0
+PRODID:-//CALENDARSERVER.ORG//NONSGML Version 1//EN
+BEGIN:VEVENT
+UID:12345-67890-text
+DTSTART:20130806T000000Z
+DURATION:PT1H
+DTSTAMP:20051222T210507Z
+SUMMARY:1
+END:VEVENT
+END:VCALENDAR
+"""
+
+        data_allday = """BEGIN:VCALENDAR
+VERSION:2.0
+PRODID:-//CALENDARSERVER.ORG//NONSGML Version 1//EN
+BEGIN:VEVENT
+UID:12345-67890-allday
+DTSTART;VALUE=DATE:20130806
+DURATION:P1D
+DTSTAMP:20051222T210507Z
+SUMMARY:1
+END:VEVENT
+END:VCALENDAR
+"""
+
+        data_peruser = """BEGIN:VCALENDAR
+VERSION:2.0
+PRODID:-//CALENDARSERVER.ORG//NONSGML Version 1//EN
+BEGIN:VEVENT
+UID:12345-67890-peruser
+DTSTART:20130806T000000Z
+DURATION:PT1H
+DTSTAMP:20051222T210507Z
+SUMMARY:1
+BEGIN:VALARM
+ACTION:DISPLAY
+DESCRIPTION:Alarm
+TRIGGER:-PT10M
+END:VALARM
+END:VEVENT
+END:VCALENDAR
+"""
+
+        yield self.homeUnderTest(name="user01", create=True)
+        calendar = yield self.calendarUnderTest(name="calendar", home="user01")
+        yield calendar.createCalendarObjectWithName("data1.ics", Component.fromString(data))
+        yield calendar.createCalendarObjectWithName("data2.ics", Component.fromString(data_allday))
+        yield calendar.createCalendarObjectWithName("data3.ics", Component.fromString(data_peruser))
+        yield self.commit()
+
+        obj = yield self.calendarObjectUnderTest(name="data1.ics", calendar_name="calendar", home="user01")
+        txt = yield obj.componentTextForUser()
+        cal = yield obj.componentForUser()
+        self.assertEqual(txt, cal.getTextWithTimezones(False))
+        yield self.commit()
+
+        for name in ("data2.ics", "data3.ics",):
+            obj = yield self.calendarObjectUnderTest(name=name, calendar_name="calendar", home="user01")
+            txt = yield obj.componentTextForUser()
+            self.assertTrue(txt is None)
+            yield self.commit()
+
+        # Old data needs upgrading
+        obj = yield self.calendarObjectUnderTest(name="data1.ics", calendar_name="calendar", home="user01")
+        co = schema.CALENDAR_OBJECT
+        yield Update(
+            {co.DATAVERSION: 0},
+            Where=co.RESOURCE_ID == obj._resourceID,
+        ).on(self.transactionUnderTest())
+        yield self.commit()
+
+        obj = yield self.calendarObjectUnderTest(name="data1.ics", calendar_name="calendar", home="user01")
+        txt = yield obj.componentTextForUser()
+        self.assertTrue(txt is None)
+        yield self.commit()
+
+    @inlineCallbacks
+    def test_propertyIndex(self):
+        """
+        Make sure the CALENDAR_OBJECT_PROPERTY rows are written for a calendar
+        object and are used to narrow down a calendar-query search.
+        """
+        data = """BEGIN:VCALENDAR
+VERSION:2.0
+PRODID:-//CALENDARSERVER.ORG//NONSGML Version 1//EN
+BEGIN:VEVENT
+UID:12345-67890-%(uid)s
+DTSTART:20130806T000000Z
+DURATION:PT1H
+DTSTAMP:20051222T210507Z
+SUMMARY:%(summary)s
+LOCATION:Room 1
+%(alarm)sEND:VEVENT
+END:VCALENDAR
+"""
+        alarm = """BEGIN:VALARM
+ACTION:DISPLAY
+DESCRIPTION:Alarm
+TRIGGER:-PT10M
+END:VALARM
+"""
+
+        yield self.homeUnderTest(name="user01", create=True)
+        calendar = yield self.calendarUnderTest(name="calendar", home="user01")
+        yield calendar.createCalendarObjectWithName("data1.ics", Component.fromString(data % {"uid": "1", "summary": "Team Lunch", "alarm": alarm}))
+        yield calendar.createCalendarObjectWithName("data2.ics", Component.fromString(data % {"uid": "2", "summary": "Dinner", "alarm": ""}))
+        yield self.commit()
+
+        @inlineCallbacks
+        def _rows(name):
+            obj = yield self.calendarObjectUnderTest(name=name, calendar_name="calendar", home="user01")
+            cop = schema.CALENDAR_OBJECT_PROPERTY
+            rows = yield Select(
+                [cop.NAME, cop.VALUE],
+                From=cop,
+                Where=cop.CALENDAR_OBJECT_RESOURCE_ID == obj._resourceID,
+            ).on(self.transactionUnderTest())
+            yield self.commit()
+            returnValue(set([tuple(row) for row in rows]))
+
+        rows = yield _rows("data1.ics")
+        self.assertEqual(rows, set((
+            ("SUMMARY", "team lunch"),
+            ("LOCATION", "room 1"),
+            ("VALARM", None),
+        )))
+
+        @inlineCallbacks
+        def _search(propfilter):
+            filter = caldavxml.Filter(
+                caldavxml.ComponentFilter(
+                    *[caldavxml.ComponentFilter(
+                        propfilter,
+                        **{"name": ("VEVENT")}
+                    )],
+                    **{"name": "VCALENDAR"}
+                )
+            )
+            calendar = yield self.calendarUnderTest(name="calendar", home="user01")
+            results = yield calendar.search(Filter(filter))
+            yield self.commit()
+            returnValue(sorted([name for name, _ignore_uid, _ignore_type in results]))
+
+        names = yield _search(caldavxml.PropertyFilter(caldavxml.TextMatch.fromString("LUNCH"), name="SUMMARY"))
+        self.assertEqual(names, ["data1.ics"])
+        names = yield _search(caldavxml.PropertyFilter(caldavxml.TextMatch.fromString("room"), name="LOCATION"))
+        self.assertEqual(names, ["data1.ics", "data2.ics"])
+
+        # Rows are replaced on update
+        obj = yield self.calendarObjectUnderTest(name="data1.ics", calendar_name="calendar", home="user01")
+        yield obj.setComponent(Component.fromString(data % {"uid": "1", "summary": "Breakfast", "alarm": ""}))
+        yield self.commit()
+
+        rows = yield _rows("data1.ics")
+        self.assertEqual(rows, set((
+            ("SUMMARY", "breakfast"),
+            ("LOCATION", "room 1"),
+        )))
+        names = yield _search(caldavxml.PropertyFilter(caldavxml.TextMatch.fromString("lunch"), name="SUMMARY"))
+        self.assertEqual(names, [])
+
+    @inlineCallbacks
+    def test_componentCache(self):
+        """
+        Make sure L{CalendarObject.component} uses the process-local component cache
+        across transactions, and does not return stale data after a change.
+        """
+        data = """BEGIN:VCALENDAR
+VERSION:2.0
+PRODID:-//CALENDARSERVER.ORG//NONSGML Version 1//EN
+BEGIN:VEVENT
+UID:12345-67890-cache
+DTSTART:20130806T000000Z
+DURATION:PT1H
+DTSTAMP:20051222T210507Z
+SUMMARY:%s
+END:VEVENT
+END:VCALENDAR
+"""
+
+        self.patch(config.ComponentCaching, "Enabled", True)
+        cache = ComponentCache(10, 1024 * 1024)
+        self.patch(componentcache, "_componentCache", cache)
+
+        yield self.homeUnderTest(name="user01", create=True)
+        calendar = yield self.calendarUnderTest(name="calendar", home="user01")
+        yield calendar.createCalendarObjectWithName("data1.ics", Component.fromString(data % ("1",)))
+        yield self.commit()
+
+        obj = yield self.calendarObjectUnderTest(name="data1.ics", calendar_name="calendar", home="user01")
+        component1 = yield obj.component()
+        yield self.commit()
+        self.assertEqual((cache.hits, cache.misses,), (0, 1,))
+
+        obj = yield self.calendarObjectUnderTest(name="data1.ics", calendar_name="calendar", home="user01")
+        component2 = yield obj.component()
+        self.assertEqual((cache.hits, cache.misses,), (1, 1,))
+        self.assertEqual(component1, component2)
+        self.assertTrue(component1 is not component2)
+
+        # Changed data is a cache miss
+        component2.mainComponent().replaceProperty(Property("SUMMARY", "2"))
+        yield obj.setComponent(component2)
+        yield self.commit()
+
+        obj = yield self.calendarObjectUnderTest(name="data1.ics", calendar_name="calendar", home="user01")
+        component3 = yield obj.component()
+        yield self.commit()
+        self.assertEqual((cache.hits, cache.misses,), (1, 2,))
+        self.assertEqual(component3.mainComponent().propertyValue("SUMMARY"), "2")
+
     @inlineCallbacks
     def test_sharedTasksMissingSharer(self):
         """
@@ -2456,6 +2676,63 @@ END:VCALENDAR
         self.assertGreater(delete_modified, old_modified)
         self.assertGreater(delete_modified, update_modified)
 
+    @inlineCallbacks
+    def test_homeSyncTokenCache(self):
+        """
+        L{CommonHome.syncToken} uses the cached revision when enabled, and the
+        cached value is updated for the owner and sharees when revisions change.
+        """
+
+        self.patch(config.QueryCaching, "HomeSyncTokens", True)
+
+        @inlineCallbacks
+        def _checkToken(name):
+            home = yield self.homeUnderTest(name=name)
+            st = yield home.syncToken()
+            cached, revision = yield home.verifySyncTokenRevision()
+            yield self.commit()
+            self.assertEqual(cached, revision)
+            self.assertEqual(self.token2revision(st), revision)
+            returnValue(st)
+
+        # Share a calendar
+        cal = yield self.calendarUnderTest(home="user01", name="calendar")
+        other = yield self.homeUnderTest(name=OTHER_HOME_UID)
+        yield cal.shareWith(other, _BIND_MODE_WRITE)
+        yield self.commit()
+
+        st_owner = yield _checkToken("user01")
+        st_sharee = yield _checkToken(OTHER_HOME_UID)
+
+        # Change an object - both tokens change
+        cal = yield self.calendarUnderTest(home="user01", name="calendar")
+        yield cal.createCalendarObjectWithName("new.ics", Component.fromString(
+            test_event_text
+        ))
+
+        # Transaction sees its own changes
+        home = yield self.homeUnderTest(name="user01")
+        st = yield home.syncTokenRevision()
+        self.assertNotEqual(st, self.token2revision(st_owner))
+        yield self.commit()
+
+        st_owner2 = yield _checkToken("user01")
+        st_sharee2 = yield _checkToken(OTHER_HOME_UID)
+        self.assertNotEqual(st_owner, st_owner2)
+        self.assertNotEqual(st_sharee, st_sharee2)
+
+        # Repair a bad value
+        home = yield self.homeUnderTest(name="user01")
+        queryCacher = self.transactionUnderTest()._queryCacher
+        yield queryCacher.set(queryCacher.keyForHomeSyncRevision(home.id()), 1)
+        cached, revision = yield home.verifySyncTokenRevision(repair=True)
+        self.assertEqual(cached, 1)
+        self.assertNotEqual(revision, 1)
+        yield self.commit()
+
+        st_owner3 = yield _checkToken("user01")
+        self.assertEqual(st_owner2, st_owner3)
+
     @inlineCallbacks
     def test_homeSyncTokenWithTrash_Visible(self):
         """
@@ -8756,9 +9033,9 @@ END:VCALENDAR
         self.trcount = 0
         base_addInstances = CalendarObject._addInstances
 
-        def _addInstances(*args):
+        def _addInstances(*args, **kwargs):
             self.trcount += 1
-            return base_addInstances(*args)
+            return base_addInstances(*args, **kwargs)
         self.patch(CalendarObject, "_addInstances", _addInstances)
 
         self.patch(config, "FreeBusyIndexDelayedExpand", False)
@@ -9305,6 +9582,245 @@ END:VCALENDAR
         self.assertEqual(self.trcount, 6)
 
 
+class InstanceIndexing(CommonCommonTests, DateTimeSubstitutionsMixin, unittest.TestCase):
+    """
+    CalendarObject multi-row and incremental instance indexing tests.
+    """
+
+    EVENT = """BEGIN:VCALENDAR
+VERSION:2.0
+PRODID:-//CALENDARSERVER.ORG//NONSGML Version 1//EN
+CALSCALE:GREGORIAN
+BEGIN:VEVENT
+CREATED:20100203T013849Z
+UID:uid1
+DTSTART:{nowDate_back1}T120000Z
+DURATION:PT1H
+SUMMARY:New Event
+DTSTAMP:20100203T013909Z
+RRULE:FREQ=DAILY
+END:VEVENT
+BEGIN:VEVENT
+CREATED:20100203T013849Z
+UID:uid1
+RECURRENCE-ID:{nowDate_fwd1}T120000Z
+DTSTART:{nowDate_fwd1}T140000Z
+DURATION:PT1H
+SUMMARY:New Event now1
+DTSTAMP:20100203T013909Z
+END:VEVENT
+BEGIN:X-CALENDARSERVER-PERUSER
+UID:uid1
+X-CALENDARSERVER-PERUSER-UID:user01
+BEGIN:X-CALENDARSERVER-PERINSTANCE
+TRANSP:TRANSPARENT
+END:X-CALENDARSERVER-PERINSTANCE
+END:X-CALENDARSERVER-PERUSER
+END:VCALENDAR
+"""
+
+    EVENT_CHANGED = """BEGIN:VCALENDAR
+VERSION:2.0
+PRODID:-//CALENDARSERVER.ORG//NONSGML Version 1//EN
+CALSCALE:GREGORIAN
+BEGIN:VEVENT
+CREATED:20100203T013849Z
+UID:uid1
+DTSTART:{nowDate_back1}T120000Z
+DURATION:PT1H
+SUMMARY:New Event
+DTSTAMP:20100203T013909Z
+RRULE:FREQ=DAILY
+END:VEVENT
+BEGIN:VEVENT
+CREATED:20100203T013849Z
+UID:uid1
+RECURRENCE-ID:{nowDate_fwd1}T120000Z
+DTSTART:{nowDate_fwd1}T150000Z
+DURATION:PT1H
+SUMMARY:New Event now1
+DTSTAMP:20100203T013909Z
+END:VEVENT
+BEGIN:VEVENT
+CREATED:20100203T013849Z
+UID:uid1
+RECURRENCE-ID:{nowDate_fwd2}T120000Z
+DTSTART:{nowDate_fwd2}T120000Z
+DURATION:PT1H
+SUMMARY:New Event now2
+DTSTAMP:20100203T013909Z
+TRANSP:TRANSPARENT
+END:VEVENT
+BEGIN:X-CALENDARSERVER-PERUSER
+UID:uid1
+X-CALENDARSERVER-PERUSER-UID:user01
+BEGIN:X-CALENDARSERVER-PERINSTANCE
+TRANSP:TRANSPARENT
+END:X-CALENDARSERVER-PERINSTANCE
+BEGIN:X-CALENDARSERVER-PERINSTANCE
+RECURRENCE-ID:{nowDate_fwd1}T120000Z
+TRANSP:OPAQUE
+END:X-CALENDARSERVER-PERINSTANCE
+END:X-CALENDARSERVER-PERUSER
+END:VCALENDAR
+"""
+
+    @inlineCallbacks
+    def setUp(self):
+        yield super(InstanceIndexing, self).setUp()
+        yield self.buildStoreAndDirectory()
+        yield self.populate()
+
+        self.setupDateTimeValues()
+
+        self.patch(config, "FreeBusyIndexDelayedExpand", False)
+
+    @inlineCallbacks
+    def populate(self):
+        yield populateCalendarsFrom(self.requirements, self.storeUnderTest())
+        self.notifierFactory.reset()
+
+    @property
+    def requirements(self):
+        return {
+            "home1": {
+                "calendar_1": {},
+            },
+        }
+
+    @inlineCallbacks
+    def _indexRows(self, name):
+        """
+        Read back the TIME_RANGE and PERUSER rows for a resource, ignoring the
+        instance IDs which will differ between resources.
+        """
+        cobj = yield self.calendarObjectUnderTest(name=name)
+        tr = schema.TIME_RANGE
+        tpy = schema.PERUSER
+        timeRanges = yield Select(
+            [tr.FLOATING, tr.START_DATE, tr.END_DATE, tr.FBTYPE, tr.TRANSPARENT],
+            From=tr,
+            Where=tr.CALENDAR_OBJECT_RESOURCE_ID == cobj._resourceID,
+        ).on(self.transactionUnderTest())
+        perUser = yield Select(
+            [tr.START_DATE, tpy.USER_ID, tpy.TRANSPARENT, tpy.ADJUSTED_START_DATE, tpy.ADJUSTED_END_DATE],
+            From=tr.join(tpy, on=tr.INSTANCE_ID == tpy.TIME_RANGE_INSTANCE_ID),
+            Where=tr.CALENDAR_OBJECT_RESOURCE_ID == cobj._resourceID,
+        ).on(self.transactionUnderTest())
+        yield self.commit()
+        returnValue((sorted(timeRanges), sorted(perUser),))
+
+    @inlineCallbacks
+    def test_bulkMatchesSingle(self):
+        """
+        Test that multi-row instance indexing writes the same TIME_RANGE and PERUSER
+        rows as one insert per instance.
+        """
+
+        self.patch(config, "FreeBusyIndexBulkInsertSize", 0)
+        cal = yield self.calendarUnderTest()
+        yield cal.createObjectResourceWithName("1.ics", Component.fromString(self.EVENT.format(**self.dtsubs)))
+        yield self.commit()
+
+        # Small batch size to force multiple statements
+        self.patch(config, "FreeBusyIndexBulkInsertSize", 7)
+        cal = yield self.calendarUnderTest()
+        yield cal.createObjectResourceWithName("2.ics", Component.fromString(self.EVENT.format(**self.dtsubs).replace("uid1", "uid2")))
+        yield self.commit()
+
+        single = yield self._indexRows("1.ics")
+        bulk = yield self._indexRows("2.ics")
+
+        self.assertTrue(len(single[0]) > 100)
+        self.assertTrue(len(single[1]) > 100)
+        self.assertEqual(single, bulk)
+
+    @inlineCallbacks
+    def test_bulkStatementCount(self):
+        """
+        Test that multi-row instance indexing does not use one statement per instance.
+        """
+
+        self.patch(config, "FreeBusyIndexBulkInsertSize", 500)
+        cal = yield self.calendarUnderTest()
+        txn = self.transactionUnderTest()
+        before = txn.statementCount
+        yield cal.createObjectResourceWithName("1.ics", Component.fromString(self.EVENT.format(**self.dtsubs)))
+        statements = txn.statementCount - before
+        yield self.commit()
+
+        timeRanges, _ignore_perUser = yield self._indexRows("1.ics")
+        self.assertTrue(statements < len(timeRanges))
+
+    @inlineCallbacks
+    def _instanceIDs(self, name):
+        cobj = yield self.calendarObjectUnderTest(name=name)
+        tr = schema.TIME_RANGE
+        rows = yield Select(
+            [tr.INSTANCE_ID],
+            From=tr,
+            Where=tr.CALENDAR_OBJECT_RESOURCE_ID == cobj._resourceID,
+        ).on(self.transactionUnderTest())
+        yield self.commit()
+        returnValue(set([row[0] for row in rows]))
+
+    @inlineCallbacks
+    def _checkIncrementalMatchesRebuild(self):
+        # Update an existing resource incrementally
+        self.patch(config, "FreeBusyIndexIncrementalUpdate", True)
+        cal = yield self.calendarUnderTest()
+        yield cal.createObjectResourceWithName("1.ics", Component.fromString(self.EVENT.format(**self.dtsubs)))
+        yield self.commit()
+        before = yield self._instanceIDs("1.ics")
+
+        cobj = yield self.calendarObjectUnderTest(name="1.ics")
+        yield cobj.setComponent(Component.fromString(self.EVENT_CHANGED.format(**self.dtsubs)))
+        yield self.commit()
+        after = yield self._instanceIDs("1.ics")
+
+        # Update an existing resource by re-building the index
+        self.patch(config, "FreeBusyIndexIncrementalUpdate", False)
+        cal = yield self.calendarUnderTest()
+        yield cal.createObjectResourceWithName("2.ics", Component.fromString(self.EVENT.format(**self.dtsubs).replace("uid1", "uid2")))
+        yield self.commit()
+
+        cobj = yield self.calendarObjectUnderTest(name="2.ics")
+        yield cobj.setComponent(Component.fromString(self.EVENT_CHANGED.format(**self.dtsubs).replace("uid1", "uid2")))
+        yield self.commit()
+
+        # Create a new resource with the changed data
+        cal = yield self.calendarUnderTest()
+        yield cal.createObjectResourceWithName("3.ics", Component.fromString(self.EVENT_CHANGED.format(**self.dtsubs).replace("uid1", "uid3")))
+        yield self.commit()
+
+        incremental = yield self._indexRows("1.ics")
+        rebuilt = yield self._indexRows("2.ics")
+        created = yield self._indexRows("3.ics")
+
+        self.assertEqual(incremental, rebuilt)
+        self.assertEqual(incremental, created)
+
+        # Most of the instances are unchanged and must have been left alone
+        self.assertTrue(len(before & after) > len(after) - 5)
+
+    def test_incrementalMatchesRebuild(self):
+        """
+        Test that an incremental instance index update gives the same TIME_RANGE and
+        PERUSER rows as a full rebuild.
+        """
+
+        return self._checkIncrementalMatchesRebuild()
+
+    def test_incrementalMatchesRebuild_noBulk(self):
+        """
+        Test that an incremental instance index update gives the same TIME_RANGE and
+        PERUSER rows as a full rebuild when multi-row inserts are disabled.
+        """
+
+        self.patch(config, "FreeBusyIndexBulkInsertSize", 0)
+        return self._checkIncrementalMatchesRebuild()
+
+
 class GroupExpand(CommonCommonTests, DateTimeSubstitutionsMixin, unittest.TestCase):
     """
     CalendarObject group attendee expansion.
@@ -20,7 +20,9 @@ from twext.python.filepath import CachingFilePath as FilePath
 from twisted.internet.defer import inlineCallbacks, returnValue
 from twisted.trial.unittest import TestCase
 from twistedcaldav import customxml
+from twistedcaldav.ical import Component
 from twistedcaldav.stdconfig import config
+from txdav.caldav.datastore.sql import Calendar
 from txdav.base.propertystore.base import PropertyName
 from txdav.common.datastore.sql_tables import _BIND_MODE_DIRECT
 from txdav.common.datastore.sql_tables import _BIND_MODE_GROUP
@@ -1869,3 +1871,47 @@ class SharingRevisions(BaseSharingTests):
             self.assertEqual(len(changed), 0)
             self.assertEqual(len(deleted), 0)
             self.assertEqual(len(invalid), 0)
+
+    @inlineCallbacks
+    def test_sharedRevisionsMultiple(self):
+        """
+        Verify that resourceNamesSinceRevision on a home combines the changes from
+        multiple shared calendars without querying each one separately.
+        """
+        sharedName1 = yield self._createShare()
+
+        calendar = yield self.calendarUnderTest(home="user03", name="calendar")
+        shareeView = yield calendar.inviteUIDToShare("user02", _BIND_MODE_READ, "summary")
+        inviteUID = shareeView.shareUID()
+        yield self.commit()
+
+        shareeHome = yield self.homeUnderTest(name="user02")
+        shareeView = yield shareeHome.acceptShare(inviteUID)
+        sharedName3 = shareeView.name()
+        yield self.commit()
+
+        otherHome = yield self.homeUnderTest(name="user02")
+        revision = yield otherHome.syncTokenRevision()
+        yield self.commit()
+
+        # Change each shared calendar
+        calendar = yield self.calendarUnderTest(home="user01", name="calendar")
+        obj = yield calendar.objectResourceWithName("cal1.ics")
+        yield obj.remove()
+        calendar = yield self.calendarUnderTest(home="user03", name="calendar")
+        yield calendar.createCalendarObjectWithName("cal3.ics", Component.fromString(self.cal1.replace("uid1", "uid3")))
+        yield self.commit()
+
+        def _failed(self, revision, depth):
+            raise AssertionError("Shared calendar not batched")
+        self.patch(Calendar, "sharedChildResourceNamesSinceRevision", _failed)
+
+        otherHome = yield self.homeUnderTest(name="user02")
+        for depth, result_changed, result_deleted in (
+            ("1", [sharedName1 + "/", sharedName3 + "/"], [],),
+            ("infinity", [sharedName1 + "/", sharedName3 + "/", sharedName3 + "/cal3.ics"], [sharedName1 + "/cal1.ics"],),
+        ):
+            changed, deleted, invalid = yield otherHome.resourceNamesSinceRevision(revision, depth)
+            self.assertEqual(set(changed), set(result_changed))
+            self.assertEqual(set(deleted), set(result_deleted))
+            self.assertEqual(len(invalid), 0)
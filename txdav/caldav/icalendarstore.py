@@ -684,6 +684,14 @@ class IAttachment(IDataStoreObject):
         @type protocol: L{IProtocol}
         """
 
+    def open():  # @NoSelf
+        """
+        Open the content of this attachment for reading.
+
+        @return: a seekable file object for the attachment data.
+        @rtype: C{file}
+        """
+
 
 #
 # Exceptions
@@ -553,6 +553,8 @@ class AddressBook(AddressBookSharingMixIn, CommonHomeChild):
     @inlineCallbacks
     def _changeRevision(self, action, name, id=0):
 
+        yield self._syncTokenChanging()
+
         # Need to handle the case where for some reason the revision entry is
         # actually missing. For a "delete" we don't care, for an "update" we
         # will turn it into an "insert".
@@ -639,6 +641,13 @@ class AddressBook(AddressBookSharingMixIn, CommonHomeChild):
         invalid = [item[lenpath:] for item in sharedChildInvalid if item.startswith(selfPath) and item != selfPath]
         returnValue((changed, deleted, invalid))
 
+    def _batchableSharedChanges(self, revision):
+        """
+        Shared groups need the group membership changes as well as the revisions,
+        so always use L{sharedChildResourceNamesSinceRevision}.
+        """
+        return False
+
     @inlineCallbacks
     def sharedChildResourceNamesSinceRevision(self, revision, depth):
         """
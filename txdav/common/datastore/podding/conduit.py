@@ -29,7 +29,8 @@ from txdav.common.datastore.podding.sharing_invites import (
 from txdav.common.datastore.podding.store_api import StoreAPIConduitMixin
 from txdav.common.datastore.podding.util import UtilityConduitMixin
 
-from twisted.internet.defer import inlineCallbacks, returnValue
+from twisted.internet.defer import Deferred, inlineCallbacks, returnValue
+from twisted.python.failure import Failure
 from twisted.python.reflect import namedClass
 
 log = Logger()
@@ -70,18 +71,28 @@ class PoddingConduit(
     Some simple forms of send_/recv_ methods can be auto-generated to simplify
     coding.
 
+    A "batch" request carries a list of request C{dict}s in its "requests" key,
+    each of which must be one of the read-only C{batchableActions}. The
+    receiving side processes them in order in a single transaction and returns
+    a list with the response C{dict} for each one as the value. As none of them
+    change anything, a failure of one is reported for that request alone.
+
     Actual implementations of this will be done via mix-ins for the different
     sub-systems using the conduit.
     """
 
     conduitRequestClass = ConduitRequest
 
+    # Maximum number of requests combined into one "batch" request
+    batchSize = 50
+
     def __init__(self, store):
         """
         @param store: the L{CommonDataStore} in use.
         """
         self.store = store
         self.streamingActions = ("get-attachment-data",)
+        self._pendingBatches = {}
 
     @inlineCallbacks
     def validRequest(self, source_uid, destination_uid):
@@ -145,6 +156,17 @@ class PoddingConduit(
                 "Failed cross-pod request: {}".format(e)
             )
 
+        returnValue(self._responseValue(response))
+
+    @staticmethod
+    def _responseValue(response):
+        """
+        Get the value returned in a cross-pod response, or raise the exception
+        it carries.
+
+        @param response: the response data
+        @type response: C{dict}
+        """
         if response["result"] == "exception":
             raise namedClass(response["class"])(response["details"])
         elif response["result"] != "ok":
@@ -152,7 +174,83 @@ class PoddingConduit(
                 "Cross-pod request failed: {}".format(response)
             )
         else:
-            returnValue(response.get("value"))
+            return response.get("value")
+
+    def sendBatchableRequestToServer(self, txn, server, data):
+        """
+        Send a request that may be combined with others. Batchable requests for
+        the same transaction and server made during one reactor iteration are
+        sent together as "batch" requests of up to C{batchSize} actions, each
+        of which the other pod processes in a single transaction. Only the
+        read-only actions listed in C{batchableActions} can be sent this way;
+        the other pod rejects a batch containing any other action.
+
+        @param txn: transaction to use
+        @type txn: L{CommonStoreTransaction}
+        @param server: server to send the request to
+        @type server: L{Server}
+        @param data: the request data
+        @type data: C{dict}
+
+        @return: L{Deferred} resulting in the value returned for the request.
+        """
+        key = (txn, server.id,)
+        if key not in self._pendingBatches:
+            from twisted.internet import reactor
+            self._pendingBatches[key] = (server, [],)
+            reactor.callLater(0, self._sendBatches, key)
+
+        d = Deferred()
+        self._pendingBatches[key][1].append((data, d,))
+        return d
+
+    def _sendBatches(self, key):
+        """
+        Send all the pending batchable requests for a transaction and server.
+        """
+        txn, _ignore_id = key
+        server, pending = self._pendingBatches.pop(key)
+        for offset in xrange(0, len(pending), self.batchSize):
+            self._sendBatch(txn, server, pending[offset:offset + self.batchSize])
+
+    @inlineCallbacks
+    def _sendBatch(self, txn, server, batch):
+        """
+        Send a set of requests in one "batch" request and fire the L{Deferred}
+        for each with its own result. A lone request is sent as-is.
+
+        @param batch: the request data and L{Deferred} for each request
+        @type batch: C{list} of C{tuple} of (C{dict}, L{Deferred})
+        """
+        if len(batch) == 1:
+            data, d = batch[0]
+            try:
+                value = yield self.sendRequestToServer(txn, server, data)
+            except Exception:
+                d.errback()
+            else:
+                d.callback(value)
+            returnValue(None)
+
+        request = {
+            "action": "batch",
+            "requests": [batch_data for batch_data, _ignore_d in batch],
+        }
+        try:
+            responses = yield self.sendRequestToServer(txn, server, request)
+        except Exception:
+            f = Failure()
+            for _ignore_data, d in batch:
+                d.errback(f)
+            returnValue(None)
+
+        for response, (_ignore_data, d) in zip(responses, batch):
+            try:
+                value = self._responseValue(response)
+            except Exception:
+                d.errback()
+            else:
+                d.callback(value)
 
     def isStreamAction(self, data):
         """
@@ -203,19 +301,33 @@ class PoddingConduit(
             result = {"result": "ok"}
             returnValue(result)
 
-        method = "recv_{}".format(action.replace("-", "_"))
-        if not hasattr(self, method):
-            log.error("Unsupported action: {action}", action=action)
-            raise FailedCrossPodRequestError(
-                "Unsupported action: {}".format(action)
-            )
+        if action == "batch":
+            requests = data.get("requests")
+            if not isinstance(requests, list):
+                raise FailedCrossPodRequestError(
+                    "Batch request must have a list of 'requests'"
+                )
+            methods = [self._recvMethod(request) for request in requests]
+            for request in requests:
+                if request["action"] not in self.batchableActions:
+                    log.error("Action cannot be batched: {action}", action=request["action"])
+                    raise FailedCrossPodRequestError(
+                        "Action cannot be batched: {}".format(request["action"])
+                    )
+        else:
+            methods = [self._recvMethod(data)]
 
         # Need a transaction to work with
         txn = self.store.newTransaction(repr("Conduit request"))
 
         # Do the actual request processing
         try:
-            value = (yield getattr(self, method)(txn, data))
+            if action == "batch":
+                value = []
+                for method, request in zip(methods, requests):
+                    value.append((yield self._processBatchedRequest(txn, method, request)))
+            else:
+                value = (yield methods[0](txn, data))
             result = {"result": "ok"}
             if value is not None:
                 result["value"] = value
@@ -240,6 +352,57 @@ class PoddingConduit(
 
         returnValue(result)
 
+    def _recvMethod(self, data):
+        """
+        Get the "recv_{action}" method that processes a request.
+
+        @param data: the JSON data to process
+        @type data: C{dict}
+        """
+        try:
+            action = data["action"]
+        except (KeyError, TypeError) as e:
+            raise FailedCrossPodRequestError(
+                "JSON data must have an object as its root with an 'action' "
+                "attribute: {}\n{}"
+                .format(e, data,)
+            )
+
+        method = "recv_{}".format(action.replace("-", "_"))
+        if not hasattr(self, method):
+            log.error("Unsupported action: {action}", action=action)
+            raise FailedCrossPodRequestError(
+                "Unsupported action: {}".format(action)
+            )
+        return getattr(self, method)
+
+    @inlineCallbacks
+    def _processBatchedRequest(self, txn, method, request):
+        """
+        Process one request of a "batch" request, returning its response
+        C{dict} rather than raising any exception.
+        """
+        try:
+            value = (yield method(txn, request))
+        except Exception as e:
+            log.error(
+                "Failed batched action: {action}, {error}",
+                action=request["action"], error=e
+            )
+            result = {
+                "result": "exception",
+                "class": ".".join((
+                    e.__class__.__module__,
+                    e.__class__.__name__,
+                )),
+                "details": str(e),
+            }
+        else:
+            result = {"result": "ok"}
+            if value is not None:
+                result["value"] = value
+        returnValue(result)
+
     @inlineCallbacks
     def processRequestStream(self, data, stream):
         """
@@ -16,7 +16,7 @@
 
 from twext.python.log import Logger
 
-from twisted.internet.defer import returnValue, inlineCallbacks
+from twisted.internet.defer import returnValue, inlineCallbacks, DeferredList
 from twisted.python.failure import Failure
 
 from twistedcaldav.accounting import emitAccounting
@@ -697,6 +697,11 @@ class CrossPodHomeSync(object):
         remote_objects = yield remote_calendar.objectResourcesWithNames(remaining)
         remote_objects = dict([(obj.name(), obj) for obj in remote_objects])
 
+        # Fetch all the remote data at once so the requests are batched - each
+        # object caches its component for the loop below, and any failure is
+        # raised again there
+        yield DeferredList([obj.component() for obj in remote_objects.values()], consumeErrors=True)
+
         # Get local objects
         local_home = yield self._localHome(txn)
         local_calendar = yield local_home.childWithID(localID)
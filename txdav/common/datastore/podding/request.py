@@ -30,7 +30,8 @@ from twisted.internet.protocol import Factory
 
 from twistedcaldav.accounting import accountingEnabledForCategory, \
     emitAccounting
-from twistedcaldav.client.pool import _configuredClientContextFactory
+from twistedcaldav.client.pool import _configuredClientContextFactory, \
+    getPersistentHTTPClientPool
 from twistedcaldav.config import config
 from twistedcaldav.util import utf8String
 
@@ -96,6 +97,7 @@ class ConduitRequest(object):
                 data = (yield allDataFromStream(response.stream))
                 data = json.loads(data)
             else:
+                yield allDataFromStream(response.stream)
                 raise ValueError("Incorrect cross-pod response status code: {}".format(response.code))
 
         except Exception as e:
@@ -193,17 +195,21 @@ class ConduitRequest(object):
         headers.setHeader("User-Agent", "CalendarServer/{}".format(version))
         headers.addRawHeader(*self.server.secretHeader())
 
-        from twisted.internet import reactor
-        f = Factory()
-        f.protocol = HTTPClientProtocol
-        ep = GAIEndpoint(reactor, host, port, _configuredClientContextFactory(host) if ssl else None)
-        proto = (yield ep.connect(f))
-
         request = ClientRequest("POST", path, headers, self.stream if self.stream is not None else self.data)
 
         if accountingEnabledForCategory("xPod"):
             self.loggedRequest = yield self.logRequest(request)
 
-        response = (yield proto.submitRequest(request))
+        # Attachment data is streamed over its own connection as the pool would
+        # have to buffer the whole body in memory to be able to retry it
+        if config.OutboundHTTPConnections.Enabled and self.stream is None:
+            response = (yield getPersistentHTTPClientPool(ssl, host, port).submitRequest(request))
+        else:
+            from twisted.internet import reactor
+            f = Factory()
+            f.protocol = HTTPClientProtocol
+            ep = GAIEndpoint(reactor, host, port, _configuredClientContextFactory(host) if ssl else None)
+            proto = (yield ep.connect(f))
+            response = (yield proto.submitRequest(request))
 
         returnValue(response)
@@ -23,7 +23,8 @@ import txweb2.dav.test.util
 from txweb2.http_headers import MimeType
 from txweb2.stream import MemoryStream
 
-from twisted.internet.defer import inlineCallbacks, succeed, returnValue
+from twisted.internet.defer import inlineCallbacks, succeed, returnValue, \
+    gatherResults
 
 from twistedcaldav import caldavxml
 from twistedcaldav.ical import Component, normalize_iCalStr
@@ -129,6 +130,8 @@ class TestConduitToConduit(MultiStoreConduitTest):
 
     class FakeConduit(PoddingConduit):
 
+        batchableActions = frozenset(("fake", "fake-error",))
+
         @inlineCallbacks
         def send_fake(self, txn, ownerUID, shareeUID):
             _ignore_owner, sharee = yield self.validRequest(ownerUID, shareeUID)
@@ -146,6 +149,17 @@ class TestConduitToConduit(MultiStoreConduitTest):
                 "more": "bits",
             })
 
+        @inlineCallbacks
+        def send_fake_batched(self, txn, ownerUID, shareeUID, actions):
+            _ignore_owner, sharee = yield self.validRequest(ownerUID, shareeUID)
+            returnValue([
+                self.sendBatchableRequestToServer(txn, sharee.server(), {"action": action, "echo": "bravo"})
+                for action in actions
+            ])
+
+        def recv_fake_error(self, txn, j):
+            raise ValueError("fake error")
+
     def makeConduit(self, store):
         """
         Use our own variant.
@@ -170,6 +184,52 @@ class TestConduitToConduit(MultiStoreConduitTest):
         self.assertEqual(response, {"back2u": "bravo", "more": "bits"})
         yield self.commitTransaction(1)
 
+    @inlineCallbacks
+    def test_batched_actions(self):
+        """
+        Batchable requests made together are sent in one cross-pod request, and
+        each gets its own result.
+        """
+
+        store = self.theStoreUnderTest(0)
+        txn = self.theTransactionUnderTest(0)
+        results = yield store.conduit.send_fake_batched(txn, "user01", "puser01", ("fake", "fake",))
+        responses = yield gatherResults(results)
+        self.assertEqual(responses, [{"back2u": "bravo", "more": "bits"}] * 2)
+        self.assertEqual(txn.logItems["xpod"], 1)
+        yield self.commitTransaction(0)
+
+    @inlineCallbacks
+    def test_batched_actions_failed(self):
+        """
+        When one request in a batch fails, the others still get their results.
+        """
+
+        store = self.theStoreUnderTest(0)
+        txn = self.theTransactionUnderTest(0)
+        results = yield store.conduit.send_fake_batched(txn, "user01", "puser01", ("fake", "fake-error", "fake",))
+        response = yield results[0]
+        self.assertEqual(response, {"back2u": "bravo", "more": "bits"})
+        yield self.assertFailure(results[1], ValueError)
+        response = yield results[2]
+        self.assertEqual(response, {"back2u": "bravo", "more": "bits"})
+        self.assertEqual(txn.logItems["xpod"], 1)
+        yield self.commitTransaction(0)
+
+    @inlineCallbacks
+    def test_batched_actions_not_batchable(self):
+        """
+        A batch containing an action that is not batchable is rejected.
+        """
+
+        store = self.theStoreUnderTest(0)
+        txn = self.theTransactionUnderTest(0)
+        self.theStoreUnderTest(1).conduit.batchableActions = frozenset(("fake",))
+        results = yield store.conduit.send_fake_batched(txn, "user01", "puser01", ("fake", "fake-error",))
+        for result in results:
+            yield self.assertFailure(result, FailedCrossPodRequestError)
+        yield self.commitTransaction(0)
+
 
 class TestConduitAPI(MultiStoreConduitTest):
     """
@@ -861,6 +921,52 @@ END:VCALENDAR
         self.assertEqual(normalize_iCalStr(str(ical)), normalize_iCalStr(self.caldata1))
         yield self.commitTransaction(1)
 
+    @inlineCallbacks
+    def test_componentTextForUser(self):
+        """
+        Test that an object on another pod never returns local text for the
+        componentForUser() fast path.
+        """
+
+        yield self.createShare("user01", "puser01")
+
+        calendar1 = yield self.calendarUnderTest(txn=self.theTransactionUnderTest(0), home="user01", name="calendar")
+        yield calendar1.createCalendarObjectWithName("1.ics", Component.fromString(self.caldata1))
+        yield self.commitTransaction(0)
+
+        shared_object = yield self.calendarObjectUnderTest(txn=self.theTransactionUnderTest(1), home="puser01", calendar_name="shared-calendar", name="1.ics")
+        text = yield shared_object.componentTextForUser()
+        self.assertTrue(text is None)
+        yield self.commitTransaction(1)
+
+    @inlineCallbacks
+    def test_component_batched(self):
+        """
+        Test that concurrent action=component requests are batched.
+        """
+
+        yield self.createShare("user01", "puser01")
+
+        calendar1 = yield self.calendarUnderTest(txn=self.theTransactionUnderTest(0), home="user01", name="calendar")
+        yield calendar1.createCalendarObjectWithName("1.ics", Component.fromString(self.caldata1))
+        yield calendar1.createCalendarObjectWithName("2.ics", Component.fromString(self.caldata2))
+        yield calendar1.createCalendarObjectWithName("3.ics", Component.fromString(self.caldata3))
+        yield self.commitTransaction(0)
+
+        txn = self.theTransactionUnderTest(1)
+        shared = yield self.calendarUnderTest(txn=txn, home="puser01", name="shared-calendar")
+        objects = yield shared.objectResourcesWithNames(("1.ics", "2.ics", "3.ics",))
+        objects = sorted(objects, key=lambda obj: obj.name())
+        requests = txn.logItems["xpod"]
+
+        icals = yield gatherResults([obj.component() for obj in objects])
+        self.assertEqual(txn.logItems["xpod"], requests + 1)
+        self.assertEqual(
+            [normalize_iCalStr(str(ical)) for ical in icals],
+            [normalize_iCalStr(caldata) for caldata in (self.caldata1, self.caldata2, self.caldata3,)],
+        )
+        yield self.commitTransaction(1)
+
     @inlineCallbacks
     def test_remove(self):
         """
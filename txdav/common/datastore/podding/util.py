@@ -28,6 +28,9 @@ class UtilityConduitMixin(object):
     Defines utility methods for cross-pod API and mix-ins.
     """
 
+    # Read-only actions that can be combined in a "batch" request
+    batchableActions = frozenset()
+
     #
     # Utility methods to map from store objects to/from JSON
     #
@@ -177,7 +180,7 @@ class UtilityConduitMixin(object):
     #
 
     @inlineCallbacks
-    def _simple_object_send(self, actionName, storeObject, classMethod=False, transform=None, args=None, kwargs=None):
+    def _simple_object_send(self, actionName, storeObject, classMethod=False, transform=None, args=None, kwargs=None, batchable=False):
         """
         A simple send operation that returns a value.
 
@@ -193,6 +196,8 @@ class UtilityConduitMixin(object):
         @type args: C{list}
         @param kwargs: optional keyword arguments.
         @type kwargs: C{dict}
+        @param batchable: whether the request may be combined with others in a "batch" request.
+        @type batchable: C{bool}
         """
 
         txn, request, server = yield self._getRequestForStoreObject(actionName, storeObject, classMethod)
@@ -200,7 +205,10 @@ class UtilityConduitMixin(object):
             request["arguments"] = args
         if kwargs is not None:
             request["keywords"] = kwargs
-        response = yield self.sendRequestToServer(txn, server, request)
+        if batchable:
+            response = yield self.sendBatchableRequestToServer(txn, server, request)
+        else:
+            response = yield self.sendRequestToServer(txn, server, request)
         returnValue(transform(response) if transform is not None else response)
 
     @inlineCallbacks
@@ -231,12 +239,14 @@ class UtilityConduitMixin(object):
     # Factory methods for binding actions to the conduit class
     #
     @staticmethod
-    def _make_simple_action(bindcls, action, method, classMethod=False, transform_recv_result=None, transform_send_result=None):
+    def _make_simple_action(bindcls, action, method, classMethod=False, transform_recv_result=None, transform_send_result=None, batchable=False):
+        if batchable:
+            bindcls.batchableActions = bindcls.batchableActions | frozenset((action,))
         setattr(
             bindcls,
             "send_{}".format(action),
             lambda self, storeObject, *args, **kwargs:
-                self._simple_object_send(action, storeObject, classMethod=classMethod, transform=transform_send_result, args=args, kwargs=kwargs)
+                self._simple_object_send(action, storeObject, classMethod=classMethod, transform=transform_send_result, args=args, kwargs=kwargs, batchable=batchable)
         )
         setattr(
             bindcls,
@@ -27,6 +27,7 @@ __all__ = [
     "andExpression",
     "orExpression",
     "timerangeExpression",
+    "propertyExpression",
     "textcompareExpression",
     "containsExpression",
     "notcontainsExpression",
@@ -198,6 +199,29 @@ class timerangeExpression(baseExpression):
         return "timerange(" + str(self.start) + ", " + str(self.end) + ")"
 
 
+class propertyExpression(baseExpression):
+    """
+    CalDAV property index expression. Selects resources that might have a
+    row in the property index table C{field} for a property (or sub-component)
+    called C{name} whose lower-cased value matches C{text} using C{match} (one
+    of C{"equals"}, C{"contains"}, C{"starts-with"} or C{"ends-with"}). When
+    C{match} is C{None} only the presence of the property is tested. The
+    result may be a superset of the true matches.
+    """
+
+    def __init__(self, field, name, match=None, text=None):
+        self.field = field
+        self.name = name
+        self.match = match
+        self.text = text
+
+    def __str__(self):
+        if self.match is None:
+            return "property(" + self.name + ")"
+        else:
+            return "property(" + self.name + ", " + self.match + ", " + self.text + ")"
+
+
 class textcompareExpression(baseExpression):
     """
     Base class for text comparison expressions.
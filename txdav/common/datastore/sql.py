@@ -86,11 +86,12 @@ from calendarserver.tools.util import displayNameForCollection, getEventDetails,
 
 from zope.interface import implements, directlyProvides
 
-from collections import defaultdict
+from collections import defaultdict, deque
 import datetime
 import inspect
 import itertools
 import os
+import random
 import sys
 import time
 from uuid import uuid4
@@ -155,6 +156,7 @@ class CommonDataStore(Service, object):
         logSQL=False,
         logTransactionWaits=0,
         timeoutTransactions=0,
+        sqlTracer=None,
         cacheQueries=True,
         cachePool="Default",
         cacheExpireSeconds=3600
@@ -177,6 +179,7 @@ class CommonDataStore(Service, object):
         self.logSQL = logSQL
         self.logTransactionWaits = logTransactionWaits
         self.timeoutTransactions = timeoutTransactions
+        self.sqlTracer = sqlTracer
         self.queuer = LocalQueuer(self.newTransaction)
         self._migrating = False
         self._enableNotifications = True
@@ -483,6 +486,178 @@ class TransactionStatsCollector(object):
         return (total_statements, total_rows, total_time,)
 
 
+class SQLTracer(object):
+    """
+    Low overhead, always-on tracing of the SQL executed by transactions. The
+    number of statements, rows and time taken by each transaction are added to
+    its log items (and thus to the extended access log for the HTTP request the
+    transaction belongs to). A sample of transactions also record each
+    statement they execute, and if one of those takes longer than the slow
+    threshold its full trace is kept in a ring buffer of recent slow
+    transactions, which can be fetched via the control API.
+    """
+
+    def __init__(self, slowSeconds=0, sampleRate=1.0, maxStatements=500, bufferSize=20):
+        """
+        @param slowSeconds: transactions lasting at least this long have their
+            trace kept - C{0} disables capturing traces
+        @type slowSeconds: C{float}
+        @param sampleRate: fraction of transactions that record statements
+        @type sampleRate: C{float}
+        @param maxStatements: maximum number of statements recorded for a
+            single transaction
+        @type maxStatements: C{int}
+        @param bufferSize: number of slow transaction traces kept
+        @type bufferSize: C{int}
+        """
+        self.slowSeconds = slowSeconds
+        self.sampleRate = sampleRate
+        self.maxStatements = maxStatements
+        self.slowTraces = deque(maxlen=bufferSize)
+
+    def newTrace(self, label):
+        """
+        Create the trace for a new transaction, deciding whether it will record
+        individual statements.
+
+        @param label: the transaction label
+        @type label: C{str}
+        @rtype: L{TransactionSQLTrace}
+        """
+        record = (
+            self.slowSeconds > 0 and
+            self.maxStatements > 0 and
+            self.slowTraces.maxlen > 0 and
+            (self.sampleRate >= 1.0 or random.random() < self.sampleRate)
+        )
+        return TransactionSQLTrace(self, label, self.maxStatements if record else 0)
+
+    def traceFinished(self, trace):
+        """
+        Called when a transaction ends. Keep its trace if it was slow.
+
+        @param trace: the finished trace
+        @type trace: L{TransactionSQLTrace}
+        """
+        if trace.statements is not None and trace.elapsed() >= self.slowSeconds:
+            self.slowTraces.append(trace.toDict())
+
+    def recentSlowTraces(self, clear=False):
+        """
+        Get the traces of recent slow transactions, most recent first.
+
+        @param clear: if C{True} empty the ring buffer as well
+        @type clear: C{bool}
+        @rtype: C{list} of C{dict}
+        """
+        traces = list(reversed(self.slowTraces))
+        if clear:
+            self.slowTraces.clear()
+        return traces
+
+
+class TransactionSQLTrace(object):
+    """
+    The SQL trace for a single transaction. Totals are always kept, individual
+    statements only if the transaction was sampled by the L{SQLTracer}.
+    """
+
+    def __init__(self, tracer, label, maxStatements):
+        self.tracer = tracer
+        self.label = label
+        self.maxStatements = maxStatements
+        self.statements = [] if maxStatements else None
+        self.statementCount = 0
+        self.rowCount = 0
+        self.sqlTime = 0.0
+        self.startTime = time.time()
+        self.endTime = None
+        self.outcome = None
+
+    def endStatement(self, context, rows):
+        """
+        Called after an SQL query has executed.
+
+        @param context: C{tuple} of the SQL statement, its arguments and the
+            time it started
+        @type context: C{tuple}
+        @param rows: rows returned from the query
+        @type rows: C{list}
+        """
+        sql, args, tstamp = context
+        t = time.time()
+        rows = len(rows) if rows else 0
+        self.statementCount += 1
+        self.rowCount += rows
+        self.sqlTime += t - tstamp
+        if self.statements is not None and len(self.statements) < self.maxStatements:
+            self.statements.append((sql, args, rows, tstamp, t,))
+
+    def finish(self, outcome):
+        """
+        Called when the transaction has been committed or aborted.
+
+        @param outcome: C{"commit"} or C{"abort"}
+        @type outcome: C{str}
+        """
+        if self.endTime is None:
+            self.endTime = time.time()
+            self.outcome = outcome
+            self.tracer.traceFinished(self)
+
+    def elapsed(self):
+        """
+        Time from the start of the transaction to its end (or now).
+
+        @rtype: C{float}
+        """
+        return (self.endTime if self.endTime is not None else time.time()) - self.startTime
+
+    def logItems(self):
+        """
+        Totals to add to the access log.
+
+        @rtype: C{dict}
+        """
+        return {
+            "sql-s": str(self.statementCount),
+            "sql-r": str(self.rowCount),
+            "sql-t": "%.1f" % (self.sqlTime * 1000.0,),
+        }
+
+    def toDict(self):
+        """
+        Get a JSON-able version of the full trace. Statement arguments are only
+        formatted (and truncated) here, so that this cost is paid only for
+        slow transactions.
+
+        @rtype: C{dict}
+        """
+        statements = []
+        for sql, args, rows, t_start, t_end in self.statements:
+            args = ["%s" % (arg,) for arg in args]
+            args = [((arg[:10] + "...") if len(arg) > 40 else arg) for arg in args]
+            args = [(arg.decode("utf-8", "replace") if isinstance(arg, str) else arg) for arg in args]
+            statements.append({
+                "sql": sql,
+                "args": args,
+                "rows": rows,
+                "start": (t_start - self.startTime) * 1000.0,
+                "time": (t_end - t_start) * 1000.0,
+            })
+        return {
+            "label": self.label,
+            "outcome": self.outcome,
+            "start": self.startTime,
+            "elapsed": self.elapsed() * 1000.0,
+            "statements": self.statementCount,
+            "rows": self.rowCount,
+            "sql-time": self.sqlTime * 1000.0,
+            "truncated": self.statementCount - len(self.statements),
+            "trace": statements,
+        }
+
+
 class CommonStoreTransactionMonitor(object):
     """
     Object that monitors the state of a transaction over time and logs or times out
@@ -595,6 +770,8 @@ class CommonStoreTransaction(
         self._notifierFactories = notifierFactories
         self._notifiedAlready = set()
         self._bumpedRevisionAlready = set()
+        self._syncTokenChangedAlready = set()
+        self._syncTokenChangedHomes = set()
         self._label = label
         self._migrating = migrating
         self._allowDisabled = False
@@ -626,6 +803,10 @@ class CommonStoreTransaction(
             TransactionStatsCollector(self._label, self._store.logStatsLogFile)
             if self._store.logStats else None
         )
+        self._trace = (
+            self._store.sqlTracer.newTrace(self._label)
+            if self._store.sqlTracer is not None else None
+        )
         self.statementCount = 0
         self.iudCount = 0
         self.currentStatement = None
@@ -880,6 +1061,29 @@ class CommonStoreTransaction(
         """
         self._bumpedRevisionAlready.add(obj.id())
 
+    def isSyncTokenChangedAlready(self, key):
+        """
+        Indicates whether or not syncTokenChangedForObject has already been
+        called for the given object key, in order to facilitate marking the
+        home sync tokens affected by its revisions only once per object.
+        """
+        return key in self._syncTokenChangedAlready
+
+    def syncTokenChangedForObject(self, key, homeIDs):
+        """
+        Records the fact that revisions of the object with the given key, which
+        change the sync tokens of the given homes, are being changed.
+        """
+        self._syncTokenChangedAlready.add(key)
+        self._syncTokenChangedHomes.update(homeIDs)
+
+    def isSyncTokenChangedForHome(self, homeID):
+        """
+        Indicates whether or not the sync token of the given home has been
+        changed by this transaction.
+        """
+        return homeID in self._syncTokenChangedHomes
+
     _savepointCounter = 0
 
     def _savepoint(self):
@@ -979,6 +1183,8 @@ class CommonStoreTransaction(
         """
         if self._stats:
             statsContext = self._stats.startStatement(a[0], a[1] if len(a) > 1 else ())
+        if self._trace is not None:
+            traceContext = (a[0], a[1] if len(a) > 1 else (), time.time())
         self.currentStatement = a[0]
         if self._store.logTransactionWaits and a[0].split(" ", 1)[0].lower() in ("insert", "update", "delete",):
             self.iudCount += 1
@@ -994,6 +1200,8 @@ class CommonStoreTransaction(
             self.currentStatement = None
             if self._stats:
                 self._stats.endStatement(statsContext, results)
+            if self._trace is not None:
+                self._trace.endStatement(traceContext, results)
         returnValue(results)
 
     @inlineCallbacks
@@ -1019,13 +1227,19 @@ class CommonStoreTransaction(
         # Do stats logging as a postCommit because there might be some pending preCommit SQL we want to log
         if self._stats:
             self.postCommit(self.statsReport)
-        return self._sqlTxn.commit()
+        d = self._sqlTxn.commit()
+        if self._trace is not None:
+            d.addBoth(self._finishTrace, "commit")
+        return d
 
     def abort(self):
         """
         Abort the transaction.
         """
-        return self._sqlTxn.abort()
+        d = self._sqlTxn.abort()
+        if self._trace is not None:
+            d.addBoth(self._finishTrace, "abort")
+        return d
 
     def timeout(self):
         """
@@ -1043,6 +1257,15 @@ class CommonStoreTransaction(
         self.logItems["sql-r"] = str(sql_rows)
         self.logItems["sql-t"] = "%.1f" % (sql_time,)
 
+    def _finishTrace(self, result, outcome):
+        """
+        Record the SQL trace totals as log items and hand the trace back to
+        the tracer once the transaction has ended.
+        """
+        self.logItems.update(self._trace.logItems())
+        self._trace.finish(outcome)
+        return result
+
     def _oldEventsBase(self, limit):
         ch = schema.CALENDAR_HOME
         co = schema.CALENDAR_OBJECT
@@ -1496,6 +1719,11 @@ class CommonHome(SharingHomeMixIn):
     _dataVersionKey = None
     _dataVersionValue = None
 
+    # Whether the sync token can be cached. This is only possible when every
+    # change to a revision that contributes to the sync token is reported via
+    # L{CommonHomeChild._syncTokenChanging}.
+    _syncTokenCacheable = False
+
     @classmethod
     def makeClass(cls, transaction, homeData, authzUID=None):
         """
@@ -2352,13 +2580,79 @@ class CommonHome(SharingHomeMixIn):
             self._syncTokenRevision = yield self.syncTokenRevision()
         returnValue("%s_%s" % (self._resourceID, self._syncTokenRevision))
 
+    def _syncTokenCacher(self):
+        """
+        The L{QueryCacher} used to cache the sync token revision, or L{None} if
+        the sync token is not being cached.
+        """
+        if self._syncTokenCacheable and config.QueryCaching.HomeSyncTokens:
+            return self._txn._queryCacher
+        else:
+            return None
+
     @inlineCallbacks
     def syncTokenRevision(self):
+        """
+        Return the current sync token revision for the home. When caching is
+        enabled, the latest revision is shared across processes so that the
+        (expensive) L{_syncTokenQuery} only needs to be run when the revisions
+        change. Any change to the revisions replaces the cached value with
+        L{QueryCacher.SYNC_REVISION_CHANGED}, so the check-and-set here can only
+        store a value if no change has been committed since it was read.
+        """
+        queryCacher = self._syncTokenCacher()
+        if queryCacher is None or self._txn.isSyncTokenChangedForHome(self._resourceID):
+            revision = yield self.syncTokenRevisionFromQuery()
+            returnValue(revision)
+
+        cacheKey = queryCacher.keyForHomeSyncRevision(self._resourceID)
+        identifier, cached = yield queryCacher.get(cacheKey, withIdentifier=True)
+        if cached is not None and cached != queryCacher.SYNC_REVISION_CHANGED:
+            returnValue(cached)
+
+        revision = yield self.syncTokenRevisionFromQuery()
+        if cached is None:
+            yield queryCacher.add(cacheKey, revision)
+        else:
+            yield queryCacher.checkAndSet(cacheKey, revision, identifier)
+        returnValue(revision)
+
+    @inlineCallbacks
+    def syncTokenRevisionFromQuery(self):
+        """
+        Determine the current sync token revision for the home directly from
+        the revisions tables.
+        """
         revision = (yield self._syncTokenQuery.on(self._txn, resourceID=self._resourceID))[0][0]
         if revision is None:
             revision = int((yield self._txn.calendarserverValue("MIN-VALID-REVISION")))
         returnValue(revision)
 
+    @inlineCallbacks
+    def verifySyncTokenRevision(self, repair=False):
+        """
+        Check that the cached sync token revision matches the one determined
+        from the revisions tables.
+
+        @param repair: if C{True}, replace a cached value that does not match
+        @type repair: C{bool}
+
+        @return: a C{tuple} of the cached revision (or L{None} if nothing is
+            cached) and the actual revision
+        @rtype: C{tuple}
+        """
+        revision = yield self.syncTokenRevisionFromQuery()
+        cached = None
+        queryCacher = self._syncTokenCacher()
+        if queryCacher is not None:
+            cacheKey = queryCacher.keyForHomeSyncRevision(self._resourceID)
+            cached = yield queryCacher.get(cacheKey)
+            if cached == queryCacher.SYNC_REVISION_CHANGED:
+                cached = None
+            if cached is not None and cached != revision and repair:
+                yield queryCacher.set(cacheKey, queryCacher.SYNC_REVISION_CHANGED)
+        returnValue((cached, revision,))
+
     @classproperty
     def _changesQuery(cls):
         bind = cls._bindSchema
@@ -2492,15 +2786,14 @@ class CommonHome(SharingHomeMixIn):
                     changed.add("%s/%s" % (path, name,))
 
         # Now deal with existing shared collections
-        # TODO: think about whether this can be done in one query rather than looping over each share
-        for share in (yield self.children()):
-            if not share.owned():
-                sharedChanged, sharedDeleted, sharedInvalid = yield share.sharedChildResourceNamesSinceRevision(revision, depth)
-                changed |= sharedChanged
-                changed -= sharedInvalid
-                deleted |= sharedDeleted
-                deleted -= sharedInvalid
-                invalid |= sharedInvalid
+        shares = [share for share in (yield self.children()) if not share.owned()]
+        if shares:
+            sharedChanged, sharedDeleted, sharedInvalid = yield self._childClass.sharedChildrenResourceNamesSinceRevision(shares, revision, depth)
+            changed |= sharedChanged
+            changed -= sharedInvalid
+            deleted |= sharedDeleted
+            deleted -= sharedInvalid
+            invalid |= sharedInvalid
 
         changed = sorted(changed)
         deleted = sorted(deleted)
@@ -4060,19 +4353,109 @@ class CommonHomeChild(FancyEqMixin, Memoizable, _SharedSyncLogic, HomeChildBase,
                 if name
             ]
 
-            for path, name, wasdeleted in results:
-                if wasdeleted:
-                    if depth == "1":
-                        changed.add("%s/" % (path,))
-                    else:
-                        deleted.add("%s/%s" % (path, name,))
+            self._sharedChangedNames(results, depth, changed, deleted)
 
-                # Always report collection as changed
-                changed.add("%s/" % (path,))
+        returnValue((changed, deleted, invalid,))
 
-                # Resource changed - for depth "infinity" report resource as changed
-                if name and depth != "1":
-                    changed.add("%s/%s" % (path, name,))
+    @staticmethod
+    def _sharedChangedNames(results, depth, changed, deleted):
+        """
+        Add the changed and deleted paths for the revisions of child resources
+        of shared collections.
+
+        @param results: the collection name, resource name and deleted flag for
+            each revision
+        @type results: C{list} of C{tuple}
+        @param depth: depth for determine what changed
+        @type depth: C{str}
+        @param changed: the changed paths to add to
+        @type changed: C{set}
+        @param deleted: the deleted paths to add to
+        @type deleted: C{set}
+        """
+        for path, name, wasdeleted in results:
+            if wasdeleted:
+                if depth == "1":
+                    changed.add("%s/" % (path,))
+                else:
+                    deleted.add("%s/%s" % (path, name,))
+
+            # Always report collection as changed
+            changed.add("%s/" % (path,))
+
+            # Resource changed - for depth "infinity" report resource as changed
+            if name and depth != "1":
+                changed.add("%s/%s" % (path, name,))
+
+    def _batchableSharedChanges(self, revision):
+        """
+        Whether the changes since a revision for this shared collection can be
+        determined together with those of other shares by
+        L{sharedChildrenResourceNamesSinceRevision}. That is not possible for
+        external shares, or when all the resources have to be listed because
+        the share was bound after the revision. Subclasses may override.
+
+        @param revision: the sync revision to compare to
+        @type revision: C{int}
+        """
+        return not self.external() and revision != 0 and revision >= self._bindRevision
+
+    @classmethod
+    def _sharedChildrenChangesQuery(cls, count):
+        """
+        DAL query to find the resource revisions since a sync revision for a
+        set of collections.
+        """
+        rev = cls._revisionsSchema
+        return Select(
+            [rev.RESOURCE_ID, rev.RESOURCE_NAME, rev.DELETED],
+            From=rev,
+            Where=(rev.REVISION > Parameter("revision")).And(
+                rev.RESOURCE_ID.In(Parameter("resourceIDs", count))),
+        )
+
+    @classmethod
+    @inlineCallbacks
+    def sharedChildrenResourceNamesSinceRevision(cls, shares, revision, depth):
+        """
+        Determine the combined list of child resources that have changed since the specified
+        sync revision for a set of shared collections in the same home. The changes for all
+        the shares that allow it are found with a single query, the rest are handled by
+        L{sharedChildResourceNamesSinceRevision}.
+
+        @param shares: the shared collections
+        @type shares: C{list} of L{CommonHomeChild}
+        @param revision: the sync revision to compare to
+        @type revision: C{int}
+        @param depth: depth for determine what changed
+        @type depth: C{str}
+        """
+        changed = set()
+        deleted = set()
+        invalid = set()
+        batched = {}
+        for share in shares:
+            if share._batchableSharedChanges(revision):
+                batched[share._resourceID] = share.name()
+            else:
+                sharedChanged, sharedDeleted, sharedInvalid = yield share.sharedChildResourceNamesSinceRevision(revision, depth)
+                changed |= sharedChanged
+                deleted |= sharedDeleted
+                invalid |= sharedInvalid
+
+        if batched:
+            resourceIDs = sorted(batched.keys())
+            rows = yield cls._sharedChildrenChangesQuery(len(resourceIDs)).on(
+                shares[0]._txn,
+                revision=revision,
+                resourceIDs=resourceIDs,
+            )
+            results = [
+                (batched[resourceID], name, wasdeleted)
+                for resourceID, name, wasdeleted in rows
+                if name
+            ]
+            cls._sharedChangedNames(results, depth, changed, deleted)
 
         returnValue((changed, deleted, invalid,))
 
@@ -4158,6 +4541,45 @@ class CommonHomeChild(FancyEqMixin, Memoizable, _SharedSyncLogic, HomeChildBase,
     def getNotifier(self, factory_name):
         return self._notifiers.get(factory_name) if self._notifiers else None
 
+    @classproperty
+    def _bindHomeIDsQuery(cls):
+        """
+        DAL query to find all the homes bound to a child.
+        """
+        bind = cls._bindSchema
+        return Select(
+            [bind.HOME_RESOURCE_ID],
+            From=bind,
+            Where=bind.RESOURCE_ID == Parameter("resourceID"),
+        )
+
+    @inlineCallbacks
+    def _syncTokenChanging(self):
+        """
+        Called before the revisions of this child are changed. The home sync tokens
+        of the owner and of all sharees include these revisions, so mark any cached
+        value for those as changed, both now and once the transaction commits
+        (because another transaction could re-cache the old value before then).
+        """
+        # A shared child has the same id as the owned one, so also use the
+        # viewer's home to distinguish them
+        key = (self._home._resourceID, self._resourceID,)
+        if self._txn.isSyncTokenChangedAlready(key):
+            returnValue(None)
+        queryCacher = self._home._syncTokenCacher()
+        if queryCacher is None:
+            returnValue(None)
+
+        homeIDs = set([row[0] for row in (yield self._bindHomeIDsQuery.on(self._txn, resourceID=self._resourceID))])
+        homeIDs.add(self._home._resourceID)
+        homeIDs.add(self.ownerHome()._resourceID)
+        self._txn.syncTokenChangedForObject(key, homeIDs)
+
+        for homeID in homeIDs:
+            cacheKey = queryCacher.keyForHomeSyncRevision(homeID)
+            yield queryCacher.set(cacheKey, queryCacher.SYNC_REVISION_CHANGED)
+            queryCacher.setAfterCommit(self._txn, cacheKey, queryCacher.SYNC_REVISION_CHANGED)
+
     def notifierID(self):
         return (self.ownerHome()._notifierPrefix, "%s/%s" % (self.ownerHome().uid(), self._ownerName,),)
 
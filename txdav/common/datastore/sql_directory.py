@@ -346,7 +346,7 @@ class GroupCacherAPIMixin(object):
 
         membershipHashContent = hashlib.md5()
         for memberUID in sorted(memberUIDs):
-            membershipHashContent.update(str(memberUID))
+            membershipHashContent.update(memberUID.encode("utf-8") if isinstance(memberUID, unicode) else memberUID)
         membershipHash = membershipHashContent.hexdigest()
 
         if group.membershipHash != membershipHash:
@@ -418,12 +418,9 @@ class GroupCacherAPIMixin(object):
         """
         The members of the given group as recorded in the db
         """
-        members = set()
         memberUIDs = (yield self.groupMemberUIDs(groupID))
-        for uid in memberUIDs:
-            record = (yield self.directoryService().recordWithUID(uid))
-            if record is not None:
-                members.add(record)
+        records = (yield self.directoryService().recordsWithUIDs(memberUIDs))
+        members = set([record for record in records.values() if record is not None])
         returnValue(members)
 
     @inlineCallbacks
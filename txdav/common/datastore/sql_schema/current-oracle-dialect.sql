@@ -259,6 +259,13 @@ create table PERUSER (
 );
 
 
+create table CALENDAR_OBJECT_PROPERTY (
+    "CALENDAR_OBJECT_RESOURCE_ID" integer not null references CALENDAR_OBJECT on delete cascade,
+    "NAME" nvarchar2(255),
+    "VALUE" nvarchar2(255) default null
+);
+
+
 create table CALENDAR_OBJECT_MIGRATION (
     "CALENDAR_HOME_RESOURCE_ID" integer references CALENDAR_HOME on delete cascade,
     "REMOTE_RESOURCE_ID" integer not null,
@@ -276,7 +283,8 @@ create table ATTACHMENT (
     "MD5" nchar(32),
     "CREATED" timestamp default CURRENT_TIMESTAMP at time zone 'UTC',
     "MODIFIED" timestamp default CURRENT_TIMESTAMP at time zone 'UTC',
-    "PATH" nvarchar2(1024)
+    "PATH" nvarchar2(1024),
+    "CONTENT_HASH" nvarchar2(64) default null
 );
 
 
@@ -772,8 +780,8 @@ create table CALENDARSERVER (
     "VALUE" nvarchar2(255)
 );
 
-insert into CALENDARSERVER (NAME, VALUE) values ('VERSION', '66');
-insert into CALENDARSERVER (NAME, VALUE) values ('CALENDAR-DATAVERSION', '6');
+insert into CALENDARSERVER (NAME, VALUE) values ('VERSION', '68');
+insert into CALENDARSERVER (NAME, VALUE) values ('CALENDAR-DATAVERSION', '7');
 insert into CALENDARSERVER (NAME, VALUE) values ('ADDRESSBOOK-DATAVERSION', '2');
 insert into CALENDARSERVER (NAME, VALUE) values ('NOTIFICATION-DATAVERSION', '1');
 insert into CALENDARSERVER (NAME, VALUE) values ('MIN-VALID-REVISION', '1');
@@ -860,6 +868,11 @@ create index TIME_RANGE_CALENDAR_O_acf37bd1 on TIME_RANGE (
     "CALENDAR_OBJECT_RESOURCE_ID"
 );
 
+create index CALENDAR_OBJECT_PROPE_0b75ad75 on CALENDAR_OBJECT_PROPERTY (
+    "CALENDAR_OBJECT_RESOURCE_ID",
+    "NAME"
+);
+
 create index CALENDAR_OBJECT_MIGRA_0502cbef on CALENDAR_OBJECT_MIGRATION (
     "CALENDAR_HOME_RESOURCE_ID",
     "LOCAL_RESOURCE_ID"
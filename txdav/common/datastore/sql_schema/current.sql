@@ -403,6 +403,25 @@ create table PERUSER (
 );
 
 
+------------------------------
+-- Calendar Object Property --
+------------------------------
+
+-- Lower-cased values of frequently filtered properties on the top-level
+-- components of each calendar object, used to narrow calendar-query
+-- searches. A null VALUE (value too long to index, or a component
+-- marker such as VALARM) matches any text-match.
+
+create table CALENDAR_OBJECT_PROPERTY (
+  CALENDAR_OBJECT_RESOURCE_ID bigint       not null references CALENDAR_OBJECT on delete cascade,
+  NAME                        varchar(255) not null,
+  VALUE                       varchar(255) default null
+);
+
+create index CALENDAR_OBJECT_PROPERTY_RESOURCE_ID_NAME on
+  CALENDAR_OBJECT_PROPERTY(CALENDAR_OBJECT_RESOURCE_ID, NAME);
+
+
 -------------------------------
 -- Calendar Object Migration --
 -------------------------------
@@ -436,7 +455,8 @@ create table ATTACHMENT (
   MD5                         char(32)          not null,
   CREATED                     timestamp default timezone('UTC', CURRENT_TIMESTAMP),
   MODIFIED                    timestamp default timezone('UTC', CURRENT_TIMESTAMP),
-  PATH                        varchar(1024)     not null
+  PATH                        varchar(1024)     not null,
+  CONTENT_HASH                varchar(64)       default null -- SHA-256 of the data, locates the shared blob file
 );
 
 create index ATTACHMENT_CALENDAR_HOME_RESOURCE_ID on
@@ -1314,8 +1334,8 @@ create table CALENDARSERVER (
   VALUE                         varchar(255)
 );
 
-insert into CALENDARSERVER values ('VERSION', '66');
-insert into CALENDARSERVER values ('CALENDAR-DATAVERSION', '6');
+insert into CALENDARSERVER values ('VERSION', '68');
+insert into CALENDARSERVER values ('CALENDAR-DATAVERSION', '7');
 insert into CALENDARSERVER values ('ADDRESSBOOK-DATAVERSION', '2');
 insert into CALENDARSERVER values ('NOTIFICATION-DATAVERSION', '1');
 insert into CALENDARSERVER values ('MIN-VALID-REVISION', '1');
@@ -0,0 +1,26 @@
+----
+-- Copyright (c) 2012-2018 Apple Inc. All rights reserved.
+--
+-- Licensed under the Apache License, Version 2.0 (the "License");
+-- you may not use this file except in compliance with the License.
+-- You may obtain a copy of the License at
+--
+-- http://www.apache.org/licenses/LICENSE-2.0
+--
+-- Unless required by applicable law or agreed to in writing, software
+-- distributed under the License is distributed on an "AS IS" BASIS,
+-- WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+-- See the License for the specific language governing permissions and
+-- limitations under the License.
+----
+
+---------------------------------------------------
+-- Upgrade database schema from VERSION 67 to 68 --
+---------------------------------------------------
+
+-- Content-addressed attachment storage
+alter table ATTACHMENT
+	add ("CONTENT_HASH" nvarchar2(64) default null);
+
+-- update the version
+update CALENDARSERVER set VALUE = '68' where NAME = 'VERSION';
@@ -17,6 +17,7 @@
 
 from twext.enterprise.dal.syntax import Max, Select, Parameter, Delete, Insert, \
     Update, ColumnSyntax, TableSyntax, Upper, utcNowSQL
+from twext.enterprise.ienterprise import ORACLE_DIALECT
 from twext.python.clsprop import classproperty
 from twext.python.log import Logger
 from twisted.internet.defer import succeed, inlineCallbacks, returnValue
@@ -197,8 +198,16 @@ class _SharedSyncLogic(object):
             Return=[rev.REVISION]
         )
 
+    def _syncTokenChanging(self):
+        """
+        Called before any change to the revisions of this collection, so that
+        anything derived from them can be updated. Subclasses may override.
+        """
+        return succeed(None)
+
     @inlineCallbacks
     def _initSyncToken(self):
+        yield self._syncTokenChanging()
         yield self._removeDeletedRevision.on(
             self._txn, homeID=self._home._resourceID, collectionName=self._name
         )
@@ -228,6 +237,7 @@ class _SharedSyncLogic(object):
 
     @inlineCallbacks
     def _renameSyncToken(self):
+        yield self._syncTokenChanging()
         rows = yield self._renameSyncTokenQuery.on(
             self._txn, name=self._name, resourceID=self._resourceID)
         if rows:
@@ -257,6 +267,7 @@ class _SharedSyncLogic(object):
 
         if not self._txn.isRevisionBumpedAlready(self):
             self._txn.bumpRevisionForObject(self)
+            yield self._syncTokenChanging()
             yield self._bumpSyncTokenQuery.on(
                 self._txn,
                 resourceID=self._resourceID,
@@ -322,6 +333,8 @@ class _SharedSyncLogic(object):
         @param sharedRemoval: indicates whether the collection being removed is shared
         @type sharedRemoval: L{bool}
         """
+        yield self._syncTokenChanging()
+
         # Remove all child entries
         yield self._deleteSyncTokenQuery.on(self._txn,
                                             homeID=self._home._resourceID,
@@ -431,6 +444,8 @@ class _SharedSyncLogic(object):
     @inlineCallbacks
     def _changeRevision(self, action, name):
 
+        yield self._syncTokenChanging()
+
         # Need to handle the case where for some reason the revision entry is
         # actually missing. For a "delete" we don't care, for an "update" we
         # will turn it into an "insert".
@@ -530,6 +545,83 @@ def determineNewest(uid, homeType):
     )
 
 
+@inlineCallbacks
+def allocateSequenceValues(txn, sequence, count):
+    """
+    Allocate a block of new values from a database sequence using a single
+    statement. This allows callers doing bulk inserts to know the primary keys
+    of the rows they will insert ahead of time, rather than relying on a
+    C{RETURNING} clause for each row.
+
+    @param txn: the transaction to use
+    @type txn: L{CommonStoreTransaction}
+    @param sequence: the sequence to allocate from
+    @type sequence: L{SequenceSyntax}
+    @param count: the number of values to allocate
+    @type count: C{int}
+
+    @return: the allocated values
+    @rtype: C{list} of C{int}
+    """
+    if count <= 0:
+        returnValue([])
+
+    name = sequence.model.name
+    if txn.dbtype.dialect == ORACLE_DIALECT:
+        sql = "select {}.nextval from dual connect by level <= {}".format(name, int(count))
+    else:
+        sql = "select nextval('{}') from generate_series(1, {})".format(name, int(count))
+    rows = yield txn.execSQL(sql, [])
+    returnValue([row[0] for row in rows])
+
+
+@inlineCallbacks
+def bulkInsert(txn, columns, rows, batchSize):
+    """
+    Insert a set of rows into a table using multi-row insert statements, with
+    at most C{batchSize} rows per statement. The DAL L{Insert} only handles a
+    single row, which means one database round trip per row - this is used
+    where a large number of rows need to be written at once (e.g. instance
+    indexing of recurring events).
+
+    @param txn: the transaction to use
+    @type txn: L{CommonStoreTransaction}
+    @param columns: the columns being inserted - all must be in the same table
+    @type columns: C{list} of L{ColumnSyntax}
+    @param rows: the values for each row in the same order as C{columns}
+    @type rows: C{list} of C{tuple}
+    @param batchSize: maximum number of rows per statement
+    @type batchSize: C{int}
+    """
+    if not rows:
+        returnValue(None)
+
+    tableName = columns[0].model.table.name
+    columnNames = ", ".join([column.model.name for column in columns])
+    numeric = txn.dbtype.paramstyle == "numeric"
+    oracle = txn.dbtype.dialect == ORACLE_DIALECT
+
+    for offset in range(0, len(rows), max(batchSize, 1)):
+        args = []
+        values = []
+        for row in rows[offset:offset + max(batchSize, 1)]:
+            placeholders = []
+            for value in row:
+                args.append(value)
+                placeholders.append(":{}".format(len(args)) if numeric else "%s")
+            values.append("({})".format(", ".join(placeholders)))
+
+        if oracle:
+            # Oracle does not support multi-row VALUES
+            sql = "insert all {} select * from dual".format(" ".join([
+                "into {} ({}) values {}".format(tableName, columnNames, value)
+                for value in values
+            ]))
+        else:
+            sql = "insert into {} ({}) values {}".format(tableName, columnNames, ", ".join(values))
+        yield txn.execSQL(sql, args)
+
+
 @inlineCallbacks
 def mergeHomes(sqlTxn, one, other, homeType):
     """
@@ -29,7 +29,7 @@ from twisted.trial.unittest import TestCase
 # from twistedcaldav.vcard import Component as VCard
 from txdav.common.datastore.sql import (
     log, CommonStoreTransactionMonitor,
-    CommonHome, CommonHomeChild, ECALENDARTYPE
+    CommonHome, CommonHomeChild, ECALENDARTYPE, SQLTracer
 )
 from txdav.common.datastore.sql_tables import schema
 from txdav.common.datastore.sql_util import _normalizeColumnUUIDs, \
@@ -81,6 +81,86 @@ class CommonSQLStoreTests(CommonCommonTests, TestCase):
         self.assertEqual(len(version), 1)
         self.assertEqual(len(version[0]), 1)
 
+    @inlineCallbacks
+    def test_sqlTracing(self):
+        """
+        L{SQLTracer} adds SQL totals to the transaction log items and keeps
+        the trace of slow transactions.
+        """
+
+        tracer = SQLTracer(slowSeconds=0.000001, bufferSize=2)
+        self.patch(self.store, "sqlTracer", tracer)
+
+        cs = schema.CALENDARSERVER
+        for _ignore in range(3):
+            txn = self.transactionUnderTest()
+            yield Select(
+                [cs.VALUE],
+                From=cs,
+                Where=cs.NAME == "VERSION",
+            ).on(txn)
+            yield self.commit()
+
+            self.assertEqual(txn.logItems["sql-s"], "1")
+            self.assertEqual(txn.logItems["sql-r"], "1")
+            self.assertTrue("sql-t" in txn.logItems)
+
+        traces = tracer.recentSlowTraces()
+        self.assertEqual(len(traces), 2)
+        self.assertEqual(traces[0]["outcome"], "commit")
+        self.assertEqual(traces[0]["statements"], 1)
+        self.assertEqual(traces[0]["truncated"], 0)
+        self.assertEqual(len(traces[0]["trace"]), 1)
+        self.assertTrue("CALENDARSERVER" in traces[0]["trace"][0]["sql"])
+        self.assertEqual(traces[0]["trace"][0]["args"], ["VERSION"])
+        self.assertEqual(traces[0]["trace"][0]["rows"], 1)
+
+        self.assertEqual(len(tracer.recentSlowTraces(clear=True)), 2)
+        self.assertEqual(len(tracer.recentSlowTraces()), 0)
+
+    @inlineCallbacks
+    def test_sqlTracingNotSlow(self):
+        """
+        L{SQLTracer} does not keep the trace of fast or unsampled transactions
+        but still records their totals, and limits the statements recorded.
+        """
+
+        cs = schema.CALENDARSERVER
+
+        @inlineCallbacks
+        def _doQueries(count):
+            txn = self.transactionUnderTest()
+            for _ignore in range(count):
+                yield Select(
+                    [cs.VALUE],
+                    From=cs,
+                    Where=cs.NAME == "VERSION",
+                ).on(txn)
+            yield self.abort()
+            returnValue(txn)
+
+        tracer = SQLTracer(slowSeconds=3600)
+        self.patch(self.store, "sqlTracer", tracer)
+        txn = yield _doQueries(2)
+        self.assertEqual(txn.logItems["sql-s"], "2")
+        self.assertEqual(len(tracer.recentSlowTraces()), 0)
+
+        tracer = SQLTracer(slowSeconds=0.000001, sampleRate=0.0)
+        self.patch(self.store, "sqlTracer", tracer)
+        txn = yield _doQueries(2)
+        self.assertEqual(txn.logItems["sql-s"], "2")
+        self.assertEqual(len(tracer.recentSlowTraces()), 0)
+
+        tracer = SQLTracer(slowSeconds=0.000001, maxStatements=2)
+        self.patch(self.store, "sqlTracer", tracer)
+        txn = yield _doQueries(3)
+        traces = tracer.recentSlowTraces()
+        self.assertEqual(len(traces), 1)
+        self.assertEqual(traces[0]["outcome"], "abort")
+        self.assertEqual(traces[0]["statements"], 3)
+        self.assertEqual(traces[0]["truncated"], 1)
+        self.assertEqual(len(traces[0]["trace"]), 2)
+
     def test_logWaits(self):
         """
         CommonStoreTransactionMonitor logs waiting transactions.
@@ -170,6 +170,7 @@ class SQLSchemaFiles(TestCase):
         # Set of tables for which missing primary key is allowed
         table_exceptions = (
             "ADDRESSBOOK_OBJECT_REVISIONS",
+            "CALENDAR_OBJECT_PROPERTY",
             "CALENDAR_OBJECT_REVISIONS",
             "NOTIFICATION_OBJECT_REVISIONS",
             "PERUSER",
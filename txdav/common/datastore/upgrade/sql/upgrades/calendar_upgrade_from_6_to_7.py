@@ -0,0 +1,92 @@
+# -*- test-case-name: txdav.common.datastore.upgrade.sql.test -*-
+##
+# Copyright (c) 2017 Apple Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+##
+
+from twext.enterprise.dal.syntax import Select
+
+from twisted.internet.defer import inlineCallbacks
+
+from twistedcaldav.config import config
+from twistedcaldav.ical import Component, InvalidICalendarDataError
+
+from txdav.caldav.datastore.sql import CalendarObject
+from txdav.common.datastore.sql_tables import schema, _BIND_MODE_OWN
+from txdav.common.datastore.upgrade.sql.upgrades.util import updateCalendarDataVersion, \
+    doToEachHomeNotAtVersion, logUpgradeError
+
+"""
+Data upgrade from database version 6 to 7
+"""
+
+UPGRADE_TO_VERSION = 7
+BATCH_SIZE = 100
+
+
+@inlineCallbacks
+def doUpgrade(sqlStore):
+    """
+    Do the required upgrade steps.
+    """
+    yield doToEachHomeNotAtVersion(sqlStore, schema.CALENDAR_HOME, UPGRADE_TO_VERSION, indexCalendarHome, "Index Calendar Properties", filterOwnerUID=config.UpgradeHomePrefix)
+
+    # Don't do remaining upgrade if we are only process a subset of the homes
+    if not config.UpgradeHomePrefix:
+        # Always bump the DB value
+        yield updateCalendarDataVersion(sqlStore, UPGRADE_TO_VERSION)
+
+
+@inlineCallbacks
+def indexCalendarHome(txn, homeResourceID):
+    """
+    For this calendar home, add the CALENDAR_OBJECT_PROPERTY rows for each
+    calendar object in its owned calendars. Only the property index is written,
+    the calendar data and its other indexes are left alone.
+    """
+
+    co = schema.CALENDAR_OBJECT
+    cb = schema.CALENDAR_BIND
+    lastResourceID = 0
+    while True:
+        rows = yield Select(
+            [co.RESOURCE_ID, co.ICALENDAR_TEXT],
+            From=co,
+            Where=(co.RESOURCE_ID > lastResourceID).And(
+                co.CALENDAR_RESOURCE_ID.In(Select(
+                    [cb.CALENDAR_RESOURCE_ID],
+                    From=cb,
+                    Where=(cb.CALENDAR_HOME_RESOURCE_ID == homeResourceID).And(
+                        cb.BIND_MODE == _BIND_MODE_OWN
+                    ),
+                ))
+            ),
+            OrderBy=co.RESOURCE_ID,
+            Limit=BATCH_SIZE,
+        ).on(txn)
+        if len(rows) == 0:
+            break
+
+        for resourceID, text in rows:
+            try:
+                component = Component.fromString(text)
+            except InvalidICalendarDataError, e:
+                logUpgradeError(
+                    "Index Calendar Properties",
+                    "Invalid calendar data in id: {}: {}".format(resourceID, e)
+                )
+                continue
+            yield CalendarObject._updatePropertyIndex(txn, resourceID, component, False)
+
+        lastResourceID = rows[-1][0]
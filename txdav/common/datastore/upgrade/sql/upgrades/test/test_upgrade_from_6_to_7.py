@@ -0,0 +1,121 @@
+##
+# Copyright (c) 2017 Apple Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+##
+
+"""
+Tests for L{txdav.common.datastore.upgrade.sql.upgrade}.
+"""
+
+from twisted.internet.defer import inlineCallbacks, returnValue
+
+from twext.enterprise.dal.syntax import Update, Select, Delete
+
+from twistedcaldav.ical import Component
+
+from txdav.caldav.datastore.test.util import CommonStoreTests
+from txdav.common.datastore.sql_tables import schema
+from txdav.common.datastore.upgrade.sql.upgrades.calendar_upgrade_from_6_to_7 import doUpgrade
+
+
+class Upgrade_from_6_to_7(CommonStoreTests):
+    """
+    Tests for the calendar property index upgrade.
+    """
+
+    data = """BEGIN:VCALENDAR
+VERSION:2.0
+PRODID:-//CALENDARSERVER.ORG//NONSGML Version 1//EN
+BEGIN:VEVENT
+UID:12345-67890-%(uid)s
+DTSTART:20130806T000000Z
+DURATION:PT1H
+DTSTAMP:20051222T210507Z
+SUMMARY:%(summary)s
+BEGIN:VALARM
+ACTION:DISPLAY
+DESCRIPTION:Alarm
+TRIGGER:-PT10M
+END:VALARM
+END:VEVENT
+END:VCALENDAR
+"""
+
+    @inlineCallbacks
+    def _propertyRows(self, user, name):
+        obj = yield self.calendarObjectUnderTest(name=name, calendar_name="calendar_1", home=user)
+        cop = schema.CALENDAR_OBJECT_PROPERTY
+        rows = yield Select(
+            [cop.NAME, cop.VALUE],
+            From=cop,
+            Where=cop.CALENDAR_OBJECT_RESOURCE_ID == obj._resourceID,
+        ).on(self.transactionUnderTest())
+        yield self.commit()
+        returnValue(sorted([tuple(row) for row in rows]))
+
+    @inlineCallbacks
+    def test_propertyIndexUpgrade(self):
+        """
+        Calendar objects stored before the property index existed get their
+        CALENDAR_OBJECT_PROPERTY rows, and the calendar data version is bumped.
+        """
+
+        details = (
+            ("user01", "data1.ics", "Team Lunch",),
+            ("user01", "data2.ics", "Dinner",),
+            ("user02", "data1.ics", "Breakfast",),
+        )
+        for user, name, summary in details:
+            calendar = yield self.calendarUnderTest(name="calendar_1", home=user)
+            yield calendar.createCalendarObjectWithName(name, Component.fromString(self.data % {"uid": user + name, "summary": summary}))
+        yield self.commit()
+
+        expected = {}
+        for user, name, summary in details:
+            expected[(user, name,)] = yield self._propertyRows(user, name)
+            self.assertTrue(("SUMMARY", summary.lower(),) in expected[(user, name,)])
+            self.assertTrue(("VALARM", None,) in expected[(user, name,)])
+
+        # Remove the index and force data version to previous
+        yield Delete(
+            From=schema.CALENDAR_OBJECT_PROPERTY,
+            Where=None,
+        ).on(self.transactionUnderTest())
+        for user in ("user01", "user02",):
+            home = (yield self.homeUnderTest(name=user))
+            ch = home._homeSchema
+            yield Update(
+                {ch.DATAVERSION: 6},
+                Where=ch.RESOURCE_ID == home._resourceID,
+            ).on(self.transactionUnderTest())
+        yield self.transactionUnderTest().setCalendarserverValue("CALENDAR-DATAVERSION", "6")
+        yield self.commit()
+
+        for user, name, _ignore_summary in details:
+            rows = yield self._propertyRows(user, name)
+            self.assertEqual(rows, [])
+
+        yield doUpgrade(self._sqlCalendarStore)
+
+        for user, name, _ignore_summary in details:
+            rows = yield self._propertyRows(user, name)
+            self.assertEqual(rows, expected[(user, name,)])
+
+        for user in ("user01", "user02",):
+            home = (yield self.homeUnderTest(name=user))
+            version = (yield home.dataVersion())
+            self.assertEqual(version, 7)
+
+        version = yield self.transactionUnderTest().calendarserverValue("CALENDAR-DATAVERSION")
+        self.assertEqual(int(version), 7)
@@ -26,7 +26,9 @@ from twext.who.idirectory import RecordType, IDirectoryService
 import twext.who.idirectory
 from twext.who.util import ConstantsContainer
 from twisted.internet import reactor
-from twisted.internet.defer import inlineCallbacks, returnValue, succeed
+from twisted.internet.defer import (
+    Deferred, inlineCallbacks, returnValue, succeed, fail, gatherResults
+)
 from twisted.internet.error import ConnectError
 from twisted.internet.protocol import ClientCreator
 from twisted.protocols import amp
@@ -45,7 +47,9 @@ from txdav.dps.commands import (
     StatsCommand, ExternalDelegatesCommand, ExpandedMemberUIDsCommand,
     AddMembersCommand, RemoveMembersCommand,
     UpdateRecordsCommand, ExpandedMembersCommand, FlushCommand,
-    SetAutoScheduleModeCommand, ContainsUIDsCommand
+    SetAutoScheduleModeCommand, ContainsUIDsCommand,
+    RecordsWithUIDsCommand, RecordsForCalendarUserAddressesCommand,
+    GroupChangeTokenCommand
 )
 from txdav.who.delegates import RecordType as DelegatesRecordType
 from txdav.who.directory import (
@@ -59,6 +63,141 @@ from zope.interface import implementer
 
 log = Logger()
 
+
+class DirectoryProxyClientProtocol(amp.AMP):
+    """
+    Client side AMP protocol that tells its connection pool when the
+    connection is lost.
+    """
+
+    pool = None
+
+    def connectionLost(self, reason):
+        amp.AMP.connectionLost(self, reason)
+        if self.pool is not None:
+            self.pool.connectionLost(self)
+
+
+class DirectoryProxyConnectionPool(object):
+    """
+    A pool of AMP connections to the directory proxy. Requests are sent on the
+    connected protocol with the fewest outstanding requests, so that a slow
+    request (e.g. a large search) does not hold up everything queued behind
+    it. New connections are made, up to the pool size, only when all the
+    existing ones are busy. After a failed connection attempt, further
+    attempts are delayed with an exponential backoff so that workers do not
+    hammer a proxy that is down or restarting.
+    """
+
+    def __init__(self, connector, size, backoff, maxBackoff, clock=reactor):
+        """
+        @param connector: a callable returning a L{Deferred} that fires with a
+            connected L{DirectoryProxyClientProtocol}
+        @type connector: callable
+        @param size: maximum number of connections
+        @type size: C{int}
+        @param backoff: initial reconnect delay in seconds
+        @type backoff: C{float}
+        @param maxBackoff: maximum reconnect delay in seconds
+        @type maxBackoff: C{float}
+        """
+        self._connector = connector
+        self._size = max(size, 1)
+        self._backoff = backoff
+        self._maxBackoff = maxBackoff
+        self._clock = clock
+
+        # Map of connected protocol to number of outstanding requests
+        self._outstanding = {}
+        self._connecting = False
+        self._waiters = []
+        self._failures = 0
+        self._retryAt = 0
+
+    def connectionCount(self):
+        return len(self._outstanding)
+
+    def acquire(self):
+        """
+        Get a connection to send a request on.
+
+        @return: a L{Deferred} that fires with the protocol
+        """
+        best = None
+        if self._outstanding:
+            best = min(self._outstanding, key=self._outstanding.get)
+            if self._outstanding[best] == 0 or len(self._outstanding) >= self._size:
+                return succeed(best)
+
+        if not self._connecting and self._clock.seconds() < self._retryAt:
+            if best is not None:
+                return succeed(best)
+            return fail(ConnectError("Directory proxy reconnect delayed after failure"))
+
+        if not self._connecting:
+            self._connect()
+
+        if best is not None:
+            # Don't wait for the extra connection - it will be used by later
+            # requests
+            return succeed(best)
+
+        d = Deferred()
+        self._waiters.append(d)
+        return d
+
+    def _connect(self):
+        log.debug("Creating connection")
+        self._connecting = True
+
+        def _connected(protocol):
+            self._connecting = False
+            self._failures = 0
+            protocol.pool = self
+            self._outstanding[protocol] = 0
+            waiters, self._waiters = self._waiters, []
+            for waiter in waiters:
+                waiter.callback(protocol)
+
+        def _failed(f):
+            self._connecting = False
+            self._failures += 1
+            delay = min(
+                self._backoff * (2 ** (self._failures - 1)),
+                self._maxBackoff
+            )
+            self._retryAt = self._clock.seconds() + delay
+            log.error(
+                "Failed to connect to directory proxy, retrying in {delay}s: {f}",
+                delay=delay, f=f.getErrorMessage()
+            )
+            waiters, self._waiters = self._waiters, []
+            for waiter in waiters:
+                waiter.errback(f)
+
+        self._connector().addCallbacks(_connected, _failed)
+
+    def requestStarted(self, protocol):
+        if protocol in self._outstanding:
+            self._outstanding[protocol] += 1
+
+    def requestFinished(self, protocol):
+        if protocol in self._outstanding:
+            self._outstanding[protocol] -= 1
+
+    def connectionLost(self, protocol):
+        self._outstanding.pop(protocol, None)
+
+    def discard(self, protocol):
+        """
+        Stop using a connection that a request failed on.
+        """
+        if self._outstanding.pop(protocol, None) is not None:
+            protocol.pool = None
+            if protocol.transport is not None:
+                protocol.transport.loseConnection()
+
+
 #
 # Client implementation of Directory Proxy Service
 #
@@ -151,38 +290,100 @@ class DirectoryService(BaseDirectoryService, CalendarDirectoryServiceMixin):
                 results.append(record)
         return results
 
-    @inlineCallbacks
-    def _getConnection(self):
+    # Upper bounds (in ms) of the buckets of the per-command latency histograms
+    latencyBuckets = (1, 5, 10, 50, 100, 500, 1000, 5000,)
+
+    def _connectionPool(self):
+        """
+        Get the pool of connections to the directory proxy, creating it on
+        first use.
 
-        from twistedcaldav.config import config
-        path = config.DirectoryProxy.SocketPath
-        if getattr(self, "_connection", None) is None:
-            log.debug("Creating connection")
-            connection = (
-                yield ClientCreator(reactor, amp.AMP).connectUNIX(path)
+        @rtype: L{DirectoryProxyConnectionPool}
+        """
+        if getattr(self, "_pool", None) is None:
+            from twistedcaldav.config import config
+            path = config.DirectoryProxy.SocketPath
+            self._pool = DirectoryProxyConnectionPool(
+                lambda: ClientCreator(
+                    reactor, DirectoryProxyClientProtocol
+                ).connectUNIX(path),
+                config.DirectoryProxy.ClientConnections,
+                config.DirectoryProxy.ClientReconnectSeconds,
+                config.DirectoryProxy.ClientMaxReconnectSeconds,
             )
-            self._connection = connection
-        returnValue(self._connection)
+        return self._pool
+
+    def _getConnection(self):
+        return self._connectionPool().acquire()
 
     @inlineCallbacks
-    def _sendCommand(self, command, **kwds):
+    def _sendCommand(self, command, ampProto=None, **kwds):
         """
-        Execute a remote AMP command, first making the connection to the peer.
+        Execute a remote AMP command, first getting a connection to the peer.
         Any kwds are passed on to the AMP command.
 
         @param command: the AMP command to call
         @type command: L{twisted.protocols.amp.Command}
+        @param ampProto: the connection to use, or L{None} to use any
+        @type ampProto: L{twisted.protocols.amp.AMP}
         """
-        ampProto = (yield self._getConnection())
+        if ampProto is None:
+            ampProto = (yield self._getConnection())
+        pool = getattr(self, "_pool", None)
+        if pool is not None:
+            pool.requestStarted(ampProto)
+        startTime = time.time()
         try:
             results = (yield ampProto.callRemote(command, **kwds))
         except Exception, e:
             log.error("Failed AMP command", error=e)
-            #  FIXME: is there a way to hook into ConnectionLost?
-            self._connection = None
+            # A remote error means the connection itself is fine
+            if pool is not None and not isinstance(e, amp.RemoteAmpError):
+                pool.discard(ampProto)
             raise
+        finally:
+            if pool is not None:
+                pool.requestFinished(ampProto)
+        self._recordLatency(command, time.time() - startTime)
         returnValue(results)
 
+    def _recordLatency(self, command, duration):
+        """
+        Add a request duration to the latency histogram of the command.
+
+        @param command: the AMP command
+        @type command: L{twisted.protocols.amp.Command}
+        @param duration: the request duration in seconds
+        @type duration: C{float}
+        """
+        if getattr(self, "_latency", None) is None:
+            self._latency = {}
+        histogram = self._latency.setdefault(
+            command.__name__, [0] * (len(self.latencyBuckets) + 1)
+        )
+        duration *= 1000.0
+        for ctr, limit in enumerate(self.latencyBuckets):
+            if duration < limit:
+                histogram[ctr] += 1
+                break
+        else:
+            histogram[-1] += 1
+
+    def latencyStats(self):
+        """
+        Get the per-command latency histograms.
+
+        @return: a C{dict} whose keys are command names and values are C{dict}s
+            of bucket name to count
+        @rtype: C{dict}
+        """
+        labels = ["<{}ms".format(limit) for limit in self.latencyBuckets]
+        labels.append(">={}ms".format(self.latencyBuckets[-1]))
+        return dict([
+            (name, dict(zip(labels, histogram)))
+            for name, histogram in getattr(self, "_latency", {}).items()
+        ])
+
     def _logResultTiming(self, command, startTime, results):
         duration = time.time() - startTime
         numResults = 0
@@ -211,23 +412,39 @@ class DirectoryService(BaseDirectoryService, CalendarDirectoryServiceMixin):
         @type postProcess: callable
         """
         startTime = time.time()
-        results = yield self._sendCommand(command, **kwds)
+        ampProto = yield self._getConnection()
+        results = yield self._sendCommand(command, ampProto=ampProto, **kwds)
         if results.get("continuation", None) is None:
             # We have all the results
             self._logResultTiming(command, startTime, results)
             returnValue(postProcess(results))
 
-        # There are more results to fetch, so loop until the continuation
-        # keyword we get back is None
+        # There are more results to fetch. The continuations are held by the
+        # connection the command was sent on, so they have to be fetched
+        # over that same connection.
 
         multi = [results]
 
-        while results.get("continuation", None) is not None:
-            results = yield self._sendCommand(
-                ContinuationCommand,
-                continuation=results["continuation"]
-            )
-            multi.append(results)
+        if results.get("continuations"):
+            # The server told us about all the remaining pages, so request
+            # them all at once
+            pages = yield gatherResults([
+                self._sendCommand(
+                    ContinuationCommand,
+                    ampProto=ampProto,
+                    continuation=token
+                ) for token in results["continuations"]
+            ])
+            multi.extend(pages)
+        else:
+            # Loop until the continuation keyword we get back is None
+            while results.get("continuation", None) is not None:
+                results = yield self._sendCommand(
+                    ContinuationCommand,
+                    ampProto=ampProto,
+                    continuation=results["continuation"]
+                )
+                multi.append(results)
 
         results = {"items": []}
         for result in multi:
@@ -324,6 +541,97 @@ class DirectoryService(BaseDirectoryService, CalendarDirectoryServiceMixin):
             **kwds
         )
 
+    def _processKeyedRecords(self, result):
+        """
+        Takes a dictionary with a "items" key whose value is an iterable
+        of pickled (key, record fields) tuples, and returns a dictionary of
+        key to record (or L{None}).
+        """
+        results = {}
+        for item in result["items"]:
+            key, serializedFields = pickle.loads(item)
+            results[key] = self._dictToRecord(serializedFields)
+        return results
+
+    # Bulk lookup keys are sent in a single AMP value, so large requests have
+    # to be split up to fit within the AMP size limit
+    _maxBulkKeysSize = 50000
+
+    @inlineCallbacks
+    def _bulkCall(self, command, argument, keys, timeoutSeconds=None):
+        """
+        Send a bulk lookup command, splitting the keys over several concurrent
+        requests if needed.
+
+        @param command: the AMP command to call
+        @type command: L{twisted.protocols.amp.Command}
+        @param argument: name of the command argument holding the keys
+        @type argument: C{str}
+        @param keys: the keys to look up
+        @type keys: C{list} of C{str}
+
+        @return: a C{dict} of key to record (or L{None})
+        @rtype: L{Deferred} firing C{dict}
+        """
+        chunks = []
+        chunk = []
+        size = 0
+        for key in keys:
+            if chunk and size + len(key) > self._maxBulkKeysSize:
+                chunks.append(chunk)
+                chunk = []
+                size = 0
+            chunk.append(key)
+            size += len(key) + 2
+        if chunk:
+            chunks.append(chunk)
+
+        kwds = {}
+        if timeoutSeconds is not None:
+            kwds["timeoutSeconds"] = timeoutSeconds
+
+        results = {}
+        for result in (yield gatherResults([
+            self._call(
+                command, self._processKeyedRecords,
+                **dict(kwds, **{argument: keysChunk})
+            ) for keysChunk in chunks
+        ])):
+            results.update(result)
+        returnValue(results)
+
+    @inlineCallbacks
+    def recordsWithUIDs(self, uids, timeoutSeconds=None):
+        uids = set(uids)
+        records = yield self._bulkCall(
+            RecordsWithUIDsCommand,
+            "uids",
+            [uid.encode("utf-8") for uid in uids],
+            timeoutSeconds=timeoutSeconds
+        )
+        results = dict([(uid, None,) for uid in uids])
+        results.update(records)
+        returnValue(results)
+
+    @inlineCallbacks
+    def recordsForCalendarUserAddresses(self, addresses, timeoutSeconds=None):
+        encoded = dict([
+            (
+                address.encode("utf-8") if isinstance(address, unicode) else address,
+                address,
+            ) for address in addresses
+        ])
+        records = yield self._bulkCall(
+            RecordsForCalendarUserAddressesCommand,
+            "addresses",
+            encoded.keys(),
+            timeoutSeconds=timeoutSeconds
+        )
+        results = dict([(address, None,) for address in encoded.values()])
+        for address, record in records.items():
+            results[encoded[address]] = record
+        returnValue(results)
+
     def recordsMatchingTokens(
         self, tokens, context=None, limitResults=None, timeoutSeconds=None
     ):
@@ -385,6 +693,14 @@ class DirectoryService(BaseDirectoryService, CalendarDirectoryServiceMixin):
             self._processMultipleRecords
         )
 
+    @inlineCallbacks
+    def groupChangeToken(self):
+        try:
+            result = yield self._sendCommand(GroupChangeTokenCommand)
+            returnValue(result.get("token"))
+        except ConnectError:
+            returnValue(None)
+
     def recordsFromExpression(self, expression, recordTypes=None):
         raise NotImplementedError(
             "This won't work until expressions are serializable to send "
@@ -422,7 +738,9 @@ class DirectoryService(BaseDirectoryService, CalendarDirectoryServiceMixin):
     def stats(self):
         try:
             result = yield self._sendCommand(StatsCommand)
-            returnValue(pickle.loads(result['stats']))
+            stats = pickle.loads(result['stats'])
+            stats["dps-client-latency"] = self.latencyStats()
+            returnValue(stats)
         except ConnectError:
             returnValue({})
 
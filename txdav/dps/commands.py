@@ -57,6 +57,7 @@ class RecordsWithRecordTypeCommand(amp.Command):
     response = [
         ('items', amp.ListOf(amp.String())),
         ('continuation', amp.String(optional=True)),
+        ('continuations', amp.ListOf(amp.String(), optional=True)),
     ]
 
 
@@ -69,6 +70,31 @@ class RecordsWithEmailAddressCommand(amp.Command):
     response = [
         ('items', amp.ListOf(amp.String())),
         ('continuation', amp.String(optional=True)),
+        ('continuations', amp.ListOf(amp.String(), optional=True)),
+    ]
+
+
+class RecordsWithUIDsCommand(amp.Command):
+    arguments = [
+        ('uids', amp.ListOf(amp.String())),
+        ('timeoutSeconds', amp.Integer(optional=True)),
+    ]
+    response = [
+        ('items', amp.ListOf(amp.String())),
+        ('continuation', amp.String(optional=True)),
+        ('continuations', amp.ListOf(amp.String(), optional=True)),
+    ]
+
+
+class RecordsForCalendarUserAddressesCommand(amp.Command):
+    arguments = [
+        ('addresses', amp.ListOf(amp.String())),
+        ('timeoutSeconds', amp.Integer(optional=True)),
+    ]
+    response = [
+        ('items', amp.ListOf(amp.String())),
+        ('continuation', amp.String(optional=True)),
+        ('continuations', amp.ListOf(amp.String(), optional=True)),
     ]
 
 
@@ -92,6 +118,7 @@ class RecordsMatchingTokensCommand(amp.Command):
     response = [
         ('items', amp.ListOf(amp.String())),
         ('continuation', amp.String(optional=True)),
+        ('continuations', amp.ListOf(amp.String(), optional=True)),
     ]
 
 
@@ -106,6 +133,7 @@ class RecordsMatchingFieldsCommand(amp.Command):
     response = [
         ('items', amp.ListOf(amp.String())),
         ('continuation', amp.String(optional=True)),
+        ('continuations', amp.ListOf(amp.String(), optional=True)),
     ]
 
 
@@ -135,6 +163,7 @@ class MembersCommand(amp.Command):
     response = [
         ('items', amp.ListOf(amp.String())),
         ('continuation', amp.String(optional=True)),
+        ('continuations', amp.ListOf(amp.String(), optional=True)),
     ]
 
 
@@ -145,6 +174,7 @@ class ExpandedMembersCommand(amp.Command):
     response = [
         ('items', amp.ListOf(amp.String())),
         ('continuation', amp.String(optional=True)),
+        ('continuations', amp.ListOf(amp.String(), optional=True)),
     ]
 
 
@@ -155,6 +185,7 @@ class GroupsCommand(amp.Command):
     response = [
         ('items', amp.ListOf(amp.String())),
         ('continuation', amp.String(optional=True)),
+        ('continuations', amp.ListOf(amp.String(), optional=True)),
     ]
 
 
@@ -195,6 +226,7 @@ class ExpandedMemberUIDsCommand(amp.Command):
     response = [
         ('items', amp.ListOf(amp.String())),
         ('continuation', amp.String(optional=True)),
+        ('continuations', amp.ListOf(amp.String(), optional=True)),
     ]
 
 
@@ -252,6 +284,7 @@ class ExternalDelegatesCommand(amp.Command):
     response = [
         ('items', amp.ListOf(amp.String())),
         ('continuation', amp.String(optional=True)),
+        ('continuations', amp.ListOf(amp.String(), optional=True)),
     ]
 
 
@@ -265,6 +298,13 @@ class SetAutoScheduleModeCommand(amp.Command):
     ]
 
 
+class GroupChangeTokenCommand(amp.Command):
+    arguments = []
+    response = [
+        ('token', amp.String(optional=True)),
+    ]
+
+
 class FlushCommand(amp.Command):
     arguments = []
     response = [
@@ -46,6 +46,8 @@ from txdav.dps.commands import (
     ExternalDelegatesCommand, StatsCommand, ExpandedMemberUIDsCommand,
     ContainsUIDsCommand, AddMembersCommand, RemoveMembersCommand,
     UpdateRecordsCommand, FlushCommand, SetAutoScheduleModeCommand,
+    RecordsWithUIDsCommand, RecordsForCalendarUserAddressesCommand,
+    GroupChangeTokenCommand,
     # RemoveRecordsCommand,
 )
 from txdav.who.idirectory import AutoScheduleMode
@@ -90,8 +92,9 @@ class DirectoryProxyAMPProtocol(amp.AMP):
         give back to the client so they can later retrieve these remaining
         results that did not fit in the previous AMP response.
 
-        @param things: an iterable
-        @param kind: "items" or "records"
+        @param things: a C{tuple} of the C{list} of items in a page and the
+            token of the next page (or C{None} for the last page)
+        @param kind: "page"
         @return: a C{str} token
         """
         token = str(uuid.uuid4())
@@ -123,91 +126,130 @@ class DirectoryProxyAMPProtocol(amp.AMP):
         not fit into an earlier response.
 
         @param continuation: the token returned via the "continuation" key
-            in the previous response.
+            (or one of the tokens in the "continuations" key) in an earlier
+            response.
         """
         log.debug("Continuation: {c}", c=continuation)
         things, kind = self._retrieveContinuation(continuation)
-        if kind == "records":
-            response = self._recordsToResponse(things)
-        elif kind == "items":
-            response = self._itemsToResponse(things)
+        if kind == "page":
+            items, nextToken = things
+            response = {"items": items}
+            if nextToken is not None:
+                response["continuation"] = nextToken
         else:
             response = {}
         # log.debug("Responding with: {response}", response=response)
         return response
 
-    def _recordsToResponse(self, records):
+    def _paginate(self, things, encode):
         """
-        Craft an AMP response containing as many records as will fit within
-        the size limit.  Remaining records are stored as a "continuation",
-        identified by a token that is returned to the client to fetch later
-        via the ContinuationCommand.
+        Split an iterable into pages of encoded items, each of which fits
+        within the size limit.
 
-        @param records: an iterable of records
-        @return: the response dictionary, with a list of pickled records
-            stored in the "items" key, and if there are leftover
-            records that did not fit, there will be a "continuation" key
-            containing the token the client must send via ContinuationCommand.
+        @param things: an iterable (list or set)
+        @param encode: a callable that turns one thing into a C{str}
+        @return: a C{list} of pages, each a C{list} of C{str}. There is
+            always at least one (possibly empty) page.
         """
-        fieldsList = []
-        count = 0
-        if records:
-            size = 0
-            while size < self._maxSize:
+        pages = []
+        page = []
+        size = 0
+        if things:
+            while True:
                 try:
-                    record = records.pop()
+                    thing = things.pop()
                 except (KeyError, IndexError):
                     # We're done.
-                    # Note: because records is an iterable (list or set)
+                    # Note: because things is an iterable (list or set)
                     # we're catching both KeyError and IndexError.
                     break
-                pickled = pickle.dumps(self.recordToDict(record))
-                size = size + len(pickled)
-                fieldsList.append(pickled)
-                count += 1
+                data = encode(thing)
+                size = size + len(data)
+                page.append(data)
+                if size >= self._maxSize:
+                    pages.append(page)
+                    page = []
+                    size = 0
+        if page or not pages:
+            pages.append(page)
+        return pages
+
+    def _pagesToResponse(self, pages):
+        """
+        Craft an AMP response from the first page of results. Each remaining
+        page is stored as a "continuation", identified by a token the client
+        sends via the ContinuationCommand to fetch it. Each stored page links
+        to the next one, so a client can walk the pages one at a time using
+        the "continuation" key, or fetch them all at once using the tokens in
+        the "continuations" key.
+
+        @param pages: a C{list} of pages as returned by L{_paginate}
+        @return: the response dictionary
+        """
+        response = {"items": pages[0]}
+
+        if len(pages) > 1:
+            # Store the pages last to first so each one can link to the next
+            tokens = []
+            nextToken = None
+            for page in reversed(pages[1:]):
+                nextToken = self._storeContinuation((page, nextToken), "page")
+                tokens.insert(0, nextToken)
+            response["continuation"] = tokens[0]
+            response["continuations"] = tokens
 
-        response = {"items": fieldsList}
+        return response
 
-        if records:
-            response["continuation"] = self._storeContinuation(records, "records")
+    def _recordsToResponse(self, records):
+        """
+        Craft an AMP response containing as many records as will fit within
+        the size limit.  Remaining records are stored as continuations,
+        identified by tokens that are returned to the client to fetch later
+        via the ContinuationCommand.
 
-        return response
+        @param records: an iterable of records
+        @return: the response dictionary, with a list of pickled records
+            stored in the "items" key, and if there are leftover
+            records that did not fit, there will be a "continuation" key
+            containing the token the client must send via ContinuationCommand,
+            and a "continuations" key listing the tokens of all the remaining
+            pages.
+        """
+        return self._pagesToResponse(self._paginate(
+            records,
+            lambda record: pickle.dumps(self.recordToDict(record))
+        ))
 
     def _itemsToResponse(self, items):
         """
         Craft an AMP response containing as many items as will fit within
-        the size limit.  Remaining items are stored as a "continuation",
-        identified by a token that is returned to the client to fetch later
+        the size limit.  Remaining items are stored as continuations,
+        identified by tokens that are returned to the client to fetch later
         via the ContinuationCommand.
 
         @param records: an iterable
         @return: the response dictionary, with a list of items
             stored in the "items" key, and if there are leftover
             items that did not fit, there will be a "continuation" key
-            containing the token the client must send via ContinuationCommand.
+            containing the token the client must send via ContinuationCommand,
+            and a "continuations" key listing the tokens of all the remaining
+            pages.
         """
-        itemsToSend = []
-        count = 0
-        if items:
-            size = 0
-            while size < self._maxSize:
-                try:
-                    item = items.pop()
-                except (KeyError, IndexError):
-                    # We're done.
-                    # Note: because records is an iterable (list or set)
-                    # we're catching both KeyError and IndexError.
-                    break
-                size = size + len(item)
-                itemsToSend.append(item)
-                count += 1
-
-        response = {"items": itemsToSend}
+        return self._pagesToResponse(self._paginate(items, lambda item: item))
 
-        if items:
-            response["continuation"] = self._storeContinuation(items, "items")
+    def _keyedRecordsToResponse(self, records):
+        """
+        Craft an AMP response for a bulk lookup. Each item is a pickled
+        C{tuple} of the lookup key and the fields of the record found (an
+        empty C{dict} if there was no record).
 
-        return response
+        @param records: a C{dict} of lookup key to record or L{None}
+        @return: the response dictionary
+        """
+        return self._itemsToResponse([
+            pickle.dumps((key, self.recordToDict(record),))
+            for key, record in records.items()
+        ])
 
     def recordToDict(self, record):
         """
@@ -315,6 +357,31 @@ class DirectoryProxyAMPProtocol(amp.AMP):
         # log.debug("Responding with: {response}", response=response)
         returnValue(response)
 
+    @RecordsWithUIDsCommand.responder
+    @inlineCallbacks
+    def recordsWithUIDs(self, uids, timeoutSeconds=None):
+        uids = [uid.decode("utf-8") for uid in uids]
+        log.debug("RecordsWithUIDs: {n} uids", n=len(uids))
+        records = (yield self._directory.recordsWithUIDs(
+            uids, timeoutSeconds=timeoutSeconds
+        ))
+        response = self._keyedRecordsToResponse(records)
+        # log.debug("Responding with: {response}", response=response)
+        returnValue(response)
+
+    @RecordsForCalendarUserAddressesCommand.responder
+    @inlineCallbacks
+    def recordsForCalendarUserAddresses(self, addresses, timeoutSeconds=None):
+        log.debug(
+            "RecordsForCalendarUserAddresses: {n} addresses", n=len(addresses)
+        )
+        records = (yield self._directory.recordsForCalendarUserAddresses(
+            addresses, timeoutSeconds=timeoutSeconds
+        ))
+        response = self._keyedRecordsToResponse(records)
+        # log.debug("Responding with: {response}", response=response)
+        returnValue(response)
+
     @RecordsMatchingTokensCommand.responder
     @inlineCallbacks
     def recordsMatchingTokens(
@@ -663,6 +730,16 @@ class DirectoryProxyAMPProtocol(amp.AMP):
         # log.debug("Responding with: {response}", response=response)
         returnValue(response)
 
+    @GroupChangeTokenCommand.responder
+    @inlineCallbacks
+    def groupChangeToken(self):
+        log.debug("GroupChangeToken")
+        token = yield self._directory.groupChangeToken()
+        response = {}
+        if token is not None:
+            response["token"] = token
+        returnValue(response)
+
     @FlushCommand.responder
     @inlineCallbacks
     def flush(self):
@@ -22,14 +22,19 @@ from twext.who.expression import (
 )
 from twext.who.idirectory import RecordType, FieldName
 from twisted.cred.credentials import calcResponse, calcHA1, calcHA2
-from twisted.internet.defer import inlineCallbacks, succeed
+from twisted.internet.defer import Deferred, inlineCallbacks, succeed
+from twisted.internet.error import ConnectError
+from twisted.internet.task import Clock
 from twisted.protocols.amp import AMP
 from twisted.python.filepath import FilePath
 from twisted.test.testutils import returnConnected
 from twisted.trial import unittest
 from twistedcaldav.config import config
 from twistedcaldav.test.util import StoreTestCase
-from txdav.dps.client import DirectoryService
+from txdav.dps.client import (
+    DirectoryService, DirectoryProxyConnectionPool,
+    DirectoryProxyClientProtocol
+)
 from txdav.dps.server import DirectoryProxyAMPProtocol
 from txdav.who.directory import CalendarDirectoryServiceMixin
 from txdav.who.groups import GroupCacher
@@ -114,6 +119,20 @@ class DPSClientSingleDirectoryTest(unittest.TestCase):
         record = (yield self.directory.recordWithUID(testUID))
         self.assertTrue(testShortName in record.shortNames)
 
+    @inlineCallbacks
+    def test_latencyStats(self):
+        """
+        Each request is counted in its command's latency histogram.
+        """
+        yield self.directory.recordWithUID(testUID)
+        yield self.directory.recordWithUID(testUID)
+        latency = self.directory.latencyStats()
+        self.assertEquals(sum(latency["RecordWithUIDCommand"].values()), 2)
+        self.assertEquals(
+            len(latency["RecordWithUIDCommand"]),
+            len(DirectoryService.latencyBuckets) + 1
+        )
+
     @inlineCallbacks
     def test_shortName(self):
         record = (yield self.directory.recordWithShortName(
@@ -145,6 +164,48 @@ class DPSClientSingleDirectoryTest(unittest.TestCase):
             self.assertEquals(len(records), 1)
             self.assertEquals(records[0].shortNames, [u"cdaboo"])
 
+    @inlineCallbacks
+    def test_recordsWithUIDs(self):
+        """
+        Several UIDs are looked up with a single request, and UIDs with no
+        record map to L{None}.
+        """
+        records = (yield self.directory.recordsWithUIDs(
+            [testUID, u"__no_such_uid__"]
+        ))
+        self.assertEquals(
+            set(records.keys()), set([testUID, u"__no_such_uid__"])
+        )
+        self.assertTrue(testShortName in records[testUID].shortNames)
+        self.assertEquals(records[u"__no_such_uid__"], None)
+        latency = self.directory.latencyStats()
+        self.assertEquals(sum(latency["RecordsWithUIDsCommand"].values()), 1)
+        self.assertTrue("RecordWithUIDCommand" not in latency)
+
+    @inlineCallbacks
+    def test_recordsForCalendarUserAddresses(self):
+        """
+        Several calendar user addresses are looked up with a single request.
+        """
+        if testMode == "xml":
+            addresses = [
+                u"urn:x-uid:{}".format(testUID),
+                u"mailto:cdaboo@bitbucket.calendarserver.org",
+                u"mailto:nobody@example.com",
+            ]
+            records = (yield self.directory.recordsForCalendarUserAddresses(
+                addresses
+            ))
+            self.assertEquals(set(records.keys()), set(addresses))
+            self.assertEquals(records[addresses[0]].uid, testUID)
+            self.assertEquals(records[addresses[1]].shortNames, [u"cdaboo"])
+            self.assertEquals(records[addresses[2]], None)
+            latency = self.directory.latencyStats()
+            self.assertEquals(
+                sum(latency["RecordsForCalendarUserAddressesCommand"].values()),
+                1
+            )
+
     @inlineCallbacks
     def test_recordsMatchingTokens(self):
         records = (yield self.directory.recordsMatchingTokens(
@@ -863,3 +924,117 @@ class DPSClientLargeResultsTest(unittest.TestCase):
         # expandedMemberUIDs
         memberUIDs = yield group.expandedMemberUIDs()
         self.assertEquals(len(memberUIDs), self.numUsers)
+
+    @inlineCallbacks
+    def test_continuationsPrefetched(self):
+        """
+        The server pre-splits a large result into linked pages and lists all
+        their tokens, and the client fetches all of them.
+        """
+        self.server._maxSize = 500
+        response = self.server._itemsToResponse(
+            ["item{:05d}".format(i) for i in xrange(1000)]
+        )
+        self.assertTrue(len(response["continuations"]) > 1)
+        self.assertEquals(response["continuation"], response["continuations"][0])
+        self.assertEquals(
+            len(self.server._continuations), len(response["continuations"])
+        )
+        self.server._continuations.clear()
+
+        records = yield self.directory.recordsWithRecordType(RecordType.user)
+        self.assertEquals(len(records), self.numUsers)
+        self.assertEquals(len(self.server._continuations), 0)
+
+    @inlineCallbacks
+    def test_continuationsSerial(self):
+        """
+        A server that only returns the next continuation token is walked one
+        page at a time.
+        """
+        self.server._maxSize = 500
+        origResponse = self.server._pagesToResponse
+
+        def _pagesToResponse(pages):
+            response = origResponse(pages)
+            response.pop("continuations", None)
+            return response
+
+        self.patch(self.server, "_pagesToResponse", _pagesToResponse)
+
+        records = yield self.directory.recordsWithRecordType(RecordType.user)
+        self.assertEquals(len(records), self.numUsers)
+        self.assertEquals(len(self.server._continuations), 0)
+
+
+class DirectoryProxyConnectionPoolTest(unittest.TestCase):
+    """
+    Tests for L{DirectoryProxyConnectionPool}.
+    """
+
+    def setUp(self):
+        self.clock = Clock()
+        self.connects = []
+        self.pool = DirectoryProxyConnectionPool(
+            self._connect, 2, 1, 4, clock=self.clock
+        )
+
+    def _connect(self):
+        d = Deferred()
+        self.connects.append(d)
+        return d
+
+    def test_growWhenBusy(self):
+        """
+        A new connection is only made when all the existing ones are busy, and
+        requests go to the least busy connection.
+        """
+        d1 = self.pool.acquire()
+        self.assertEquals(len(self.connects), 1)
+        proto1 = DirectoryProxyClientProtocol()
+        self.connects[0].callback(proto1)
+        self.assertIdentical(self.successResultOf(d1), proto1)
+
+        # Idle connection is re-used
+        self.assertIdentical(self.successResultOf(self.pool.acquire()), proto1)
+        self.assertEquals(len(self.connects), 1)
+
+        # Busy connection is still used, but another one is started
+        self.pool.requestStarted(proto1)
+        self.assertIdentical(self.successResultOf(self.pool.acquire()), proto1)
+        self.assertEquals(len(self.connects), 2)
+        proto2 = DirectoryProxyClientProtocol()
+        self.connects[1].callback(proto2)
+        self.assertIdentical(self.successResultOf(self.pool.acquire()), proto2)
+
+        # Pool is full
+        self.pool.requestStarted(proto2)
+        self.pool.requestStarted(proto2)
+        self.assertIdentical(self.successResultOf(self.pool.acquire()), proto1)
+        self.assertEquals(len(self.connects), 2)
+
+        # Lost connection is removed
+        self.pool.connectionLost(proto1)
+        self.assertEquals(self.pool.connectionCount(), 1)
+        self.assertIdentical(self.successResultOf(self.pool.acquire()), proto2)
+
+    def test_reconnectBackoff(self):
+        """
+        After a failed connection attempt, no new attempt is made until the
+        backoff delay has passed, and the delay doubles up to the maximum.
+        """
+        for delay in (1, 2, 4, 4):
+            d = self.pool.acquire()
+            self.connects[-1].errback(ConnectError("refused"))
+            self.failureResultOf(d, ConnectError)
+            attempts = len(self.connects)
+
+            self.clock.advance(delay - 0.5)
+            self.failureResultOf(self.pool.acquire(), ConnectError)
+            self.assertEquals(len(self.connects), attempts)
+            self.clock.advance(0.5)
+
+        d = self.pool.acquire()
+        proto = DirectoryProxyClientProtocol()
+        self.connects[-1].callback(proto)
+        self.assertIdentical(self.successResultOf(d), proto)
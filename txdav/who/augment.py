@@ -141,6 +141,25 @@ class AugmentedDirectoryService(
         # Defer to the directory service we're augmenting
         return self._directory.recordTypes()
 
+    @inlineCallbacks
+    def groupChangeToken(self):
+        """
+        Combine the change tokens of the aggregated services holding users or
+        groups. If any of them cannot provide a token, neither can we.
+        """
+        services = getattr(self._directory, "services", (self._directory,))
+        tokens = []
+        for service in services:
+            if not set(service.recordTypes()) & set((RecordType.user, RecordType.group)):
+                continue
+            if not hasattr(service, "groupChangeToken"):
+                returnValue(None)
+            token = yield service.groupChangeToken()
+            if token is None:
+                returnValue(None)
+            tokens.append(token)
+        returnValue("|".join(tokens))
+
     @inlineCallbacks
     def recordsFromExpression(
         self, expression, recordTypes=None,
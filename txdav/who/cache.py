@@ -236,6 +236,32 @@ class DirectoryMemcacher(object):
                 raise DirectoryMemcacheError("Failed to read from memcache")
         return value
 
+    def memcacheGetMany(self, keys):
+        """
+        Try to get several values from memcache in one request.
+
+        @param keys: the memcache keys to use
+        @type keys: L{list} of L{str}
+
+        @return: the values found, keys with no value are not present
+        @rtype: L{dict} of L{str} to L{str}
+
+        @raise: L{DirectoryMemcacheError} if failure to read from memcache
+        """
+
+        encoded = dict([(base64.b64encode(key), key) for key in keys])
+        try:
+            values = self._getMemcacheClient().get_multi(encoded.keys())
+        except MemcacheError:
+            log.error("Could not read from memcache, retrying")
+            try:
+                values = self._getMemcacheClient(refresh=True).get_multi(encoded.keys())
+            except MemcacheError:
+                log.error("Could not read from memcache again, giving up")
+                del self.memcacheClient
+                raise DirectoryMemcacheError("Failed to read from memcache")
+        return dict([(encoded[key], value) for key, value in values.items()])
+
     def generateMemcacheKey(self, indexType, indexKey):
         """
         Return a key that can be used to store/retrieve a record in memcache.
@@ -593,10 +619,17 @@ class CachingDirectoryService(
 
             log.debug("Memcache: checking %s" % (memcachekey,))
 
+            # Fetch the record and the negative cache entry in one request
+            memcachekeys = [memcachekey]
+            if self.negativeCaching:
+                memcachekeys.append("-%s" % (memcachekey,))
             try:
-                record = self._memcacher.memcacheGetRecord(memcachekey)
+                values = self._memcacher.memcacheGetMany(memcachekeys)
+                pickled = values.get(memcachekey)
+                record = self._memcacher.unpickleRecord(pickled) if pickled is not None else None
             except DirectoryMemcacheError:
                 log.error("Memcache: failed to get %s" % (memcachekey,))
+                values = {}
                 record = None
 
             if record is None:
@@ -608,11 +641,7 @@ class CachingDirectoryService(
 
             # Check negative memcache
             if self.negativeCaching:
-                try:
-                    val = self._memcacher.memcacheGet("-%s" % (memcachekey,))
-                except DirectoryMemcacheError:
-                    log.error("Memcache: failed to get -%s" % (memcachekey,))
-                    val = None
+                val = values.get("-%s" % (memcachekey,))
                 if val == 1:
                     log.debug("Memcache: negative hit %s" % (memcachekey,))
                     self._negativeCache[indexType][key] = now
@@ -733,6 +762,105 @@ class CachingDirectoryService(
 
         returnValue(records)
 
+    # Names used for the cache timing stats of each kind of lookup
+    _lookupTimingNames = {
+        "uid": "recordWithUID",
+        "guid": "recordWithGUID",
+        "shortName": "recordWithShortName",
+        "emailAddress": "recordsWithEmailAddress",
+    }
+
+    def _cacheBulkResults(self, misses, found):
+        """
+        Cache the results of a bulk lookup sent to the directory proxy.
+
+        @param misses: map of the keys that were looked up to the cache
+            index type and key for each
+        @type misses: C{dict}
+        @param found: map of the keys that were looked up to the record (or
+            L{None}) returned
+        @type found: C{dict}
+        """
+        for lookupKey, (indexType, key) in misses.items():
+            record = found.get(lookupKey)
+            if record is not None:
+                # As above, only index on email address when the record was
+                # found by its email address.
+                indexTypes = (IndexType.uid, IndexType.guid, IndexType.shortName)
+                if indexType == IndexType.emailAddress:
+                    indexTypes += (IndexType.emailAddress,)
+                self.cacheRecord(record, indexTypes)
+            else:
+                self.negativeCacheRecord(indexType, key)
+
+    @inlineCallbacks
+    def recordsWithUIDs(self, uids, timeoutSeconds=None):
+
+        if not isinstance(self._directory, DPSClientDirectoryService):
+            # No bulk lookup to use - look each one up through the cache
+            records = yield CalendarDirectoryServiceMixin.recordsWithUIDs(
+                self, uids, timeoutSeconds=timeoutSeconds
+            )
+            returnValue(records)
+
+        # First check our cache, then look up all the misses in one go
+        results = {}
+        misses = {}
+        for uid in set(uids):
+            record, doQuery = self.lookupRecord(IndexType.uid, uid, "recordWithUID")
+            results[uid] = record
+            if record is None and doQuery:
+                misses[uid] = (IndexType.uid, uid,)
+
+        if misses:
+            found = yield self._directory.recordsWithUIDs(
+                misses.keys(), timeoutSeconds=timeoutSeconds
+            )
+            self._cacheBulkResults(misses, found)
+            for uid in misses:
+                results[uid] = found.get(uid)
+
+        returnValue(results)
+
+    @inlineCallbacks
+    def recordsForCalendarUserAddresses(self, addresses, timeoutSeconds=None):
+
+        if not isinstance(self._directory, DPSClientDirectoryService):
+            # No bulk lookup to use - look each one up through the cache
+            records = yield CalendarDirectoryServiceMixin.recordsForCalendarUserAddresses(
+                self, addresses, timeoutSeconds=timeoutSeconds
+            )
+            returnValue(records)
+
+        # First check our cache, then look up all the misses in one go
+        results = {}
+        misses = {}
+        for address in set(addresses):
+            lookup = self._parseCalendarUserAddress(address)
+            if lookup is None:
+                results[address] = None
+                continue
+            kind, key = lookup
+            if kind == "shortName":
+                key = (key[0].name, key[1],)
+            indexType = IndexType.lookupByValue(kind)
+            record, doQuery = self.lookupRecord(
+                indexType, key, self._lookupTimingNames[kind]
+            )
+            results[address] = record
+            if record is None and doQuery:
+                misses[address] = (indexType, key,)
+
+        if misses:
+            found = yield self._directory.recordsForCalendarUserAddresses(
+                misses.keys(), timeoutSeconds=timeoutSeconds
+            )
+            self._cacheBulkResults(misses, found)
+            for address in misses:
+                results[address] = found.get(address)
+
+        returnValue(results)
+
     # Uncached methods:
 
     @property
@@ -800,6 +928,9 @@ class CachingDirectoryService(
     def recordsWithDirectoryBasedDelegates(self):
         return self._directory.recordsWithDirectoryBasedDelegates()
 
+    def groupChangeToken(self):
+        return self._directory.groupChangeToken()
+
     def recordWithCalendarUserAddress(self, cua, timeoutSeconds=None):
         # This will get cached by the underlying recordWith... call
         return CalendarDirectoryServiceMixin.recordWithCalendarUserAddress(
@@ -818,3 +949,17 @@ class CachingDirectoryService(
 
     def stats(self):
         return self._directory.stats()
+
+
+def isCachingDirectory(directory):
+    """
+    Check whether records looked up from a directory service are kept in a
+    cache, so that it is worth looking records up in bulk ahead of the
+    individual lookups that follow.
+
+    @param directory: the directory service
+    @type directory: L{IDirectoryService}
+
+    @rtype: C{bool}
+    """
+    return isinstance(directory, CachingDirectoryService)
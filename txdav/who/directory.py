@@ -27,7 +27,7 @@ from twext.who.expression import (
 )
 from twext.who.idirectory import RecordType as BaseRecordType, FieldName as BaseFieldName
 from twisted.cred.credentials import UsernamePassword
-from twisted.internet.defer import inlineCallbacks, returnValue
+from twisted.internet.defer import inlineCallbacks, returnValue, gatherResults, succeed
 from twistedcaldav.config import config
 from twistedcaldav.ical import Property
 from txdav.caldav.datastore.scheduling.utils import normalizeCUAddr
@@ -70,12 +70,19 @@ class CalendarDirectoryServiceMixin(object):
         """
         self.principalCollection = principalCollection
 
-    @inlineCallbacks
-    def recordWithCalendarUserAddress(
-        self, address, timeoutSeconds=None
-    ):
+    def _parseCalendarUserAddress(self, address):
+        """
+        Work out which record lookup a calendar user address maps to.
+
+        @param address: the calendar user address
+        @type address: C{str}
+
+        @return: a C{tuple} of the kind of lookup ("uid", "guid",
+            "emailAddress" or "shortName") and the key to look up, or L{None}
+            if the address cannot refer to a record
+        @rtype: C{tuple}
+        """
         address = normalizeCUAddr(address)
-        record = None
 
         if config.Scheduling.Options.FakeResourceLocationEmail:
             if address.startswith("mailto:") and address.endswith("@do_not_reply"):
@@ -89,49 +96,167 @@ class CalendarDirectoryServiceMixin(object):
                         address = ""
 
         if address.startswith("urn:x-uid:"):
-            uid = address[10:]
-            record = yield self.recordWithUID(
-                uid, timeoutSeconds=timeoutSeconds
-            )
+            return ("uid", address[10:],)
 
         elif address.startswith("urn:uuid:"):
             try:
                 guid = uuid.UUID(address[9:])
             except ValueError:
                 log.info("Invalid GUID: {guid}", guid=address[9:])
-                returnValue(None)
-            record = yield self.recordWithGUID(
-                guid, timeoutSeconds=timeoutSeconds
-            )
+                return None
+            return ("guid", guid,)
 
         elif address.startswith("mailto:"):
-            records = yield self.recordsWithEmailAddress(
-                address[7:], limitResults=1, timeoutSeconds=timeoutSeconds
-            )
-            record = records[0] if records else None
+            return ("emailAddress", address[7:],)
 
         elif address.startswith("/principals/"):
             parts = address.split("/")
             if len(parts) == 4:
                 if parts[2] == "__uids__":
-                    uid = parts[3]
-                    record = yield self.recordWithUID(
-                        uid, timeoutSeconds=timeoutSeconds
-                    )
+                    return ("uid", parts[3],)
                 else:
                     recordType = self.oldNameToRecordType(parts[2])
-                    record = yield self.recordWithShortName(
-                        recordType, parts[3], timeoutSeconds=timeoutSeconds
-                    )
+                    return ("shortName", (recordType, parts[3],),)
+
+        return None
 
+    @inlineCallbacks
+    def _recordForLookup(self, lookup, timeoutSeconds=None):
+        """
+        Do a record lookup returned by L{_parseCalendarUserAddress}.
+        """
+        kind, key = lookup
+        record = None
+        if kind == "uid":
+            record = yield self.recordWithUID(
+                key, timeoutSeconds=timeoutSeconds
+            )
+        elif kind == "guid":
+            record = yield self.recordWithGUID(
+                key, timeoutSeconds=timeoutSeconds
+            )
+        elif kind == "emailAddress":
+            records = yield self.recordsWithEmailAddress(
+                key, limitResults=1, timeoutSeconds=timeoutSeconds
+            )
+            record = records[0] if records else None
+        elif kind == "shortName":
+            recordType, shortName = key
+            record = yield self.recordWithShortName(
+                recordType, shortName, timeoutSeconds=timeoutSeconds
+            )
+        returnValue(record)
+
+    def _calendarUserRecord(self, record):
+        """
+        Only records that can be calendar users are returned for calendar
+        user addresses.
+        """
         if record:
             if record.hasCalendars or (
                 config.GroupAttendees.Enabled and
                 record.recordType == BaseRecordType.group
             ):
-                returnValue(record)
+                return record
+        return None
+
+    @inlineCallbacks
+    def recordWithCalendarUserAddress(
+        self, address, timeoutSeconds=None
+    ):
+        lookup = self._parseCalendarUserAddress(address)
+        record = None
+        if lookup is not None:
+            record = yield self._recordForLookup(
+                lookup, timeoutSeconds=timeoutSeconds
+            )
+        returnValue(self._calendarUserRecord(record))
+
+    @inlineCallbacks
+    def recordsWithUIDs(self, uids, timeoutSeconds=None):
+        """
+        Look up several records by UID.
+
+        @param uids: the UIDs to look up
+        @type uids: iterable of C{unicode}
+
+        @return: a C{dict} of UID to the matching record, or L{None} if there
+            is no record with that UID
+        @rtype: L{Deferred} firing C{dict}
+        """
+        uids = list(set(uids))
+        records = yield gatherResults([
+            self.recordWithUID(uid, timeoutSeconds=timeoutSeconds)
+            for uid in uids
+        ])
+        returnValue(dict(zip(uids, records)))
+
+    @inlineCallbacks
+    def recordsForCalendarUserAddresses(self, addresses, timeoutSeconds=None):
+        """
+        Look up the records several calendar user addresses refer to, whether
+        or not those records are calendar users. All the addresses that refer
+        to a UID are looked up with a single L{recordsWithUIDs} call.
+
+        @param addresses: the calendar user addresses to look up
+        @type addresses: iterable of C{str}
 
-        returnValue(None)
+        @return: a C{dict} of address to record, or L{None} if there is no
+            record for that address
+        @rtype: L{Deferred} firing C{dict}
+        """
+        lookups = dict([
+            (address, self._parseCalendarUserAddress(address),)
+            for address in set(addresses)
+        ])
+
+        uids = set([
+            lookup[1] for lookup in lookups.values()
+            if lookup is not None and lookup[0] == "uid"
+        ])
+        byUID = (yield self.recordsWithUIDs(
+            uids, timeoutSeconds=timeoutSeconds
+        )) if uids else {}
+
+        others = [
+            address for address, lookup in lookups.items()
+            if lookup is not None and lookup[0] != "uid"
+        ]
+        otherRecords = yield gatherResults([
+            self._recordForLookup(
+                lookups[address], timeoutSeconds=timeoutSeconds
+            )
+            for address in others
+        ])
+
+        results = dict([(address, None,) for address in lookups])
+        results.update(zip(others, otherRecords))
+        for address, lookup in lookups.items():
+            if lookup is not None and lookup[0] == "uid":
+                results[address] = byUID.get(lookup[1])
+        returnValue(results)
+
+    @inlineCallbacks
+    def recordsWithCalendarUserAddresses(self, addresses, timeoutSeconds=None):
+        """
+        Look up several calendar user addresses in one go. The result is the
+        same as calling L{recordWithCalendarUserAddress} for each address,
+        but the directory is queried in bulk where possible.
+
+        @param addresses: the calendar user addresses to look up
+        @type addresses: iterable of C{str}
+
+        @return: a C{dict} of address to calendar user record, or L{None} if
+            there is no calendar user for that address
+        @rtype: L{Deferred} firing C{dict}
+        """
+        records = yield self.recordsForCalendarUserAddresses(
+            addresses, timeoutSeconds=timeoutSeconds
+        )
+        returnValue(dict([
+            (address, self._calendarUserRecord(record),)
+            for address, record in records.items()
+        ]))
 
     searchContext_location = "location"
     searchContext_resource = "resource"
@@ -332,6 +457,17 @@ class CalendarDirectoryServiceMixin(object):
         )
         returnValue(records)
 
+    def groupChangeToken(self):
+        """
+        Return a token which changes whenever the membership of any group in
+        this service may have changed. Services which cannot tell return
+        L{None}, meaning every group has to be refreshed.
+
+        @return: the change token, or L{None}
+        @rtype: L{Deferred} firing C{str}
+        """
+        return succeed(None)
+
 
 class CalendarDirectoryRecordMixin(object):
     """
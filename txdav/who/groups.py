@@ -238,6 +238,64 @@ class GroupCacher(object):
         self.batchSize = batchSize
         self.batchSchedulingIntervalSeconds = batchSchedulingIntervalSeconds
 
+        # The directory change token seen by the last update, and the groups
+        # that update either scheduled for refresh or found already refreshed
+        self._groupChangeToken = None
+        self._scheduledGroupUIDs = frozenset()
+
+        # Counts of refreshed groups whose membership changed, refreshed
+        # groups whose membership did not change, and groups not refreshed
+        # because the directory had not changed
+        self._refreshedCount = 0
+        self._unchangedCount = 0
+        self._skippedCount = 0
+
+    def stats(self):
+        """
+        Counts of group refreshes done by this cacher.
+
+        @return: a C{dict} with "refreshed" (membership changed), "unchanged"
+            (membership fingerprint matched so the db was not touched) and
+            "skipped" (no refresh scheduled because the directory reported no
+            changes) counts
+        @rtype: C{dict}
+        """
+        return {
+            "refreshed": self._refreshedCount,
+            "unchanged": self._unchangedCount,
+            "skipped": self._skippedCount,
+        }
+
+    @inlineCallbacks
+    def _groupChangeTokenFromDirectory(self):
+        """
+        Get the directory's group change token, or L{None} if it does not
+        support one or fetching it fails.
+        """
+        if not hasattr(self.directory, "groupChangeToken"):
+            returnValue(None)
+        try:
+            token = yield self.directory.groupChangeToken()
+        except Exception, e:
+            self.log.error(
+                "Failed to get group change token ({error})", error=e
+            )
+            token = None
+        returnValue(token)
+
+    @inlineCallbacks
+    def _pendingRefreshGroupUIDs(self, txn):
+        """
+        Get the UIDs of the groups with a L{GroupRefreshWork} item that has not
+        been done yet.
+        """
+        gr = schema.GROUP_REFRESH_WORK
+        rows = yield Select(
+            [gr.GROUP_UID],
+            From=gr,
+        ).on(txn)
+        returnValue(set([row[0].decode("utf-8") for row in rows]))
+
     @inlineCallbacks
     def update(self, txn):
 
@@ -261,6 +319,10 @@ class GroupCacher(object):
 
             yield self.scheduleExternalAssignments(txn, externalAssignments)
 
+        # Get the directory change token before looking at any groups, so that
+        # changes made while we are working show up in the next update
+        changeToken = yield self._groupChangeTokenFromDirectory()
+
         # Figure out which groups matter
         groupUIDs = yield self.groupsToRefresh(txn)
         # self.log.debug(
@@ -302,10 +364,28 @@ class GroupCacher(object):
                 "Deleted old or unused groups {d}", d=deletedGroupUIDs
             )
 
+        currentGroupUIDs = set(groupUIDs) - set(deletedGroupUIDs)
+        groupUIDsToRefresh = set(currentGroupUIDs)
+
+        # If the directory has not changed since the last update only the
+        # groups that update did not refresh need refreshing. A group whose
+        # refresh work is still queued has not been refreshed yet.
+        if changeToken is not None and changeToken == self._groupChangeToken:
+            pendingGroupUIDs = yield self._pendingRefreshGroupUIDs(txn)
+            unchangedGroupUIDs = (groupUIDsToRefresh & self._scheduledGroupUIDs) - pendingGroupUIDs
+            groupUIDsToRefresh -= unchangedGroupUIDs
+            self._skippedCount += len(unchangedGroupUIDs)
+            self.log.debug(
+                "Directory unchanged, skipping refresh of {count} groups",
+                count=len(unchangedGroupUIDs)
+            )
+        self._groupChangeToken = changeToken
+        self._scheduledGroupUIDs = frozenset(currentGroupUIDs)
+
         # For each of those groups, create a per-group refresh work item
         futureSeconds = self.initialSchedulingDelaySeconds
         i = 0
-        for groupUID in set(groupUIDs) - set(deletedGroupUIDs):
+        for groupUID in groupUIDsToRefresh:
             self.log.debug(
                 "Enqueuing group refresh for {u} in {sec} seconds",
                 u=groupUID, sec=futureSeconds
@@ -440,6 +520,7 @@ class GroupCacher(object):
             membershipChanged, addedUIDs, removedUIDs = yield txn.refreshGroup(group, record)
 
             if membershipChanged:
+                self._refreshedCount += 1
                 self.log.info(
                     "Membership changed for group {uid} {name}:\n\tadded {added}\n\tremoved {removed}",
                     uid=group.groupUID,
@@ -460,6 +541,7 @@ class GroupCacher(object):
 
                 returnValue(wpsAttendee + wpsShareee)
             else:
+                self._unchangedCount += 1
                 self.log.debug(
                     "No membership change for group {uid} {name}",
                     uid=group.groupUID,
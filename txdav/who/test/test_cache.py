@@ -18,7 +18,7 @@
 Caching service tests
 """
 
-from twisted.internet.defer import inlineCallbacks
+from twisted.internet.defer import inlineCallbacks, returnValue
 
 from twistedcaldav.config import config
 from twistedcaldav.test.util import StoreTestCase
@@ -367,3 +367,110 @@ class CacheTest(StoreTestCase):
         key2 = dir._memcacher.generateMemcacheKey(IndexType.uid, "abc")
 
         self.assertNotEqual(key1, key2)
+
+    @inlineCallbacks
+    def test_bulkLookupsSendOnlyMisses(self):
+        """
+        Verify bulk lookups through a DPS client answer cached records locally
+        and send only the misses upstream, in a single request.
+        """
+        dps = DPSClientDirectoryService(None)
+        dir = CachingDirectoryService(
+            dps,
+            expireSeconds=10,
+            lookupsBetweenPurges=LOOKUPS_BETWEEN_PURGES,
+            negativeCaching=True,
+        )
+        dir.setTestTime(1.0)
+
+        requested = []
+
+        @inlineCallbacks
+        def recordsWithUIDs(uids, timeoutSeconds=None):
+            uids = list(uids)
+            requested.append(sorted(uids))
+            records = {}
+            for uid in uids:
+                records[uid] = yield self.directory.recordWithUID(uid)
+            returnValue(records)
+
+        self.patch(dps, "recordsWithUIDs", recordsWithUIDs)
+
+        records = yield dir.recordsWithUIDs(
+            [u"cache-uid-1", u"cache-uid-2", u"negative-uid-1"]
+        )
+        self.assertEquals(records[u"cache-uid-1"].uid, u"cache-uid-1")
+        self.assertEquals(records[u"cache-uid-2"].uid, u"cache-uid-2")
+        self.assertTrue(records[u"negative-uid-1"] is None)
+        self.assertEquals(
+            requested,
+            [[u"cache-uid-1", u"cache-uid-2", u"negative-uid-1"]]
+        )
+        self.assertEquals(len(dir._negativeCache[IndexType.uid]), 1)
+
+        # Cached and negatively cached records are answered locally
+        records = yield dir.recordsWithUIDs(
+            [u"cache-uid-1", u"cache-uid-duplicate-1", u"negative-uid-1"]
+        )
+        self.assertEquals(records[u"cache-uid-1"].uid, u"cache-uid-1")
+        self.assertEquals(records[u"cache-uid-duplicate-1"].uid, u"cache-uid-duplicate-1")
+        self.assertTrue(records[u"negative-uid-1"] is None)
+        self.assertEquals(requested[1:], [[u"cache-uid-duplicate-1"]])
+
+        # Nothing is sent when everything is cached
+        yield dir.recordsWithUIDs([u"cache-uid-2", u"cache-uid-duplicate-1"])
+        self.assertEquals(len(requested), 2)
+
+    @inlineCallbacks
+    def test_bulkLookupsCacheEmailAddresses(self):
+        """
+        Verify records found by email address in a bulk lookup through a DPS
+        client are cached by email address, so a later lookup of the same
+        calendar user address does not go to the DPS.
+        """
+        dps = DPSClientDirectoryService(None)
+        dir = CachingDirectoryService(
+            dps,
+            expireSeconds=10,
+            lookupsBetweenPurges=LOOKUPS_BETWEEN_PURGES,
+            negativeCaching=True,
+        )
+        dir.setTestTime(1.0)
+
+        requested = []
+
+        @inlineCallbacks
+        def recordsForCalendarUserAddresses(addresses, timeoutSeconds=None):
+            addresses = list(addresses)
+            requested.append(sorted(addresses))
+            records = {}
+            for address in addresses:
+                found = yield self.directory.recordsWithEmailAddress(address[7:])
+                records[address] = list(found)[0] if found else None
+            returnValue(records)
+
+        def recordsWithEmailAddress(emailAddress, limitResults=None, timeoutSeconds=None):
+            requested.append([emailAddress])
+            return self.directory.recordsWithEmailAddress(
+                emailAddress, limitResults=limitResults, timeoutSeconds=timeoutSeconds
+            )
+
+        self.patch(dps, "recordsForCalendarUserAddresses", recordsForCalendarUserAddresses)
+        self.patch(dps, "_wrapped_recordsWithEmailAddress", recordsWithEmailAddress)
+
+        records = yield dir.recordsForCalendarUserAddresses(
+            [u"mailto:cache-user-1@example.com", u"mailto:cache-user-2@example.com"]
+        )
+        self.assertEquals(records[u"mailto:cache-user-1@example.com"].uid, u"cache-uid-1")
+        self.assertEquals(records[u"mailto:cache-user-2@example.com"].uid, u"cache-uid-2")
+        self.assertEquals(
+            requested,
+            [[u"mailto:cache-user-1@example.com", u"mailto:cache-user-2@example.com"]]
+        )
+
+        # The individual lookups are answered from the cache
+        record = yield dir.recordWithCalendarUserAddress(u"mailto:cache-user-1@example.com")
+        self.assertEquals(record.uid, u"cache-uid-1")
+        record = yield dir.recordWithCalendarUserAddress(u"mailto:cache-user-2@example.com")
+        self.assertEquals(record.uid, u"cache-uid-2")
+        self.assertEquals(len(requested), 1)
@@ -21,7 +21,7 @@ Group membership caching implementation tests
 from twext.enterprise.jobs.jobitem import JobItem
 from twext.who.idirectory import RecordType
 from twisted.internet import reactor
-from twisted.internet.defer import inlineCallbacks
+from twisted.internet.defer import inlineCallbacks, succeed
 from twistedcaldav.stdconfig import config
 from twistedcaldav.test.util import StoreTestCase
 from txdav.common.icommondatastore import NotFoundError
@@ -865,3 +865,143 @@ class DynamicGroupTest(StoreTestCase):
             group = yield txn.groupByUID(uid, create=False)
             yield txn.commit()
             self.assertEqual(group, None)
+
+    @inlineCallbacks
+    def test_update_unchangedDirectory(self):
+        """
+        Verify that groups are not scheduled for refresh again while the
+        directory's group change token stays the same
+        """
+        store = self.storeUnderTest()
+
+        txn = store.newTransaction()
+        group = yield txn.groupByUID(u"testgroup")
+        yield txn.addDelegateGroup(delegator=u"sagen", delegateGroupID=group.groupID, readWrite=True)
+        yield txn.commit()
+
+        token = ["1"]
+        self.patch(self.directory, "groupChangeToken", lambda: succeed(token[0]))
+
+        scheduled = []
+
+        def reschedule(txn, seconds, groupUID):
+            scheduled.append(groupUID)
+            return succeed(None)
+
+        self.patch(GroupRefreshWork, "reschedule", staticmethod(reschedule))
+
+        txn = store.newTransaction()
+        yield self.groupCacher.update(txn)
+        yield txn.commit()
+        self.assertEqual(scheduled, [u"testgroup"])
+
+        # Same token - nothing scheduled
+        txn = store.newTransaction()
+        yield self.groupCacher.update(txn)
+        yield txn.commit()
+        self.assertEqual(scheduled, [u"testgroup"])
+        self.assertEqual(self.groupCacher.stats()["skipped"], 1)
+
+        # A newly used group is scheduled even though the token is the same
+        txn = store.newTransaction()
+        group = yield txn.groupByUID(u"emptygroup")
+        yield txn.addDelegateGroup(delegator=u"sagen", delegateGroupID=group.groupID, readWrite=False)
+        yield txn.commit()
+
+        txn = store.newTransaction()
+        yield self.groupCacher.update(txn)
+        yield txn.commit()
+        self.assertEqual(scheduled, [u"testgroup", u"emptygroup"])
+        self.assertEqual(self.groupCacher.stats()["skipped"], 2)
+
+        # Token changed - everything scheduled
+        del scheduled[:]
+        token[0] = "2"
+        txn = store.newTransaction()
+        yield self.groupCacher.update(txn)
+        yield txn.commit()
+        self.assertEqual(set(scheduled), set([u"testgroup", u"emptygroup"]))
+
+        # No token - everything scheduled every time
+        del scheduled[:]
+        token[0] = None
+        for _ignore in range(2):
+            txn = store.newTransaction()
+            yield self.groupCacher.update(txn)
+            yield txn.commit()
+        self.assertEqual(len(scheduled), 4)
+
+    @inlineCallbacks
+    def test_update_unchangedDirectoryPendingRefresh(self):
+        """
+        Verify that a group is scheduled for refresh again while its previous
+        refresh work has not been done, even though the directory's group
+        change token stays the same
+        """
+        store = self.storeUnderTest()
+
+        txn = store.newTransaction()
+        group = yield txn.groupByUID(u"testgroup")
+        yield txn.addDelegateGroup(delegator=u"sagen", delegateGroupID=group.groupID, readWrite=True)
+        yield txn.commit()
+
+        self.patch(self.directory, "groupChangeToken", lambda: succeed("1"))
+
+        scheduled = []
+
+        def reschedule(txn, seconds, groupUID):
+            scheduled.append(groupUID)
+            return unpatchedReschedule(txn, seconds, groupUID=groupUID)
+
+        unpatchedReschedule = GroupRefreshWork.reschedule
+        self.patch(GroupRefreshWork, "reschedule", staticmethod(reschedule))
+
+        txn = store.newTransaction()
+        yield self.groupCacher.update(txn)
+        yield txn.commit()
+        self.assertEqual(scheduled, [u"testgroup"])
+
+        # Refresh not done yet - scheduled again
+        txn = store.newTransaction()
+        yield self.groupCacher.update(txn)
+        yield txn.commit()
+        self.assertEqual(scheduled, [u"testgroup", u"testgroup"])
+        self.assertEqual(self.groupCacher.stats()["skipped"], 0)
+
+        # Refresh done - nothing scheduled
+        yield JobItem.waitEmpty(store.newTransaction, reactor, 60)
+        txn = store.newTransaction()
+        yield self.groupCacher.update(txn)
+        yield txn.commit()
+        self.assertEqual(scheduled, [u"testgroup", u"testgroup"])
+        self.assertEqual(self.groupCacher.stats()["skipped"], 1)
+
+    @inlineCallbacks
+    def test_refreshGroup_stats(self):
+        """
+        Verify refreshes are counted as unchanged when the membership
+        fingerprint matches, and as refreshed when it does not
+        """
+        store = self.storeUnderTest()
+
+        txn = store.newTransaction()
+        yield self.groupCacher.refreshGroup(txn, u"testgroup")
+        yield txn.commit()
+        self.assertEqual(
+            self.groupCacher.stats(),
+            {"refreshed": 0, "unchanged": 1, "skipped": 0}
+        )
+
+        group = yield self.directory.recordWithUID(u"testgroup")
+        members = yield self.directory.recordsWithRecordType(RecordType.user)
+        yield group.setMembers(members[:10])
+
+        txn = store.newTransaction()
+        yield self.groupCacher.refreshGroup(txn, u"testgroup")
+        members = yield txn.groupMemberUIDs((yield txn.groupByUID(u"testgroup")).groupID)
+        yield txn.commit()
+        self.assertEqual(len(members), 10)
+        self.assertEqual(
+            self.groupCacher.stats(),
+            {"refreshed": 1, "unchanged": 1, "skipped": 0}
+        )
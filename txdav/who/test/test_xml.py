@@ -129,3 +129,13 @@ class ExtendedSchemaTest(unittest.TestCase):
         ):
             record = yield self.makeRecord(typeValue=value)
             self.assertIdentical(record.recordType, recordType)
+
+    @inlineCallbacks
+    def test_groupChangeToken(self):
+        service = xmlService(self.mktemp(), serviceClass=DirectoryService)
+        token = yield service.groupChangeToken()
+        self.assertNotEquals(token, None)
+        self.assertEquals((yield service.groupChangeToken()), token)
+
+        service.filePath.setContent(service.filePath.getContent() + b"\n")
+        self.assertNotEquals((yield service.groupChangeToken()), token)
@@ -41,6 +41,7 @@ __all__ = [
     "DirectoryService",
 ]
 
+from twisted.internet.defer import succeed
 from twisted.python.constants import Values, ValueConstant
 
 from twext.who.xml import DirectoryService as BaseDirectoryService
@@ -191,3 +192,16 @@ class DirectoryService(BaseDirectoryService):
         FieldName.streetAddress,
         FieldName.geographicLocation,
     )
+
+    def groupChangeToken(self):
+        """
+        The XML file is rewritten whenever any record changes, so its
+        modification time and size serve as a change token for the whole
+        service.
+        """
+        self.filePath.restat(False)
+        if not self.filePath.exists():
+            return succeed(None)
+        return succeed("{!r}:{}".format(
+            self.filePath.getModificationTime(), self.filePath.getsize()
+        ))
@@ -30,9 +30,11 @@ See RFC 2518: http://www.ietf.org/rfc/rfc2518.txt (WebDAV)
 
 __all__ = [
     "WebDAVDocument",
+    "WebDAVDocumentParser",
 ]
 
-from txdav.xml.parser_etree import WebDAVDocument
+from txdav.xml.parser_etree import WebDAVDocument, WebDAVDocumentParser
 
 # Shh unused import
 WebDAVDocument
+WebDAVDocumentParser
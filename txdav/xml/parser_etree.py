@@ -26,6 +26,7 @@ ElementTree implementation of XML parser/generator for WebDAV documents.
 
 __all__ = [
     "WebDAVDocument",
+    "WebDAVDocumentParser",
 ]
 
 from xml.etree.ElementTree import TreeBuilder, XMLParser, \
@@ -149,19 +150,53 @@ class WebDAVContentHandler (TreeBuilder):
         self.stack[-1]["children"].append(element)
 
 
-class WebDAVDocument(AbstractWebDAVDocument):
+class WebDAVDocumentParser(object):
+    """
+    Incremental parser for L{WebDAVDocument}s. Data is fed in as it arrives
+    and the element tree is built as it goes, so the whole document never has
+    to be held as a single string.
+    """
 
-    @classmethod
-    def fromStream(cls, source):
-        parser = XMLParser(target=WebDAVContentHandler())
+    def __init__(self):
+        self._parser = XMLParser(target=WebDAVContentHandler())
+
+    def feed(self, data):
+        """
+        Parse the next chunk of the document.
+
+        @param data: the data to parse
+        @type data: C{str}
+        @raise ValueError: if the data is not well-formed
+        """
+        try:
+            self._parser.feed(data)
+        except XMLParseError, e:
+            raise ValueError(e)
+
+    def close(self):
+        """
+        Finish parsing.
+
+        @return: the parsed document
+        @rtype: L{WebDAVDocument}
+        @raise ValueError: if the document is not well-formed
+        """
         try:
-            while 1:
-                data = source.read(65536)
-                if not data:
-                    break
-                parser.feed(data)
+            return self._parser.close()
         except XMLParseError, e:
             raise ValueError(e)
+
+
+class WebDAVDocument(AbstractWebDAVDocument):
+
+    @classmethod
+    def fromStream(cls, source):
+        parser = WebDAVDocumentParser()
+        while 1:
+            data = source.read(65536)
+            if not data:
+                break
+            parser.feed(data)
         return parser.close()
 
     def writeXML(self, output):
@@ -28,6 +28,7 @@ __all__ = [
     "ErrorResponse",
     "NeedPrivilegesResponse",
     "MultiStatusResponse",
+    "MultiStatusStream",
     "ResponseQueue",
     "PropertyStatusResponseQueue",
     "statusForFailure",
@@ -35,7 +36,11 @@ __all__ = [
     "messageForFailure",
 ]
 
+import cStringIO as StringIO
 import errno
+from itertools import chain
+
+from zope.interface import implements
 
 from twisted.python.failure import Failure
 from twisted.python.filepath import InsecurePath
@@ -45,6 +50,7 @@ from txweb2 import responsecode
 from txweb2.iweb import IResponse
 from txweb2.http import Response, HTTPError, StatusResponse
 from txweb2.http_headers import MimeType
+from txweb2.stream import IByteStream, fallbackSplit
 from txweb2.dav.util import joinURL
 from txdav.xml import element
 
@@ -138,11 +144,81 @@ class MultiStatusResponse(Response):
         @param xml_responses: an interable of element.Response objects.
         """
         Response.__init__(self, code=responsecode.MULTI_STATUS,
-                          stream=element.MultiStatus(*xml_responses).toxml())
+                          stream=MultiStatusStream(xml_responses))
 
         self.headers.setHeader("content-type", MimeType("text", "xml"))
 
 
+class MultiStatusStream(object):
+    """
+    An L{IByteStream} that renders a DAV:multi-status XML document. Each
+    element.Response is serialized only when the stream is read, so the
+    complete document is never held in memory, and the response is sent
+    chunked as it has no length. Reads are driven by the consumer of the
+    stream, so a slow client stops serialization until it catches up.
+    The output is identical to that of C{element.MultiStatus(...).toxml()}.
+    """
+    implements(IByteStream)
+
+    length = None
+
+    # Minimum size of each chunk returned by read()
+    chunkSize = 64 * 1024
+
+    def __init__(self, xml_responses, pretty=True):
+        """
+        @param xml_responses: an interable of element.Response objects.
+        @param pretty: C{bool} whether to use 'pretty' formatted output or not.
+        """
+        if isinstance(xml_responses, (list, tuple)):
+            # Consume a list from the front so that serialized responses can be freed
+            self.responses = self._consume(list(reversed(xml_responses)))
+        else:
+            self.responses = iter(xml_responses)
+        self.pretty = pretty
+        self.started = False
+
+    @staticmethod
+    def _consume(reversed_responses):
+        while reversed_responses:
+            yield reversed_responses.pop()
+
+    def read(self):
+        if self.responses is None:
+            return None
+
+        output = StringIO.StringIO()
+        if not self.started:
+            self.started = True
+            output.write("<?xml version='1.0' encoding='UTF-8'?>" + ("\n" if self.pretty else ""))
+            response = next(self.responses, None)
+            if response is None:
+                output.write("<%s xmlns='%s'/>" % (element.MultiStatus.name, element.MultiStatus.namespace,))
+                self.responses = None
+                return output.getvalue()
+            output.write("<%s xmlns='%s'>" % (element.MultiStatus.name, element.MultiStatus.namespace,))
+            if self.pretty:
+                output.write("\r\n")
+            self.responses = chain((response,), self.responses)
+
+        for response in self.responses:
+            response._writeToStream(output, element.MultiStatus.namespace, 1, self.pretty)
+            if output.tell() >= self.chunkSize:
+                break
+        else:
+            output.write("</%s>" % (element.MultiStatus.name,))
+            self.responses = None
+
+        return output.getvalue()
+
+    def split(self, point):
+        return fallbackSplit(self, point)
+
+    def close(self):
+        self.responses = None
+        self.length = 0
+
+
 class ResponseQueue(object):
     """
     Stores a list of (typically error) responses for use in a
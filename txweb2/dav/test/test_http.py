@@ -27,7 +27,8 @@ import errno
 from twisted.python.failure import Failure
 from txweb2 import responsecode
 from txweb2.http import HTTPError
-from txweb2.dav.http import ErrorResponse, statusForFailure
+from txweb2.dav.http import ErrorResponse, MultiStatusResponse, MultiStatusStream, statusForFailure
+from txdav.xml import element
 import txweb2.dav.test.util
 
 
@@ -76,6 +77,60 @@ class HTTP(txweb2.dav.test.util.TestCase):
         else:
             self.fail("Unknown exception should have re-raised.")
 
+    def _responses(self, count):
+        return [
+            element.StatusResponse(
+                element.HRef("/calendars/%d.ics" % (ctr,)),
+                element.Status.fromResponseCode(responsecode.NOT_FOUND),
+            )
+            for ctr in range(count)
+        ]
+
+    def _readAll(self, stream):
+        chunks = []
+        while True:
+            data = stream.read()
+            if data is None:
+                break
+            chunks.append(data)
+        return chunks
+
+    def test_multiStatusResponse(self):
+        """
+        MultiStatusResponse streams the same document as MultiStatus.toxml(), with no length
+        """
+        for count in (0, 1, 10):
+            response = MultiStatusResponse(self._responses(count))
+            self.assertEquals(response.code, responsecode.MULTI_STATUS)
+            self.assertEquals(response.stream.length, None)
+            self.assertEquals(
+                "".join(self._readAll(response.stream)),
+                element.MultiStatus(*self._responses(count)).toxml(),
+            )
+
+    def test_multiStatusStream_chunks(self):
+        """
+        MultiStatusStream returns a chunk for each group of responses that reaches the chunk size
+        """
+        stream = MultiStatusStream(self._responses(10))
+        stream.chunkSize = 1
+        chunks = self._readAll(stream)
+        self.assertEquals(len(chunks), 11)
+        self.assertEquals("".join(chunks), element.MultiStatus(*self._responses(10)).toxml())
+
+        stream = MultiStatusStream(iter(self._responses(10)), pretty=False)
+        self.assertEquals("".join(self._readAll(stream)), element.MultiStatus(*self._responses(10)).toxml(pretty=False))
+
+    def test_multiStatusStream_close(self):
+        """
+        MultiStatusStream stops serializing once closed
+        """
+        stream = MultiStatusStream(self._responses(10))
+        stream.chunkSize = 1
+        self.assertNotEquals(stream.read(), None)
+        stream.close()
+        self.assertEquals(stream.read(), None)
+
     def _check_exception(self, exception, result):
         try:
             raise exception
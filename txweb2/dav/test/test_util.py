@@ -24,7 +24,12 @@
 ##
 
 from twisted.trial import unittest
+from twisted.internet.defer import inlineCallbacks
+from txweb2 import responsecode
 from txweb2.dav import util
+from txweb2.http import HTTPError
+from txweb2.stream import MemoryStream, ProducerStream
+from txdav.xml import element
 
 
 class Utilities(unittest.TestCase):
@@ -102,3 +107,47 @@ class Utilities(unittest.TestCase):
         self.assertEquals(util.parentForURL("/foo/bar/"), "/foo/")
         self.assertEquals(util.parentForURL("/foo/bar?x=1&y=2"), "/foo/")
         self.assertEquals(util.parentForURL("/foo/bar/?x=1&y=2"), "/foo/")
+
+    propfind = """<?xml version="1.0" encoding="utf-8" ?>
+<D:propfind xmlns:D="DAV:">
+<D:prop>
+<D:getetag/>
+</D:prop>
+</D:propfind>
+"""
+
+    @inlineCallbacks
+    def test_davXMLFromStream(self):
+        """
+        davXMLFromStream() parses the body as each chunk arrives
+        """
+        stream = ProducerStream()
+        for offset in range(0, len(self.propfind), 16):
+            stream.write(self.propfind[offset:offset + 16])
+        stream.finish()
+        doc = yield util.davXMLFromStream(stream)
+        self.assertTrue(isinstance(doc.root_element, element.PropertyFind))
+
+        doc = yield util.davXMLFromStream(MemoryStream(""))
+        self.assertEqual(doc, None)
+
+        yield self.assertFailure(util.davXMLFromStream(MemoryStream("<D:propfind")), ValueError)
+
+    @inlineCallbacks
+    def test_davXMLFromStreamTooLarge(self):
+        """
+        davXMLFromStream() rejects a body larger than maxXMLBodySize, without
+        reading it when its length is known
+        """
+        self.patch(util, "maxXMLBodySize", 32)
+
+        stream = MemoryStream(self.propfind)
+        error = yield self.assertFailure(util.davXMLFromStream(stream), HTTPError)
+        self.assertEqual(error.response.code, responsecode.REQUEST_ENTITY_TOO_LARGE)
+        self.assertEqual(stream.length, len(self.propfind))
+
+        stream = ProducerStream()
+        stream.write(self.propfind)
+        stream.finish()
+        error = yield self.assertFailure(util.davXMLFromStream(stream), HTTPError)
+        self.assertEqual(error.response.code, responsecode.REQUEST_ENTITY_TOO_LARGE)
@@ -33,6 +33,8 @@ change.
 __all__ = [
     "allDataFromStream",
     "davXMLFromStream",
+    "DAVXMLBodyReader",
+    "ParsedXMLStream",
     "noDataFromStream",
     "normalizeURL",
     "joinURL",
@@ -45,14 +47,19 @@ from urlparse import urlsplit, urlunsplit
 import posixpath  # Careful; this module is not documented as public API
 
 from twisted.python.failure import Failure
-from twisted.internet.defer import succeed
+from twisted.internet.defer import succeed, fail
 
 from twext.python.log import Logger
-from txweb2.stream import readStream
-from txdav.xml.parser import WebDAVDocument
+from txweb2 import responsecode
+from txweb2.http import HTTPError, StatusResponse
+from txweb2.stream import readStream, MemoryStream
+from txdav.xml.parser import WebDAVDocumentParser
 
 log = Logger()
 
+# Maximum size (in bytes) of an XML request body - zero for no limit
+maxXMLBodySize = 0
+
 ##
 # Reading request body
 ##
@@ -72,23 +79,89 @@ def allDataFromStream(stream, filter=None):
     return readStream(stream, data.append).addCallback(gotAllData)
 
 
+class DAVXMLBodyReader(object):
+    """
+    Parses an XML request body incrementally as its data arrives, enforcing
+    L{maxXMLBodySize}.
+    """
+
+    def __init__(self, length=None):
+        """
+        @param length: the length of the body if known in advance - a body
+            that is too large is then rejected before any of it is read
+        @type length: C{int}
+        """
+        self.maxSize = maxXMLBodySize
+        self.size = 0
+        if length is not None:
+            self._checkSize(length)
+        self._parser = WebDAVDocumentParser()
+
+    def _checkSize(self, size):
+        if self.maxSize and size > self.maxSize:
+            raise HTTPError(StatusResponse(
+                responsecode.REQUEST_ENTITY_TOO_LARGE,
+                "XML request body exceeds %d bytes" % (self.maxSize,)
+            ))
+
+    def feed(self, data):
+        """
+        Parse the next chunk of the body.
+
+        @raise HTTPError: if the body is too large
+        @raise ValueError: if the body is not well-formed XML
+        """
+        data = str(data)
+        self.size += len(data)
+        self._checkSize(self.size)
+        self._parser.feed(data)
+
+    def close(self):
+        """
+        Finish parsing the body.
+
+        @return: the validated document, or C{None} if the body was empty
+        @rtype: L{WebDAVDocument}
+        @raise ValueError: if the body is not a valid XML document
+        """
+        if self.size == 0:
+            return None
+        doc = self._parser.close()
+        doc.root_element.validate()
+        return doc
+
+
+class ParsedXMLStream(MemoryStream):
+    """
+    A request body that has already been parsed by a L{DAVXMLBodyReader}
+    (e.g. whilst computing a response cache key), so that
+    L{davXMLFromStream} can return the document without parsing it again.
+    """
+
+    def __init__(self, data, document):
+        MemoryStream.__init__(self, data)
+        self.document = document
+
+
 def davXMLFromStream(stream):
-    # FIXME:
-    #   This reads the request body into a string and then parses it.
-    #   A better solution would parse directly and incrementally from the
-    #   request stream.
     if stream is None:
         return succeed(None)
 
-    def parse(xml):
-        try:
-            doc = WebDAVDocument.fromString(xml)
-            doc.root_element.validate()
-            return doc
-        except ValueError:
-            log.error("Bad XML:\n%s" % (xml,))
-            raise
-    return allDataFromStream(stream, parse)
+    if isinstance(stream, ParsedXMLStream):
+        return succeed(stream.document)
+
+    try:
+        reader = DAVXMLBodyReader(getattr(stream, "length", None))
+    except HTTPError:
+        return fail()
+
+    def badXML(f):
+        f.trap(ValueError)
+        log.error("Bad XML in {size} byte request body: {ex}", size=reader.size, ex=f.value)
+        return f
+    return readStream(stream, reader.feed).addCallback(
+        lambda _: reader.close()
+    ).addErrback(badXML)
 
 
 def noDataFromStream(stream):
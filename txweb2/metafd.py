@@ -21,6 +21,8 @@ L{twext.internet.sendfdport.InheritedSocketDispatcher}.
 """
 from __future__ import print_function
 
+import time
+
 from zope.interface import implementer, directlyProvides
 from twisted.internet.interfaces import ISSLTransport
 
@@ -32,6 +34,7 @@ from twext.python.log import Logger
 from txweb2.channel.http import HTTPFactory
 from twisted.application.service import MultiService, Service
 from twisted.internet import reactor
+from twisted.internet.task import LoopingCall
 from twisted.python.util import FancyStrMixin
 from twisted.internet.tcp import Server
 from twext.internet.sendfdport import IStatusWatcher
@@ -65,11 +68,25 @@ class ReportingHTTPService(Service, object):
         for inbound connections tagged with the string 'SSL' as their
         descriptive data, or None if SSL is not enabled for this server.
     @type contextFactory: L{twisted.internet.ssl.ContextFactory} or C{NoneType}
+
+    @ivar loadReportInterval: seconds between load reports sent to the master
+        process, or 0 to not send any.
+    @type loadReportInterval: C{float}
+
+    @ivar openTransactions: a no-argument callable returning the number of
+        store transactions currently open in this process, or C{None}.
     """
 
     _connectionCount = 0
+    _loadReporter = None
+    _lastLoadReport = None
+
+    clock = reactor
 
-    def __init__(self, site, fd, contextFactory, usingSocketFile=False):
+    def __init__(
+        self, site, fd, contextFactory, usingSocketFile=False,
+        loadReportInterval=0, openTransactions=None,
+    ):
         self.contextFactory = contextFactory
         # Unlike other 'factory' constructions, config.MaxRequests and
         # config.MaxAccepts are dealt with in the master process, so we don't
@@ -81,6 +98,8 @@ class ReportingHTTPService(Service, object):
         # we'll tweak the transport object enough to appear secure without
         # actually doing startTLS ourselves.
         self.usingSocketFile = usingSocketFile
+        self.loadReportInterval = loadReportInterval
+        self.openTransactions = openTransactions
 
     def startService(self):
         """
@@ -94,6 +113,11 @@ class ReportingHTTPService(Service, object):
         inheritedPort.startReading()
         inheritedPort.reportStatus("0")
 
+        if self.loadReportInterval:
+            self._loadReporter = LoopingCall(self.reportLoad)
+            self._loadReporter.clock = self.clock
+            self._loadReporter.start(self.loadReportInterval, now=False)
+
     def stopService(self):
         """
         Stop reading on the inherited port.
@@ -102,6 +126,9 @@ class ReportingHTTPService(Service, object):
             complete.
         """
         Service.stopService(self)
+        if self._loadReporter is not None:
+            self._loadReporter.stop()
+            self._loadReporter = None
         # XXX stopping should really be destructive, because otherwise we will
         # always leak a file descriptor; i.e. this shouldn't be restartable.
         self.reportingFactory.inheritedPort.stopReading()
@@ -109,6 +136,19 @@ class ReportingHTTPService(Service, object):
         # Let any outstanding requests finish
         return self.reportingFactory.allConnectionsClosed()
 
+    def reportLoad(self):
+        """
+        Send a load report to the master process. Reactor lag is how late this
+        call is compared to when it was scheduled.
+        """
+        now = self.clock.seconds()
+        reactorLag = 0.0
+        if self._lastLoadReport is not None:
+            reactorLag = max(now - self._lastLoadReport - self.loadReportInterval, 0.0)
+        self._lastLoadReport = now
+        openTransactions = self.openTransactions() if self.openTransactions is not None else 0
+        self.reportingFactory.reportLoad(reactorLag, openTransactions)
+
     def createTransport(self, skt, peer, data, protocol):
         """
         Create a TCP transport, from a socket object passed by the parent.
@@ -166,6 +206,41 @@ class ReportingHTTPFactory(HTTPFactory):
         HTTPFactory.removeConnectedChannel(self, channel)
         self._report("-")
 
+    def oldestRequestAge(self):
+        """
+        The time since the oldest request currently being processed started.
+
+        @return: age in seconds, or 0 if there are no requests
+        @rtype: C{float}
+        """
+        now = time.time()
+        oldest = now
+        for channel in self.connectedChannels:
+            for chanRequest in channel.requests:
+                request = getattr(chanRequest, "request", None)
+                timeStamps = getattr(request, "timeStamps", None)
+                if timeStamps:
+                    oldest = min(oldest, timeStamps[0][1])
+        return now - oldest
+
+    def reportLoad(self, reactorLag, openTransactions):
+        """
+        Report the current load to the parent, so that it can favor less busy
+        processes when dispatching new connections. The message is "L"
+        followed by the oldest request age in ms, the reactor lag in ms and
+        the number of open store transactions, separated by commas.
+
+        @param reactorLag: reactor lag in seconds
+        @type reactorLag: C{float}
+        @param openTransactions: number of open store transactions
+        @type openTransactions: C{int}
+        """
+        self._report("L{},{},{}".format(
+            int(self.oldestRequestAge() * 1000),
+            int(reactorLag * 1000),
+            openTransactions,
+        ))
+
 
 @implementer(IStatus)
 class WorkerStatus(FancyStrMixin, object):
@@ -176,6 +251,15 @@ class WorkerStatus(FancyStrMixin, object):
     showAttributes = ("acknowledged unacknowledged total started abandoned unclosed starting stopped"
                       .split())
 
+    # Reported by the worker, not shown in the repr
+    loadAttributes = ("requestAge", "reactorLag", "transactions",)
+
+    # Weights converting the load reported by a worker into an equivalent
+    # number of extra connections when choosing where to dispatch
+    requestAgeWeight = 1.0 / 1000.0     # per ms of the oldest request's age
+    reactorLagWeight = 1.0 / 100.0      # per ms of reactor lag
+    transactionWeight = 0.5             # per open store transaction
+
     def __init__(
         self,
         acknowledged=0,
@@ -185,7 +269,10 @@ class WorkerStatus(FancyStrMixin, object):
         abandoned=0,
         unclosed=0,
         starting=1,
-        stopped=0
+        stopped=0,
+        requestAge=0,
+        reactorLag=0,
+        transactions=0,
     ):
         """
         Create a L{ConnectionStatus} with a number of sent connections and a
@@ -216,6 +303,15 @@ class WorkerStatus(FancyStrMixin, object):
 
         @param stopped: The process that owns this socket has stopped. Do not
             dispatch to it.
+
+        @param requestAge: The age in ms of the oldest request the worker was
+            processing at its last load report.
+
+        @param reactorLag: The reactor lag in ms at the worker's last load
+            report.
+
+        @param transactions: The number of open store transactions at the
+            worker's last load report.
         """
         self.acknowledged = acknowledged
         self.unacknowledged = unacknowledged
@@ -225,16 +321,32 @@ class WorkerStatus(FancyStrMixin, object):
         self.unclosed = unclosed
         self.starting = starting
         self.stopped = stopped
+        self.requestAge = requestAge
+        self.reactorLag = reactorLag
+        self.transactions = transactions
 
     def items(self):
-        return dict([(attr, getattr(self, attr)) for attr in self.showAttributes])
+        return dict([(attr, getattr(self, attr)) for attr in self.showAttributes + self.loadAttributes])
 
-    def effective(self):
+    def outstanding(self):
         """
-        The current effective load.
+        The number of connections sent to the worker and not yet closed.
         """
         return self.acknowledged + self.unacknowledged
 
+    def effective(self):
+        """
+        The current effective load, used to pick the worker to dispatch to.
+        This is the number of outstanding connections, plus a penalty for how
+        busy the worker last reported itself to be, so that a worker stuck on
+        a slow request looks more loaded than one handling quick ones.
+        """
+        return self.outstanding() + (
+            self.requestAge * self.requestAgeWeight +
+            self.reactorLag * self.reactorLagWeight +
+            self.transactions * self.transactionWeight
+        )
+
     def active(self):
         """
         Is the subprocess associated with this socket available to dispatch to.
@@ -273,6 +385,9 @@ class WorkerStatus(FancyStrMixin, object):
             abandoned=self.abandoned + self.unacknowledged,
             starting=0,
             stopped=1,
+            requestAge=0,
+            reactorLag=0,
+            transactions=0,
         )
 
     def adjust(self, **kwargs):
@@ -368,6 +483,19 @@ class ConnectionLimiter(MultiService, object):
             # A new process just started accepting new connections.
             return previousStatus.restarted()
 
+        elif message.startswith('L'):
+            # A periodic load report (see ReportingHTTPFactory.reportLoad)
+            try:
+                requestAge, reactorLag, transactions = map(int, message[1:].split(","))
+            except ValueError:
+                log.error("Invalid load report from worker: {message!r}", message=message)
+                return previousStatus
+            return previousStatus.reset(
+                requestAge=requestAge,
+                reactorLag=reactorLag,
+                transactions=transactions,
+            )
+
         else:
             # '+' acknowledges that the subprocess has taken on the work.
             return previousStatus.adjust(
@@ -401,7 +529,7 @@ class ConnectionLimiter(MultiService, object):
         C{self.dispatcher.statuses} attribute, which is what
         C{self.outstandingRequests} uses to compute it.)
         """
-        current = sum(status.effective()
+        current = sum(status.outstanding()
                       for status in self.dispatcher.statuses)
         self._outstandingRequests = current  # preserve for or= field in log
         self._maxOutstandingRequests = max(self._maxOutstandingRequests, self._outstandingRequests)
@@ -20,14 +20,17 @@ Tests for txweb2.metafd.
 """
 
 from socket import error as SocketError, AF_INET
+import time
 from errno import ENOTCONN
 
 from twext.internet import sendfdport
 from txweb2 import metafd
 from txweb2.channel.http import HTTPChannel
-from txweb2.metafd import ReportingHTTPService, ConnectionLimiter
+from txweb2.metafd import ReportingHTTPService, ConnectionLimiter, \
+    ReportingHTTPFactory
 from twisted.internet.tcp import Server
 from twisted.application.service import Service
+from twisted.internet.task import Clock
 
 from twext.internet.test.test_sendfdport import ReaderAdder
 from txweb2.metafd import WorkerStatus
@@ -140,6 +143,58 @@ class ReportingHTTPServiceTests(TestCase):
         self.assertEqual(len(channels), 1)
         self.assertEqual(list(channels)[0].transport.getPeer().host, "0.0.0.0")
 
+    def test_reportLoad(self):
+        """
+        L{ReportingHTTPService.reportLoad} sends the age of the oldest request
+        in progress, the reactor lag and the number of open transactions to
+        the master process.
+        """
+        messages = []
+
+        class FakePort(object):
+            def reportStatus(self, message):
+                messages.append(message)
+
+        class FakeRequest(object):
+            def __init__(self, started):
+                self.timeStamps = [("t", started,)]
+
+        class FakeChannelRequest(object):
+            def __init__(self, request):
+                self.request = request
+
+        class FakeChannel(object):
+            def __init__(self, requests):
+                self.requests = requests
+
+        now = time.time()
+        factory = ReportingHTTPFactory(None)
+        factory.inheritedPort = FakePort()
+        factory.connectedChannels.add(FakeChannel([
+            FakeChannelRequest(FakeRequest(now - 2.0)),
+            FakeChannelRequest(None),
+            None,
+        ]))
+        factory.connectedChannels.add(FakeChannel([
+            FakeChannelRequest(FakeRequest(now - 0.5)),
+        ]))
+
+        clock = Clock()
+        svc = ReportingHTTPService(None, None, None, loadReportInterval=1.0, openTransactions=lambda: 4)
+        svc.clock = clock
+        svc.reportingFactory = factory
+        svc.reportLoad()
+        clock.advance(1.5)
+        svc.reportLoad()
+
+        self.assertEqual(len(messages), 2)
+        for message, lag in zip(messages, (0, 500,)):
+            self.assertTrue(message.startswith("L"))
+            age, reactorLag, transactions = map(int, message[1:].split(","))
+            self.assertTrue(2000 <= age < 3000)
+            self.assertEqual(reactorLag, lag)
+            self.assertEqual(transactions, 4)
+
 
 class ConnectionLimiterTests(TestCase):
     """
@@ -203,6 +258,40 @@ class ConnectionLimiterTests(TestCase):
         builder.processRestart()
         self.assertEquals(builder.port.reading, True)
 
+    def test_loadReportDispatch(self):
+        """
+        Subprocess sockets whose workers report a slow request in progress are
+        dispatched to after less busy ones with the same number of connections.
+        """
+        builder = LimiterBuilder(self)
+        busy, idle = builder.dispatcher._subprocessSockets
+        builder.dispatcher.statusMessage(busy, "L2000,0,1")
+        self.assertEqual(busy.status.requestAge, 2000)
+        self.assertEqual(busy.status.transactions, 1)
+
+        # The load report does not count towards outstanding requests
+        self.assertEqual(builder.limiter.outstandingRequests, 0)
+
+        builder.fillUp(False, 2)
+        self.assertEqual(busy.status.outstanding(), 0)
+        self.assertEqual(idle.status.outstanding(), 2)
+
+        # Once the busy worker catches up it gets new connections again
+        builder.dispatcher.statusMessage(busy, "L0,0,0")
+        builder.fillUp(False, 1)
+        self.assertEqual(busy.status.outstanding(), 1)
+
+    def test_loadReportInvalid(self):
+        """
+        An invalid load report leaves the worker status unchanged.
+        """
+        builder = LimiterBuilder(self)
+        status = WorkerStatus(starting=0)
+        result = builder.limiter.statusFromMessage(status, "Lbogus")
+        self.assertIdentical(result, status)
+        self.assertEqual(status.effective(), 0)
+        self.assertEqual(status.acknowledged, 0)
+
     def test_workerStatusRepr(self):
         """
         L{WorkerStatus.__repr__} will show all the values associated with the